@@ -1,19 +1,315 @@
-from django.contrib import admin
+from datetime import datetime, timedelta
+from functools import cache as memoize
+
+from django.contrib import admin, messages
+from django.contrib.admin.views.main import ChangeList
 from django.contrib.auth import get_user_model
 from django.contrib.auth.admin import UserAdmin as DjangoUserAdmin
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Count, F, Max, Min, Q
+from django.utils import timezone
+from django.utils.functional import cached_property
 
+from .archive import restore_batch
+from .deletion import request_patient_deletion
+from .dictionaries import diagnoses
 from .models import (
+    ArchivedHealthRecord,
     AuditLog,
+    City,
     Department,
+    Diagnosis,
     Doctor,
     DoctorProfile,
+    Job,
     Patient,
     PatientHealthRecord,
     PatientProfile,
+    VisitType,
+    VitalsFlag,
+    VitalsReading,
 )
 
 User = get_user_model()
 
+# Changelists of the large tables ---------------------------------------------
+#
+# The stock changelist counts the filtered and the whole table on every load,
+# lists every distinct value of a filtered column, and lists the years of
+# its date hierarchy with a DISTINCT over the table; its search is a LIKE on
+# every search field.  The pieces below keep each of those to index lookups,
+# so a page costs about the same at a million rows as at a thousand
+# (``manage.py benchmark_admin`` measures it).
+
+# Rows counted exactly before the count is capped or estimated.
+COUNT_LIMIT = 10000
+# Distinct values offered by a TopValuesFilter, and how long they are cached.
+TOP_VALUES = 20
+TOP_VALUES_TIMEOUT = 60 * 10
+# Patients whose records a records search may match; more are left out with a warning.
+SEARCH_PATIENTS = 50
+
+
+def estimated_row_count(model, using='default'):
+    """Rows in ``model``'s table according to the planner statistics, or None without statistics."""
+    connection = connections[using]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            # Filled in by ANALYZE / PRAGMA optimize.
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'")
+            if cursor.fetchone() is None:
+                return None
+            cursor.execute('SELECT stat FROM sqlite_stat1 WHERE tbl = %s', [table])
+            counts = [int(stat.split()[0]) for stat, in cursor.fetchall()]
+            return max(counts) if counts else None
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples FROM pg_class WHERE oid = %s::regclass', [table])
+            row = cursor.fetchone()
+            return int(row[0]) if row and row[0] >= 0 else None
+    return None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Counts at most ``COUNT_LIMIT`` rows.  Beyond that an unfiltered table is
+    sized from the planner statistics (or its primary key span), and a
+    filtered one is reported as ``COUNT_LIMIT`` rows: later pages are not
+    offered, narrowing the filter is.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list.order_by()
+        counted = queryset[:COUNT_LIMIT + 1].count()
+        if counted <= COUNT_LIMIT:
+            return counted
+        if not queryset.query.has_filters():
+            estimate = estimated_row_count(queryset.model, queryset.db)
+            if estimate is None:
+                span = queryset.aggregate(first=Min('pk'), last=Max('pk'))
+                estimate = span['last'] - span['first'] + 1
+            return max(estimate, counted)
+        return COUNT_LIMIT
+
+
+class ProbedDatesMixin:
+    """
+    ``datetimes()`` for the date hierarchy without a DISTINCT over the table:
+    one indexed range probe per year, month or day between the first and
+    last value.
+    """
+
+    def aggregate(self, *args, **kwargs):
+        # The date hierarchy asks for the MIN and MAX of its column at once,
+        # which SQLite answers with a scan; each alone is one index seek.
+        if args or not kwargs or not all(
+            type(aggregate) in (Min, Max) and aggregate.filter is None
+            and isinstance(aggregate.source_expressions[0], F)
+            for aggregate in kwargs.values()
+        ):
+            return super().aggregate(*args, **kwargs)
+        result = {}
+        for alias, aggregate in kwargs.items():
+            name = aggregate.source_expressions[0].name
+            result[alias] = (
+                self.exclude(**{f'{name}__isnull': True})
+                .order_by(name if type(aggregate) is Min else f'-{name}')
+                .values_list(name, flat=True)
+                .first()
+            )
+        return result
+
+    def datetimes(self, field_name, kind, order='ASC', tzinfo=None):
+        if kind not in ('year', 'month', 'day'):
+            return super().datetimes(field_name, kind, order, tzinfo)
+        bounds = self.aggregate(first=Min(field_name), last=Max(field_name))
+        if bounds['first'] is None:
+            return []
+        aware = timezone.is_aware(bounds['first'])
+        zone = tzinfo or timezone.get_current_timezone()
+        first, last = (
+            timezone.localtime(value, zone).replace(tzinfo=None) if aware else value
+            for value in (bounds['first'], bounds['last'])
+        )
+        found = []
+        period = _period_start(first, kind)
+        while period <= last:
+            following = _next_period(period, kind)
+            start, end = (
+                (timezone.make_aware(period, zone), timezone.make_aware(following, zone))
+                if aware else (period, following)
+            )
+            if self.filter(**{f'{field_name}__gte': start, f'{field_name}__lt': end}).exists():
+                found.append(start)
+            period = following
+        return found if order == 'ASC' else found[::-1]
+
+
+def _period_start(value, kind):
+    if kind == 'year':
+        return datetime(value.year, 1, 1)
+    if kind == 'month':
+        return datetime(value.year, value.month, 1)
+    return datetime(value.year, value.month, value.day)
+
+
+def _next_period(period, kind):
+    if kind == 'year':
+        return period.replace(year=period.year + 1)
+    if kind == 'month':
+        return (period + timedelta(days=32)).replace(day=1)
+    return period + timedelta(days=1)
+
+
+@memoize
+def _with_probed_dates(queryset_class):
+    return type(f'ProbedDates{queryset_class.__name__}', (ProbedDatesMixin, queryset_class), {})
+
+
+class ScalableChangeList(ChangeList):
+    def get_queryset(self, request, exclude_parameters=None):
+        queryset = super().get_queryset(request, exclude_parameters)
+        if self.date_hierarchy:
+            queryset.__class__ = _with_probed_dates(queryset.__class__)
+        return queryset
+
+
+def top_values(model, field_name):
+    """The ``TOP_VALUES`` most common values of a column as ``(value, label)`` pairs, cached."""
+    key = f'core:admin-top-values:{model._meta.label_lower}.{field_name}'
+    choices = cache.get(key)
+    if choices is None:
+        field = model._meta.get_field(field_name)
+        rows = model._base_manager.exclude(**{f'{field.attname}__isnull': True})
+        if not field.is_relation:
+            rows = rows.exclude(**{field.attname: ''})
+        rows = rows.values_list(field.attname).annotate(rows=Count('pk')).order_by('-rows')[:TOP_VALUES]
+        values = [value for value, _ in rows]
+        if field.is_relation:
+            related = field.related_model._base_manager.select_related().in_bulk(values)
+            choices = [(str(value), str(related[value])) for value in values if value in related]
+        else:
+            choices = [(value, value) for value in values]
+        choices.sort(key=lambda choice: choice[1].casefold())
+        cache.set(key, choices, TOP_VALUES_TIMEOUT)
+    return choices
+
+
+def top_values_filter(field_name, title):
+    """A list filter offering the most common values of ``field_name`` rather than all of them."""
+
+    class TopValuesFilter(admin.SimpleListFilter):
+        parameter_name = field_name
+
+        def lookups(self, request, model_admin):
+            return top_values(model_admin.model, field_name)
+
+        def queryset(self, request, queryset):
+            if self.value() is None:
+                return queryset
+            return queryset.filter(**{field_name: self.value()})
+
+    TopValuesFilter.title = title
+    return TopValuesFilter
+
+
+def search_variants(term):
+    """The term as typed, capitalized and upper case, for case-sensitive index lookups."""
+    term = term.strip()
+    return {term, term.capitalize(), term.upper()}
+
+
+def search_arms(queryset, term, exact=(), prefix=()):
+    """
+    Querysets of the primary keys of the rows whose ``exact`` columns equal
+    ``term``, or whose ``prefix`` columns start with it (as typed,
+    capitalized or upper case), one per column in that order: comparisons an
+    index answers, unlike the case-insensitive LIKE of ``search_fields``.
+    """
+    variants = search_variants(term)
+    queryset = queryset.order_by().values('pk')
+    arms = [queryset.filter(**{f'{column}__in': variants}) for column in exact]
+    for column in prefix:
+        condition = Q()
+        for variant in variants:
+            condition |= Q(**{f'{column}__gte': variant, f'{column}__lt': variant + '\U0010ffff'})
+        arms.append(queryset.filter(condition))
+    return arms
+
+
+def indexed_search(queryset, term, exact=(), prefix=()):
+    """
+    The ``search_arms`` as one subquery.  Each column is searched in its own
+    arm of a UNION; ORed together, one mostly-NULL column (Aadhar numbers) is
+    enough for the planner to scan the whole table instead.
+    """
+    arms = search_arms(queryset, term, exact, prefix)
+    return arms[0].union(*arms[1:])
+
+
+# Identifiers first: a patient ID or contact detail names one patient, a
+# name prefix possibly thousands.  Each column has an index of its own.
+PATIENT_SEARCH = {
+    'exact': ('patient_id', 'aadhar_number', 'email', 'phone'),
+    'prefix': ('last_name', 'first_name'),
+}
+
+
+def search_patients(term, limit=None):
+    """
+    Primary keys of the first ``limit`` patients a search term names, for
+    searching their rows elsewhere, and whether there were more.  Exact
+    matches come first, then name matches by primary key, so the same search
+    always picks the same patients.  Fetched once rather than used as a
+    subquery, which the date hierarchy would run again for every period it
+    probes.
+    """
+    limit = SEARCH_PATIENTS if limit is None else limit
+    pks = []
+    for arm in search_arms(Patient.all_objects, term, **PATIENT_SEARCH):
+        found = arm.exclude(pk__in=pks).order_by('pk').values_list('pk', flat=True)
+        pks.extend(found[:limit + 1 - len(pks)])
+        if len(pks) > limit:
+            return pks[:limit], True
+    return pks, False
+
+
+class ScalableAdmin(admin.ModelAdmin):
+    """Changelist settings for tables that grow without bound (see above)."""
+
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_changelist(self, request, **kwargs):
+        return ScalableChangeList
+
+
+class PatientRowsAdmin(ScalableAdmin):
+    """Rows belonging to a patient: searched by the patient's identifiers, contact details or names, or diagnosis."""
+
+    search_fields = ("patient__patient_id",)  # enables the search box; see get_search_results
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term.strip():
+            return queryset, False
+        patients, more = search_patients(search_term)
+        if more:
+            self.message_user(
+                request,
+                f'"{search_term}" matches more than {SEARCH_PATIENTS} patients; showing the records of the first '
+                f'{SEARCH_PATIENTS}. Search by patient ID, Aadhar number, email or phone to find one patient.',
+                messages.WARNING,
+            )
+        condition = Q(patient__in=patients)
+        if any(field.name == 'diagnosis_ref' for field in self.model._meta.fields):
+            diagnosis = diagnoses.lookup(search_term)
+            if diagnosis is not None:
+                condition |= Q(diagnosis_ref=diagnosis)
+        return queryset.filter(condition), False
+
 
 @admin.register(User)
 class UserAdmin(DjangoUserAdmin):
@@ -41,31 +337,91 @@ class PatientProfileAdmin(admin.ModelAdmin):
 
 
 @admin.register(AuditLog)
-class AuditLogAdmin(admin.ModelAdmin):
+class AuditLogAdmin(ScalableAdmin):
     list_display = ('action', 'actor', 'target', 'created_at')
-    list_filter = ('action', 'created_at')
-    search_fields = ('action', 'target', 'details')
+    list_filter = (top_values_filter('action', 'action'),)
+    list_select_related = ('actor',)
+    date_hierarchy = 'created_at'
+    search_fields = ('target',)  # enables the search box; see get_search_results
+
+    def get_search_results(self, request, queryset, search_term):
+        # Exact matches on the indexed target; never a scan of the JSON details.
+        if not search_term.strip():
+            return queryset, False
+        return queryset.filter(target__in=search_variants(search_term)), False
+
+
+class SoftDeleteAdmin(admin.ModelAdmin):
+    """Shows soft-deleted rows too; deleting marks rows, ``purge_deleted`` removes them later."""
+
+    actions = ("soft_delete_selected", "restore_selected")
+
+    def get_queryset(self, request):
+        queryset = self.model.all_objects.get_queryset()
+        ordering = self.get_ordering(request)
+        if ordering:
+            queryset = queryset.order_by(*ordering)
+        return queryset
+
+    def get_list_filter(self, request):
+        return (*super().get_list_filter(request), ("deleted_at", admin.EmptyFieldListFilter))
+
+    def get_actions(self, request):
+        # The stock action collects every related row for its confirmation page.
+        actions = super().get_actions(request)
+        actions.pop("delete_selected", None)
+        return actions
+
+    def delete_model(self, request, obj):
+        obj.soft_delete()
+
+    def delete_queryset(self, request, queryset):
+        for obj in queryset.filter(deleted_at__isnull=True):
+            self.delete_model(request, obj)
+
+    @admin.action(description="Delete selected %(verbose_name_plural)s", permissions=["delete"])
+    def soft_delete_selected(self, request, queryset):
+        count = queryset.filter(deleted_at__isnull=True).count()
+        self.delete_queryset(request, queryset)
+        self.message_user(request, f"{count} row(s) marked deleted; they are purged after the retention period.")
+
+    @admin.action(description="Restore selected %(verbose_name_plural)s", permissions=["change"])
+    def restore_selected(self, request, queryset):
+        restored = 0
+        for obj in queryset.filter(deleted_at__isnull=False):
+            obj.restore()
+            restored += 1
+        self.message_user(request, f"{restored} row(s) restored.")
 
 
 @admin.register(Department)
-class DepartmentAdmin(admin.ModelAdmin):
-    list_display = ("name",)
+class DepartmentAdmin(SoftDeleteAdmin):
+    list_display = ("name", "deleted_at")
     search_fields = ("name",)
 
 
+@admin.register(City, Diagnosis, VisitType)
+class DictionaryEntryAdmin(admin.ModelAdmin):
+    list_display = ("name", "normalized_name")
+    search_fields = ("normalized_name",)
+    readonly_fields = ("normalized_name",)
+
+
 @admin.register(Doctor)
-class DoctorAdmin(admin.ModelAdmin):
-    list_display = ("full_name", "department", "email", "phone")
+class DoctorAdmin(SoftDeleteAdmin):
+    list_display = ("full_name", "department", "email", "phone", "deleted_at")
     list_filter = ("department",)
     search_fields = ("full_name", "email", "phone")
 
 
 @admin.register(Patient)
-class PatientAdmin(admin.ModelAdmin):
-    list_display = ("patient_id", "first_name", "last_name", "gender", "date_of_birth", "email", "registration_date")
-    list_filter = ("gender", "blood_type", "registration_date")
-    search_fields = ("patient_id", "first_name", "last_name", "email", "phone")
-    readonly_fields = ("registration_date",)
+class PatientAdmin(SoftDeleteAdmin, ScalableAdmin):
+    list_display = ("patient_id", "first_name", "last_name", "gender", "date_of_birth", "email", "registration_date",
+                    "deleted_at")
+    list_filter = ("gender", "blood_type")
+    date_hierarchy = "registration_date"
+    search_fields = ("patient_id",)  # enables the search box; see get_search_results
+    readonly_fields = ("registration_date", "deleted_at")
     fieldsets = (
         ('Patient Information', {
             'fields': ('patient_id', 'first_name', 'last_name', 'date_of_birth', 'gender')
@@ -80,16 +436,35 @@ class PatientAdmin(admin.ModelAdmin):
             'fields': ('blood_type', 'known_allergies', 'medical_history')
         }),
         ('Metadata', {
-            'fields': ('registration_date',)
+            'fields': ('registration_date', 'deleted_at')
         }),
     )
 
+    def delete_model(self, request, obj):
+        # Goes through core.deletion so the purge is audited.
+        request_patient_deletion([obj], actor=request.user)
+
+    def get_search_results(self, request, queryset, search_term):
+        # Also answers the patient autocomplete of the record admins.  Every
+        # match, paged in the changelist's order.
+        if not search_term.strip():
+            return queryset, False
+        return queryset.filter(pk__in=indexed_search(Patient.all_objects, search_term, **PATIENT_SEARCH)), False
+
 
 @admin.register(PatientHealthRecord)
-class PatientHealthRecordAdmin(admin.ModelAdmin):
+class PatientHealthRecordAdmin(PatientRowsAdmin):
     list_display = ("patient", "record_date", "doctor", "department", "diagnosis", "visit_type", "bmi")
-    list_filter = ("department", "doctor", "visit_type", "record_date", "diagnosis")
-    search_fields = ("patient__patient_id", "patient__first_name", "patient__last_name", "diagnosis", "symptoms")
+    list_filter = (
+        "department",
+        top_values_filter("doctor", "doctor"),
+        top_values_filter("visit_type_ref", "visit type"),
+        top_values_filter("diagnosis_ref", "diagnosis"),
+    )
+    # Doctor.__str__ shows the department and username.
+    list_select_related = ("patient", "doctor__department", "doctor__user", "department")
+    date_hierarchy = "record_date"
+    autocomplete_fields = ("patient", "doctor", "department")
     readonly_fields = ("bmi", "created_at")
     fieldsets = (
         ('Patient & Visit Information', {
@@ -105,4 +480,59 @@ class PatientHealthRecordAdmin(admin.ModelAdmin):
             'fields': ('created_at',)
         }),
     )
+
+
+@admin.register(ArchivedHealthRecord)
+class ArchivedHealthRecordAdmin(PatientRowsAdmin):
+    list_display = ("patient", "record_date", "doctor", "department", "diagnosis", "archived_at")
+    list_select_related = ("patient", "doctor__department", "doctor__user", "department")
+    raw_id_fields = ("patient", "doctor", "department", "diagnosis_ref", "visit_type_ref")
+    actions = ("restore",)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    @admin.action(description="Restore selected records")
+    def restore(self, request, queryset):
+        restored = 0
+        while count := restore_batch(queryset):
+            restored += count
+        self.message_user(request, f"{restored} record(s) restored.")
+
+
+@admin.register(VitalsFlag)
+class VitalsFlagAdmin(PatientRowsAdmin):
+    list_display = ("record_date", "patient", "kind", "severity", "value", "zscore", "acknowledged_at")
+    list_filter = ("kind", "severity")
+    list_select_related = ("patient",)
+    date_hierarchy = "record_date"
+    raw_id_fields = ("record", "patient", "acknowledged_by")
+
+
+@admin.register(VitalsReading)
+class VitalsReadingAdmin(PatientRowsAdmin):
+    list_display = ("recorded_at", "patient", "bed", "heart_rate", "systolic_bp", "diastolic_bp")
+    list_select_related = ("patient",)
+    date_hierarchy = "recorded_at"
+    raw_id_fields = ("patient",)
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ("name", "state", "priority", "attempts", "run_after", "locked_by", "finished_at")
+    list_filter = ("state", "name")
+    readonly_fields = ("created_at", "finished_at", "locked_by", "locked_at", "last_error", "result")
+    actions = ("requeue",)
+
+    @admin.action(description="Requeue selected jobs")
+    def requeue(self, request, queryset):
+        from django.utils import timezone
+
+        updated = queryset.exclude(state=Job.States.RUNNING).update(
+            state=Job.States.QUEUED, attempts=0, run_after=timezone.now(), finished_at=None,
+        )
+        self.message_user(request, f"Requeued {updated} jobs.")
 # Register your models here.
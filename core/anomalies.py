@@ -0,0 +1,196 @@
+"""
+Vitals anomaly engine.
+
+Flags are computed over whole batches of readings with NumPy: fixed clinical
+thresholds are boolean masks over the vitals columns, and per-patient
+deviations are z-scores against a rolling window of that patient's previous
+readings, computed with grouped cumulative sums rather than a Python loop
+per row.
+
+``flag_patients`` (used by the ``flag_vitals`` backfill command) recomputes
+every reading for a set of patients; ``flag_record`` is the incremental path
+run after a record is saved and only looks at that patient's recent window.
+"""
+import numpy as np
+from django.db import transaction
+
+from .models import PatientHealthRecord, VitalsFlag
+
+Kinds = VitalsFlag.Kinds
+Severity = VitalsFlag.Severity
+
+# Rolling window of previous readings a z-score is measured against.
+WINDOW = 10
+MIN_HISTORY = 3
+Z_THRESHOLD = 3.0
+
+# Lower bound on the spread used for z-scores, so a patient whose readings
+# never vary is not flagged for a trivial change.
+MIN_STD = {'weight': 1.5, 'systolic_bp': 8.0, 'heart_rate': 6.0}
+
+DEVIATION_KINDS = {
+    'weight': Kinds.WEIGHT_CHANGE,
+    'systolic_bp': Kinds.SYSTOLIC_DEVIATION,
+    'heart_rate': Kinds.HEART_RATE_DEVIATION,
+}
+
+PEDIATRIC_AGE = 12
+
+FIELDS = ('pk', 'patient_id', 'record_date', 'patient__date_of_birth',
+          'systolic_bp', 'diastolic_bp', 'heart_rate', 'temperature', 'weight')
+
+
+def _column(rows, index):
+    return np.array([np.nan if row[index] is None else float(row[index]) for row in rows], dtype=float)
+
+
+def _ages(rows):
+    """Approximate age in years at the time of each reading."""
+    days = [
+        (row[2].date() - row[3]).days if row[3] else 365 * 30
+        for row in rows
+    ]
+    return np.array(days, dtype=float) / 365.25
+
+
+def rolling_zscores(groups, values, window=WINDOW, min_history=MIN_HISTORY, min_std=0.0):
+    """
+    Z-score of each value against the previous ``window`` valid values of the same group.
+
+    ``groups`` must be sorted so each group's rows are contiguous and in time
+    order.  Missing values (NaN) are skipped both as inputs and as history.
+    Returns an array aligned with ``values``; entries without enough history
+    are NaN.
+    """
+    result = np.full(values.shape, np.nan)
+    valid = np.flatnonzero(~np.isnan(values))
+    if valid.size == 0:
+        return result
+    v = values[valid]
+    g = groups[valid]
+    idx = np.arange(v.size)
+    boundaries = np.r_[True, g[1:] != g[:-1]]
+    group_start = np.maximum.accumulate(np.where(boundaries, idx, 0))
+    low = np.maximum(idx - window, group_start)
+    count = idx - low
+
+    sums = np.r_[0.0, np.cumsum(v)]
+    squares = np.r_[0.0, np.cumsum(v * v)]
+    prior_sum = sums[idx] - sums[low]
+    prior_squares = squares[idx] - squares[low]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = prior_sum / count
+        variance = (prior_squares - count * mean * mean) / (count - 1)
+        std = np.maximum(np.sqrt(np.clip(variance, 0, None)), min_std)
+        z = (v - mean) / std
+    z[count < min_history] = np.nan
+    result[valid] = z
+    return result
+
+
+def compute_flags(rows):
+    """
+    Evaluate every rule over ``rows`` (tuples shaped like ``FIELDS``, sorted by
+    patient then record date) and return ``VitalsFlag`` instances, unsaved.
+    """
+    if not rows:
+        return []
+    record_ids = np.array([row[0] for row in rows])
+    patients = np.array([row[1] for row in rows])
+    systolic = _column(rows, 4)
+    diastolic = _column(rows, 5)
+    heart_rate = _column(rows, 6)
+    temperature = _column(rows, 7)
+    weight = _column(rows, 8)
+    pediatric = _ages(rows) < PEDIATRIC_AGE
+
+    with np.errstate(invalid='ignore'):
+        # A crisis stores the pressure that set it off, systolic when both did.
+        crisis = np.where(systolic >= 180, systolic, diastolic)
+        rules = [
+            (Kinds.HYPERTENSIVE_CRISIS, Severity.CRITICAL, crisis, (systolic >= 180) | (diastolic >= 120)),
+            (Kinds.HYPOTENSION, Severity.WARNING, systolic, (systolic < 90) & ~pediatric),
+            (Kinds.TACHYCARDIA, Severity.CRITICAL, heart_rate, heart_rate >= np.where(pediatric, 180, 130)),
+            (Kinds.TACHYCARDIA, Severity.WARNING, heart_rate,
+             (heart_rate > np.where(pediatric, 140, 100)) & (heart_rate < np.where(pediatric, 180, 130))),
+            (Kinds.BRADYCARDIA, Severity.WARNING, heart_rate, heart_rate < np.where(pediatric, 60, 50)),
+            (Kinds.FEVER, Severity.CRITICAL, temperature, temperature >= 39.5),
+            (Kinds.FEVER, Severity.WARNING, temperature, (temperature >= 38.0) & (temperature < 39.5)),
+            (Kinds.HYPOTHERMIA, Severity.CRITICAL, temperature, temperature < 35.0),
+        ]
+        zscores = {}
+        for field, values in (('weight', weight), ('systolic_bp', systolic), ('heart_rate', heart_rate)):
+            z = rolling_zscores(patients, values, min_std=MIN_STD[field])
+            zscores[DEVIATION_KINDS[field]] = z
+            rules.append((DEVIATION_KINDS[field], Severity.WARNING, values, np.abs(z) >= Z_THRESHOLD))
+
+    dates = {row[0]: row[2] for row in rows}
+    flags = []
+    for kind, severity, values, mask in rules:
+        z = zscores.get(kind)
+        for i in np.flatnonzero(mask & ~np.isnan(values)):
+            flags.append(VitalsFlag(
+                record_id=int(record_ids[i]),
+                patient_id=int(patients[i]),
+                record_date=dates[record_ids[i]],
+                kind=kind,
+                severity=severity,
+                value=float(values[i]),
+                zscore=None if z is None else round(float(z[i]), 2),
+            ))
+    return flags
+
+
+def _store(flags, existing):
+    """Replace the ``existing`` flags, keeping acknowledgements of flags that still apply."""
+    acknowledged = {
+        (record_id, kind): (at, by)
+        for record_id, kind, at, by in existing.filter(acknowledged_at__isnull=False).values_list(
+            'record_id', 'kind', 'acknowledged_at', 'acknowledged_by_id',
+        )
+    }
+    for flag in flags:
+        if (flag.record_id, flag.kind) in acknowledged:
+            flag.acknowledged_at, flag.acknowledged_by_id = acknowledged[(flag.record_id, flag.kind)]
+    with transaction.atomic():
+        existing.delete()
+        # A concurrent recompute of the same record may have stored its flags
+        # meanwhile; overwrite those rather than skipping rows (which would
+        # also hide rows the database rejected).
+        VitalsFlag.objects.bulk_create(
+            flags,
+            update_conflicts=True,
+            unique_fields=['record', 'kind'],
+            update_fields=['record_date', 'severity', 'value', 'zscore', 'acknowledged_at', 'acknowledged_by'],
+        )
+
+
+def flag_patients(patient_ids):
+    """Recompute flags for every reading of the given patients; returns the number stored."""
+    rows = list(
+        PatientHealthRecord.objects.filter(patient_id__in=patient_ids)
+        .order_by('patient_id', 'record_date', 'pk')
+        .values_list(*FIELDS)
+    )
+    flags = compute_flags(rows)
+    _store(flags, VitalsFlag.objects.filter(patient_id__in=patient_ids))
+    return len(flags)
+
+
+def flag_record(record_id):
+    """Recompute flags for one reading against the patient's recent history."""
+    record = PatientHealthRecord.objects.filter(pk=record_id).values('patient_id', 'record_date').first()
+    if record is None:
+        return []
+    history = (
+        PatientHealthRecord.objects.filter(patient_id=record['patient_id'], record_date__lte=record['record_date'])
+        .exclude(pk=record_id)
+        .order_by('-record_date', '-pk')
+        .values_list(*FIELDS)[:WINDOW]
+    )
+    current = PatientHealthRecord.objects.filter(pk=record_id).values_list(*FIELDS)
+    rows = list(reversed(history)) + list(current)
+    flags = [flag for flag in compute_flags(rows) if flag.record_id == record_id]
+    _store(flags, VitalsFlag.objects.filter(record_id=record_id))
+    return flags
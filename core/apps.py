@@ -7,4 +7,6 @@ class CoreConfig(AppConfig):
 
     def ready(self):
         # Import signal handlers for profile provisioning.
-        from . import signals  # noqa: F401
\ No newline at end of file
+        from . import signals  # noqa: F401
+        # Register background job handlers.
+        from . import tasks  # noqa: F401
\ No newline at end of file
@@ -0,0 +1,222 @@
+"""
+Cold-storage tier for old health records.
+
+``archive_records`` moves records older than ``RECORD_ARCHIVE_AFTER_DAYS``
+from ``PatientHealthRecord`` into ``ArchivedHealthRecord``, a lean table
+with only the indexes needed to page a patient's history and to answer
+"has this patient visited this department/doctor".  Each batch is one
+transaction (copy, roll up, delete), so the command can be interrupted and
+simply run again.
+
+Totals over all history stay correct without scanning the archive:
+``ArchiveRollup`` keeps per-year counts and vitals sums grouped by
+department, diagnosis, visit type and BMI band, and the helpers below add
+them to the figures computed from the hot table.  Patient membership
+questions use the archive's indexes directly.
+
+Anomaly flags of archived records are dropped with them; ``restore``
+recomputes them for the patients whose history comes back.
+"""
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import router, transaction
+from django.db.models import Count, F, Q, Sum
+from django.utils import timezone
+
+from .anomalies import flag_patients
+from .cohorts import bmi_band
+from .models import ArchivedHealthRecord, ArchiveRollup, Patient, PatientHealthRecord, VitalsFlag
+from .stats import invalidate_department_stats
+
+COPIED_FIELDS = (
+    'patient_id', 'record_date', 'doctor_id', 'department_id',
+    'systolic_bp', 'diastolic_bp', 'heart_rate', 'temperature', 'weight', 'height', 'bmi',
+    'symptoms', 'diagnosis', 'medications', 'notes', 'visit_type',
+    'diagnosis_ref_id', 'visit_type_ref_id', 'created_at',
+)
+
+ROLLUP_VITALS = {'systolic_bp': 'systolic', 'diastolic_bp': 'diastolic', 'heart_rate': 'heart_rate'}
+
+
+def archive_horizon():
+    return timezone.now() - timedelta(days=settings.RECORD_ARCHIVE_AFTER_DAYS)
+
+
+def _apply_rollups(rows, sign):
+    totals = defaultdict(Counter)
+    for row in rows:
+        key = (
+            row['record_date'].year,
+            row['department_id'],
+            row['diagnosis_ref_id'],
+            row['visit_type_ref_id'],
+            bmi_band(row['bmi']) if row['bmi'] is not None else '',
+        )
+        group = totals[key]
+        group['record_count'] += 1
+        for field, prefix in ROLLUP_VITALS.items():
+            if row[field] is not None:
+                group[f'{prefix}_sum'] += row[field]
+                group[f'{prefix}_count'] += 1
+
+    for (year, department_id, diagnosis_id, visit_type_id, band), group in totals.items():
+        rollup, _ = ArchiveRollup.objects.get_or_create(
+            year=year,
+            department_id=department_id,
+            diagnosis_ref_id=diagnosis_id,
+            visit_type_ref_id=visit_type_id,
+            bmi_band=band,
+        )
+        ArchiveRollup.objects.filter(pk=rollup.pk).update(
+            **{name: F(name) + sign * value for name, value in group.items()}
+        )
+    if sign < 0:
+        ArchiveRollup.objects.filter(record_count=0).delete()
+
+
+def _after_commit(patient_ids, department_ids, reflag=False):
+    def run():
+        invalidate_department_stats(*department_ids)
+        if reflag and patient_ids:
+            flag_patients(sorted(patient_ids))
+
+    transaction.on_commit(run)
+
+
+def archive_batch(cutoff, batch_size=1000):
+    """Move the oldest ``batch_size`` records dated before ``cutoff``; returns how many moved."""
+    with transaction.atomic():
+        rows = list(
+            PatientHealthRecord.objects.filter(record_date__lt=cutoff)
+            .order_by('pk')
+            .values('pk', *COPIED_FIELDS)[:batch_size]
+        )
+        if not rows:
+            return 0
+        ArchivedHealthRecord.objects.bulk_create([
+            ArchivedHealthRecord(original_id=row['pk'], **{field: row[field] for field in COPIED_FIELDS})
+            for row in rows
+        ])
+        _apply_rollups(rows, +1)
+        ids = [row['pk'] for row in rows]
+        VitalsFlag.objects.filter(record_id__in=ids).delete()
+        # A plain delete() would reload every row to send post_delete; the
+        # batch refreshes department stats once below, and cohorts span
+        # both tiers so archiving leaves them unchanged.
+        PatientHealthRecord.objects.filter(pk__in=ids)._raw_delete(router.db_for_write(PatientHealthRecord))
+        _after_commit({row['patient_id'] for row in rows}, {row['department_id'] for row in rows})
+    return len(rows)
+
+
+def restore_batch(archived, batch_size=1000):
+    """Move up to ``batch_size`` rows of the ``archived`` queryset back to the hot table."""
+    with transaction.atomic():
+        rows = list(archived.order_by('pk').values('pk', 'original_id', *COPIED_FIELDS)[:batch_size])
+        if not rows:
+            return 0
+        PatientHealthRecord.objects.bulk_create([
+            PatientHealthRecord(pk=row['original_id'], **{field: row[field] for field in COPIED_FIELDS})
+            for row in rows
+        ])
+        _apply_rollups(rows, -1)
+        ArchivedHealthRecord.objects.filter(pk__in=[row['pk'] for row in rows]).delete()
+        _after_commit({row['patient_id'] for row in rows}, {row['department_id'] for row in rows}, reflag=True)
+    return len(rows)
+
+
+def discard_archived(archived):
+    """Delete archived rows for good, taking them out of the rollups."""
+    with transaction.atomic():
+        rows = list(archived.values('pk', *COPIED_FIELDS))
+        if rows:
+            _apply_rollups(rows, -1)
+            ArchivedHealthRecord.objects.filter(pk__in=[row['pk'] for row in rows]).delete()
+            _after_commit(set(), {row['department_id'] for row in rows})
+    return len(rows)
+
+
+# Reading across both tiers ------------------------------------------------------
+#
+# Records of soft-deleted patients stay in both tables (and the rollups) until
+# the purge, but are left out of the figures: hot rows are excluded, and the
+# few archived rows of deleted patients are subtracted from the rollups.
+
+def deleted_patients():
+    """Subquery of the soft-deleted patients' keys (served by their partial index)."""
+    return Patient.all_objects.deleted().values('pk')
+
+
+def live_records(**filters):
+    """Hot records matching ``filters``, without those of soft-deleted patients."""
+    return PatientHealthRecord.objects.filter(**filters).exclude(patient__in=deleted_patients())
+
+
+def _deleted_archived(**filters):
+    """Archived records of soft-deleted patients, which the rollups still count."""
+    return ArchivedHealthRecord.objects.filter(patient__in=deleted_patients(), **filters).order_by()
+
+
+def visited(**filters):
+    """``Q`` matching patients with a visit (hot or archived) matching ``filters``."""
+    return (
+        Q(pk__in=PatientHealthRecord.objects.filter(**filters).values('patient_id'))
+        | Q(pk__in=ArchivedHealthRecord.objects.filter(**filters).values('patient_id'))
+    )
+
+
+def record_count(**filters):
+    """Number of records matching ``filters`` (rollup fields only) across both tiers."""
+    archived = ArchiveRollup.objects.filter(**filters).aggregate(total=Sum('record_count'))['total'] or 0
+    return live_records(**filters).count() + archived - _deleted_archived(**filters).count()
+
+
+def record_counts_by(field):
+    """``Counter`` of record counts grouped by a rollup field (e.g. ``diagnosis_ref``) across both tiers."""
+    counts = Counter()
+    for row in live_records().values(field).annotate(count=Count('id')).order_by():
+        counts[row[field]] += row['count']
+    for row in ArchiveRollup.objects.values(field).annotate(count=Sum('record_count')).order_by():
+        counts[row[field]] += row['count']
+    for row in _deleted_archived().values(field).annotate(count=Count('id')):
+        counts[row[field]] -= row['count']
+    return +counts
+
+
+def archived_bmi_bands():
+    """Archived record counts per BMI band label (records without a BMI left out)."""
+    rows = ArchiveRollup.objects.exclude(bmi_band='').values('bmi_band').annotate(count=Sum('record_count'))
+    bands = Counter({row['bmi_band']: row['count'] for row in rows.order_by()})
+    for bmi in _deleted_archived().exclude(bmi__isnull=True).values_list('bmi', flat=True):
+        bands[bmi_band(bmi)] -= 1
+    return dict(+bands)
+
+
+def vitals_averages_by_department():
+    """``{department_id: {'systolic': avg, 'diastolic': avg, 'heart_rate': avg}}`` across both tiers."""
+    sums = defaultdict(Counter)
+    hot = live_records().values('department_id').annotate(
+        **{f'{prefix}_sum': Sum(field) for field, prefix in ROLLUP_VITALS.items()},
+        **{f'{prefix}_count': Count(field) for field, prefix in ROLLUP_VITALS.items()},
+    ).order_by()
+    archived = ArchiveRollup.objects.values('department_id').annotate(
+        **{f'{prefix}_sum': Sum(f'{prefix}_sum') for prefix in ROLLUP_VITALS.values()},
+        **{f'{prefix}_count': Sum(f'{prefix}_count') for prefix in ROLLUP_VITALS.values()},
+    ).order_by()
+    deleted = _deleted_archived().values('department_id').annotate(
+        **{f'{prefix}_sum': Sum(field) for field, prefix in ROLLUP_VITALS.items()},
+        **{f'{prefix}_count': Count(field) for field, prefix in ROLLUP_VITALS.items()},
+    )
+    for rows, sign in ((hot, 1), (archived, 1), (deleted, -1)):
+        for row in rows:
+            for name, value in row.items():
+                if name != 'department_id' and value:
+                    sums[row['department_id']][name] += sign * value
+    return {
+        department_id: {
+            prefix: totals[f'{prefix}_sum'] / totals[f'{prefix}_count'] if totals[f'{prefix}_count'] else None
+            for prefix in ROLLUP_VITALS.values()
+        }
+        for department_id, totals in sums.items()
+    }
@@ -0,0 +1,206 @@
+"""
+Static asset delivery.
+
+Third-party browser libraries are vendored into ``static/vendor/`` by the
+``vendor_assets`` command so that they are fingerprinted, compressed and
+cached like the site's own files; until an asset has been vendored the
+``{% vendored_script %}`` / ``{% vendored_stylesheet %}`` tags fall back to
+its pinned CDN URL.
+
+``CompressedManifestStaticFilesStorage`` writes a gzip and a brotli copy
+of every text asset during ``collectstatic`` (the brotli one needs the
+``Brotli`` package from requirements.txt), so nothing is compressed per
+request.
+``StaticFilesMiddleware`` serves ``STATIC_ROOT`` with the best precompressed
+variant the client accepts.  A fingerprinted name never changes content, so
+it is cached for a year as immutable and repeat page loads only fetch the
+HTML.
+"""
+import gzip
+import mimetypes
+import os
+from functools import lru_cache
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, staticfiles_storage
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, HttpResponseNotModified
+from django.templatetags.static import static
+from django.utils._os import safe_join
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+try:
+    import brotli
+except ImportError:  # only gzip variants are written without it
+    brotli = None
+
+# name -> (CDN URL, path under static/).  The version is part of the path, so
+# upgrading a library gives it a new URL even without fingerprinting.
+VENDORED_ASSETS = {
+    'chart.js': (
+        'https://cdn.jsdelivr.net/npm/chart.js@4.4.0/dist/chart.umd.min.js',
+        'vendor/chart.js/4.4.0/chart.umd.min.js',
+    ),
+    'bootstrap.css': (
+        'https://cdn.jsdelivr.net/npm/bootstrap@5.3.3/dist/css/bootstrap.min.css',
+        'vendor/bootstrap/5.3.3/bootstrap.min.css',
+    ),
+    'bootstrap.js': (
+        'https://cdn.jsdelivr.net/npm/bootstrap@5.3.3/dist/js/bootstrap.bundle.min.js',
+        'vendor/bootstrap/5.3.3/bootstrap.bundle.min.js',
+    ),
+}
+
+COMPRESSIBLE = ('.css', '.js', '.json', '.map', '.svg', '.txt', '.html', '.xml', '.ico')
+# Below this a compressed copy saves less than the extra header costs.
+MIN_COMPRESS_SIZE = 256
+
+# Preferred first.
+ENCODINGS = [('br', '.br', brotli.compress)] if brotli else []
+ENCODINGS.append(('gzip', '.gz', lambda data: gzip.compress(data, compresslevel=9, mtime=0)))
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+
+@lru_cache(maxsize=None)
+def _is_vendored(path):
+    return finders.find(path) is not None
+
+
+def vendored_url(name):
+    """URL of a vendored asset: the local static file once vendored, else the CDN."""
+    cdn_url, path = VENDORED_ASSETS[name]
+    return static(path) if _is_vendored(path) else cdn_url
+
+
+def precompress(path):
+    """Write compressed variants next to ``path``; returns the files written."""
+    data = Path(path).read_bytes()
+    written = []
+    for _, suffix, compress in ENCODINGS:
+        target = Path(f'{path}{suffix}')
+        compressed = compress(data) if len(data) >= MIN_COMPRESS_SIZE else b''
+        if compressed and len(compressed) < len(data) * 0.95:
+            target.write_bytes(compressed)
+            written.append(target)
+        else:
+            # Not worth it; make sure a variant from an older version is not served.
+            target.unlink(missing_ok=True)
+    return written
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """Fingerprinting storage that also precompresses text assets."""
+
+    # Source maps are not vendored with the libraries, so their comments are
+    # left alone instead of failing collectstatic on the missing files (the
+    # browser only asks for them with its developer tools open).
+    patterns = tuple(
+        (extension, tuple(
+            pattern for pattern in extension_patterns
+            if 'sourceMappingURL' not in (pattern[0] if isinstance(pattern, tuple) else pattern)
+        ))
+        for extension, extension_patterns in ManifestStaticFilesStorage.patterns
+    )
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        # Both names are collected: templates only ever link the hashed one,
+        # but other files may still refer to the original.
+        names = set(paths) | set(self.hashed_files.values())
+        for name in sorted(names):
+            if name.endswith(COMPRESSIBLE):
+                precompress(self.path(name))
+
+
+def accepted_encodings(header):
+    """Content codings the client accepts, from an ``Accept-Encoding`` header."""
+    codings = set()
+    for item in header.split(','):
+        coding, _, params = item.partition(';')
+        coding = coding.strip().lower()
+        name, _, value = params.strip().partition('=')
+        if not coding:
+            continue
+        if name.strip().lower() == 'q':
+            try:
+                if float(value) <= 0:
+                    continue
+            except ValueError:
+                continue
+        codings.add(coding)
+    return codings
+
+
+class StaticFilesMiddleware:
+    """
+    Serves ``STATIC_URL`` from ``STATIC_ROOT`` (after ``collectstatic``),
+    picking a precompressed variant by ``Accept-Encoding``.  Enabled in
+    ``settings_production``; development keeps using runserver's handler.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        self.prefix = settings.STATIC_URL
+        self.root = str(settings.STATIC_ROOT)
+        # Names listed in the manifest carry a content hash.
+        self.immutable = frozenset(getattr(staticfiles_storage, 'hashed_files', {}).values())
+
+    def is_static(self, request):
+        return request.method in ('GET', 'HEAD') and request.path_info.startswith(self.prefix)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if self.is_static(request):
+            response = self.serve(request, request.path_info[len(self.prefix):])
+            if response is not None:
+                return response
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        if self.is_static(request):
+            response = await sync_to_async(self.serve)(request, request.path_info[len(self.prefix):])
+            if response is not None:
+                return response
+        return await self.get_response(request)
+
+    def serve(self, request, name):
+        try:
+            path = safe_join(self.root, name)
+        except SuspiciousFileOperation:
+            return None
+        if not os.path.isfile(path):
+            return None
+
+        served, encoding = path, None
+        accepted = accepted_encodings(request.headers.get('Accept-Encoding', ''))
+        for coding, suffix, _ in ENCODINGS:
+            if coding in accepted and os.path.isfile(path + suffix):
+                served, encoding = path + suffix, coding
+                break
+
+        mtime = os.stat(served).st_mtime
+        if not was_modified_since(request.headers.get('If-Modified-Since'), mtime):
+            response = HttpResponseNotModified()
+        else:
+            content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+            response = FileResponse(open(served, 'rb'), content_type=content_type, filename=os.path.basename(name))
+            if encoding:
+                response['Content-Encoding'] = encoding
+        response['Last-Modified'] = http_date(mtime)
+        response['Cache-Control'] = IMMUTABLE if name in self.immutable else 'public, max-age=60'
+        patch_vary_headers(response, ['Accept-Encoding'])
+        return response
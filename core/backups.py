@@ -0,0 +1,285 @@
+"""
+Online snapshots of the SQLite database.
+
+``backup_db`` copies the live database with SQLite's online backup API,
+``BACKUP_STEP_PAGES`` pages at a time with a ``BACKUP_STEP_SLEEP`` pause
+after each step.  A step holds a shared lock only while it copies its
+pages, so requests and workers keep committing while a backup runs, unlike
+copying the file (which can catch a half-written transaction) or
+``VACUUM INTO`` (which holds its read lock, and so blocks every commit,
+until it is done).  A commit by another connection makes SQLite start the
+copy over; after ``MAX_RESTARTS`` of those the database is copied in one
+step, which holds commits back for as long as that takes (about two
+seconds per gigabyte; readers are never held back, nor are writers in WAL
+journal mode).
+
+The copy is checked with ``PRAGMA integrity_check`` and gzipped into
+``BACKUP_DIR`` beside a JSON manifest holding the SHA-256 of the database
+and of the compressed file; the manifest is written last, so a snapshot
+without one is incomplete and ignored.  The newest ``BACKUP_KEEP``
+snapshots are kept; labelled ones (such as the ``pre-restore`` copy
+``restore_db`` takes) are not rotated and stay until deleted by hand.
+
+``restore_db`` verifies both checksums and the integrity of a snapshot
+before copying it back, also with the backup API, so connections other
+processes hold stay valid (they should still be restarted to drop their
+caches).
+
+With ``ANALYTICS_REPLICA`` set, every snapshot also replaces that file by
+an atomic rename, giving reporting tools a consistent copy to query that
+never locks the live database.
+"""
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+MAX_RESTARTS = 3
+CHUNK_SIZE = 1 << 20
+
+
+class SnapshotError(Exception):
+    pass
+
+
+class _TooBusy(Exception):
+    pass
+
+
+def online_copy(source, target_path, pages=None, sleep=None, max_restarts=MAX_RESTARTS):
+    """
+    Copy the database of the ``source`` sqlite3 connection to ``target_path``
+    in steps; returns how many times writes made the copy start over.
+    """
+    pages = pages or settings.BACKUP_STEP_PAGES
+    sleep = settings.BACKUP_STEP_SLEEP if sleep is None else sleep
+    restarts = 0
+    last_remaining = None
+
+    def progress(status, remaining, total):
+        nonlocal restarts, last_remaining
+        # A step that started over copies as many pages as it did before;
+        # a step that found the database locked copies none and is retried.
+        if status == sqlite3.SQLITE_OK and last_remaining is not None and remaining >= last_remaining:
+            restarts += 1
+            if restarts > max_restarts:
+                raise _TooBusy
+        last_remaining = remaining
+        if remaining and sleep:
+            time.sleep(sleep)
+
+    target = sqlite3.connect(target_path)
+    try:
+        try:
+            source.backup(target, pages=pages, progress=progress)
+        except _TooBusy:
+            source.backup(target, pages=-1)
+    finally:
+        target.close()
+    return restarts
+
+
+def integrity_check(path):
+    """``'ok'``, or the problems ``PRAGMA integrity_check`` found in the database file."""
+    database = sqlite3.connect(f'{Path(path).resolve().as_uri()}?mode=ro', uri=True)
+    try:
+        return '; '.join(row[0] for row in database.execute('PRAGMA integrity_check'))
+    except sqlite3.DatabaseError as exc:
+        return str(exc)
+    finally:
+        database.close()
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        while chunk := file.read(CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _replace(source, destination):
+    """Copy ``source`` over ``destination`` so that readers see either file whole."""
+    destination = Path(destination)
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    partial = destination.with_name(destination.name + '.partial')
+    shutil.copyfile(source, partial)
+    os.replace(partial, destination)
+
+
+def _database(using):
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        raise SnapshotError("Snapshots are taken of SQLite databases only; use the database's own tools.")
+    connection.ensure_connection()
+    return connection
+
+
+def create_snapshot(using='default', directory=None, keep=None, replica=None, label='', pages=None, sleep=None):
+    """Snapshot the database into ``directory`` (default ``BACKUP_DIR``); returns the manifest."""
+    connection = _database(using)
+    directory = Path(directory or settings.BACKUP_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    created_at = timezone.now()
+    name = created_at.strftime('db-%Y%m%dT%H%M%SZ') + (f'-{label}' if label else '')
+    if (directory / f'{name}.json').exists():
+        name += created_at.strftime('-%f')
+    started = time.monotonic()
+
+    with tempfile.TemporaryDirectory(dir=directory) as scratch:
+        copy = Path(scratch, 'db.sqlite3')
+        restarts = online_copy(connection.connection, copy, pages, sleep)
+        copied = time.monotonic()
+        problems = integrity_check(copy)
+        if problems != 'ok':
+            raise SnapshotError(f'The copy failed its integrity check: {problems}')
+
+        archive = directory / f'{name}.sqlite3.gz'
+        partial = archive.with_name(archive.name + '.partial')
+        with open(copy, 'rb') as source, gzip.open(partial, 'wb', compresslevel=6) as target:
+            shutil.copyfileobj(source, target, CHUNK_SIZE)
+        os.replace(partial, archive)
+        manifest = {
+            'name': name,
+            'label': label,
+            'file': archive.name,
+            'created_at': created_at.isoformat(),
+            'source': str(connection.settings_dict['NAME']),
+            'size': copy.stat().st_size,
+            'compressed_size': archive.stat().st_size,
+            'sha256': _sha256(copy),
+            'compressed_sha256': _sha256(archive),
+            'copy_seconds': round(copied - started, 3),
+            'restarts': restarts,
+        }
+        manifest_path = directory / f'{name}.json'
+        partial = manifest_path.with_name(manifest_path.name + '.partial')
+        partial.write_text(json.dumps(manifest, indent=2))
+        os.replace(partial, manifest_path)
+
+        replica = settings.ANALYTICS_REPLICA if replica is None else replica
+        if replica:
+            _replace(copy, replica)
+
+    manifest['removed'] = rotate(directory, settings.BACKUP_KEEP if keep is None else keep)
+    return manifest
+
+
+def list_snapshots(directory=None):
+    """Manifests of the complete snapshots in ``directory``, oldest first."""
+    directory = Path(directory or settings.BACKUP_DIR)
+    manifests = []
+    for path in directory.glob('db-*.json'):
+        try:
+            manifests.append(json.loads(path.read_text()))
+        except (OSError, ValueError):
+            continue
+    return sorted(manifests, key=lambda manifest: manifest['created_at'])
+
+
+def latest_snapshot_time(directory=None):
+    """When the newest snapshot was taken, or None."""
+    snapshots = list_snapshots(directory)
+    return parse_datetime(snapshots[-1]['created_at']) if snapshots else None
+
+
+def rotate(directory=None, keep=None):
+    """
+    Delete all but the newest ``keep`` unlabelled snapshots (0 keeps all);
+    returns the names removed.
+    """
+    directory = Path(directory or settings.BACKUP_DIR)
+    keep = settings.BACKUP_KEEP if keep is None else keep
+    if not keep:
+        return []
+    stale = [manifest for manifest in list_snapshots(directory) if not manifest.get('label')][:-keep]
+    for manifest in stale:
+        (directory / f"{manifest['name']}.json").unlink(missing_ok=True)
+        (directory / manifest['file']).unlink(missing_ok=True)
+    return [manifest['name'] for manifest in stale]
+
+
+def find_snapshot(name=None, directory=None):
+    """The manifest of snapshot ``name`` (or the path of its manifest), or of the newest one."""
+    directory = Path(directory or settings.BACKUP_DIR)
+    if name and Path(name).suffix in ('.json', '.gz') and Path(name).exists():
+        directory = Path(name).parent
+        name = Path(name).name.split('.')[0]
+    snapshots = list_snapshots(directory)
+    if name:
+        snapshots = [manifest for manifest in snapshots if manifest['name'] == name]
+    if not snapshots:
+        raise SnapshotError(f'No snapshot {name} in {directory}.' if name else f'No snapshots in {directory}.')
+    manifest = dict(snapshots[-1])
+    manifest['directory'] = str(directory)
+    return manifest
+
+
+def extract_snapshot(manifest, path):
+    """
+    Decompress a snapshot to ``path`` and check it: both checksums, the
+    integrity check, and that it is a database of this project.
+    """
+    archive = Path(manifest['directory'], manifest['file'])
+    if not archive.exists():
+        raise SnapshotError(f'{archive} is missing.')
+    if _sha256(archive) != manifest['compressed_sha256']:
+        raise SnapshotError(f'{archive.name} does not match its checksum; the file is damaged.')
+    digest = hashlib.sha256()
+    try:
+        with gzip.open(archive, 'rb') as source, open(path, 'wb') as target:
+            while chunk := source.read(CHUNK_SIZE):
+                digest.update(chunk)
+                target.write(chunk)
+    except (OSError, EOFError) as exc:
+        raise SnapshotError(f'{archive.name} cannot be decompressed: {exc}') from None
+    if digest.hexdigest() != manifest['sha256']:
+        raise SnapshotError(f'The database in {archive.name} does not match its checksum.')
+    problems = integrity_check(path)
+    if problems != 'ok':
+        raise SnapshotError(f'The database in {archive.name} failed its integrity check: {problems}')
+    database = sqlite3.connect(path)
+    try:
+        migrations = database.execute("SELECT COUNT(*) FROM django_migrations WHERE app = 'core'").fetchone()[0]
+    except sqlite3.DatabaseError:
+        migrations = 0
+    finally:
+        database.close()
+    if not migrations:
+        raise SnapshotError(f'{archive.name} is not a database of this project.')
+
+
+def verify_snapshot(manifest):
+    """Check a snapshot as ``extract_snapshot`` does, without keeping the copy."""
+    with tempfile.TemporaryDirectory(dir=manifest['directory']) as scratch:
+        extract_snapshot(manifest, Path(scratch, 'db.sqlite3'))
+
+
+def restore_snapshot(manifest, using='default', target=None):
+    """
+    Verify a snapshot and copy it over the live database, or into the file
+    ``target`` when given.
+    """
+    connection = _database(using) if target is None else None
+    with tempfile.TemporaryDirectory(dir=manifest['directory']) as scratch:
+        copy = Path(scratch, 'db.sqlite3')
+        extract_snapshot(manifest, copy)
+        if target is not None:
+            _replace(copy, target)
+            return
+        source = sqlite3.connect(copy)
+        try:
+            # One step: the live database is locked until the copy is complete.
+            source.backup(connection.connection)
+        finally:
+            source.close()
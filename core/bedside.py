@@ -0,0 +1,296 @@
+"""
+Bedside monitor readings streamed over a socket into ``VitalsReading``.
+
+``serve_vitals`` runs a ``VitalsServer`` on an asyncio event loop.
+Monitors, or a gateway in front of them, connect over TCP or a Unix socket
+and send newline-delimited JSON, one reading per line:
+
+    {"patient_id": "PAT00001", "bed": "ICU-4", "recorded_at": "2026-10-19T09:30:05Z",
+     "heart_rate": 82, "systolic_bp": 121, "diastolic_bp": 79}
+
+``recorded_at`` may also be Unix seconds and defaults to the time of
+receipt; at least one vital is required.  Nothing is sent back: rejected
+lines are only counted, and a connection sending a line longer than
+``MAX_LINE`` bytes is closed.
+
+Accepted readings go into a bounded queue that one writer drains in
+micro-batches: a batch is written with a single ``bulk_create`` once it
+holds ``batch_size`` readings or its first reading has waited
+``max_delay`` seconds.  When the database falls behind, batches grow to
+``batch_size`` and then the queue fills up; connections are not read again
+until there is room, so TCP flow control slows the senders down rather than
+the server buffering without limit.
+
+Readings are kept out of ``PatientHealthRecord``: one every few seconds
+per bed would swamp the visit counts, charts and anomaly checks built on
+health records.
+
+Metrics are recorded with ``core.metrics``; set ``METRICS_DIR`` so that
+``/metrics`` of the web processes includes them.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import Counter
+from contextlib import suppress
+from datetime import datetime, timezone as dt_timezone
+
+from asgiref.sync import sync_to_async
+from django.db import DatabaseError, IntegrityError, close_old_connections
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import metrics
+from .ingest import FeedError, PatientLookup, _aware
+from .models import VitalsReading
+
+logger = logging.getLogger(__name__)
+
+MAX_LINE = 4096
+
+# Same bounds as the PatientHealthRecord validators.
+VITAL_LIMITS = {
+    'heart_rate': (0, 300),
+    'systolic_bp': (0, 300),
+    'diastolic_bp': (0, 200),
+}
+
+# Patients unknown when first seen are looked up again after this long.
+LOOKUP_TTL = 60
+
+# A batch the database refused for a transient reason is retried after a
+# delay that doubles up to this many seconds, at most MAX_RETRIES times;
+# after that its readings are counted as failed and the next batch is written.
+MAX_RETRY_DELAY = 5.0
+MAX_RETRIES = 5
+
+
+def parse_reading(line):
+    """Turn one NDJSON line into a reading dict; raises FeedError."""
+    try:
+        data = json.loads(line)
+    except ValueError as exc:
+        raise FeedError(f'invalid JSON: {exc}') from None
+    if not isinstance(data, dict):
+        raise FeedError('not a JSON object')
+    patient_id = data.get('patient_id')
+    if not isinstance(patient_id, str) or not patient_id:
+        raise FeedError('no patient_id')
+
+    vitals = {}
+    for field, (low, high) in VITAL_LIMITS.items():
+        value = data.get(field)
+        if value is None:
+            continue
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or not low <= value <= high:
+            raise FeedError(f'{field} must be a number from {low} to {high}')
+        vitals[field] = round(value)
+    if not vitals:
+        raise FeedError('no vitals')
+
+    received_at = timezone.now()
+    recorded_at = data.get('recorded_at')
+    # Well-formed but impossible values (February 30th, 1e20 seconds, NaN)
+    # raise ValueError or OverflowError rather than returning None.
+    try:
+        if recorded_at is None:
+            recorded_at = received_at
+        elif isinstance(recorded_at, (int, float)) and not isinstance(recorded_at, bool):
+            recorded_at = datetime.fromtimestamp(recorded_at, tz=dt_timezone.utc)
+        elif isinstance(recorded_at, str) and parse_datetime(recorded_at):
+            recorded_at = _aware(parse_datetime(recorded_at))
+        else:
+            recorded_at = None
+    except (ValueError, OverflowError, OSError):
+        recorded_at = None
+    if recorded_at is None:
+        raise FeedError('recorded_at must be an ISO 8601 timestamp or Unix seconds')
+
+    return {
+        'patient_id': patient_id,
+        'bed': str(data.get('bed') or '')[:40],
+        'recorded_at': recorded_at,
+        'received_at': received_at,
+        'received': time.monotonic(),
+        'vitals': vitals,
+    }
+
+
+class VitalsWriter:
+    """Inserts batches of readings; runs in the database thread."""
+
+    def __init__(self):
+        self.patients = PatientLookup()
+        self.loaded = time.monotonic()
+
+    def write(self, readings):
+        """Insert a batch; returns the number stored (readings of unknown patients are dropped)."""
+        close_old_connections()
+        if time.monotonic() - self.loaded > LOOKUP_TTL:
+            self.patients, self.loaded = PatientLookup(), time.monotonic()
+        self.patients.prefetch(readings)
+        rows = []
+        for reading in readings:
+            patient_id = self.patients.get(reading)
+            if patient_id is not None:
+                rows.append(VitalsReading(
+                    patient_id=patient_id,
+                    bed=reading['bed'],
+                    recorded_at=reading['recorded_at'],
+                    received_at=reading['received_at'],
+                    **reading['vitals'],
+                ))
+        VitalsReading.objects.bulk_create(rows)
+        metrics.maybe_flush()
+        return len(rows)
+
+
+class VitalsServer:
+    def __init__(self, batch_size=500, max_delay=0.25, max_queue=10000, writer=None):
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.queue = asyncio.Queue(max_queue)
+        self.writer = writer or VitalsWriter()
+        # Totals since start, for the status line (the metrics hold the same).
+        self.counts = Counter()
+        self.paused = 0.0
+        self.max_lag = 0.0
+        self.connections = set()
+        self.listener = None
+        self.drainer = None
+        self.path = None
+
+    def count(self, outcome, amount=1):
+        self.counts[outcome] += amount
+        metrics.inc('vitals_readings_total', amount, outcome=outcome)
+
+    async def start(self, host='127.0.0.1', port=8765, path=None):
+        if path:
+            self.path = path
+            self.listener = await asyncio.start_unix_server(self.handle, path, limit=MAX_LINE)
+        else:
+            self.listener = await asyncio.start_server(self.handle, host, port, limit=MAX_LINE)
+        self.drainer = asyncio.create_task(self.drain())
+        return self.listener
+
+    async def stop(self):
+        """Stop accepting readings and write out those already queued."""
+        self.listener.close()
+        for connection in list(self.connections):
+            connection.close()
+        await self.listener.wait_closed()
+        if self.path:
+            with suppress(OSError):
+                os.unlink(self.path)
+        await self.queue.join()
+        self.drainer.cancel()
+        with suppress(asyncio.CancelledError):
+            await self.drainer
+
+    async def handle(self, reader, writer):
+        self.connections.add(writer)
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    self.count('rejected')  # longer than MAX_LINE
+                    break
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                try:
+                    reading = parse_reading(line)
+                except FeedError:
+                    self.count('rejected')
+                    continue
+                self.count('accepted')
+                if self.queue.full():
+                    # Backpressure: this connection is not read until the
+                    # writer makes room.
+                    started = time.monotonic()
+                    await self.queue.put(reading)
+                    paused = time.monotonic() - started
+                    self.paused += paused
+                    metrics.inc('vitals_backpressure_seconds_total', paused)
+                else:
+                    self.queue.put_nowait(reading)
+        except ConnectionError:
+            pass
+        finally:
+            self.connections.discard(writer)
+            writer.close()
+            with suppress(ConnectionError):
+                await writer.wait_closed()
+
+    async def next_batch(self):
+        """Wait for a reading, then collect more until the batch is full or due."""
+        loop = asyncio.get_running_loop()
+        batch = [await self.queue.get()]
+        deadline = loop.time() + self.max_delay
+        while len(batch) < self.batch_size:
+            if not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+                continue
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+            except TimeoutError:
+                break
+        return batch
+
+    async def drain(self):
+        while True:
+            batch = await self.next_batch()
+            await self.write(batch)
+            for _ in batch:
+                self.queue.task_done()
+
+    async def write(self, batch):
+        retry_delay = 0.1
+        for attempt in range(MAX_RETRIES + 1):
+            started = time.monotonic()
+            try:
+                stored = await sync_to_async(self.writer.write)(batch)
+                break
+            except IntegrityError as exc:
+                # A patient removed since the lookup; retrying cannot help.
+                logger.error('Dropped a batch of %d readings: %s', len(batch), exc)
+                self.count('failed', len(batch))
+                return
+            except DatabaseError as exc:
+                if attempt == MAX_RETRIES:
+                    logger.error('Dropped a batch of %d readings after %d retries: %s', len(batch), attempt, exc)
+                    self.count('failed', len(batch))
+                    return
+                logger.warning(
+                    'Writing %d readings failed, retrying in %.1fs: %s', len(batch), retry_delay, exc,
+                )
+                await asyncio.sleep(retry_delay)
+                retry_delay = min(retry_delay * 2, MAX_RETRY_DELAY)
+        committed = time.monotonic()
+        metrics.observe('vitals_batch_duration_seconds', committed - started)
+        for reading in batch:
+            metrics.observe('vitals_ingest_lag_seconds', committed - reading['received'])
+        self.max_lag = max(self.max_lag, committed - batch[0]['received'])
+        self.counts['batches'] += 1
+        self.count('stored', stored)
+        if stored < len(batch):
+            self.count('unknown_patient', len(batch) - stored)
+
+    def status(self):
+        """One line of totals since start; resets the maximum lag."""
+        counts = self.counts
+        line = (
+            f"{counts['accepted']} accepted, {counts['stored']} stored, {counts['rejected']} rejected, "
+            f"{counts['unknown_patient']} unknown patients; queue {self.queue.qsize()}/{self.queue.maxsize}, "
+            f"{counts['stored'] / (counts['batches'] or 1):.0f} per batch, max lag {self.max_lag:.2f}s, "
+            f"paused {self.paused:.1f}s"
+        )
+        self.max_lag = 0.0
+        return line
@@ -0,0 +1,305 @@
+"""
+In-memory cohort index used by the dashboard drill-down.
+
+Every filterable attribute value (gender, blood type, age band, city,
+department seen, diagnosis, BMI band, visit type) maps to a bitset of patient
+primary keys.  Bitsets are plain Python integers, so AND/OR/NOT across
+filters are single big-integer operations instead of JOINs with DISTINCT.
+
+The index is built lazily on first use and then maintained incrementally from
+model signals (see ``core.signals``).  Age bands are relative to the build
+date, so the index rebuilds itself when the date rolls over; it is also
+rebuilt after ``MAX_AGE`` seconds to pick up writes made by other processes.
+"""
+import threading
+import time
+
+from django.db.models import Case, CharField, Value, When
+from django.utils import timezone
+
+from .dictionaries import cities, diagnoses, normalize, visit_types
+from .models import ArchivedHealthRecord, Department, Patient, PatientHealthRecord
+
+MAX_AGE = 60 * 10
+
+AGE_BANDS = [
+    ('0-17', 0, 17),
+    ('18-30', 18, 30),
+    ('31-45', 31, 45),
+    ('46-60', 46, 60),
+    ('61-75', 61, 75),
+    ('75+', 76, None),
+]
+
+BMI_BANDS = [
+    ('Underweight (<18.5)', None, 18.5),
+    ('Normal (18.5-24.9)', 18.5, 25),
+    ('Overweight (25-29.9)', 25, 30),
+    ('Obese (≥30)', 30, None),
+]
+
+NOT_SPECIFIED = 'not specified'
+
+ATTRIBUTES = (
+    'gender',
+    'blood_type',
+    'age_group',
+    'city',
+    'department',
+    'diagnosis',
+    'bmi',
+    'visit_type',
+)
+
+
+def age_band(age):
+    for label, low, high in AGE_BANDS:
+        if age >= low and (high is None or age <= high):
+            return label
+    return AGE_BANDS[0][0]
+
+
+def bmi_band(bmi):
+    for label, low, high in BMI_BANDS:
+        if (low is None or bmi >= low) and (high is None or bmi < high):
+            return label
+    return None
+
+
+def _bmi_band_expression():
+    whens = []
+    for label, low, high in BMI_BANDS:
+        bounds = {}
+        if low is not None:
+            bounds['bmi__gte'] = low
+        if high is not None:
+            bounds['bmi__lt'] = high
+        whens.append(When(then=Value(label), **bounds))
+    return Case(*whens, default=Value(None), output_field=CharField())
+
+
+def _age(date_of_birth, today):
+    return today.year - date_of_birth.year - ((today.month, today.day) < (date_of_birth.month, date_of_birth.day))
+
+
+def iter_ids(bitmap, reverse=False):
+    """Yield the primary keys set in ``bitmap`` in ascending (or descending) order."""
+    if bitmap <= 0:
+        return
+    raw = bitmap.to_bytes((bitmap.bit_length() + 7) // 8, 'little')
+    offsets = range(len(raw) - 1, -1, -1) if reverse else range(len(raw))
+    bits = (7, 6, 5, 4, 3, 2, 1, 0) if reverse else (0, 1, 2, 3, 4, 5, 6, 7)
+    for offset in offsets:
+        byte = raw[offset]
+        if not byte:
+            continue
+        base = offset * 8
+        for bit in bits:
+            if byte >> bit & 1:
+                yield base + bit
+
+
+def to_bitmap(ids):
+    bitmap = 0
+    for pk in ids:
+        bitmap |= 1 << pk
+    return bitmap
+
+
+class CohortIndex:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._bitmaps = {}
+        self._patient_keys = {}
+        self.universe = 0
+        self.built_on = None
+        self.built_at = 0.0
+
+    @property
+    def is_built(self):
+        return self.built_on is not None
+
+    def is_stale(self):
+        return (
+            self.built_on != timezone.localdate()
+            or time.monotonic() - self.built_at > MAX_AGE
+        )
+
+    # Building and maintenance -------------------------------------------------
+
+    def _patient_attribute_keys(self, pk, gender, blood_type, date_of_birth, city_id, today):
+        keys = {('gender', gender), ('age_group', age_band(_age(date_of_birth, today))), ('city', city_id)}
+        if blood_type:
+            keys.add(('blood_type', blood_type))
+        return keys
+
+    def _record_keys(self, records):
+        """Yield ``(patient_id, key)`` pairs for the record-derived attributes."""
+        records = records.order_by()
+        for patient_id, department_id in records.values_list('patient_id', 'department_id').distinct():
+            yield patient_id, ('department', department_id)
+        diagnosed = records.filter(diagnosis_ref__isnull=False).values_list('patient_id', 'diagnosis_ref_id')
+        for patient_id, diagnosis_id in diagnosed.distinct():
+            yield patient_id, ('diagnosis', diagnosis_id)
+        for patient_id, visit_type_id in records.values_list('patient_id', 'visit_type_ref_id').distinct():
+            yield patient_id, ('visit_type', visit_type_id)
+        banded = (
+            records.filter(bmi__isnull=False)
+            .annotate(bmi_band=_bmi_band_expression())
+            .values_list('patient_id', 'bmi_band')
+            .distinct()
+        )
+        for patient_id, band in banded:
+            yield patient_id, ('bmi', band)
+
+    def build(self):
+        today = timezone.localdate()
+        patient_keys = {}
+        patients = Patient.objects.order_by().values_list(
+            'pk', 'gender', 'blood_type', 'date_of_birth', 'city_ref_id',
+        )
+        for row in patients.iterator(chunk_size=5000):
+            patient_keys[row[0]] = self._patient_attribute_keys(*row, today=today)
+        for records in (PatientHealthRecord.objects.all(), ArchivedHealthRecord.objects.all()):
+            for patient_id, key in self._record_keys(records):
+                if patient_id in patient_keys:
+                    patient_keys[patient_id].add(key)
+
+        members = {}
+        for pk, keys in patient_keys.items():
+            for key in keys:
+                members.setdefault(key, []).append(pk)
+        bitmaps = {key: to_bitmap(ids) for key, ids in members.items()}
+
+        with self._lock:
+            self._bitmaps = bitmaps
+            self._patient_keys = patient_keys
+            self.universe = to_bitmap(patient_keys)
+            self.built_on = today
+            self.built_at = time.monotonic()
+
+    def invalidate(self):
+        """Drop the index; it is rebuilt on the next query."""
+        with self._lock:
+            self._bitmaps = {}
+            self._patient_keys = {}
+            self.universe = 0
+            self.built_on = None
+
+    def ensure_fresh(self):
+        if not self.is_built or self.is_stale():
+            self.build()
+
+    def _set_keys(self, pk, keys):
+        bit = 1 << pk
+        with self._lock:
+            previous = self._patient_keys.pop(pk, set())
+            for key in previous - keys:
+                remaining = self._bitmaps.get(key, 0) & ~bit
+                if remaining:
+                    self._bitmaps[key] = remaining
+                else:
+                    self._bitmaps.pop(key, None)
+            for key in keys - previous:
+                self._bitmaps[key] = self._bitmaps.get(key, 0) | bit
+            if keys:
+                self._patient_keys[pk] = keys
+                self.universe |= bit
+            else:
+                self.universe &= ~bit
+
+    def refresh_patient(self, pk):
+        """Recompute one patient's memberships after a write."""
+        if not self.is_built:
+            return
+        row = Patient.objects.filter(pk=pk).values_list(
+            'pk', 'gender', 'blood_type', 'date_of_birth', 'city_ref_id',
+        ).first()
+        if row is None:
+            self._set_keys(pk, set())
+            return
+        keys = self._patient_attribute_keys(*row, today=self.built_on)
+        for model in (PatientHealthRecord, ArchivedHealthRecord):
+            keys.update(key for _, key in self._record_keys(model.objects.filter(patient_id=pk)))
+        self._set_keys(pk, keys)
+
+    def remove_patient(self, pk):
+        if self.is_built:
+            self._set_keys(pk, set())
+
+    # Querying -----------------------------------------------------------------
+
+    def resolve_keys(self, attribute, value):
+        """Translate a dashboard label into the index keys it stands for."""
+        if attribute == 'gender':
+            labels = {label.casefold(): code for code, label in Patient.GENDER_CHOICES}
+            return [('gender', labels.get(value.casefold(), value))]
+        if attribute in ('blood_type', 'age_group', 'bmi'):
+            return [(attribute, value)]
+        if attribute == 'department':
+            ids = Department.objects.filter(name__iexact=value.strip()).values_list('pk', flat=True)
+            return [('department', pk) for pk in ids]
+        if attribute in ('city', 'visit_type'):
+            if normalize(value) == NOT_SPECIFIED:
+                return [(attribute, None)]
+            pk = (cities if attribute == 'city' else visit_types).lookup(value)
+            return [(attribute, pk)] if pk is not None else []
+        if attribute == 'diagnosis':
+            pk = diagnoses.lookup(value)
+            return [('diagnosis', pk)] if pk is not None else []
+        raise ValueError(f'Unknown cohort attribute: {attribute}')
+
+    def bitmap_for(self, attribute, values):
+        """Union of the bitsets for several values of one attribute."""
+        bitmap = 0
+        for value in values:
+            for key in self.resolve_keys(attribute, value):
+                bitmap |= self._bitmaps.get(key, 0)
+        return bitmap
+
+    def query(self, include=None, exclude=None):
+        """
+        Evaluate a cohort: values of the same attribute are ORed, attributes
+        are ANDed, and every excluded value is removed.
+
+        ``include`` and ``exclude`` map attribute names to lists of labels.
+        """
+        self.ensure_fresh()
+        with self._lock:
+            result = self.universe
+            for attribute, values in (include or {}).items():
+                result &= self.bitmap_for(attribute, values)
+            for attribute, values in (exclude or {}).items():
+                result &= ~self.bitmap_for(attribute, values)
+        return result
+
+
+class CohortResult:
+    """Sequence of patients in a cohort bitmap, newest registration first, for ``Paginator``."""
+
+    def __init__(self, bitmap, fields=None):
+        self.bitmap = bitmap
+        self.fields = fields
+
+    def count(self):
+        return self.bitmap.bit_count()
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        start, stop = index.start or 0, index.stop
+        ids = []
+        for position, pk in enumerate(iter_ids(self.bitmap, reverse=True)):
+            if stop is not None and position >= stop:
+                break
+            if position >= start:
+                ids.append(pk)
+        queryset = Patient.objects.only(*self.fields) if self.fields else Patient.objects
+        patients = queryset.in_bulk(ids)
+        return [patients[pk] for pk in ids if pk in patients]
+
+
+cohort_index = CohortIndex()
@@ -1,14 +1,36 @@
 from functools import wraps
 
+from asgiref.sync import iscoroutinefunction, sync_to_async
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.contrib.auth.views import redirect_to_login
 from django.core.exceptions import PermissionDenied
 
 
+async def aload_user(request):
+    """
+    Resolve ``request.user`` for an async view.
+
+    Under ASGI a template cannot query the database, so the lazy
+    ``request.user`` is replaced by the loaded user, and the patient profile
+    that base.html and the views look up for non-staff users is fetched up
+    front.
+    """
+    user = await request.auser()
+    if user.is_authenticated and not user.is_staff and not user.is_doctor:
+        # Caches the profile, or its absence, on the user.
+        await sync_to_async(getattr)(user, 'patient_profile', None)
+    request.user = user
+    return user
+
+
 def role_required(*roles):
     """
     Decorator enforcing that the current user has one of the allowed roles.
 
+    Without roles it only requires a logged-in user.  Works on async views
+    as well (see ``aload_user``).
+
     Example:
         @role_required(User.Roles.ADMIN, User.Roles.SUPERADMIN)
         def my_view(...):
@@ -16,6 +38,20 @@ def role_required(*roles):
     """
 
     def decorator(view_func):
+        if iscoroutinefunction(view_func):
+            # Checked inline rather than with login_required, which would
+            # run its test in a worker thread.
+            @wraps(view_func)
+            async def _wrapped(request, *args, **kwargs):
+                user = await aload_user(request)
+                if not user.is_authenticated:
+                    return redirect_to_login(request.get_full_path())
+                if roles and user.role not in roles:
+                    raise PermissionDenied
+                return await view_func(request, *args, **kwargs)
+
+            return _wrapped
+
         @wraps(view_func)
         @login_required
         def _wrapped(request, *args, **kwargs):
@@ -37,4 +73,3 @@ class RoleRequiredMixin(LoginRequiredMixin):
         if self.required_roles and request.user.role not in self.required_roles:
             raise PermissionDenied
         return super().dispatch(request, *args, **kwargs)
-
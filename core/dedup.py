@@ -0,0 +1,284 @@
+"""
+Duplicate patient detection.
+
+Comparing every patient against every other one is quadratic, so patients
+are first grouped by *blocking keys* stored in ``PatientBlockKey``:
+
+* ``name:<soundex of last name>:<birth year>`` catches typos and
+  transliterations of the surname,
+* ``phone:<last 7 digits>`` catches re-registrations with a new email,
+* ``aadhar:<keyed hash>`` catches the same national ID (the number itself is
+  never written to the index).
+
+Only patients that share a key are scored.  ``score`` combines Jaro-Winkler
+similarity of the names with date of birth, phone and email agreement into a
+value between 0 and 1.
+
+``possible_duplicates`` answers the live check on the signup/registration
+forms; ``find_duplicates`` (used by the ``find_duplicates`` command) scores
+every block, optionally across a process pool.
+"""
+import hashlib
+import hmac
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from itertools import combinations
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Count
+
+from .models import Patient, PatientBlockKey
+
+FIELDS = ('pk', 'first_name', 'last_name', 'date_of_birth', 'phone', 'email', 'aadhar_number')
+
+# Scores at or above POSSIBLE are surfaced on the forms; LIKELY is the
+# default cut-off for the batch report.
+POSSIBLE = 0.7
+LIKELY = 0.85
+
+WEIGHTS = {'name': 0.45, 'date_of_birth': 0.3, 'phone': 0.15, 'email': 0.1}
+
+PHONE_SUFFIX = 7
+
+# Blocks larger than this (a very common surname born in the same year) are
+# not expanded into pairs; the other keys of those patients still apply.
+MAX_BLOCK = 500
+
+_SOUNDEX_CODES = {
+    **dict.fromkeys('bfpv', '1'),
+    **dict.fromkeys('cgjkqsxz', '2'),
+    **dict.fromkeys('dt', '3'),
+    'l': '4',
+    **dict.fromkeys('mn', '5'),
+    'r': '6',
+}
+
+
+def soundex(name):
+    """American Soundex code of ``name`` ('' when it has no letters)."""
+    letters = [ch for ch in name.casefold() if 'a' <= ch <= 'z']
+    if not letters:
+        return ''
+    code = letters[0].upper()
+    previous = _SOUNDEX_CODES.get(letters[0], '')
+    for ch in letters[1:]:
+        digit = _SOUNDEX_CODES.get(ch, '')
+        if digit and digit != previous:
+            code += digit
+            if len(code) == 4:
+                break
+        # 'h' and 'w' do not separate letters with the same code; vowels do.
+        if ch not in 'hw':
+            previous = digit
+    return code.ljust(4, '0')
+
+
+def jaro_winkler(a, b, prefix_scale=0.1):
+    """Jaro-Winkler similarity of two strings, 1.0 meaning identical."""
+    if a == b:
+        return 1.0
+    len_a, len_b = len(a), len(b)
+    if not len_a or not len_b:
+        return 0.0
+    window = max(max(len_a, len_b) // 2 - 1, 0)
+    matched_b = [False] * len_b
+    matches_a = []
+    for i, ch in enumerate(a):
+        for j in range(max(0, i - window), min(len_b, i + window + 1)):
+            if not matched_b[j] and b[j] == ch:
+                matched_b[j] = True
+                matches_a.append(ch)
+                break
+    if not matches_a:
+        return 0.0
+    matches_b = [b[j] for j in range(len_b) if matched_b[j]]
+    transpositions = sum(x != y for x, y in zip(matches_a, matches_b)) / 2
+    m = len(matches_a)
+    jaro = (m / len_a + m / len_b + (m - transpositions) / m) / 3
+    prefix = 0
+    for x, y in zip(a[:4], b[:4]):
+        if x != y:
+            break
+        prefix += 1
+    return jaro + prefix * prefix_scale * (1 - jaro)
+
+
+def hash_aadhar(number):
+    return hmac.new(settings.SECRET_KEY.encode(), number.encode(), hashlib.sha256).hexdigest()[:40]
+
+
+def _digits(value):
+    return ''.join(ch for ch in value or '' if ch.isdigit())
+
+
+def prepare(row):
+    """Normalize a ``FIELDS`` dict (or form data) for blocking and scoring."""
+    dob = row.get('date_of_birth')
+    if isinstance(dob, str):
+        try:
+            dob = date.fromisoformat(dob)
+        except ValueError:
+            dob = None
+    return {
+        'pk': row.get('pk'),
+        'first_name': ' '.join((row.get('first_name') or '').split()).casefold(),
+        'last_name': ' '.join((row.get('last_name') or '').split()).casefold(),
+        'date_of_birth': dob,
+        'phone': _digits(row.get('phone'))[-PHONE_SUFFIX:],
+        'email': (row.get('email') or '').strip().casefold(),
+        'aadhar_number': _digits(row.get('aadhar_number')),
+    }
+
+
+def block_keys(row):
+    """Blocking keys of a prepared row."""
+    keys = set()
+    code = soundex(row['last_name'])
+    if code and row['date_of_birth']:
+        keys.add(f"name:{code}:{row['date_of_birth'].year}")
+    if len(row['phone']) == PHONE_SUFFIX:
+        keys.add(f"phone:{row['phone']}")
+    if len(row['aadhar_number']) == 12:
+        keys.add(f"aadhar:{hash_aadhar(row['aadhar_number'])}")
+    return keys
+
+
+def _date_similarity(a, b):
+    if a is None or b is None:
+        return 0.0
+    if a == b:
+        return 1.0
+    if a.year == b.year and (a.month, a.day) == (b.day, b.month):
+        return 0.8  # day and month swapped
+    differing = (a.year != b.year) + (a.month != b.month) + (a.day != b.day)
+    return 0.5 if differing == 1 else 0.0
+
+
+def score(a, b, minimum=0.0):
+    """
+    Similarity of two prepared rows between 0 and 1.
+
+    Pairs that cannot reach ``minimum`` even with identical names score 0.0
+    without the (comparatively costly) name comparison.
+    """
+    if a['aadhar_number'] and a['aadhar_number'] == b['aadhar_number']:
+        return 1.0
+    partial = (
+        WEIGHTS['date_of_birth'] * _date_similarity(a['date_of_birth'], b['date_of_birth'])
+        + WEIGHTS['phone'] * (bool(a['phone']) and a['phone'] == b['phone'])
+        + WEIGHTS['email'] * (bool(a['email']) and a['email'] == b['email'])
+    )
+    if partial + WEIGHTS['name'] < minimum:
+        return 0.0
+    name = (jaro_winkler(a['first_name'], b['first_name']) + jaro_winkler(a['last_name'], b['last_name'])) / 2
+    if name < 1.0:
+        swapped = (jaro_winkler(a['first_name'], b['last_name']) + jaro_winkler(a['last_name'], b['first_name'])) / 2
+        name = max(name, swapped)
+    return round(partial + WEIGHTS['name'] * name, 3)
+
+
+def index_patients(patient_ids):
+    """Rewrite the blocking keys of the given patients."""
+    rows = Patient.objects.filter(pk__in=patient_ids).values(*FIELDS)
+    keys = [
+        PatientBlockKey(patient_id=row['pk'], key=key)
+        for row in rows
+        for key in block_keys(prepare(row))
+    ]
+    with transaction.atomic():
+        PatientBlockKey.objects.filter(patient_id__in=patient_ids).delete()
+        PatientBlockKey.objects.bulk_create(keys, ignore_conflicts=True)
+    return len(keys)
+
+
+def possible_duplicates(data, exclude=None, threshold=POSSIBLE, limit=5, anonymous=False):
+    """
+    Existing patients resembling ``data`` (a dict with ``FIELDS`` names,
+    e.g. form input), best match first, as ``(score, patient_values)`` pairs.
+
+    For ``anonymous`` callers the Aadhar number is ignored and a patient only
+    counts when surname, date of birth and phone all match exactly, so the
+    answer cannot be used to probe Aadhar numbers or partial identities.
+    """
+    candidate = prepare(data)
+    if anonymous:
+        candidate['aadhar_number'] = ''
+    keys = block_keys(candidate)
+    # Oversized blocks are skipped, as in candidate_pairs: a slice of one
+    # would be an arbitrary subset, and the phone and Aadhar keys still apply.
+    blocks = PatientBlockKey.objects.filter(key__in=keys).values('key').annotate(size=Count('pk')).order_by()
+    keys = [block['key'] for block in blocks if block['size'] <= MAX_BLOCK]
+    if not keys:
+        return []
+    ids = PatientBlockKey.objects.filter(key__in=keys).values_list('patient_id', flat=True).distinct()
+    if exclude is not None:
+        ids = ids.exclude(patient_id=exclude)
+    matches = []
+    for row in Patient.objects.filter(pk__in=list(ids)).values('patient_id', *FIELDS):
+        existing = prepare(row)
+        if anonymous and any(
+            not candidate[name] or candidate[name] != existing[name]
+            for name in ('last_name', 'date_of_birth', 'phone')
+        ):
+            continue
+        similarity = score(candidate, existing, threshold)
+        if similarity >= threshold:
+            matches.append((similarity, row))
+    matches.sort(key=lambda match: -match[0])
+    return matches[:limit]
+
+
+_rows = {}
+
+
+def _init_worker(rows):
+    global _rows
+    _rows = rows
+
+
+def _score_pairs(pairs, threshold):
+    found = []
+    for a, b in pairs:
+        similarity = score(_rows[a], _rows[b], threshold)
+        if similarity >= threshold:
+            found.append((similarity, a, b))
+    return found
+
+
+def candidate_pairs(max_block=MAX_BLOCK):
+    """Distinct ``(low pk, high pk)`` pairs sharing a block, plus the number of oversized blocks skipped."""
+    blocks = defaultdict(list)
+    for key, patient_id in PatientBlockKey.objects.order_by('key').values_list('key', 'patient_id').iterator():
+        blocks[key].append(patient_id)
+    pairs = set()
+    skipped = 0
+    for ids in blocks.values():
+        if len(ids) > max_block:
+            skipped += 1
+            continue
+        pairs.update(combinations(sorted(ids), 2))
+    return pairs, skipped
+
+
+def find_duplicates(threshold=LIKELY, processes=1, chunk_size=20000, max_block=MAX_BLOCK):
+    """
+    Score every candidate pair and return ``(score, pk, pk)`` tuples at or
+    above ``threshold``, best first, along with the number of pairs compared.
+    """
+    pairs, _ = candidate_pairs(max_block)
+    pairs = sorted(pairs)
+    rows = {row['pk']: prepare(row) for row in Patient.objects.values(*FIELDS).iterator()}
+    chunks = [pairs[i:i + chunk_size] for i in range(0, len(pairs), chunk_size)]
+    if processes > 1 and len(chunks) > 1:
+        # Forked workers must not share the parent's database connection.
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker, initargs=(rows,)) as pool:
+            results = pool.map(_score_pairs, chunks, [threshold] * len(chunks))
+            found = [match for chunk in results for match in chunk]
+    else:
+        _init_worker(rows)
+        found = [match for chunk in chunks for match in _score_pairs(chunk, threshold)]
+    found.sort(key=lambda match: (-match[0], match[1], match[2]))
+    return found, len(pairs)
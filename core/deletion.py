@@ -0,0 +1,166 @@
+"""
+Deleting patients, doctors and departments.
+
+Deletes are soft (see ``SoftDeleteModel``): a request only sets
+``deleted_at``, which hides the row from the default managers straight away.
+``purge_deleted`` later removes the rows whose retention window
+(``PURGE_AFTER_DAYS``) has passed, off-peak and in batches.
+
+A patient's purge does not go through ``Patient.delete()``, which would
+cascade through Django's collector, loading every related row into memory
+and sending a signal per row.  It removes the dependent rows table by table
+in primary-key chunks with plain ``DELETE`` statements, each chunk in its own
+transaction together with the running count on the patient's audit entry.
+An interrupted purge therefore continues where it stopped, and the audit
+entry ends up with the exact number of rows removed from each table.
+Derived state (department stats, cohort index, archive rollups) is updated
+once per chunk rather than once per row.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import router, transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from .archive import discard_archived
+from .models import (
+    ArchivedHealthRecord,
+    AuditLog,
+    Department,
+    Doctor,
+    Patient,
+    PatientBlockKey,
+    PatientHealthRecord,
+    VitalsFlag,
+    VitalsReading,
+)
+from .stats import invalidate_department_stats
+
+# Rows that reference the patient, in an order that never leaves a dangling
+# foreign key (flags point at health records).
+CASCADE = (VitalsFlag, VitalsReading, PatientBlockKey, PatientHealthRecord, ArchivedHealthRecord)
+
+# Doctors and departments are only purged once nothing refers to them; until
+# then they stay soft-deleted so that historic records keep their names.
+REFERENCES = {
+    Doctor: (PatientHealthRecord, ArchivedHealthRecord),
+    Department: (Doctor, PatientHealthRecord, ArchivedHealthRecord),
+}
+
+
+def purge_cutoff(model, now=None):
+    """Rows of ``model`` soft-deleted before this instant are due for purging."""
+    days = settings.PURGE_AFTER_DAYS[model._meta.model_name]
+    return (now or timezone.now()) - timedelta(days=days)
+
+
+def request_patient_deletion(patients, actor=None, delete_user=False):
+    """
+    Soft-delete ``patients`` and open an audit entry for each one not already
+    deleted; ``delete_user`` also removes their login account when purged.
+    Returns the number of patients deleted.
+    """
+    deleted = 0
+    with transaction.atomic():
+        for patient in patients:
+            if patient.is_deleted:
+                continue
+            patient.soft_delete()
+            AuditLog.objects.create(
+                actor=actor,
+                action='delete_patient',
+                target=patient.patient_id,
+                details={'patient': patient.pk, 'state': 'pending', 'delete_user': delete_user, 'deleted': {}},
+            )
+            deleted += 1
+    return deleted
+
+
+def _record(audit, label, count):
+    deleted = audit.details.setdefault('deleted', {})
+    deleted[label] = deleted.get(label, 0) + count
+    audit.save(update_fields=['details'])
+
+
+def _delete_chunk(model, patient_id, chunk_size, audit):
+    """Delete one chunk of ``model`` rows belonging to the patient; returns the number removed."""
+    with transaction.atomic():
+        rows = model.objects.filter(patient_id=patient_id).order_by('pk')
+        if model is PatientHealthRecord:
+            chunk = list(rows.values_list('pk', 'department_id')[:chunk_size])
+            ids = [pk for pk, _ in chunk]
+            departments = {department_id for _, department_id in chunk}
+            transaction.on_commit(lambda: invalidate_department_stats(*departments))
+        else:
+            ids = list(rows.values_list('pk', flat=True)[:chunk_size])
+        if not ids:
+            return 0
+        if model is ArchivedHealthRecord:
+            # Goes through core.archive so the rollups are decremented too.
+            count = discard_archived(model.objects.filter(pk__in=ids))
+        else:
+            count = model.objects.filter(pk__in=ids)._raw_delete(router.db_for_write(model))
+        _record(audit, model._meta.label, count)
+    return count
+
+
+def purge_patient(patient, chunk_size=None):
+    """Physically remove a soft-deleted patient; returns the per-table counts."""
+    chunk_size = chunk_size or settings.DELETE_CHUNK_SIZE
+    audit = (
+        AuditLog.objects.filter(action='delete_patient', details__patient=patient.pk, details__state='pending')
+        .order_by('-created_at')
+        .first()
+    )
+    if audit is None:
+        audit = AuditLog.objects.create(
+            action='delete_patient',
+            target=patient.patient_id,
+            details={'patient': patient.pk, 'state': 'pending', 'delete_user': False, 'deleted': {}},
+        )
+
+    for model in CASCADE:
+        while _delete_chunk(model, patient.pk, chunk_size, audit):
+            pass
+
+    with transaction.atomic():
+        # Nothing references the patient any more, so this is a single
+        # DELETE; the post_delete signals update the cohort index.
+        patient.delete()
+        _record(audit, Patient._meta.label, 1)
+        if audit.details.get('delete_user') and patient.user_id:
+            get_user_model().objects.filter(pk=patient.user_id).delete()
+        audit.details['state'] = 'completed'
+        audit.details['completed_at'] = timezone.now().isoformat()
+        audit.save(update_fields=['details'])
+    return audit.details['deleted']
+
+
+def purge_patients(cutoff, limit, chunk_size=None):
+    """Purge up to ``limit`` patients soft-deleted before ``cutoff``; returns how many."""
+    patients = list(Patient.all_objects.filter(deleted_at__lt=cutoff).order_by('deleted_at', 'pk')[:limit])
+    for patient in patients:
+        purge_patient(patient, chunk_size)
+    return len(patients)
+
+
+def purgeable(model, cutoff):
+    """Soft-deleted rows of ``model`` (doctors or departments) past ``cutoff`` that nothing refers to."""
+    rows = model.all_objects.filter(deleted_at__lt=cutoff)
+    field = model._meta.model_name
+    for referencing in REFERENCES[model]:
+        # all_objects: soft-deleted doctors still hold on to their department.
+        manager = getattr(referencing, 'all_objects', referencing.objects)
+        rows = rows.exclude(Exists(manager.filter(**{field: OuterRef('pk')})))
+    return rows
+
+
+def purge_unreferenced(model, cutoff, limit):
+    """Purge up to ``limit`` unreferenced soft-deleted rows; returns how many."""
+    with transaction.atomic():
+        ids = list(purgeable(model, cutoff).order_by('deleted_at', 'pk').values_list('pk', flat=True)[:limit])
+        if ids:
+            model.all_objects.filter(pk__in=ids).delete()
+    return len(ids)
@@ -0,0 +1,80 @@
+"""
+Resolvers for the interned lookup tables (diagnoses, visit types, cities).
+
+Free text typed into forms is canonicalized (trimmed, inner whitespace
+collapsed, case-folded) and mapped to a small integer key.  Resolved keys are
+cached in-process, so repeated values cost a dict lookup rather than a query.
+"""
+import threading
+
+from django.db import IntegrityError, transaction
+
+from .models import City, Diagnosis, VisitType
+
+
+def normalize(value):
+    """Case- and whitespace-insensitive form of a free-text value."""
+    return ' '.join((value or '').split()).casefold()[:255]
+
+
+def display_name(value):
+    return ' '.join((value or '').split())[:255]
+
+
+class DictionaryResolver:
+    def __init__(self, model):
+        self.model = model
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def _remember(self, key, pk):
+        # Only cache rows that are known to be committed; a rolled-back insert
+        # must not leave a dangling key behind.
+        def store():
+            with self._lock:
+                self._cache[key] = pk
+
+        transaction.on_commit(store)
+
+    def lookup(self, value):
+        """Return the key for ``value`` without creating it, or ``None``."""
+        key = normalize(value)
+        if not key:
+            return None
+        if key in self._cache:
+            return self._cache[key]
+        pk = self.model.objects.filter(normalized_name=key).values_list('pk', flat=True).first()
+        if pk is not None:
+            self._remember(key, pk)
+        return pk
+
+    def resolve(self, value):
+        """Return the key for ``value``, creating the entry on first sight."""
+        key = normalize(value)
+        if not key:
+            return None
+        pk = self.lookup(value)
+        if pk is not None:
+            return pk
+        try:
+            with transaction.atomic():
+                pk = self.model.objects.create(name=display_name(value), normalized_name=key).pk
+        except IntegrityError:
+            # Another writer interned the same value first.
+            pk = self.model.objects.get(normalized_name=key).pk
+        self._remember(key, pk)
+        return pk
+
+    def names(self, pks):
+        """Map keys back to display names in a single query."""
+        pks = [pk for pk in pks if pk is not None]
+        return dict(self.model.objects.filter(pk__in=pks).values_list('pk', 'name'))
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+
+diagnoses = DictionaryResolver(Diagnosis)
+visit_types = DictionaryResolver(VisitType)
+cities = DictionaryResolver(City)
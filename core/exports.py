@@ -0,0 +1,167 @@
+"""
+FHIR bulk data export, modelled on the ``$export`` operation.
+
+``start_export`` queues a ``fhir_export`` job (see ``core.tasks``); the
+worker walks each resource type's table in primary-key chunks with
+``.values()``, serializes the chunks to NDJSON (``core.fhir``) in a process
+pool, and streams the result into one gzip file per resource type under
+``EXPORT_ROOT/<export id>/``.  When done, the job result holds the manifest,
+which also lists each file's resource count and SHA-256 checksum; a copy is
+written next to the files as ``manifest.json``.  Observations are read from
+both the current and the archived health records (``core.archive``).
+
+``_since`` exports only patients registered and records created at or after
+the given instant.  Rows created after the export's ``transactionTime`` are
+left out, so chaining exports with ``_since=<previous transactionTime>``
+neither misses nor repeats rows.
+"""
+import gzip
+import hashlib
+import json
+import shutil
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+from uuid import uuid4
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import fhir
+from .jobs import enqueue
+from .models import ArchivedHealthRecord, Job, Patient, PatientHealthRecord
+
+# resource type -> (serializer, ((model, fields, column _since applies to), ...))
+RESOURCE_TYPES = {
+    'Patient': (fhir.serialize_patients, (
+        (Patient, fhir.PATIENT_FIELDS, 'registration_date'),
+    )),
+    'Observation': (fhir.serialize_observations, (
+        (PatientHealthRecord, fhir.OBSERVATION_FIELDS, 'created_at'),
+        (ArchivedHealthRecord, fhir.OBSERVATION_FIELDS + ('original_id',), 'created_at'),
+    )),
+}
+
+CHUNK_SIZE = 2000
+
+
+def export_dir(export_id):
+    return Path(settings.EXPORT_ROOT) / export_id
+
+
+def start_export(types, since=None, requested_by=None, request_url=''):
+    """Queue an export and return its id."""
+    export_id = uuid4().hex
+    enqueue(
+        'fhir_export',
+        export_id=export_id,
+        types=list(types),
+        since=since.isoformat() if since else None,
+        requested_by=requested_by,
+        request_url=request_url,
+    )
+    return export_id
+
+
+def find_job(export_id):
+    return Job.objects.filter(name='fhir_export', payload__export_id=export_id).first()
+
+
+def iter_chunks(queryset, fields, chunk_size=CHUNK_SIZE):
+    """Yield lists of ``.values()`` rows, paging on the primary key rather than OFFSET."""
+    last = None
+    while True:
+        page = queryset if last is None else queryset.filter(pk__gt=last)
+        rows = list(page.order_by('pk').values(*fields)[:chunk_size])
+        if not rows:
+            return
+        yield rows
+        last = rows[-1]['pk']
+
+
+def _ordered_map(pool, func, items, window):
+    """Like ``pool.map`` but with at most ``window`` chunks in flight, so memory stays bounded."""
+    pending = deque()
+    for item in items:
+        pending.append(pool.submit(func, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as handle:
+        for block in iter(lambda: handle.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _since_rows(model, since_field, since, transaction_time):
+    rows = model.objects.filter(**{f'{since_field}__lt': transaction_time})
+    if since:
+        rows = rows.filter(**{f'{since_field}__gte': since})
+    return rows
+
+
+def run_export(export_id, types, since=None, request_url='', processes=1, chunk_size=CHUNK_SIZE, progress=None):
+    """Write the export files and return the manifest."""
+    transaction_time = timezone.now()
+    directory = export_dir(export_id)
+    directory.mkdir(parents=True, exist_ok=True)
+    since = parse_datetime(since) if isinstance(since, str) else since
+
+    pool = None
+    if processes > 1:
+        # spawn, not fork: the job runs inside a threaded worker process.
+        pool = ProcessPoolExecutor(max_workers=processes, mp_context=get_context('spawn'))
+    output = []
+    try:
+        for resource_type in types:
+            serializer, sources = RESOURCE_TYPES[resource_type]
+            chunks = (
+                chunk
+                for model, fields, since_field in sources
+                for chunk in iter_chunks(_since_rows(model, since_field, since, transaction_time), fields, chunk_size)
+            )
+            results = _ordered_map(pool, serializer, chunks, processes * 2) if pool else map(serializer, chunks)
+
+            filename = f'{resource_type}.ndjson.gz'
+            path = directory / filename
+            count = 0
+            with gzip.open(path, 'wb') as out:
+                for data, resources in results:
+                    out.write(data)
+                    count += resources
+                    if progress:
+                        progress(f'{resource_type}: {count} resources')
+            if not count:
+                path.unlink()
+                continue
+            output.append({
+                'type': resource_type,
+                'url': filename,
+                'count': count,
+                'extension': {'sha256': _sha256(path)},
+            })
+    finally:
+        if pool:
+            pool.shutdown()
+
+    manifest = {
+        'transactionTime': transaction_time.isoformat(),
+        'request': request_url,
+        'requiresAccessToken': True,
+        'output': output,
+        'error': [],
+    }
+    (directory / 'manifest.json').write_text(json.dumps(manifest, indent=2))
+    return manifest
+
+
+def delete_export(export_id):
+    shutil.rmtree(export_dir(export_id), ignore_errors=True)
+    Job.objects.filter(name='fhir_export', payload__export_id=export_id).delete()
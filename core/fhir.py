@@ -0,0 +1,130 @@
+"""
+FHIR R4 serialization of patients and vitals.
+
+The functions here work on plain ``.values()`` dicts and return NDJSON
+bytes, and deliberately import nothing from Django, so that ``core.exports``
+can run them in worker processes started with the ``spawn`` method.
+"""
+import json
+
+GENDERS = {'M': 'male', 'F': 'female', 'O': 'other', 'P': 'unknown'}
+
+PATIENT_FIELDS = (
+    'pk', 'patient_id', 'first_name', 'last_name', 'date_of_birth', 'gender', 'email',
+    'phone_country_code', 'phone', 'address', 'city', 'registration_date',
+)
+
+OBSERVATION_FIELDS = (
+    'pk', 'patient__patient_id', 'record_date', 'created_at', 'systolic_bp', 'diastolic_bp',
+    'heart_rate', 'temperature', 'weight', 'height', 'bmi',
+)
+
+LOINC = 'http://loinc.org'
+UCUM = 'http://unitsofmeasure.org'
+PATIENT_ID_SYSTEM = 'urn:hospital:patient-id'
+
+VITAL_SIGNS_CATEGORY = [{
+    'coding': [{
+        'system': 'http://terminology.hl7.org/CodeSystem/observation-category',
+        'code': 'vital-signs',
+        'display': 'Vital Signs',
+    }],
+}]
+
+# column -> (LOINC code, display, UCUM unit)
+VITALS = {
+    'heart_rate': ('8867-4', 'Heart rate', '/min'),
+    'temperature': ('8310-5', 'Body temperature', 'Cel'),
+    'weight': ('29463-7', 'Body weight', 'kg'),
+    'height': ('8302-2', 'Body height', 'cm'),
+    'bmi': ('39156-5', 'Body mass index (BMI) [Ratio]', 'kg/m2'),
+}
+BLOOD_PRESSURE = ('85354-9', 'Blood pressure panel with all children optional')
+SYSTOLIC = ('8480-6', 'Systolic blood pressure')
+DIASTOLIC = ('8462-4', 'Diastolic blood pressure')
+
+
+def _instant(value):
+    return value.isoformat() if value is not None else None
+
+
+def _concept(code, display):
+    return {'coding': [{'system': LOINC, 'code': code, 'display': display}], 'text': display}
+
+
+def _quantity(value, unit):
+    return {'value': float(value), 'unit': unit, 'system': UCUM, 'code': unit}
+
+
+def patient_resource(row):
+    telecom = [{'system': 'phone', 'value': f"{row['phone_country_code']}{row['phone']}", 'use': 'mobile'}]
+    if row['email']:
+        telecom.append({'system': 'email', 'value': row['email']})
+    resource = {
+        'resourceType': 'Patient',
+        'id': row['patient_id'],
+        'meta': {'lastUpdated': _instant(row['registration_date'])},
+        'identifier': [{'system': PATIENT_ID_SYSTEM, 'value': row['patient_id']}],
+        'name': [{'family': row['last_name'], 'given': [row['first_name']]}],
+        'gender': GENDERS.get(row['gender'], 'unknown'),
+        'birthDate': row['date_of_birth'].isoformat(),
+        'telecom': telecom,
+    }
+    if row['address'] or row['city']:
+        address = {'city': row['city']} if row['city'] else {}
+        if row['address']:
+            address['line'] = row['address'].splitlines()
+        resource['address'] = [address]
+    return resource
+
+
+def observation_resources(row):
+    """One Observation per vital recorded on a health record (blood pressure as a panel)."""
+    # Archived records keep the id they had before archiving.
+    record_id = row.get('original_id', row['pk'])
+    common = {
+        'resourceType': 'Observation',
+        'status': 'final',
+        'category': VITAL_SIGNS_CATEGORY,
+        'subject': {'reference': f"Patient/{row['patient__patient_id']}"},
+        'effectiveDateTime': _instant(row['record_date']),
+        'meta': {'lastUpdated': _instant(row['created_at'])},
+    }
+    resources = []
+    if row['systolic_bp'] is not None or row['diastolic_bp'] is not None:
+        components = [
+            {'code': _concept(*concept), 'valueQuantity': _quantity(row[column], 'mm[Hg]')}
+            for column, concept in (('systolic_bp', SYSTOLIC), ('diastolic_bp', DIASTOLIC))
+            if row[column] is not None
+        ]
+        resources.append({
+            **common,
+            'id': f"{record_id}-bp",
+            'code': _concept(*BLOOD_PRESSURE),
+            'component': components,
+        })
+    for column, (code, display, unit) in VITALS.items():
+        if row[column] is not None:
+            resources.append({
+                **common,
+                'id': f"{record_id}-{column.replace('_', '-')}",
+                'code': _concept(code, display),
+                'valueQuantity': _quantity(row[column], unit),
+            })
+    return resources
+
+
+def _dumps(resource):
+    return json.dumps(resource, separators=(',', ':'), ensure_ascii=False)
+
+
+def serialize_patients(rows):
+    """NDJSON bytes and resource count for a chunk of patient rows."""
+    lines = [_dumps(patient_resource(row)) for row in rows]
+    return ''.join(line + '\n' for line in lines).encode(), len(lines)
+
+
+def serialize_observations(rows):
+    """NDJSON bytes and resource count for a chunk of health record rows."""
+    lines = [_dumps(resource) for row in rows for resource in observation_resources(row)]
+    return ''.join(line + '\n' for line in lines).encode(), len(lines)
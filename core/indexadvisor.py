@@ -0,0 +1,288 @@
+"""
+Index advice from a captured workload (used by ``suggest_indexes``).
+
+A workload is a list of executed statements with their parameters already
+interpolated, as Django records them in ``connection.queries``: either read
+from a log (one JSON object with ``sql`` and ``time`` per line) or recorded
+by requesting pages in-process.  Statements are grouped by fingerprint (the
+SQL with its literals replaced by ``?``) and replayed against a scratch copy
+of the database, so candidate indexes can be created, measured and dropped
+without touching the real one.
+
+Candidates come from the columns a statement filters on (equality first,
+then one range or ORDER BY column) on ``TARGET_TABLES``.  A candidate is
+kept when the planner uses it for at least one statement; its benefit is
+the replay time saved, weighted by how often each statement occurred.
+Existing indexes that no statement uses are reported with the number of
+logged writes that had to maintain them.
+"""
+import json
+import re
+import sqlite3
+import tempfile
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+
+from django.apps import apps
+from django.db import connection, models
+from django.db.migrations import AddIndex, Migration
+from django.db.migrations.loader import MigrationLoader
+from django.db.migrations.writer import MigrationWriter
+
+from .models import AuditLog, Patient, PatientHealthRecord
+
+TARGET_TABLES = {model._meta.db_table: model for model in (Patient, PatientHealthRecord, AuditLog)}
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\bIN \(\?(?:,\s*\?)*\)')
+_SPACE = re.compile(r'\s+')
+_ALIAS = re.compile(r'"(\w+)" (?:AS )?"?([UT]\d+)\b')
+_PREDICATE = re.compile(r'(?:"(\w+)"|\b([UT]\d+))\."(\w+)"\s*(=|IN\b|>=|<=|>|<|IS NULL|LIKE\b)\s*(\'%)?')
+_ORDER_BY = re.compile(r'ORDER BY (.+?)(?: LIMIT| OFFSET|\)|$)')
+_ORDER_TERM = re.compile(r'(?:"(\w+)"|\b([UT]\d+))\."(\w+)" (ASC|DESC)')
+_WRITE = re.compile(r'^(?:INSERT INTO|UPDATE|DELETE FROM) "(\w+)"')
+_USES_INDEX = re.compile(r'USING (?:COVERING )?INDEX (\w+)')
+
+
+def fingerprint(sql):
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _IN_LIST.sub('IN (...)', sql)
+    return _SPACE.sub(' ', sql).strip()
+
+
+@dataclass
+class Statement:
+    fingerprint: str
+    samples: list = field(default_factory=list)
+    count: int = 0
+    logged_time: float = 0.0
+    replay_time: float = 0.0  # mean seconds per execution on the scratch copy
+
+    @property
+    def is_read(self):
+        return self.fingerprint.startswith('SELECT')
+
+    @property
+    def weight(self):
+        return self.count * self.replay_time
+
+
+def load_log(lines):
+    """Workload entries from NDJSON lines with ``sql`` and (optional) ``time`` in seconds."""
+    queries = []
+    for line in lines:
+        line = line.strip()
+        if line:
+            entry = json.loads(line)
+            queries.append({'sql': entry['sql'], 'time': float(entry.get('time') or 0)})
+    return queries
+
+
+def group(queries, samples=3):
+    """Group queries by fingerprint, keeping up to ``samples`` distinct statements of each."""
+    statements = {}
+    for query in queries:
+        key = fingerprint(query['sql'])
+        statement = statements.setdefault(key, Statement(key))
+        statement.count += 1
+        statement.logged_time += query['time']
+        if len(statement.samples) < samples and query['sql'] not in statement.samples:
+            statement.samples.append(query['sql'])
+    return list(statements.values())
+
+
+def scratch_copy():
+    """A private copy of the default (SQLite) database, made with the online backup API."""
+    connection.ensure_connection()
+    target = tempfile.NamedTemporaryFile(prefix='suggest-indexes-', suffix='.sqlite3', delete=False)
+    target.close()
+    scratch = sqlite3.connect(target.name)
+    connection.connection.backup(scratch)
+    scratch.execute('ANALYZE')
+    return scratch, target.name
+
+
+def _time(scratch, sql, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        scratch.execute(sql).fetchall()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def replay(scratch, statements, repeat=3):
+    """Measure every read statement on the scratch copy (best of ``repeat``, mean over samples)."""
+    for statement in statements:
+        if statement.is_read:
+            times = [_time(scratch, sql, repeat) for sql in statement.samples]
+            statement.replay_time = sum(times) / len(times)
+
+
+def _plan(scratch, sql):
+    return [row[3] for row in scratch.execute(f'EXPLAIN QUERY PLAN {sql}')]
+
+
+def _aliases(sql):
+    return {alias: table for table, alias in _ALIAS.findall(sql)}
+
+
+def filter_columns(sql):
+    """``{table: (equality columns, range columns, [(order column, descending)])}`` of a statement."""
+    aliases = _aliases(sql)
+    columns = defaultdict(lambda: ([], [], []))
+    nulls = defaultdict(list)
+    for table, alias, column, operator, leading_wildcard in _PREDICATE.findall(sql):
+        table = table or aliases.get(alias, alias)
+        equal, ranged, _ = columns[table]
+        if operator == 'IS NULL':
+            # Usually the soft-delete marker, true of most rows: never the leading column.
+            if column not in nulls[table]:
+                nulls[table].append(column)
+        elif operator in ('=', 'IN'):
+            if column not in equal:
+                equal.append(column)
+        elif operator == 'LIKE' and leading_wildcard:
+            continue  # a B-tree cannot help '%text%'
+        elif column not in ranged:
+            ranged.append(column)
+    for clause in _ORDER_BY.findall(sql):
+        for table, alias, column, direction in _ORDER_TERM.findall(clause):
+            table = table or aliases.get(alias, alias)
+            columns[table][2].append((column, direction == 'DESC'))
+    for table, cols in nulls.items():
+        columns[table][0].extend(column for column in cols if column not in columns[table][0])
+    return columns
+
+
+def existing_indexes(scratch):
+    """``{index name: (table, [columns], unique)}`` of the target tables."""
+    indexes = {}
+    for table in TARGET_TABLES:
+        for _, name, unique, origin, _ in scratch.execute(f'PRAGMA index_list("{table}")'):
+            cols = [row[2] for row in scratch.execute(f'PRAGMA index_info("{name}")')]
+            indexes[name] = (table, cols, bool(unique) or origin != 'c')
+    return indexes
+
+
+@dataclass(frozen=True)
+class Candidate:
+    table: str
+    columns: tuple  # (column, descending) pairs
+
+    def __str__(self):
+        return f"{self.table}({', '.join(c + (' DESC' if desc else '') for c, desc in self.columns)})"
+
+    def index(self):
+        """The ``models.Index`` creating this candidate, named the way Django would."""
+        model = TARGET_TABLES[self.table]
+        names = {f.column: f.name for f in model._meta.concrete_fields}
+        index = models.Index(fields=[('-' if desc else '') + names[column] for column, desc in self.columns])
+        index.set_name_with_model(model)
+        return index
+
+
+def candidates(statements, indexes):
+    found = set()
+    for statement in statements:
+        if not statement.is_read:
+            continue
+        for table, (equal, ranged, order) in filter_columns(statement.samples[0]).items():
+            if table not in TARGET_TABLES:
+                continue
+            equal = [(column, False) for column in equal]
+            for column in equal + [(column, False) for column in ranged] + order[:1]:
+                found.add(Candidate(table, (column,)))
+            tails = [(column, False) for column in ranged[:1]] or order[:1]
+            if equal and tails:
+                found.add(Candidate(table, tuple(equal[:2]) + tuple(tails)))
+            elif len(equal) > 1:
+                found.add(Candidate(table, tuple(equal[:2])))
+    covered = {(table, tuple(cols)) for table, cols, _ in indexes.values()}
+    return sorted(
+        (c for c in found if (c.table, tuple(column for column, _ in c.columns)) not in covered),
+        key=str,
+    )
+
+
+@dataclass
+class Result:
+    candidate: Candidate
+    statements: list  # (statement, time before, time after)
+
+    @property
+    def saved(self):
+        return sum(s.count * (before - after) for s, before, after in self.statements)
+
+    @property
+    def speedup(self):
+        before = sum(s.count * before for s, before, _ in self.statements)
+        after = sum(s.count * after for s, _, after in self.statements)
+        return before / after if after else float('inf')
+
+
+def evaluate(scratch, candidate, statements, repeat=3):
+    """Create the candidate in the scratch copy and re-time the statements that use it."""
+    columns = ', '.join(f'"{column}"' + (' DESC' if desc else '') for column, desc in candidate.columns)
+    scratch.execute(f'CREATE INDEX suggest_indexes_candidate ON "{candidate.table}" ({columns})')
+    scratch.execute('ANALYZE suggest_indexes_candidate')
+    try:
+        affected = []
+        for statement in statements:
+            if not statement.is_read or candidate.table not in statement.fingerprint:
+                continue
+            if not any('suggest_indexes_candidate' in line for line in _plan(scratch, statement.samples[0])):
+                continue
+            after = sum(_time(scratch, sql, repeat) for sql in statement.samples) / len(statement.samples)
+            affected.append((statement, statement.replay_time, after))
+    finally:
+        scratch.execute('DROP INDEX suggest_indexes_candidate')
+    return Result(candidate, affected) if affected else None
+
+
+def unused_indexes(scratch, statements, indexes):
+    """Non-unique existing indexes no statement uses, with the logged writes that maintain them."""
+    used = set()
+    writes = defaultdict(int)
+    for statement in statements:
+        for sql in statement.samples:
+            used.update(name for line in _plan(scratch, sql) for name in _USES_INDEX.findall(line))
+        match = _WRITE.match(statement.fingerprint)
+        if match:
+            writes[match.group(1)] += statement.count
+    unused = []
+    for name, (table, cols, unique) in sorted(indexes.items()):
+        if unique or name in used:
+            continue
+        model = TARGET_TABLES[table]
+        foreign_key = len(cols) == 1 and any(
+            f.column == cols[0] and f.is_relation for f in model._meta.concrete_fields
+        )
+        covered_by = next((
+            other for other, (other_table, other_cols, _) in sorted(indexes.items())
+            if other != name and other_table == table and len(other_cols) > len(cols)
+            and other_cols[:len(cols)] == cols
+        ), None)
+        unused.append({'name': name, 'table': table, 'columns': cols, 'writes': writes[table],
+                       'foreign_key': foreign_key, 'covered_by': covered_by})
+    return unused
+
+
+def migration_for(results, name='suggested_indexes'):
+    """Source of a migration adding the indexes of ``results``, after the latest core migration."""
+    loader = MigrationLoader(None, ignore_no_migrations=True)
+    leaf = max(loader.graph.leaf_nodes('core'))
+    number = int(leaf[1].split('_', 1)[0]) + 1
+    migration = Migration(f'{number:04d}_{name}', 'core')
+    migration.dependencies = [leaf]
+    migration.operations = [
+        AddIndex(model_name=apps.get_model('core', TARGET_TABLES[r.candidate.table].__name__)._meta.model_name,
+                 index=r.candidate.index())
+        for r in results
+    ]
+    writer = MigrationWriter(migration)
+    return writer.filename, writer.as_string()
@@ -0,0 +1,342 @@
+"""
+Streaming ingestion of lab/ADT feeds into ``PatientHealthRecord``.
+
+The pipeline is a chain of generators, so a feed file is never held in
+memory as a whole:
+
+    read_hl7 / read_csv      -> one *reading* dict per HL7 message / CSV row
+    batched                  -> lists of ``batch_size`` readings
+    FeedWriter.write_batch   -> resolves patients, bulk-inserts, checkpoints
+
+Each batch is written in one transaction together with its
+``IngestCheckpoint``, so a crashed run resumes after the last committed
+batch without duplicating records.  Records are inserted with
+``bulk_create``; the work normally done by signals (anomaly flags,
+department stats, cohort index) is done once per batch after commit.
+
+HL7 v2: ORU (or ADT) messages whose OBX segments carry LOINC-coded vitals;
+the patient comes from PID-3 (``MR`` identifiers are patient IDs, ``NI`` /
+``AADHAR`` or bare 12-digit identifiers are Aadhar numbers), the department
+from PV1-3, the doctor from PV1-7 or OBR-16, the time from OBR-7.
+
+CSV: a header row naming any of ``CSV_COLUMNS``.
+"""
+import csv
+import re
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .anomalies import flag_patients
+from .cohorts import cohort_index
+from .dictionaries import normalize
+from .fhir import BLOOD_PRESSURE, DIASTOLIC, SYSTOLIC, VITALS
+from .models import Department, Doctor, IngestCheckpoint, Patient, PatientHealthRecord
+from .stats import invalidate_department_stats
+
+VITAL_FIELDS = ('systolic_bp', 'diastolic_bp', 'heart_rate', 'temperature', 'weight', 'height')
+
+LOINC_FIELDS = {
+    SYSTOLIC[0]: 'systolic_bp',
+    DIASTOLIC[0]: 'diastolic_bp',
+    **{code: column for column, (code, _, _) in VITALS.items() if column in VITAL_FIELDS},
+}
+
+# Non-metric units seen in feeds, converted to the units the model stores.
+UNIT_CONVERSIONS = {
+    ('temperature', 'degf'): lambda value: (value - 32) * 5 / 9,
+    ('weight', 'lb'): lambda value: value * Decimal('0.45359237'),
+    ('weight', 'lb_av'): lambda value: value * Decimal('0.45359237'),
+    ('weight', 'g'): lambda value: value / 1000,
+    ('height', 'in'): lambda value: value * Decimal('2.54'),
+    ('height', 'in_i'): lambda value: value * Decimal('2.54'),
+    ('height', 'm'): lambda value: value * 100,
+}
+
+PATIENT_CLASSES = {'E': 'Emergency', 'I': 'Inpatient', 'O': 'Outpatient'}
+
+CSV_COLUMNS = (
+    'patient_id', 'aadhar_number', 'record_date', *VITAL_FIELDS,
+    'department', 'doctor', 'diagnosis', 'visit_type', 'notes',
+)
+
+READ_SIZE = 1 << 16
+
+
+class FeedError(Exception):
+    """A reading that cannot be turned into a health record."""
+
+
+# Parsing ----------------------------------------------------------------------
+
+def parse_hl7_timestamp(value):
+    """HL7 TS (``YYYY[MM[DD[HH[MM[SS[.S]]]]]][+/-ZZZZ]``) as an aware datetime, or None."""
+    match = re.fullmatch(r'(\d{4})(\d{2})?(\d{2})?(\d{2})?(\d{2})?(\d{2})?(?:\.\d+)?([+-]\d{4})?', value or '')
+    if not match:
+        return None
+    year, month, day, hour, minute, second, offset = match.groups()
+    parsed = datetime(int(year), int(month or 1), int(day or 1), int(hour or 0), int(minute or 0), int(second or 0))
+    if offset:
+        return datetime.strptime(parsed.strftime('%Y%m%d%H%M%S') + offset, '%Y%m%d%H%M%S%z')
+    return timezone.make_aware(parsed)
+
+
+def iter_segments(handle):
+    """Yield HL7 segments from a text stream, whatever the line terminator."""
+    buffer = ''
+    while True:
+        chunk = handle.read(READ_SIZE)
+        if not chunk:
+            break
+        parts = re.split(r'[\r\n]+', buffer + chunk)
+        buffer = parts.pop()
+        for part in parts:
+            if part.strip():
+                yield part
+    if buffer.strip():
+        yield buffer
+
+
+def iter_messages(segments):
+    """Group segments into messages, each starting with MSH; batch envelopes are dropped."""
+    message = []
+    for segment in segments:
+        if segment.startswith(('FHS', 'BHS', 'BTS', 'FTS')):
+            continue
+        if segment.startswith('MSH') and message:
+            yield message
+            message = []
+        if message or segment.startswith('MSH'):
+            message.append(segment)
+    if message:
+        yield message
+
+
+def _decimal(value):
+    try:
+        return Decimal(value.strip())
+    except (InvalidOperation, AttributeError):
+        return None
+
+
+def parse_hl7_message(segments):
+    """Turn one HL7 message into a reading dict."""
+    msh = segments[0]
+    separator = msh[3]
+    component = msh[4] if len(msh) > 4 else '^'
+    repetition = msh[5] if len(msh) > 5 else '~'
+
+    def fields(segment):
+        return segment.split(separator)
+
+    def get(values, index, comp=0):
+        if index >= len(values):
+            return ''
+        parts = values[index].split(repetition)[0].split(component)
+        return parts[comp] if comp < len(parts) else ''
+
+    header = [None] + fields(msh)  # MSH-1 is the separator itself, so MSH-n is header[n]
+    reading = {'ref': get(header, 10) or None, 'vitals': {}, 'notes': ''}
+    record_date = None
+    for segment in segments[1:]:
+        values = fields(segment)
+        kind = values[0]
+        if kind == 'PID':
+            for identifier in (values[3] if len(values) > 3 else '').split(repetition):
+                parts = identifier.split(component)
+                number, code = parts[0], (parts[4] if len(parts) > 4 else '').upper()
+                if not number:
+                    continue
+                if code in ('NI', 'AADHAR') or (not code and re.fullmatch(r'\d{12}', number)):
+                    reading.setdefault('aadhar_number', number)
+                else:
+                    reading.setdefault('patient_id', number)
+        elif kind == 'PV1':
+            reading['visit_type'] = PATIENT_CLASSES.get(get(values, 2), '')
+            reading['department'] = get(values, 3) or get(values, 10)
+            doctor = ' '.join(filter(None, (get(values, 7, 2), get(values, 7, 1))))
+            if doctor:
+                reading['doctor'] = doctor
+        elif kind == 'OBR':
+            record_date = record_date or parse_hl7_timestamp(get(values, 7))
+            doctor = ' '.join(filter(None, (get(values, 16, 2), get(values, 16, 1))))
+            if doctor:
+                reading.setdefault('doctor', doctor)
+        elif kind == 'OBX':
+            if get(values, 11) in ('D', 'X', 'W'):
+                continue  # deleted / cannot be obtained / wrong
+            code = get(values, 3)
+            raw = values[5] if len(values) > 5 else ''
+            unit = get(values, 6).strip('[]').casefold()
+            if code == BLOOD_PRESSURE[0] and '/' in raw:
+                systolic, diastolic = raw.split('/', 1)
+                reading['vitals']['systolic_bp'] = _decimal(systolic)
+                reading['vitals']['diastolic_bp'] = _decimal(diastolic)
+            elif code in LOINC_FIELDS:
+                field = LOINC_FIELDS[code]
+                value = _decimal(raw.split(component)[-1])  # SN values look like "^120"
+                if value is not None:
+                    convert = UNIT_CONVERSIONS.get((field, unit))
+                    reading['vitals'][field] = convert(value) if convert else value
+                record_date = record_date or parse_hl7_timestamp(get(values, 14))
+        elif kind == 'NTE':
+            reading['notes'] = '\n'.join(filter(None, (reading['notes'], get(values, 3))))
+    reading['record_date'] = record_date
+    return reading
+
+
+def read_hl7(handle):
+    for message in iter_messages(iter_segments(handle)):
+        yield parse_hl7_message(message)
+
+
+def _aware(value):
+    if value is not None and timezone.is_naive(value):
+        return timezone.make_aware(value)
+    return value
+
+
+def read_csv(handle):
+    for line, row in enumerate(csv.DictReader(handle), start=2):
+        row = {key.strip().lower(): (value or '').strip() for key, value in row.items() if key}
+        reading = {
+            'ref': f'line {line}',
+            'vitals': {field: _decimal(row[field]) for field in VITAL_FIELDS if row.get(field)},
+            'record_date': _aware(parse_datetime(row['record_date'])) if row.get('record_date') else None,
+        }
+        for key in ('patient_id', 'aadhar_number', 'department', 'doctor', 'diagnosis', 'visit_type', 'notes'):
+            if row.get(key):
+                reading[key] = row[key]
+        yield reading
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+# Resolution and writing -------------------------------------------------------
+
+class PatientLookup:
+    """Patient pks by ``patient_id`` and Aadhar number, cached for the whole run."""
+
+    def __init__(self):
+        self.by_patient_id = {}
+        self.by_aadhar = {}
+
+    def prefetch(self, readings):
+        """Resolve every identifier of a batch not seen before with one query per identifier type."""
+        for field, cache in (('patient_id', self.by_patient_id), ('aadhar_number', self.by_aadhar)):
+            missing = {reading[field] for reading in readings if reading.get(field)} - cache.keys()
+            if not missing:
+                continue
+            cache.update(dict.fromkeys(missing))
+            cache.update(Patient.objects.filter(**{f'{field}__in': missing}).values_list(field, 'pk'))
+
+    def get(self, reading):
+        return self.by_patient_id.get(reading.get('patient_id')) or self.by_aadhar.get(reading.get('aadhar_number'))
+
+
+class FeedWriter:
+    def __init__(self, checkpoint, default_department=None, default_doctor=None, source_name=''):
+        self.checkpoint = checkpoint
+        self.patients = PatientLookup()
+        self.departments = {normalize(name): pk for pk, name in Department.objects.values_list('pk', 'name')}
+        self.doctors = {}
+        for pk, name, department_id in Doctor.objects.values_list('pk', 'full_name', 'department_id'):
+            self.doctors.setdefault(normalize(name.removeprefix('Dr. ')), (pk, department_id))
+        self.default_department = default_department
+        self.default_doctor = default_doctor
+        self.source_name = source_name
+
+    def _doctor(self, reading):
+        name = normalize((reading.get('doctor') or '').removeprefix('Dr. '))
+        if name in self.doctors:
+            return self.doctors[name]
+        if self.default_doctor:
+            return self.default_doctor.pk, self.default_doctor.department_id
+        raise FeedError(f"unknown doctor {reading.get('doctor')!r}")
+
+    def build(self, reading):
+        if not any(value is not None for value in reading['vitals'].values()):
+            raise FeedError('no vitals')
+        patient_id = self.patients.get(reading)
+        if patient_id is None:
+            raise FeedError(
+                f"unknown patient {reading.get('patient_id') or reading.get('aadhar_number') or '(no identifier)'}"
+            )
+        doctor_id, doctor_department_id = self._doctor(reading)
+        department_id = self.departments.get(normalize(reading.get('department') or ''))
+        if department_id is None:
+            department_id = self.default_department.pk if self.default_department else doctor_department_id
+        notes = reading.get('notes', '')
+        if reading.get('ref'):
+            notes = '\n'.join(filter(None, (notes, f"Imported from {self.source_name} ({reading['ref']})")))
+        record = PatientHealthRecord(
+            patient_id=patient_id,
+            doctor_id=doctor_id,
+            department_id=department_id,
+            record_date=reading['record_date'] or timezone.now(),
+            diagnosis=reading.get('diagnosis', ''),
+            visit_type=reading.get('visit_type', ''),
+            notes=notes,
+            **{field: value for field, value in reading['vitals'].items() if value is not None},
+        )
+        for field in ('temperature', 'weight', 'height'):
+            value = getattr(record, field)
+            if value is not None:
+                setattr(record, field, value.quantize(Decimal('0.01')))
+        record.calculate_derived_fields()
+        record.full_clean(exclude=['patient', 'doctor', 'department', 'bmi'])
+        return record
+
+    def write_batch(self, readings):
+        """Insert a batch and advance the checkpoint atomically; returns ``(created, errors)``."""
+        self.patients.prefetch(readings)
+        records, errors = [], []
+        for reading in readings:
+            try:
+                records.append(self.build(reading))
+            except FeedError as exc:
+                errors.append((reading.get('ref'), str(exc)))
+            except ValidationError as exc:
+                errors.append((reading.get('ref'), '; '.join(exc.messages)))
+
+        with transaction.atomic():
+            PatientHealthRecord.objects.bulk_create(records)
+            self.checkpoint.position += len(readings)
+            self.checkpoint.created += len(records)
+            self.checkpoint.skipped += len(errors)
+            self.checkpoint.save(update_fields=['position', 'created', 'skipped', 'updated_at'])
+            patient_ids = sorted({record.patient_id for record in records})
+            department_ids = {record.department_id for record in records}
+            transaction.on_commit(lambda: self._after_commit(patient_ids, department_ids))
+        return len(records), errors
+
+    @staticmethod
+    def _after_commit(patient_ids, department_ids):
+        if not patient_ids:
+            return
+        flag_patients(patient_ids)
+        invalidate_department_stats(*department_ids)
+        for patient_id in patient_ids:
+            cohort_index.refresh_patient(patient_id)
+
+
+def checkpoint_for(path, fingerprint, restart=False):
+    """The checkpoint for ``path``; starts over if asked to or if the file was replaced."""
+    checkpoint, created = IngestCheckpoint.objects.get_or_create(
+        source=str(path), defaults={'fingerprint': fingerprint},
+    )
+    if not created and (restart or checkpoint.fingerprint != fingerprint):
+        checkpoint.fingerprint = fingerprint
+        checkpoint.position = checkpoint.created = checkpoint.skipped = 0
+        checkpoint.completed_at = None
+        checkpoint.save()
+    return checkpoint
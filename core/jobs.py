@@ -0,0 +1,270 @@
+"""
+Durable, database-backed background job queue.
+
+Work is registered with ``@task('name')`` (see ``core.tasks``), queued with
+``enqueue('name', **payload)`` and executed by ``manage.py run_workers``.
+Because jobs are ordinary rows, an enqueue inside a transaction only becomes
+visible to workers once that transaction commits.
+
+Claiming is a conditional ``UPDATE ... WHERE state = 'queued'`` per job,
+which is atomic on SQLite (single writer) as well as on PostgreSQL, where
+``SELECT ... FOR UPDATE SKIP LOCKED`` is used first so concurrent workers do
+not contend for the same rows.  Failed jobs are retried with exponential
+backoff until ``max_attempts`` is reached.  While a handler runs, a
+heartbeat thread refreshes ``locked_at`` every ``HEARTBEAT_INTERVAL``; a
+running job whose heartbeat is older than ``LOCK_TIMEOUT`` lost its worker
+(crashed or killed) and is requeued, or failed if that was its last attempt.
+Outcomes are only recorded while the worker still holds the job.
+
+A task registered with ``batch_size`` receives a list of payloads instead of
+keyword arguments: the worker claims up to that many queued jobs of the same
+name at once, and the handler returns one outcome per payload (a result dict,
+or an exception instance to fail just that job).
+"""
+import logging
+import os
+import socket
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.db import DatabaseError, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import metrics
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+BACKOFF_BASE = timedelta(seconds=10)
+BACKOFF_MAX = timedelta(hours=1)
+LOCK_TIMEOUT = timedelta(minutes=15)
+HEARTBEAT_INTERVAL = timedelta(minutes=1)
+
+_registry = {}
+
+
+class UnknownTask(Exception):
+    pass
+
+
+def task(name, max_attempts=None, batch_size=None):
+    """Register a function as the handler for jobs called ``name``."""
+
+    def decorator(func):
+        func.job_name = name
+        func.max_attempts = max_attempts
+        func.batch_size = batch_size
+        _registry[name] = func
+        return func
+
+    return decorator
+
+
+def get_task(name):
+    try:
+        return _registry[name]
+    except KeyError:
+        raise UnknownTask(name) from None
+
+
+def enqueue(name, *, priority=0, delay=None, max_attempts=None, **payload):
+    """Queue a job; ``payload`` must be JSON-serializable and is passed to the handler as kwargs."""
+    handler = get_task(name)
+    return Job.objects.create(
+        name=name,
+        payload=payload,
+        priority=priority,
+        run_after=timezone.now() + (delay or timedelta()),
+        max_attempts=max_attempts or handler.max_attempts or Job._meta.get_field('max_attempts').default,
+    )
+
+
+def worker_id():
+    return f'{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}'
+
+
+def backoff(attempts):
+    return min(BACKOFF_BASE * (2 ** max(attempts - 1, 0)), BACKOFF_MAX)
+
+
+def due_jobs(now, names=None):
+    """Queued jobs whose time has come, in the order workers claim them."""
+    due = Job.objects.filter(state=Job.States.QUEUED, run_after__lte=now).order_by('-priority', 'run_after', 'pk')
+    if names:
+        due = due.filter(name__in=names)
+    return due
+
+
+def claim(worker, limit=1, names=None):
+    """Atomically move up to ``limit`` due jobs to RUNNING for ``worker`` and return them."""
+    now = timezone.now()
+    due = due_jobs(now, names)
+
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            candidates = list(due.select_for_update(skip_locked=True).values_list('pk', flat=True)[:limit])
+            Job.objects.filter(pk__in=candidates).update(
+                state=Job.States.RUNNING, locked_by=worker, locked_at=now, attempts=F('attempts') + 1,
+            )
+    else:
+        candidates = []
+        for pk in due.values_list('pk', flat=True)[:limit * 4]:
+            won = Job.objects.filter(pk=pk, state=Job.States.QUEUED).update(
+                state=Job.States.RUNNING, locked_by=worker, locked_at=now, attempts=F('attempts') + 1,
+            )
+            if won:
+                candidates.append(pk)
+                if len(candidates) >= limit:
+                    break
+    return list(Job.objects.filter(pk__in=candidates).order_by('-priority', 'run_after', 'pk'))
+
+
+def _held(job):
+    """The job's row, as long as the worker that claimed it still holds it."""
+    return Job.objects.filter(pk=job.pk, state=Job.States.RUNNING, locked_by=job.locked_by)
+
+
+def _lost(job):
+    logger.warning('Job %s (%s) was released from %s before it finished; its outcome is dropped',
+                   job.pk, job.name, job.locked_by)
+    return False
+
+
+def complete(job, result=None):
+    """Record success; returns False when the job was released from this worker meanwhile."""
+    updated = _held(job).update(
+        state=Job.States.SUCCEEDED,
+        result=result if isinstance(result, dict) else {},
+        last_error='',
+        finished_at=timezone.now(),
+    )
+    return bool(updated) or _lost(job)
+
+
+def fail(job, error):
+    """Record a failed attempt; the job is retried after a backoff until it runs out of attempts."""
+    retry = job.attempts < job.max_attempts
+    updated = _held(job).update(
+        state=Job.States.QUEUED if retry else Job.States.FAILED,
+        run_after=timezone.now() + backoff(job.attempts),
+        last_error=error,
+        locked_by='',
+        locked_at=None,
+        finished_at=None if retry else timezone.now(),
+    )
+    return bool(updated) or _lost(job)
+
+
+@contextmanager
+def heartbeat(jobs, interval=HEARTBEAT_INTERVAL):
+    """Refresh ``locked_at`` of the claimed ``jobs`` every ``interval`` while the block runs."""
+    stop = threading.Event()
+
+    def beat():
+        try:
+            while not stop.wait(interval.total_seconds()):
+                for job in jobs:
+                    try:
+                        _held(job).update(locked_at=timezone.now())
+                    except DatabaseError:
+                        logger.warning('Heartbeat of job %s failed', job.pk, exc_info=True)
+        finally:
+            connection.close()  # this thread's own connection
+
+    thread = threading.Thread(target=beat, name=f'heartbeat-{jobs[0].pk}', daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def _record_run(name, started, succeeded, failed):
+    metrics.observe('job_duration_seconds', time.perf_counter() - started, task=name)
+    if succeeded:
+        metrics.inc('jobs_finished_total', succeeded, task=name, outcome='succeeded')
+    if failed:
+        metrics.inc('jobs_finished_total', failed, task=name, outcome='failed')
+    metrics.maybe_flush()
+
+
+def execute(job):
+    """Run a claimed job and record the outcome."""
+    started = time.perf_counter()
+    try:
+        with heartbeat([job]):
+            result = get_task(job.name)(**job.payload)
+    except Exception:
+        logger.exception('Job %s (%s) failed on attempt %s', job.pk, job.name, job.attempts)
+        fail(job, traceback.format_exc())
+        _record_run(job.name, started, 0, 1)
+        return False
+    complete(job, result)
+    _record_run(job.name, started, 1, 0)
+    return True
+
+
+def execute_batch(jobs):
+    """Run claimed jobs of one batched task together; returns how many succeeded."""
+    started = time.perf_counter()
+    try:
+        with heartbeat(jobs):
+            outcomes = get_task(jobs[0].name)([job.payload for job in jobs])
+    except Exception:
+        logger.exception('Batch of %s %s jobs failed', len(jobs), jobs[0].name)
+        error = traceback.format_exc()
+        for job in jobs:
+            fail(job, error)
+        _record_run(jobs[0].name, started, 0, len(jobs))
+        return 0
+    succeeded = 0
+    for job, outcome in zip(jobs, outcomes):
+        if isinstance(outcome, Exception):
+            logger.warning('Job %s (%s) failed on attempt %s: %s', job.pk, job.name, job.attempts, outcome)
+            fail(job, ''.join(traceback.format_exception(outcome)))
+        else:
+            complete(job, outcome)
+            succeeded += 1
+    _record_run(jobs[0].name, started, succeeded, len(jobs) - succeeded)
+    return succeeded
+
+
+def release_stale(timeout=LOCK_TIMEOUT):
+    """
+    Requeue RUNNING jobs whose worker stopped heartbeating (crashed or
+    killed), or fail them when that was their last attempt; returns how many.
+    """
+    now = timezone.now()
+    stale = Job.objects.filter(state=Job.States.RUNNING, locked_at__lt=now - timeout)
+    failed = stale.filter(attempts__gte=F('max_attempts')).update(
+        state=Job.States.FAILED,
+        last_error=f'The worker stopped heartbeating (no sign of it for {timeout}).',
+        locked_by='',
+        locked_at=None,
+        finished_at=now,
+    )
+    return failed + stale.update(state=Job.States.QUEUED, locked_by='', locked_at=None)
+
+
+def run_pending(limit=None, names=None, worker=None):
+    """Claim and execute due jobs in this thread until none are left; returns the count run."""
+    worker = worker or worker_id()
+    ran = 0
+    while limit is None or ran < limit:
+        jobs = claim(worker, names=names)
+        if not jobs:
+            break
+        job = jobs[0]
+        batch_size = getattr(_registry.get(job.name), 'batch_size', None)
+        if batch_size:
+            jobs += claim(worker, limit=batch_size - 1, names=[job.name])
+            execute_batch(jobs)
+        else:
+            execute(job)
+        ran += len(jobs)
+    return ran
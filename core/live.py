@@ -0,0 +1,286 @@
+"""
+Live dashboard updates over Server-Sent Events.
+
+Writes to Patient and PatientHealthRecord become deltas: counter increments
+keyed by ``(chart, label)`` (``patient_deltas``, ``record_deltas``), which
+``core.signals`` publishes after commit.  ``publisher`` fans each delta out
+to the subscription of every open dashboard, and ``dashboard_events``
+streams a subscription to the browser, where dashboard.js adds the
+increments to its charts in place.
+
+A subscription's buffer coalesces: increments to the same key are summed
+until the stream takes them, at most every ``MIN_INTERVAL`` seconds, so a
+burst of writes is one message.  It holds at most ``MAX_PENDING`` keys; a
+client that falls further behind is told to start over (``resync``) instead
+of being sent a growing backlog: it fetches fresh numbers from
+``dashboard_snapshot`` and subscribes again from there.  The last
+``HISTORY`` deltas are kept so that a client reconnecting with
+``Last-Event-ID`` receives what it missed.
+
+The publisher is per process: a stream only carries the writes of the
+process serving it.  Writes made elsewhere (job workers, other server
+processes, or this one while no dashboard was listening) show up on the
+next snapshot or reload, as do changes other than new rows and patients
+being soft-deleted or restored.  Event ids are therefore wall-clock
+milliseconds rather than a count of this process's writes, so a client may
+resume on any server process: only deltas that fell out of the history make
+it resync.
+
+A stream holds its connection open for up to ``MAX_STREAM_SECONDS``, which
+under WSGI means a worker thread each; a few dashboards left open all day
+would use up the pool.  So the dashboard only streams when served by ASGI,
+and otherwise fetches ``dashboard_snapshot`` every ``POLL_SECONDS``.
+"""
+import asyncio
+import json
+import threading
+import time
+from collections import Counter, deque
+from datetime import timedelta
+
+from django.utils import timezone
+
+from .cohorts import age_band, bmi_band
+from .dictionaries import cities, diagnoses, visit_types
+from .models import ArchivedHealthRecord, PatientHealthRecord
+
+GENDER_LABELS = {'M': 'Male', 'F': 'Female', 'O': 'Other', 'P': 'Prefer not to say'}
+NOT_SPECIFIED = 'Not specified'
+
+# Distinct (chart, label) keys a subscription buffers before it gives up.
+MAX_PENDING = 500
+HISTORY = 256
+MIN_INTERVAL = 1.0
+KEEPALIVE = 15.0
+# Streams end after this long; EventSource reconnects with Last-Event-ID.
+MAX_STREAM_SECONDS = 60 * 30
+RETRY_MS = 3000
+# How often a dashboard served by WSGI refreshes its numbers instead.
+POLL_SECONDS = 60
+
+RECENT = timedelta(days=30)
+
+
+class Subscription:
+    def __init__(self):
+        self.pending = Counter()
+        self.overflowed = False
+        self.sequence = 0
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._loop = None
+        self._async_ready = None
+
+    def push(self, sequence, deltas):
+        with self._lock:
+            self.sequence = sequence
+            if not self.overflowed:
+                self.pending.update(deltas)
+                if len(self.pending) > MAX_PENDING:
+                    self.overflowed = True
+                    self.pending.clear()
+        self._wake()
+
+    def _wake(self):
+        self._ready.set()
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._async_ready.set)
+
+    def take(self):
+        """``(sequence, overflowed, deltas)`` buffered since the last call."""
+        with self._lock:
+            pending, self.pending = self.pending, Counter()
+            return self.sequence, self.overflowed, {key: amount for key, amount in pending.items() if amount}
+
+    def wait(self, timeout):
+        """Block until something was pushed; False on timeout."""
+        if not self._ready.wait(timeout):
+            return False
+        self._ready.clear()
+        return True
+
+    async def await_push(self, timeout):
+        if self._loop is None:
+            self._loop = asyncio.get_running_loop()
+            self._async_ready = asyncio.Event()
+            if self._ready.is_set():
+                self._async_ready.set()
+        try:
+            await asyncio.wait_for(self._async_ready.wait(), timeout)
+        except TimeoutError:
+            return False
+        self._async_ready.clear()
+        self._ready.clear()
+        return True
+
+
+class Publisher:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = set()
+        self._history = deque(maxlen=HISTORY)
+        self.sequence = 0
+        # Clients resuming from before this id missed deltas no longer in the history.
+        self.complete_since = 0
+
+    def last_event_id(self):
+        """
+        The current time as an event id: numbers read from the database now
+        include every delta before it, whichever process published them.
+        """
+        with self._lock:
+            # Later deltas get later ids, even within the same millisecond.
+            self.sequence = max(self.sequence, int(time.time() * 1000))
+            return str(self.sequence)
+
+    def has_subscribers(self):
+        return bool(self._subscriptions)
+
+    def publish(self, deltas):
+        deltas = {key: amount for key, amount in deltas.items() if amount}
+        if not deltas:
+            return
+        with self._lock:
+            # Increasing even if the clock steps back.
+            self.sequence = max(self.sequence + 1, int(time.time() * 1000))
+            if len(self._history) == HISTORY:
+                self.complete_since = self._history[0][0]
+            self._history.append((self.sequence, deltas))
+            for subscription in self._subscriptions:
+                subscription.push(self.sequence, deltas)
+
+    def subscribe(self, last_event_id=''):
+        subscription = Subscription()
+        since = last_event_id or ''
+        with self._lock:
+            subscription.sequence = self.sequence
+            if since:
+                # An id from another process resumes here as well; its writes never reach this stream anyway.
+                if since.isdigit() and int(since) >= self.complete_since:
+                    for sequence, deltas in self._history:
+                        if sequence > int(since):
+                            subscription.pending.update(deltas)
+                else:
+                    subscription.overflowed = True
+                if subscription.pending or subscription.overflowed:
+                    subscription._ready.set()
+            self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+
+publisher = Publisher()
+
+
+def encode(deltas):
+    """``{chart: {label: amount}}`` for the client."""
+    charts = {}
+    for (chart, label), amount in sorted(deltas.items()):
+        charts.setdefault(chart, {})[label] = amount
+    return charts
+
+
+def _event(name, event_id, data):
+    return f'id: {event_id}\nevent: {name}\ndata: {json.dumps(data)}\n\n'
+
+
+def _message(subscription):
+    sequence, overflowed, deltas = subscription.take()
+    if overflowed:
+        return _event('resync', sequence, {}), True
+    if deltas:
+        return _event('delta', sequence, encode(deltas)), False
+    return None, False
+
+
+def stream(subscription):
+    """The event stream of a subscription, for a WSGI worker thread."""
+    try:
+        yield f'retry: {RETRY_MS}\n\n'
+        deadline = time.monotonic() + MAX_STREAM_SECONDS
+        while time.monotonic() < deadline:
+            if not subscription.wait(KEEPALIVE):
+                yield ': keepalive\n\n'
+                continue
+            message, done = _message(subscription)
+            if message:
+                yield message
+            if done:
+                return
+            time.sleep(MIN_INTERVAL)
+    finally:
+        publisher.unsubscribe(subscription)
+
+
+async def astream(subscription):
+    """The event stream of a subscription, for ASGI: waits without holding a thread."""
+    try:
+        yield f'retry: {RETRY_MS}\n\n'
+        deadline = time.monotonic() + MAX_STREAM_SECONDS
+        while time.monotonic() < deadline:
+            if not await subscription.await_push(KEEPALIVE):
+                yield ': keepalive\n\n'
+                continue
+            message, done = _message(subscription)
+            if message:
+                yield message
+            if done:
+                return
+            await asyncio.sleep(MIN_INTERVAL)
+    finally:
+        publisher.unsubscribe(subscription)
+
+
+def _name(resolver, pk):
+    if pk is None:
+        return NOT_SPECIFIED
+    return resolver.names([pk]).get(pk, NOT_SPECIFIED)
+
+
+def patient_deltas(patient, sign=1):
+    """What adding (``sign=1``) or removing (``-1``) ``patient`` changes on the dashboard."""
+    now = timezone.now()
+    deltas = Counter({
+        ('totals', 'patients'): sign,
+        ('gender', GENDER_LABELS.get(patient.gender, patient.gender)): sign,
+        ('age_group', age_band(patient.age)): sign,
+        ('city', _name(cities, patient.city_ref_id)): sign,
+    })
+    if patient.blood_type:
+        deltas['blood_type', patient.blood_type] += sign
+    if patient.registration_date >= now - timedelta(days=365):
+        deltas['registration', patient.registration_date.strftime('%Y-%m')] += sign
+    if patient.registration_date >= now - RECENT:
+        deltas['totals', 'new_patients'] += sign
+    return deltas
+
+
+def record_deltas(record):
+    """What adding ``record`` changes on the dashboard."""
+    deltas = Counter({
+        ('totals', 'health_records'): 1,
+        ('visit_type', _name(visit_types, record.visit_type_ref_id)): 1,
+    })
+    if record.diagnosis_ref_id is not None:
+        deltas['diagnosis', _name(diagnoses, record.diagnosis_ref_id)] += 1
+    if record.bmi is not None:
+        deltas['bmi', bmi_band(record.bmi)] += 1
+    if record.record_date >= timezone.now() - RECENT:
+        deltas['totals', 'visits'] += 1
+    # The department chart counts patients, so only their first visit counts.
+    visit = {'patient_id': record.patient_id, 'department_id': record.department_id}
+    if not (
+        PatientHealthRecord.objects.filter(**visit).exclude(pk=record.pk).exists()
+        or ArchivedHealthRecord.objects.filter(**visit).exists()
+    ):
+        deltas['department', record.department.name] += 1
+    return deltas
+
+
+def publish_change(make_deltas, *args):
+    """Publish ``make_deltas(*args)`` if a dashboard is listening; otherwise it is not worth the queries."""
+    if publisher.has_subscribers():
+        publisher.publish(make_deltas(*args))
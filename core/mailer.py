@@ -0,0 +1,96 @@
+"""
+Batched onboarding (password reset) email dispatch.
+
+``PasswordResetForm.save()`` renders its templates and opens a backend
+connection for every single message.  ``OnboardingMailer`` renders from
+templates compiled once per process and pushes a whole batch through one
+open connection, sending message by message so that a rejected address only
+fails that message.  ``ONBOARDING_MAIL_RATE`` (messages per second, 0 to
+disable) throttles the batch for providers that enforce sending limits.
+
+The ``send_password_reset`` job in ``core.tasks`` is the usual entry point.
+"""
+import time
+from functools import lru_cache
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.tokens import default_token_generator
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.template import loader
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+
+User = get_user_model()
+
+SUBJECT_TEMPLATE = 'registration/password_reset_subject.txt'
+BODY_TEMPLATE = 'registration/password_reset_email.html'
+
+
+@lru_cache(maxsize=None)
+def _template(name):
+    return loader.get_template(name)
+
+
+class OnboardingMailer:
+    def __init__(self, connection=None, rate=None, sleep=time.sleep, token_generator=default_token_generator):
+        self.connection = connection or get_connection()
+        self.rate = getattr(settings, 'ONBOARDING_MAIL_RATE', 0) if rate is None else rate
+        self.sleep = sleep
+        self.token_generator = token_generator
+        self._last_sent = None
+
+    def build(self, user, domain, use_https=False):
+        """Render the onboarding email for ``user`` as an unsent message."""
+        context = {
+            'email': user.email,
+            'domain': domain,
+            'site_name': domain,
+            'uid': urlsafe_base64_encode(force_bytes(user.pk)),
+            'user': user,
+            'token': self.token_generator.make_token(user),
+            'protocol': 'https' if use_https else 'http',
+        }
+        subject = ''.join(_template(SUBJECT_TEMPLATE).render(context).splitlines())
+        body = _template(BODY_TEMPLATE).render(context)
+        return EmailMultiAlternatives(subject, body, None, [user.email], connection=self.connection)
+
+    def _throttle(self):
+        if not self.rate:
+            return
+        if self._last_sent is not None:
+            wait = 1 / self.rate - (time.monotonic() - self._last_sent)
+            if wait > 0:
+                self.sleep(wait)
+        self._last_sent = time.monotonic()
+
+    def send(self, requests):
+        """
+        Send one email per request (dicts with ``user_id``, ``domain`` and
+        ``use_https``) and return an outcome per request, in order: a result
+        dict, or the exception that prevented that message from going out.
+        """
+        users = User.objects.in_bulk({request['user_id'] for request in requests})
+        outcomes = []
+        try:
+            for request in requests:
+                user = users.get(request['user_id'])
+                if user is None or not user.is_active or not user.email:
+                    # Nothing to retry: the account was removed or disabled meanwhile.
+                    outcomes.append({'sent': False})
+                    continue
+                try:
+                    message = self.build(user, request['domain'], request.get('use_https', False))
+                    self._throttle()
+                    # No-op while the connection is open; reconnects after a failure.
+                    self.connection.open()
+                    self.connection.send_messages([message])
+                except Exception as exc:
+                    outcomes.append(exc)
+                    # The transport may be left mid-conversation; the next message starts a fresh one.
+                    self.connection.close()
+                else:
+                    outcomes.append({'sent': True, 'email': user.email})
+        finally:
+            self.connection.close()
+        return outcomes
@@ -0,0 +1,216 @@
+"""
+Routine upkeep of the SQLite database, run by ``db_maintenance``.
+
+Bulk seeding, purges and archiving leave the file full of free pages and the
+planner statistics (``sqlite_stat1``, which also sizes the admin changelists)
+describing tables that have since grown or shrunk.  A run:
+
+* takes an online copy of the database (``core.backups.online_copy``) and
+  does the reads that touch every page on the copy: ``PRAGMA
+  integrity_check``, table and index sizes from the ``dbstat`` table and
+  row counts.  Holding a read lock on the live file for that long would
+  hold every commit back in rollback-journal mode;
+* runs ``ANALYZE`` on the tables whose row count has moved more than
+  ``STALE_RATIO`` from the statistics, one index per transaction with a
+  pause after each, so writers only ever wait for one index to be read
+  (``PRAGMA analysis_limit`` would make that cheaper, but its estimates
+  are far enough off to change plans), then ``PRAGMA optimize``;
+* returns up to ``MAINTENANCE_VACUUM_MAX_PAGES`` free pages to the file
+  system with ``PRAGMA incremental_vacuum``, in steps of
+  ``MAINTENANCE_VACUUM_STEP_PAGES`` with a pause after each.  That needs
+  ``auto_vacuum = INCREMENTAL``, which new databases get from the
+  connection's ``init_command``; older files are converted once by
+  ``enable_incremental_vacuum`` (a full ``VACUUM`` that blocks the database
+  while it runs, so not during business hours);
+* records the measurements as a ``MaintenanceRun`` to compare with later
+  runs.
+
+The writes are skipped when the integrity check finds problems.
+"""
+import sqlite3
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connections
+
+from .backups import integrity_check, online_copy
+from .models import MaintenanceRun
+
+STALE_RATIO = 0.1
+
+
+class MaintenanceError(Exception):
+    pass
+
+
+def _database(using):
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        raise MaintenanceError("db_maintenance looks after SQLite databases only; use the database's own tools.")
+    connection.ensure_connection()
+    return connection
+
+
+def _pragma(cursor, name):
+    cursor.execute(f'PRAGMA {name}')
+    return cursor.fetchone()[0]
+
+
+def measure(database):
+    """
+    Page counts and, by table, rows, bytes of table and index pages and the
+    row estimate of the planner statistics, read through the sqlite3
+    connection ``database``.
+    """
+    cursor = database.cursor()
+    tables = {
+        name: {'model': '', 'rows': 0, 'table_bytes': 0, 'index_bytes': 0, 'estimate': None}
+        for name, in cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+    }
+    index_tables = dict(cursor.execute("SELECT name, tbl_name FROM sqlite_master WHERE type = 'index'"))
+    for name, size in cursor.execute('SELECT name, SUM(pgsize) FROM dbstat GROUP BY name').fetchall():
+        if name in index_tables:
+            tables[index_tables[name]]['index_bytes'] += size
+        else:
+            tables.setdefault(name, {'model': '', 'rows': 0, 'table_bytes': 0, 'index_bytes': 0, 'estimate': None})
+            tables[name]['table_bytes'] += size
+    for name, table in tables.items():
+        table['rows'] = cursor.execute(f'SELECT COUNT(*) FROM "{name}"').fetchone()[0]
+    if 'sqlite_stat1' in tables:
+        estimates = defaultdict(int)
+        for name, stat in cursor.execute('SELECT tbl, stat FROM sqlite_stat1'):
+            if name in tables:
+                estimates[name] = max(estimates[name], int(stat.split()[0]))
+        for name, estimate in estimates.items():
+            tables[name]['estimate'] = estimate
+    for model in apps.get_app_config('core').get_models():
+        if model._meta.db_table in tables:
+            tables[model._meta.db_table]['model'] = model._meta.label
+    return {
+        'page_size': _pragma(cursor, 'page_size'),
+        'page_count': _pragma(cursor, 'page_count'),
+        'free_pages': _pragma(cursor, 'freelist_count'),
+        'tables': tables,
+    }
+
+
+def stale_tables(tables):
+    """Tables whose row count has moved more than ``STALE_RATIO`` from their statistics."""
+    stale = []
+    for name, table in tables.items():
+        if name.startswith('sqlite_'):
+            continue
+        estimate, rows = table['estimate'], table['rows']
+        if estimate is None:
+            if rows:
+                stale.append(name)
+        elif abs(rows - estimate) > STALE_RATIO * max(rows, estimate):
+            stale.append(name)
+    return stale
+
+
+def analyze(connection, tables, sleep=None):
+    """
+    Refresh the statistics of ``tables``, one index at a time with a pause
+    after each, then run ``PRAGMA optimize``.
+    """
+    sleep = settings.MAINTENANCE_STEP_SLEEP if sleep is None else sleep
+    with connection.cursor() as cursor:
+        for table in tables:
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = %s", [table])
+            # A table without indexes has a single statistics row, its own.
+            for name in [name for name, in cursor.fetchall()] or [table]:
+                cursor.execute(f'ANALYZE "{name}"')
+                if sleep:
+                    time.sleep(sleep)
+        cursor.execute('PRAGMA optimize')
+
+
+def uses_incremental_vacuum(connection):
+    with connection.cursor() as cursor:
+        return _pragma(cursor, 'auto_vacuum') == 2
+
+
+def incremental_vacuum(connection, max_pages=None, step=None, sleep=None):
+    """
+    Return up to ``max_pages`` free pages to the file system, ``step`` pages
+    per transaction; returns how many were, or None when the database does
+    not use incremental auto-vacuum.
+    """
+    max_pages = settings.MAINTENANCE_VACUUM_MAX_PAGES if max_pages is None else max_pages
+    step = step or settings.MAINTENANCE_VACUUM_STEP_PAGES
+    sleep = settings.MAINTENANCE_STEP_SLEEP if sleep is None else sleep
+    if not uses_incremental_vacuum(connection):
+        return None
+    if connection.in_atomic_block:
+        raise MaintenanceError('The incremental vacuum cannot run inside a transaction.')
+    freed = 0
+    with connection.cursor() as cursor:
+        while freed < max_pages:
+            free = _pragma(cursor, 'freelist_count')
+            if not free:
+                break
+            # The pragma frees one page per step of the statement, and the
+            # sqlite3 module steps a statement without result rows only once;
+            # executescript() runs it to the end.
+            connection.connection.executescript(f'PRAGMA incremental_vacuum({min(step, max_pages - freed)})')
+            done = free - _pragma(cursor, 'freelist_count')
+            if done <= 0:
+                break
+            freed += done
+            if sleep:
+                time.sleep(sleep)
+    return freed
+
+
+def enable_incremental_vacuum(using='default'):
+    """
+    Switch an existing database to incremental auto-vacuum.  This rebuilds
+    the whole file with ``VACUUM``, which locks the database until it is done
+    and needs free disk space for a second copy.
+    """
+    connection = _database(using)
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        cursor.execute('VACUUM')
+    return uses_incremental_vacuum(connection)
+
+
+def run_maintenance(using='default', check_integrity=True, analyze_all=False, vacuum_pages=None, report_only=False):
+    """Measure the database, analyze and vacuum it unless ``report_only``; returns the saved ``MaintenanceRun``."""
+    connection = _database(using)
+    started = time.monotonic()
+    directory = Path(settings.BACKUP_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=directory) as scratch:
+        copy = Path(scratch, 'db.sqlite3')
+        online_copy(connection.connection, copy)
+        integrity = integrity_check(copy) if check_integrity else ''
+        database = sqlite3.connect(copy)
+        try:
+            measured = measure(database)
+        finally:
+            database.close()
+
+    analyzed, freed = [], 0
+    if not report_only and integrity in ('', 'ok'):
+        tables = measured['tables']
+        analyzed = [name for name in tables if not name.startswith('sqlite_')] if analyze_all else stale_tables(tables)
+        analyze(connection, analyzed)
+        if vacuum_pages != 0:
+            freed = incremental_vacuum(connection, vacuum_pages)
+
+    return MaintenanceRun.objects.using(using).create(
+        seconds=round(time.monotonic() - started, 3),
+        page_size=measured['page_size'],
+        page_count=measured['page_count'],
+        free_pages=measured['free_pages'],
+        freed_pages=freed or 0,
+        integrity=integrity,
+        analyzed=analyzed,
+        tables=measured['tables'],
+    )
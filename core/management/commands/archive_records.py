@@ -0,0 +1,91 @@
+"""
+Move old health records into the archive table (see core.archive), or bring
+them back with --restore.
+
+Every batch is its own transaction, so the command can be stopped at any
+point and rerun: it simply continues with the records still left to move.
+"""
+import time
+from datetime import timedelta
+from functools import partial
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from core.archive import archive_batch, archive_horizon, restore_batch
+from core.models import ArchivedHealthRecord, Patient
+
+
+class Command(BaseCommand):
+    help = 'Archives health records older than RECORD_ARCHIVE_AFTER_DAYS, or restores archived ones.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--older-than-days',
+            type=int,
+            help='Archive records dated more than this many days ago (default: RECORD_ARCHIVE_AFTER_DAYS)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Records moved per transaction (default: 1000)',
+        )
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=0.0,
+            help='Seconds to pause between batches to leave room for other writers (default: 0)',
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            help='Stop after moving this many records',
+        )
+        parser.add_argument(
+            '--restore',
+            action='store_true',
+            help='Move archived records back instead (narrow it down with --patient/--year)',
+        )
+        parser.add_argument('--patient', help='Patient ID (e.g. PAT-00001) to restore')
+        parser.add_argument('--year', type=int, help='Record year to restore')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive.')
+
+        if options['restore']:
+            archived = ArchivedHealthRecord.objects.all()
+            if options['patient']:
+                patient = Patient.objects.filter(patient_id=options['patient']).first()
+                if patient is None:
+                    raise CommandError(f"Unknown patient {options['patient']}.")
+                archived = archived.filter(patient=patient)
+            if options['year']:
+                archived = archived.filter(record_date__year=options['year'])
+            step = partial(restore_batch, archived)
+            verb = 'Restored'
+        else:
+            if options['patient'] or options['year']:
+                raise CommandError('--patient and --year only apply with --restore.')
+            days = options['older_than_days']
+            cutoff = timezone.now() - timedelta(days=days) if days is not None else archive_horizon()
+            self.stdout.write(f'Archiving records dated before {cutoff:%Y-%m-%d}.')
+            step = partial(archive_batch, cutoff)
+            verb = 'Archived'
+
+        started = time.monotonic()
+        moved = 0
+        limit = options['limit']
+        while limit is None or moved < limit:
+            size = options['batch_size'] if limit is None else min(options['batch_size'], limit - moved)
+            count = step(size)
+            if not count:
+                break
+            moved += count
+            self.stdout.write(f'{verb} {moved} records so far...')
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(f'{verb} {moved} health records in {elapsed:.1f}s.'))
@@ -0,0 +1,69 @@
+"""
+Backfill the interned diagnosis/visit-type keys on existing health records
+and the city key on existing patients.
+
+Rows are walked in primary-key ranges so each batch is a short transaction;
+re-running the command only touches rows that are still unresolved.
+"""
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max, Min, Q
+
+from core.dictionaries import cities, diagnoses, visit_types
+from core.models import Patient, PatientHealthRecord
+
+
+class Command(BaseCommand):
+    help = 'Resolves diagnosis, visit type and city text into lookup-table keys for existing rows.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Number of primary keys scanned per transaction (default: 5000)',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        records = PatientHealthRecord.objects.filter(
+            (Q(diagnosis_ref__isnull=True) & ~Q(diagnosis=''))
+            | (Q(visit_type_ref__isnull=True) & ~Q(visit_type=''))
+        )
+        updated = self.backfill(
+            records,
+            batch_size,
+            {'diagnosis': ('diagnosis_ref_id', diagnoses), 'visit_type': ('visit_type_ref_id', visit_types)},
+        )
+        self.stdout.write(self.style.SUCCESS(f'Backfilled {updated} health records.'))
+
+        patients = Patient.objects.filter(city_ref__isnull=True).exclude(city='')
+        updated = self.backfill(patients, batch_size, {'city': ('city_ref_id', cities)})
+        self.stdout.write(self.style.SUCCESS(f'Backfilled {updated} patients.'))
+
+    def backfill(self, pending, batch_size, columns):
+        """Resolve ``columns`` (text field -> (key field, resolver)) for ``pending`` rows."""
+        model = pending.model
+        pending = pending.order_by()
+        bounds = pending.aggregate(low=Min('pk'), high=Max('pk'))
+        if bounds['low'] is None:
+            return 0
+
+        updated = 0
+        for start in range(bounds['low'], bounds['high'] + 1, batch_size):
+            with transaction.atomic():
+                rows = list(
+                    pending.filter(pk__gte=start, pk__lt=start + batch_size).values_list('pk', *columns)
+                )
+                for position, (_, (key_field, resolver)) in enumerate(columns.items(), start=1):
+                    groups = defaultdict(list)
+                    for row in rows:
+                        groups[resolver.resolve(row[position])].append(row[0])
+                    for key, pks in groups.items():
+                        model.objects.filter(pk__in=pks).update(**{key_field: key})
+            updated += len(rows)
+            if rows:
+                self.stdout.write(f'{model._meta.verbose_name}: resolved up to id {start + batch_size - 1} ({updated} so far)')
+        return updated
@@ -0,0 +1,58 @@
+"""
+Take a compressed, checksummed snapshot of the (SQLite) database.
+
+The live database is copied with SQLite's online backup API in small steps
+with pauses between them, so it can run at any time of day without holding
+up writers; see core.backups.  Snapshots go to BACKUP_DIR and the newest
+BACKUP_KEEP are kept.  ``restore_db`` lists, verifies and restores them.
+"""
+from django.core.management.base import BaseCommand, CommandError
+
+from core.backups import SnapshotError, create_snapshot
+
+
+class Command(BaseCommand):
+    help = 'Snapshots the database into BACKUP_DIR without blocking writers, and rotates old snapshots.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', help='Directory to write the snapshot to (default: BACKUP_DIR)')
+        parser.add_argument(
+            '--keep',
+            type=int,
+            help='Snapshots to keep after this one is written, 0 for all (default: BACKUP_KEEP)',
+        )
+        parser.add_argument(
+            '--step-pages',
+            type=int,
+            help='Database pages copied per step (default: BACKUP_STEP_PAGES)',
+        )
+        parser.add_argument(
+            '--step-sleep',
+            type=float,
+            help='Seconds to pause after each step so writers can commit (default: BACKUP_STEP_SLEEP)',
+        )
+        parser.add_argument(
+            '--replica',
+            help='Also replace this file with the snapshot, for analytics (default: ANALYTICS_REPLICA)',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            manifest = create_snapshot(
+                directory=options['dir'],
+                keep=options['keep'],
+                replica=options['replica'],
+                pages=options['step_pages'],
+                sleep=options['step_sleep'],
+            )
+        except (SnapshotError, OSError) as exc:
+            raise CommandError(f'Backup failed: {exc}')
+        restarts = manifest['restarts']
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {manifest['file']}: {manifest['size'] / 2 ** 20:.1f} MB database, "
+            f"{manifest['compressed_size'] / 2 ** 20:.1f} MB compressed, copied in {manifest['copy_seconds']:.1f}s"
+            + (f' ({restarts} restart{"s" if restarts != 1 else ""} after concurrent writes)' if restarts else '')
+            + '.'
+        ))
+        if manifest['removed']:
+            self.stdout.write(f"Removed {len(manifest['removed'])} old snapshot(s): {', '.join(manifest['removed'])}")
@@ -0,0 +1,197 @@
+"""
+Measure admin changelist load times as the large tables grow.
+
+Works on a private copy of the (SQLite) database, never the live one: the
+patient, health record and audit log tables are grown to each of
+``--sizes`` rows by copying existing rows (with fresh unique values and
+dates spread over ten years), the statistics are refreshed with ANALYZE,
+and the changelist pages are requested as a superuser.  With
+``--compare`` each page is also timed with Django's stock changelist
+(exact counts, DISTINCT date hierarchy) for contrast.
+"""
+import os
+import time
+
+from django.contrib import admin
+from django.contrib.admin.views.main import ChangeList
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.core.paginator import Paginator
+from django.db import connection
+from django.test import Client
+
+from core.admin import top_values
+from core.indexadvisor import scratch_copy
+from core.models import AuditLog, Patient, PatientHealthRecord
+
+# (model, date column varied between copies)
+TABLES = (
+    (Patient, 'registration_date'),
+    (PatientHealthRecord, 'record_date'),
+    (AuditLog, 'created_at'),
+)
+SPREAD_DAYS = 3650
+
+
+def inflate(model, size, date_field):
+    """Copy rows of ``model`` into its own table until it holds ``size`` rows.
+
+    Copies of rows belonging to a patient are moved to a random patient,
+    so that each patient keeps a realistic number of rows.
+    """
+    quote = connection.ops.quote_name
+    table = quote(model._meta.db_table)
+    patients = quote(Patient._meta.db_table)
+    last_patient = Patient.all_objects.order_by('-pk').values_list('pk', flat=True).first() or 1
+    columns, expressions = [], []
+    for field in model._meta.concrete_fields:
+        if field.primary_key:
+            continue
+        column = quote(field.column)
+        if field.related_model is Patient:
+            # Correlated with the copied row, so a patient is drawn per row.
+            expression = (
+                f'COALESCE((SELECT id FROM {patients} '
+                f'WHERE id >= ({table}.{column} + abs(random())) % {last_patient} ORDER BY id LIMIT 1), {column})'
+            )
+        elif field.unique and field.null:
+            expression = 'NULL'
+        elif field.unique:
+            expression = f'substr(hex(randomblob(8)), 1, {min(field.max_length or 16, 16)})'
+        elif field.name == date_field:
+            expression = f"strftime('%Y-%m-%d %H:%M:%f', 'now', '-' || (abs(random()) % {SPREAD_DAYS}) || ' days')"
+        else:
+            expression = column
+        columns.append(column)
+        expressions.append(expression)
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT COUNT(*) FROM {table}')
+        current = cursor.fetchone()[0]
+        if not current:
+            raise CommandError(f'{model._meta.verbose_name_plural} has no rows to copy.')
+        while current < size:
+            batch = min(current, size - current)
+            cursor.execute(
+                f'INSERT INTO {table} ({", ".join(columns)}) '
+                f'SELECT {", ".join(expressions)} FROM {table} LIMIT {batch}'
+            )
+            current += batch
+    return current
+
+
+class Command(BaseCommand):
+    help = 'Times the admin changelists of the large tables at growing row counts, on a scratch copy.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            default='10000,100000,1000000',
+            help='Comma-separated row counts to grow each table to (default: 10000,100000,1000000)',
+        )
+        parser.add_argument('--repeat', type=int, default=3, help='Timings per page; the best is kept (default: 3)')
+        parser.add_argument('--compare', action='store_true', help="Also time Django's stock changelist")
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('benchmark_admin works on SQLite databases only.')
+        try:
+            sizes = sorted(int(size) for size in options['sizes'].split(','))
+        except ValueError:
+            raise CommandError('--sizes must be comma-separated integers.')
+        if not PatientHealthRecord.objects.exists():
+            raise CommandError('There are no health records to copy; run seed_data first.')
+
+        scratch, path = scratch_copy()
+        scratch.close()
+        original = connection.settings_dict['NAME']
+        connection.close()
+        connection.settings_dict['NAME'] = path
+        try:
+            self.run(sizes, options)
+        finally:
+            connection.close()
+            connection.settings_dict['NAME'] = original
+            os.unlink(path)
+
+    def run(self, sizes, options):
+        User = get_user_model()
+        user = User.objects.create_superuser('benchmark-admin', 'benchmark@example.com', None)
+        if not AuditLog.objects.exists():
+            AuditLog.objects.create(actor=user, action='benchmark', target='benchmark')
+        client = Client()
+        client.force_login(user)
+
+        results = []
+        for size in sizes:
+            started = time.monotonic()
+            for model, date_field in TABLES:
+                inflate(model, size, date_field)
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+            self.stdout.write(f'{size} rows per table (grown in {time.monotonic() - started:.1f}s)')
+            for label, url in self.pages():
+                timings = [self.time(client, url, options['repeat'])]
+                if options['compare']:
+                    with stock_changelists():
+                        timings.append(self.time(client, url, options['repeat']))
+                results.append((size, label, timings))
+                self.stdout.write(
+                    f'  {label:<28} {timings[0] * 1000:8.1f} ms'
+                    + (f'   stock {timings[1] * 1000:8.1f} ms' if len(timings) > 1 else '')
+                )
+
+        if len(sizes) > 1:
+            first = {label: timings[0] for size, label, timings in results if size == sizes[0]}
+            last = {label: timings[0] for size, label, timings in results if size == sizes[-1]}
+            growth = max(last[label] / first[label] for label in first)
+            self.stdout.write(self.style.SUCCESS(
+                f'{sizes[-1] // sizes[0]}x the rows: slowest page grew {growth:.1f}x.'
+            ))
+
+    def pages(self):
+        record = PatientHealthRecord.objects.select_related('patient').order_by('pk').first()
+        audit = AuditLog.objects.order_by('pk').first()
+        doctor = top_values(PatientHealthRecord, 'doctor')[0][0]
+        year = PatientHealthRecord.objects.order_by('-record_date').values_list('record_date', flat=True)[0].year
+        return (
+            ('records', '/admin/core/patienthealthrecord/'),
+            ('records: search patient', f'/admin/core/patienthealthrecord/?q={record.patient.patient_id}'),
+            ('records: filter doctor', f'/admin/core/patienthealthrecord/?doctor={doctor}'),
+            ('records: one year', f'/admin/core/patienthealthrecord/?record_date__year={year}'),
+            ('patients', '/admin/core/patient/'),
+            ('patients: search surname', f'/admin/core/patient/?q={record.patient.last_name[:3]}'),
+            ('audit log', '/admin/core/auditlog/'),
+            ('audit log: search target', f'/admin/core/auditlog/?q={audit.target}'),
+        )
+
+    def time(self, client, url, repeat):
+        """Best of ``repeat`` requests, after one that warms the caches."""
+        timings = []
+        for _ in range(repeat + 1):
+            started = time.perf_counter()
+            response = client.get(url)
+            timings.append(time.perf_counter() - started)
+            if response.status_code != 200:
+                raise CommandError(f'{url} answered {response.status_code}.')
+        return min(timings[1:])
+
+
+class stock_changelists:
+    """Temporarily give the registered admins Django's default changelist behaviour."""
+
+    SETTINGS = {
+        'paginator': Paginator,
+        'show_full_result_count': True,
+        'get_changelist': lambda request, **kwargs: ChangeList,
+    }
+
+    def __enter__(self):
+        self.admins = [admin.site._registry[model] for model, _ in TABLES]
+        for model_admin in self.admins:
+            for name, value in self.SETTINGS.items():
+                setattr(model_admin, name, value)
+
+    def __exit__(self, *exc_info):
+        for model_admin in self.admins:
+            for name in self.SETTINGS:
+                delattr(model_admin, name)
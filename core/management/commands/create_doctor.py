@@ -2,9 +2,9 @@
 CLI helper to provision doctor accounts with role-aware defaults.
 """
 from django.contrib.auth import get_user_model
-from django.contrib.auth.forms import PasswordResetForm
 from django.core.management.base import BaseCommand
 
+from core.jobs import enqueue
 from core.models import AuditLog
 
 
@@ -67,12 +67,7 @@ class Command(BaseCommand):
             profile.save(update_fields=['full_name', 'specialization'])
 
         if not password:
-            reset_form = PasswordResetForm({'email': user.email})
-            if reset_form.is_valid():
-                reset_form.save(
-                    domain_override=domain,
-                    use_https=False,
-                )
+            enqueue('send_password_reset', priority=10, user_id=user.pk, domain=domain, use_https=False)
 
         AuditLog.objects.create(
             actor=None,
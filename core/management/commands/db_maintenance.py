@@ -0,0 +1,141 @@
+"""
+Keep the (SQLite) database fast: refresh stale planner statistics, return
+free pages to the file system a few at a time, check integrity, and report
+table and index sizes, free pages and row counts against the previous run.
+
+Every step works in short transactions with pauses in between, so it can be
+scheduled during the day (e.g. hourly from cron); see core.maintenance.
+--history shows the recorded runs.  --enable-incremental-vacuum converts an
+older database file once, which locks it for a while: run that off-hours.
+"""
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from core.backups import SnapshotError
+from core.maintenance import (
+    MaintenanceError,
+    enable_incremental_vacuum,
+    run_maintenance,
+    uses_incremental_vacuum,
+)
+from core.models import MaintenanceRun
+
+
+def _mb(size):
+    return size / 2 ** 20
+
+
+def _delta(value, before, fmt='{:+,}'):
+    return f' ({fmt.format(value - before)})' if before is not None and value != before else ''
+
+
+class Command(BaseCommand):
+    help = 'Analyzes, incrementally vacuums and checks the database, and reports sizes and row counts.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--report-only', action='store_true', help='Measure and check, change nothing')
+        parser.add_argument(
+            '--no-integrity-check',
+            action='store_false',
+            dest='check_integrity',
+            help='Skip PRAGMA integrity_check',
+        )
+        parser.add_argument(
+            '--analyze-all',
+            action='store_true',
+            help='Refresh the statistics of every table, not only the stale ones',
+        )
+        parser.add_argument(
+            '--vacuum-pages',
+            type=int,
+            help='Free pages to return to the file system at most, 0 for none (default: MAINTENANCE_VACUUM_MAX_PAGES)',
+        )
+        parser.add_argument(
+            '--enable-incremental-vacuum',
+            action='store_true',
+            help='Rebuild the database with incremental auto-vacuum enabled; locks it while running',
+        )
+        parser.add_argument('--history', type=int, metavar='N', help='Show the last N runs and exit')
+
+    def handle(self, *args, **options):
+        if options['history']:
+            for run in reversed(MaintenanceRun.objects.all()[:options['history']]):
+                self.stdout.write(
+                    f"{run.created_at:%Y-%m-%d %H:%M}  {_mb(run.page_count * run.page_size):9.1f} MB"
+                    f"  {run.free_ratio:6.1%} free  freed {run.freed_pages:>7} pages"
+                    f"  analyzed {len(run.analyzed):>2}  integrity {run.integrity or '-'}"
+                )
+            return
+
+        try:
+            if options['enable_incremental_vacuum']:
+                self.stdout.write('Rebuilding the database with VACUUM; it is locked until this finishes.')
+                enable_incremental_vacuum()
+                self.stdout.write(self.style.SUCCESS('Incremental vacuum is enabled.'))
+                return
+            previous = MaintenanceRun.objects.first()
+            run = run_maintenance(
+                check_integrity=options['check_integrity'],
+                analyze_all=options['analyze_all'],
+                vacuum_pages=options['vacuum_pages'],
+                report_only=options['report_only'],
+            )
+        except (MaintenanceError, SnapshotError, OSError) as exc:
+            raise CommandError(f'Maintenance failed: {exc}')
+
+        self.report(run, previous)
+        if run.integrity not in ('', 'ok'):
+            raise CommandError(
+                f'Integrity check failed: {run.integrity}. Statistics and free pages were left alone; '
+                'restore the newest good snapshot with restore_db.'
+            )
+
+    def report(self, run, previous):
+        size = run.page_count * run.page_size
+        before = previous.page_count * previous.page_size if previous else None
+        self.stdout.write(
+            f'Database: {_mb(size):.1f} MB{_delta(_mb(size), _mb(before) if before else None, "{:+.1f} MB")}, '
+            f'{run.page_count:,} pages of {run.page_size} bytes, {run.free_pages:,} free ({run.free_ratio:.1%}'
+            + (f', was {previous.free_ratio:.1%}' if previous else '') + ').'
+        )
+        if run.integrity:
+            self.stdout.write(f'Integrity check: {run.integrity}')
+
+        old = previous.tables if previous else {}
+        self.stdout.write(f"{'Model':<28} {'Rows':>22} {'Table MB':>20} {'Indexes MB':>20}")
+        core, other = [], [0, 0, 0]
+        for name, table in run.tables.items():
+            if table['model']:
+                core.append((name, table))
+            else:
+                other[0] += table['rows'] if not name.startswith('sqlite_') else 0
+                other[1] += table['table_bytes']
+                other[2] += table['index_bytes']
+        core.sort(key=lambda item: item[1]['table_bytes'] + item[1]['index_bytes'], reverse=True)
+        for name, table in core:
+            was = old.get(name, {})
+            rows = f"{table['rows']:,}{_delta(table['rows'], was.get('rows'))}"
+            table_mb = _mb(table['table_bytes'])
+            index_mb = _mb(table['index_bytes'])
+            table_was = _mb(was['table_bytes']) if was else None
+            index_was = _mb(was['index_bytes']) if was else None
+            self.stdout.write(
+                f"{table['model']:<28} {rows:>22} "
+                f"{f'{table_mb:.1f}' + _delta(table_mb, table_was, '{:+.1f}'):>20} "
+                f"{f'{index_mb:.1f}' + _delta(index_mb, index_was, '{:+.1f}'):>20}"
+            )
+        self.stdout.write(f"{'Other tables':<28} {other[0]:>22,} {_mb(other[1]):>20.1f} {_mb(other[2]):>20.1f}")
+
+        if run.analyzed:
+            self.stdout.write(f"Refreshed the statistics of {len(run.analyzed)} table(s): {', '.join(run.analyzed)}")
+        if run.freed_pages:
+            self.stdout.write(
+                f'Returned {run.freed_pages:,} free pages ({_mb(run.freed_pages * run.page_size):.1f} MB) '
+                'to the file system.'
+            )
+        elif run.free_pages and not uses_incremental_vacuum(connection):
+            self.stdout.write(self.style.WARNING(
+                f'{_mb(run.free_pages * run.page_size):.1f} MB of free pages cannot be returned while the database '
+                'runs without incremental auto-vacuum; run db_maintenance --enable-incremental-vacuum off-hours.'
+            ))
+        self.stdout.write(self.style.SUCCESS(f'Maintenance finished in {run.seconds:.1f}s.'))
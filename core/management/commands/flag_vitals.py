@@ -0,0 +1,44 @@
+"""
+Recompute vitals anomaly flags for existing health records in batches.
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.anomalies import flag_patients
+from core.models import Patient
+
+
+class Command(BaseCommand):
+    help = 'Recomputes vitals anomaly flags for all (or selected) patients.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Number of patients whose full history is evaluated per batch (default: 500)',
+        )
+        parser.add_argument(
+            '--patient',
+            action='append',
+            default=[],
+            help='Limit to a patient_id (may be repeated)',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        patients = Patient.objects.order_by('pk')
+        if options['patient']:
+            patients = patients.filter(patient_id__in=options['patient'])
+        patient_ids = list(patients.values_list('pk', flat=True))
+
+        started = time.monotonic()
+        total = 0
+        for offset in range(0, len(patient_ids), batch_size):
+            batch = patient_ids[offset:offset + batch_size]
+            total += flag_patients(batch)
+            self.stdout.write(f'Processed {offset + len(batch)}/{len(patient_ids)} patients ({total} flags)')
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(f'Stored {total} flags in {elapsed:.1f}s.'))
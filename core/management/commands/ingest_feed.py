@@ -0,0 +1,101 @@
+"""
+Stream an HL7 v2 or CSV lab/ADT feed into patient health records.
+
+Progress is checkpointed after every batch; running the command again on the
+same file resumes after the last committed batch (use --restart to start
+over).  See core.ingest for the supported message layout and CSV columns.
+"""
+import hashlib
+import time
+from itertools import islice
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from core.ingest import FeedWriter, batched, checkpoint_for, read_csv, read_hl7
+from core.models import Department, Doctor
+
+
+class Command(BaseCommand):
+    help = 'Imports vitals from an HL7 v2 (ORU/ADT) or CSV feed file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Feed file to import')
+        parser.add_argument(
+            '--format',
+            choices=('auto', 'hl7', 'csv'),
+            default='auto',
+            help='Feed format (default: guessed from the file contents)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Messages/rows written per transaction and checkpoint (default: 500)',
+        )
+        parser.add_argument('--department', help='Department for readings whose department is unknown')
+        parser.add_argument('--doctor', help='Doctor (full name) for readings whose doctor is unknown')
+        parser.add_argument('--restart', action='store_true', help='Ignore the checkpoint and start from the top')
+        parser.add_argument(
+            '--max-errors',
+            type=int,
+            default=20,
+            help='Number of rejected readings to print (default: 20)',
+        )
+
+    def handle(self, *args, **options):
+        path = Path(options['path']).resolve()
+        if not path.is_file():
+            raise CommandError(f'{path} does not exist.')
+        with open(path, 'rb') as handle:
+            head = handle.read(1 << 16)
+        feed_format = options['format']
+        if feed_format == 'auto':
+            feed_format = 'hl7' if head.lstrip().startswith((b'MSH', b'FHS', b'BHS')) else 'csv'
+
+        default_department = default_doctor = None
+        if options['department']:
+            default_department = Department.objects.filter(name__iexact=options['department']).first()
+            if default_department is None:
+                raise CommandError(f"Unknown department {options['department']!r}.")
+        if options['doctor']:
+            default_doctor = Doctor.objects.filter(full_name__iexact=options['doctor']).first()
+            if default_doctor is None:
+                raise CommandError(f"Unknown doctor {options['doctor']!r}.")
+
+        checkpoint = checkpoint_for(path, hashlib.sha256(head).hexdigest(), restart=options['restart'])
+        if checkpoint.completed_at and not options['restart']:
+            self.stdout.write(f'{path.name} was already imported on {checkpoint.completed_at:%Y-%m-%d %H:%M}; '
+                              'use --restart to import it again.')
+            return
+        if checkpoint.position:
+            self.stdout.write(f'Resuming {path.name} after {checkpoint.position} messages/rows.')
+
+        writer = FeedWriter(checkpoint, default_department, default_doctor, source_name=path.name)
+        reader = read_hl7 if feed_format == 'hl7' else read_csv
+        started = time.monotonic()
+        created = printed = 0
+        with open(path, encoding='utf-8', errors='replace', newline='') as handle:
+            readings = islice(reader(handle), checkpoint.position, None)
+            for batch in batched(readings, options['batch_size']):
+                batch_created, errors = writer.write_batch(batch)
+                created += batch_created
+                for ref, message in errors:
+                    if printed < options['max_errors']:
+                        self.stderr.write(f'Skipped {ref or "reading"}: {message}')
+                        printed += 1
+                elapsed = time.monotonic() - started
+                self.stdout.write(
+                    f'{checkpoint.position} processed, {created} records created '
+                    f'({created / elapsed if elapsed else 0:.0f} records/s)'
+                )
+
+        checkpoint.completed_at = timezone.now()
+        checkpoint.save(update_fields=['completed_at', 'updated_at'])
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {created} records from {path.name} in {elapsed:.1f}s '
+            f'({created / elapsed if elapsed else 0:.0f} records/s); '
+            f'{checkpoint.skipped} readings skipped in total.'
+        ))
@@ -0,0 +1,207 @@
+"""
+Compare concurrent throughput of the WSGI and ASGI request handlers.
+
+Both handlers are driven in-process, without a server in front, so the
+numbers isolate what Django does with concurrency: WSGI requests run on a
+pool of ``--concurrency`` threads (like a threaded WSGI server), ASGI
+requests as ``--concurrency`` concurrent tasks on one event loop (like one
+uvicorn worker).  Middleware and database are whatever the active settings
+configure; run with ``DJANGO_SETTINGS_MODULE=hospital_site.settings_asgi``
+to measure the deployment profile.
+
+By default the pages served by the async views are requested as the first
+superuser; pass ``--as`` a doctor to include their patient list.
+"""
+import asyncio
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+from django.test import Client
+from django.urls import reverse
+
+from core.models import Department, PatientHealthRecord
+
+
+def _paths(user):
+    """The pages of the async views, with a patient and a record ``user`` may see."""
+    paths = [reverse('departments'), reverse('doctors')]
+    records = PatientHealthRecord.objects.order_by('pk')
+    if user.is_doctor:
+        paths.append(reverse('doctor_patients'))
+        records = records.filter(doctor__user=user)
+    elif not user.is_staff:
+        records = records.filter(patient__user=user)
+    record = records.first()
+    if record:
+        paths.append(reverse('patient_detail', args=[record.patient_id]))
+        paths.append(reverse('health_record_detail', args=[record.pk]))
+    department = Department.objects.order_by('pk').first()
+    if department:
+        paths.append(reverse('department_detail', args=[department.pk]))  # sync, for comparison
+    return paths
+
+
+def _summary(name, latencies, errors, elapsed):
+    latencies = sorted(latencies)
+    return {
+        'handler': name,
+        'requests': len(latencies),
+        'errors': errors,
+        'throughput': len(latencies) / elapsed,
+        'p50_ms': statistics.median(latencies) * 1000,
+        'p95_ms': latencies[int(len(latencies) * 0.95) - 1] * 1000,
+    }
+
+
+class Command(BaseCommand):
+    help = 'Measures concurrent throughput of the WSGI and ASGI handlers on the same pages.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='*', help='Paths to request in turn (default: the async views)')
+        parser.add_argument(
+            '--requests',
+            type=int,
+            default=500,
+            help='Requests per handler (default: 500)',
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=16,
+            help='Requests in flight at once (default: 16)',
+        )
+        parser.add_argument(
+            '--as',
+            dest='username',
+            help='User making the requests (default: the first superuser)',
+        )
+        parser.add_argument(
+            '--host',
+            default='localhost',
+            help='Host header; must be in ALLOWED_HOSTS (default: localhost)',
+        )
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        users = User.objects.filter(is_active=True)
+        username = options['username']
+        user = users.filter(username=username).first() if username else users.filter(is_superuser=True).first()
+        if user is None:
+            raise CommandError(f'No user {username!r}.' if username else 'No superuser; pass --as USERNAME.')
+        client = Client()
+        client.force_login(user)
+        self.cookie = f'{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}'
+        self.host = options['host']
+        paths = options['paths'] or _paths(user)
+        total, concurrency = options['requests'], options['concurrency']
+        self.stdout.write(f'{total} requests per handler, {concurrency} concurrent, over: {" ".join(paths)}')
+
+        # Warm up both handlers (template loading, first connections).
+        wsgi, asgi = get_wsgi_application(), get_asgi_application()
+        for path in paths:
+            for status in (self.wsgi_request(wsgi, path)[0], asyncio.run(self.asgi_request(asgi, path))[0]):
+                if status != 200:
+                    raise CommandError(f'{path} answered {status}.')
+
+        results = [self.run_wsgi(wsgi, paths, total, concurrency), self.run_asgi(asgi, paths, total, concurrency)]
+        for result in results:
+            self.stdout.write(
+                f'{result["handler"]}: {result["throughput"]:7.1f} req/s'
+                f'  p50 {result["p50_ms"]:7.1f} ms  p95 {result["p95_ms"]:7.1f} ms'
+                f'  ({result["errors"]} errors)'
+            )
+        ratio = results[1]['throughput'] / results[0]['throughput']
+        self.stdout.write(self.style.SUCCESS(f'ASGI/WSGI throughput: {ratio:.2f}x'))
+
+    def wsgi_request(self, application, path):
+        environ = {
+            'REQUEST_METHOD': 'GET',
+            'PATH_INFO': path,
+            'QUERY_STRING': '',
+            'SERVER_NAME': self.host,
+            'SERVER_PORT': '80',
+            'SERVER_PROTOCOL': 'HTTP/1.1',
+            'REMOTE_ADDR': '127.0.0.1',
+            'HTTP_HOST': self.host,
+            'HTTP_COOKIE': self.cookie,
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': 'http',
+            'wsgi.input': BytesIO(),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+        status = []
+        started = time.perf_counter()
+        body = application(environ, lambda line, headers: status.append(int(line.split()[0])))
+        try:
+            for _ in body:
+                pass
+        finally:
+            body.close()
+        return status[0], time.perf_counter() - started
+
+    async def asgi_request(self, application, path):
+        scope = {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': 'GET',
+            'scheme': 'http',
+            'path': path,
+            'raw_path': path.encode(),
+            'query_string': b'',
+            'root_path': '',
+            'headers': [(b'host', self.host.encode()), (b'cookie', self.cookie.encode())],
+            'client': ('127.0.0.1', 50000),
+            'server': (self.host, 80),
+        }
+        requested = False
+
+        async def receive():
+            nonlocal requested
+            if not requested:
+                requested = True
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+            await asyncio.Event().wait()  # the client never disconnects
+
+        status = []
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                status.append(message['status'])
+
+        started = time.perf_counter()
+        await application(scope, receive, send)
+        return status[0], time.perf_counter() - started
+
+    def run_wsgi(self, application, paths, total, concurrency):
+        started = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as pool:
+            results = list(pool.map(lambda n: self.wsgi_request(application, paths[n % len(paths)]), range(total)))
+        elapsed = time.perf_counter() - started
+        return _summary('WSGI', [t for _, t in results], sum(s != 200 for s, _ in results), elapsed)
+
+    def run_asgi(self, application, paths, total, concurrency):
+        async def run():
+            limit = asyncio.Semaphore(concurrency)
+
+            async def one(n):
+                async with limit:
+                    return await self.asgi_request(application, paths[n % len(paths)])
+
+            return await asyncio.gather(*(one(n) for n in range(total)))
+
+        started = time.perf_counter()
+        results = asyncio.run(run())
+        elapsed = time.perf_counter() - started
+        return _summary('ASGI', [t for _, t in results], sum(s != 200 for s, _ in results), elapsed)
@@ -0,0 +1,83 @@
+"""
+Physically remove soft-deleted patients, doctors and departments whose
+retention window (PURGE_AFTER_DAYS) has passed; see core.deletion.
+
+Meant to be scheduled off-peak.  Work is done in small transactions, so the
+command can be stopped at any time and resumes on the next run.
+"""
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from core.deletion import purge_cutoff, purge_patients, purge_unreferenced, purgeable
+from core.models import Department, Doctor, Patient
+
+
+class Command(BaseCommand):
+    help = 'Purges soft-deleted rows older than their retention period.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=50,
+            help='Patients, doctors or departments purged per batch (default: 50)',
+        )
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=0.0,
+            help='Seconds to pause between batches (default: 0)',
+        )
+        parser.add_argument(
+            '--older-than-days',
+            type=int,
+            help='Override PURGE_AFTER_DAYS for every model',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report what would be purged',
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive.')
+        now = timezone.now()
+        started = time.monotonic()
+        totals = {}
+        for model in (Patient, Doctor, Department):
+            if options['older_than_days'] is not None:
+                cutoff = now - timedelta(days=options['older_than_days'])
+            else:
+                cutoff = purge_cutoff(model, now)
+            label = model._meta.verbose_name_plural
+            due = model.all_objects.filter(deleted_at__lt=cutoff)
+            if options['dry_run']:
+                ready = due.count() if model is Patient else purgeable(model, cutoff).count()
+                self.stdout.write(f'{label}: {ready} of {due.count()} due would be purged.')
+                continue
+
+            purged = 0
+            while True:
+                if model is Patient:
+                    count = purge_patients(cutoff, options['batch_size'])
+                else:
+                    count = purge_unreferenced(model, cutoff, options['batch_size'])
+                if not count:
+                    break
+                purged += count
+                self.stdout.write(f'{label}: purged {purged} so far...')
+                if options['sleep']:
+                    time.sleep(options['sleep'])
+            totals[label] = purged
+            kept = due.count()
+            if kept:
+                self.stdout.write(f'{label}: {kept} kept because records still refer to them.')
+
+        if not options['dry_run']:
+            summary = ', '.join(f'{count} {label}' for label, count in totals.items())
+            elapsed = time.monotonic() - started
+            self.stdout.write(self.style.SUCCESS(f'Purged {summary} in {elapsed:.1f}s.'))
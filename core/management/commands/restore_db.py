@@ -0,0 +1,88 @@
+"""
+Restore the database from a snapshot taken by ``backup_db``.
+
+The snapshot is decompressed and checked (checksums, PRAGMA integrity_check)
+before anything is overwritten, and the current database is snapshotted
+first unless --no-safety-snapshot is given.  --check only verifies;
+--target restores into another file instead, e.g. a staging copy or an
+analytics replica.  --list shows the snapshots available.
+"""
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+
+from core.backups import (
+    SnapshotError,
+    create_snapshot,
+    find_snapshot,
+    list_snapshots,
+    restore_snapshot,
+    verify_snapshot,
+)
+
+
+class Command(BaseCommand):
+    help = 'Verifies a database snapshot and restores it over the database (or into another file).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('snapshot', nargs='?', help='Snapshot name or manifest path (default: the newest)')
+        parser.add_argument('--dir', help='Directory holding the snapshots (default: BACKUP_DIR)')
+        parser.add_argument('--list', action='store_true', help='List the snapshots and exit')
+        parser.add_argument('--check', action='store_true', help='Only verify the snapshot')
+        parser.add_argument('--target', help='Restore into this file instead of the database')
+        parser.add_argument(
+            '--no-safety-snapshot',
+            action='store_false',
+            dest='safety_snapshot',
+            help='Do not snapshot the current database before overwriting it',
+        )
+        parser.add_argument(
+            '--noinput',
+            '--no-input',
+            action='store_false',
+            dest='interactive',
+            help='Do not ask for confirmation',
+        )
+
+    def handle(self, *args, **options):
+        if options['list']:
+            for manifest in list_snapshots(options['dir']):
+                self.stdout.write(
+                    f"{manifest['name']}  {manifest['created_at']}  {manifest['size'] / 2 ** 20:8.1f} MB"
+                )
+            return
+
+        try:
+            manifest = find_snapshot(options['snapshot'], options['dir'])
+            if options['check']:
+                verify_snapshot(manifest)
+                self.stdout.write(self.style.SUCCESS(f"{manifest['name']} is intact."))
+                return
+
+            if options['target']:
+                restore_snapshot(manifest, target=options['target'])
+                self.stdout.write(self.style.SUCCESS(f"Restored {manifest['name']} into {options['target']}."))
+                return
+
+            if options['interactive']:
+                answer = input(
+                    f"This replaces the database {connection.settings_dict['NAME']} with {manifest['name']} "
+                    f"({manifest['created_at']}).\nType 'yes' to continue, or 'no' to cancel: "
+                )
+                if answer != 'yes':
+                    raise CommandError('Restore cancelled.')
+            if options['safety_snapshot']:
+                safety = create_snapshot(directory=options['dir'], keep=0, replica='', label='pre-restore')
+                self.stdout.write(f"Saved the current database as {safety['name']}.")
+            restore_snapshot(manifest)
+        except (SnapshotError, OSError) as exc:
+            raise CommandError(f'Restore failed: {exc}')
+
+        self.stdout.write(self.style.SUCCESS(f"Restored {manifest['name']}."))
+        executor = MigrationExecutor(connection)
+        pending = executor.migration_plan(executor.loader.graph.leaf_nodes())
+        if pending:
+            self.stdout.write(self.style.WARNING(
+                f'The snapshot predates {len(pending)} migration(s) of this code; run migrate.'
+            ))
+        self.stdout.write('Restart the web and worker processes so they drop cached data.')
@@ -0,0 +1,101 @@
+"""
+Run background job workers (see ``core.jobs``).
+
+Each worker thread polls for due jobs, claims them and runs their handler.
+``--processes`` forks that many worker processes, each running ``--threads``
+threads, for CPU-bound work that would otherwise serialize on the GIL.
+"""
+import multiprocessing
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connections
+
+from core.jobs import release_stale, run_pending, worker_id
+
+# How often the first thread of each process releases jobs from dead workers.
+RELEASE_INTERVAL = 60
+
+
+def work(threads, poll_interval, names, once):
+    """Entry point of one worker process."""
+    stop = threading.Event()
+
+    def loop(index):
+        worker = f'{worker_id()}#{index}'
+        last_release = time.monotonic()
+        try:
+            while not stop.is_set():
+                close_old_connections()
+                if index == 0 and time.monotonic() - last_release > RELEASE_INTERVAL:
+                    release_stale()
+                    last_release = time.monotonic()
+                ran = run_pending(names=names, worker=worker)
+                if once and not ran:
+                    break
+                if not ran:
+                    stop.wait(poll_interval)
+        finally:
+            connections.close_all()
+
+    pool = [threading.Thread(target=loop, args=(index,), daemon=True) for index in range(threads)]
+    for thread in pool:
+        thread.start()
+    try:
+        for thread in pool:
+            while thread.is_alive():
+                thread.join(timeout=1)
+    except KeyboardInterrupt:
+        stop.set()
+        for thread in pool:
+            thread.join()
+
+
+class Command(BaseCommand):
+    help = 'Processes queued background jobs.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=2, help='Worker threads per process (default: 2)')
+        parser.add_argument('--processes', type=int, default=1, help='Worker processes (default: 1)')
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=2.0,
+            help='Seconds an idle worker waits before polling again (default: 2)',
+        )
+        parser.add_argument(
+            '--name',
+            action='append',
+            default=[],
+            help='Only run jobs with this name (may be repeated)',
+        )
+        parser.add_argument('--once', action='store_true', help='Drain the queue and exit instead of polling')
+
+    def handle(self, *args, **options):
+        released = release_stale()
+        if released:
+            self.stdout.write(f'Released {released} jobs abandoned by a previous worker.')
+
+        args = (options['threads'], options['poll_interval'], options['name'] or None, options['once'])
+        started = time.monotonic()
+        if options['processes'] > 1:
+            # Children must open their own database connections.
+            connections.close_all()
+            children = [
+                multiprocessing.Process(target=work, args=args, daemon=False)
+                for _ in range(options['processes'])
+            ]
+            for child in children:
+                child.start()
+            try:
+                for child in children:
+                    child.join()
+            except KeyboardInterrupt:
+                for child in children:
+                    child.join()
+        else:
+            work(*args)
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(f'Workers stopped after {elapsed:.1f}s.'))
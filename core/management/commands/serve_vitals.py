@@ -0,0 +1,76 @@
+"""
+Accept streamed bedside monitor readings over TCP or a Unix socket.
+
+Readings are newline-delimited JSON, written to ``VitalsReading`` in
+micro-batches; see core.bedside for the format and the backpressure
+behaviour.  A status line is printed every ``--stats-interval`` seconds;
+SIGINT/SIGTERM stop the server after the queued readings are written.
+``simulate_vitals`` generates load against it.
+"""
+import asyncio
+import signal
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.bedside import VitalsServer
+
+
+class Command(BaseCommand):
+    help = 'Runs the ingestion server for streamed bedside vitals.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1', help='Address to listen on (default: 127.0.0.1)')
+        parser.add_argument('--port', type=int, default=8765, help='TCP port to listen on (default: 8765)')
+        parser.add_argument('--socket', help='Listen on this Unix socket instead of TCP')
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Most readings written per transaction (default: 500)',
+        )
+        parser.add_argument(
+            '--max-delay',
+            type=float,
+            default=0.25,
+            help='Seconds a reading may wait for its batch to fill (default: 0.25)',
+        )
+        parser.add_argument(
+            '--max-queue',
+            type=int,
+            default=10000,
+            help='Readings buffered before connections are paused (default: 10000)',
+        )
+        parser.add_argument(
+            '--stats-interval',
+            type=float,
+            default=10.0,
+            help='Seconds between status lines (default: 10)',
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1 or options['max_queue'] < options['batch_size']:
+            raise CommandError('--max-queue must be at least --batch-size, which must be positive.')
+        asyncio.run(self.serve(options))
+
+    async def serve(self, options):
+        server = VitalsServer(options['batch_size'], options['max_delay'], options['max_queue'])
+        try:
+            await server.start(options['host'], options['port'], options['socket'])
+        except OSError as exc:
+            raise CommandError(f'Cannot listen: {exc}')
+        where = options['socket'] or f"{options['host']}:{options['port']}"
+        self.stdout.write(f'Accepting vitals on {where}.')
+
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, stop.set)
+        while not stop.is_set():
+            try:
+                await asyncio.wait_for(stop.wait(), options['stats_interval'])
+            except TimeoutError:
+                self.stdout.write(server.status())
+
+        self.stdout.write('Stopping; writing queued readings.')
+        await server.stop()
+        self.stdout.write(self.style.SUCCESS(f'Stopped: {server.status()}'))
@@ -0,0 +1,123 @@
+"""
+Generate bedside monitor load against ``serve_vitals``.
+
+Each simulated bed is assigned an existing patient and sends a reading
+every ``--interval`` seconds (a random walk around normal values, with an
+occasional abnormal spike); beds are spread over ``--connections``
+connections.  ``--interval 0`` sends as fast as the server accepts, which
+shows its throughput and backpressure: time spent waiting for the server
+to read is reported as "blocked".
+"""
+import asyncio
+import json
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from core.models import Patient
+
+
+class Bed:
+    def __init__(self, name, patient_id):
+        self.name = name
+        self.patient_id = patient_id
+        self.heart_rate = random.gauss(78, 8)
+        self.systolic_bp = random.gauss(120, 10)
+        self.diastolic_bp = random.gauss(78, 6)
+
+    def reading(self):
+        self.heart_rate = min(max(self.heart_rate + random.gauss(0, 2), 45), 160)
+        self.systolic_bp = min(max(self.systolic_bp + random.gauss(0, 2), 80), 200)
+        self.diastolic_bp = min(max(self.diastolic_bp + random.gauss(0, 1.5), 45), 120)
+        spike = 1.4 if random.random() < 0.01 else 1
+        return json.dumps({
+            'patient_id': self.patient_id,
+            'bed': self.name,
+            'recorded_at': timezone.now().isoformat(),
+            'heart_rate': round(self.heart_rate * spike),
+            'systolic_bp': round(self.systolic_bp * spike),
+            'diastolic_bp': round(self.diastolic_bp),
+        }) + '\n'
+
+
+class Command(BaseCommand):
+    help = 'Streams simulated bedside vitals to a running serve_vitals.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1', help='Server address (default: 127.0.0.1)')
+        parser.add_argument('--port', type=int, default=8765, help='Server TCP port (default: 8765)')
+        parser.add_argument('--socket', help='Connect to this Unix socket instead of TCP')
+        parser.add_argument('--beds', type=int, default=50, help='Simulated beds (default: 50)')
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=2.0,
+            help='Seconds between readings of one bed; 0 sends as fast as possible (default: 2)',
+        )
+        parser.add_argument('--duration', type=float, default=30.0, help='Seconds to run (default: 30)')
+        parser.add_argument('--connections', type=int, default=1, help='Connections to spread the beds over (default: 1)')
+
+    def handle(self, *args, **options):
+        patient_ids = list(Patient.objects.order_by('pk').values_list('patient_id', flat=True)[:options['beds']])
+        if not patient_ids:
+            raise CommandError('There are no patients to attach beds to; run seed_data first.')
+        beds = [Bed(f'BED-{number + 1:03d}', patient_ids[number % len(patient_ids)]) for number in range(options['beds'])]
+        sent, blocked, elapsed = asyncio.run(self.simulate(beds, options))
+        self.stdout.write(self.style.SUCCESS(
+            f'Sent {sent} readings from {len(beds)} beds in {elapsed:.1f}s ({sent / elapsed:.0f}/s); '
+            f'blocked {blocked:.1f}s waiting for the server.'
+        ))
+
+    async def connect(self, options):
+        if options['socket']:
+            return await asyncio.open_unix_connection(options['socket'])
+        return await asyncio.open_connection(options['host'], options['port'])
+
+    async def simulate(self, beds, options):
+        count = max(1, min(options['connections'], len(beds)))
+        try:
+            connections = [(await self.connect(options))[1] for _ in range(count)]
+        except OSError as exc:
+            raise CommandError(f'Cannot connect: {exc}')
+        sent = 0
+        blocked = 0.0
+        started = time.monotonic()
+        deadline = started + options['duration']
+
+        async def run(writer, group):
+            nonlocal sent, blocked
+            interval = options['interval']
+            # Beds on one connection start staggered rather than in lockstep.
+            await asyncio.sleep(random.uniform(0, interval))
+            next_at = time.monotonic()
+            while time.monotonic() < deadline:
+                for bed in group:
+                    writer.write(bed.reading().encode())
+                sent += len(group)
+                waiting = time.monotonic()
+                await writer.drain()
+                blocked += time.monotonic() - waiting
+                if interval:
+                    next_at += interval
+                    await asyncio.sleep(max(0, next_at - time.monotonic()))
+
+        # One sender per bed when paced, so each keeps its own schedule;
+        # flat out, one per connection sending all its beds at once.
+        paced = options['interval'] > 0
+        tasks = []
+        for index, writer in enumerate(connections):
+            group = beds[index::count]
+            if paced:
+                tasks.extend(run(writer, [bed]) for bed in group)
+            else:
+                tasks.append(run(writer, group))
+        try:
+            await asyncio.gather(*tasks)
+        except ConnectionError as exc:
+            raise CommandError(f'The server closed the connection: {exc}')
+        finally:
+            for writer in connections:
+                writer.close()
+        return sent, blocked, time.monotonic() - started
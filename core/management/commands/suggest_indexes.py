@@ -0,0 +1,188 @@
+"""
+Suggest indexes for Patient, PatientHealthRecord and AuditLog from a real
+workload (see core.indexadvisor).
+
+The workload is either a query log (``--log``, one ``{"sql": ..., "time":
+...}`` object per line, e.g. ``connection.queries`` dumped by a benchmark
+run) or recorded here by requesting pages as a superuser (``--record``).
+Recorded requests run inside a transaction that is rolled back, and the
+candidates are tried on a scratch copy of the database, so the command
+never changes the data or the schema it is pointed at.  Run it against a
+seeded database of realistic size; on a near-empty one every plan is fast.
+"""
+import json
+import os
+import sys
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from core import indexadvisor, migrations
+
+DEFAULT_PAGES = ['dashboard', 'patient_list', 'departments', 'doctors', 'flagged_readings']
+
+
+class Command(BaseCommand):
+    help = 'Replays a query workload and suggests indexes, with a migration adding them.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--log',
+            help='Query log to replay (NDJSON with "sql" and "time" in seconds; "-" for stdin)',
+        )
+        parser.add_argument(
+            '--record',
+            nargs='*',
+            metavar='URL',
+            help=f'Record the workload by requesting these paths (default: {", ".join(DEFAULT_PAGES)})',
+        )
+        parser.add_argument(
+            '--as',
+            dest='username',
+            help='User the pages are requested as with --record (default: the first superuser)',
+        )
+        parser.add_argument(
+            '--save-log',
+            help='Write the recorded workload to this file, for replaying later with --log',
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=3,
+            help='Timing runs per statement; the fastest counts (default: 3)',
+        )
+        parser.add_argument(
+            '--min-speedup',
+            type=float,
+            default=1.1,
+            help='Only suggest indexes that make the statements using them this much faster (default: 1.1)',
+        )
+        parser.add_argument(
+            '--write',
+            action='store_true',
+            help='Write the migration to core/migrations/ instead of only printing it',
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('suggest_indexes replays the workload on a copy of a SQLite database.')
+        if bool(options['log']) == (options['record'] is not None):
+            raise CommandError('Give either --log or --record.')
+
+        if options['log']:
+            if options['log'] == '-':
+                queries = indexadvisor.load_log(sys.stdin)
+            else:
+                with open(options['log']) as fh:
+                    queries = indexadvisor.load_log(fh)
+        else:
+            queries = self.record(options['record'] or [reverse(name) for name in DEFAULT_PAGES],
+                                  options['username'])
+            if options['save_log']:
+                with open(options['save_log'], 'w') as fh:
+                    fh.writelines(json.dumps(query) + '\n' for query in queries)
+        if not queries:
+            raise CommandError('The workload is empty.')
+
+        statements = indexadvisor.group(queries)
+        scratch, path = indexadvisor.scratch_copy()
+        try:
+            indexadvisor.replay(scratch, statements, options['repeat'])
+            indexes = indexadvisor.existing_indexes(scratch)
+            results = []
+            for candidate in indexadvisor.candidates(statements, indexes):
+                result = indexadvisor.evaluate(scratch, candidate, statements, options['repeat'])
+                if result and result.saved > 0 and result.speedup >= options['min_speedup']:
+                    results.append(result)
+            unused = indexadvisor.unused_indexes(scratch, statements, indexes)
+        finally:
+            scratch.close()
+            os.unlink(path)
+
+        self.report_workload(statements)
+        results.sort(key=lambda result: result.saved, reverse=True)
+        results = self.without_redundant(results)
+        self.report_suggestions(results, statements)
+        self.report_unused(unused)
+        if results:
+            filename, source = indexadvisor.migration_for(results)
+            if options['write']:
+                target = os.path.join(os.path.dirname(migrations.__file__), filename)
+                with open(target, 'w') as fh:
+                    fh.write(source)
+                self.stdout.write(self.style.SUCCESS(f'Wrote {target}.'))
+            else:
+                self.stdout.write(f'\nMigration ({filename}):\n')
+                self.stdout.write(source)
+
+    def record(self, paths, username):
+        User = get_user_model()
+        users = User.objects.filter(is_active=True)
+        user = users.filter(username=username).first() if username else users.filter(is_superuser=True).first()
+        if user is None:
+            raise CommandError(f'No user {username!r}.' if username else 'No superuser; pass --as USERNAME.')
+        client = Client()
+        client.force_login(user)
+        queries = []
+        with transaction.atomic():
+            with CaptureQueriesContext(connection) as captured:
+                for path in paths:
+                    response = client.get(path)
+                    if response.status_code != 200:
+                        self.stderr.write(f'{path}: HTTP {response.status_code}')
+            queries = [{'sql': query['sql'], 'time': float(query['time'])} for query in captured.captured_queries]
+            transaction.set_rollback(True)
+        self.stdout.write(f'Recorded {len(queries)} queries from {len(paths)} pages.')
+        return queries
+
+    def without_redundant(self, results):
+        """Drop a suggestion when a better one on the same table starts with the same columns."""
+        kept = []
+        for result in results:
+            columns = result.candidate.columns
+            if not any(
+                other.candidate.table == result.candidate.table and other.candidate.columns[:len(columns)] == columns
+                for other in kept
+            ):
+                kept.append(result)
+        return kept
+
+    def report_workload(self, statements):
+        total = sum(statement.weight for statement in statements) or 1
+        self.stdout.write(f'{sum(s.count for s in statements)} statements, {len(statements)} fingerprints.')
+        self.stdout.write('Heaviest reads (count x replay time):')
+        for statement in sorted(statements, key=lambda s: s.weight, reverse=True)[:10]:
+            if statement.weight:
+                self.stdout.write(
+                    f'  {statement.weight / total:6.1%}  {statement.count:5d} x {statement.replay_time * 1000:8.3f} ms'
+                    f'  {statement.fingerprint[:120]}'
+                )
+
+    def report_suggestions(self, results, statements):
+        total = sum(statement.weight for statement in statements) or 1
+        if not results:
+            self.stdout.write(self.style.SUCCESS('\nNo index would speed up this workload.'))
+            return
+        self.stdout.write('\nSuggested indexes:')
+        for result in results:
+            self.stdout.write(
+                f'  {result.candidate}: {result.speedup:.1f}x faster on {len(result.statements)} statement(s),'
+                f' saves {result.saved * 1000:.2f} ms ({result.saved / total:.1%} of the read time)'
+            )
+
+    def report_unused(self, unused):
+        if not unused:
+            return
+        self.stdout.write('\nExisting indexes no statement used (maintained on every write):')
+        for index in unused:
+            note = ' (backs a foreign key)' if index['foreign_key'] else ''
+            if index['covered_by']:
+                note += f'; redundant with {index["covered_by"]}'
+            self.stdout.write(
+                f'  {index["name"]} on {index["table"]}({", ".join(index["columns"])}):'
+                f' {index["writes"]} logged writes{note}'
+            )
@@ -0,0 +1,85 @@
+"""
+Download the pinned third-party browser assets (core.assets.VENDORED_ASSETS)
+into static/vendor/, so that they are served, fingerprinted and cached with
+the rest of the static files instead of coming from a CDN.
+
+The SHA-256 of every file is recorded in static/vendor/vendor.lock.json.  A
+later download that does not match the recorded hash is refused, and
+``--check`` verifies the committed files without touching the network.
+"""
+import hashlib
+import json
+import urllib.request
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.assets import VENDORED_ASSETS
+
+
+class Command(BaseCommand):
+    help = 'Vendors pinned third-party static assets into static/vendor/.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'names',
+            nargs='*',
+            help=f'Assets to vendor (default: all of {", ".join(VENDORED_ASSETS)})',
+        )
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Only verify the vendored files against the lock file',
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Download again even if the file is already vendored',
+        )
+
+    def handle(self, *args, **options):
+        static_dir = settings.BASE_DIR / 'static'
+        lock_path = static_dir / 'vendor' / 'vendor.lock.json'
+        lock = json.loads(lock_path.read_text()) if lock_path.exists() else {}
+        names = options['names'] or list(VENDORED_ASSETS)
+        unknown = set(names) - set(VENDORED_ASSETS)
+        if unknown:
+            raise CommandError(f'Unknown assets: {", ".join(sorted(unknown))}')
+
+        if options['check']:
+            problems = []
+            for name in names:
+                _, path = VENDORED_ASSETS[name]
+                target = static_dir / path
+                if not target.exists():
+                    problems.append(f'{name}: not vendored')
+                elif lock.get(path, {}).get('sha256') != hashlib.sha256(target.read_bytes()).hexdigest():
+                    problems.append(f'{name}: does not match vendor.lock.json')
+            if problems:
+                raise CommandError('; '.join(problems))
+            self.stdout.write(self.style.SUCCESS(f'{len(names)} vendored assets verified.'))
+            return
+
+        for name in names:
+            url, path = VENDORED_ASSETS[name]
+            target = static_dir / path
+            if target.exists() and not options['force']:
+                self.stdout.write(f'{name}: already vendored.')
+                continue
+            try:
+                with urllib.request.urlopen(url, timeout=30) as response:
+                    content = response.read()
+            except OSError as exc:
+                raise CommandError(f'{name}: could not download {url}: {exc}')
+            digest = hashlib.sha256(content).hexdigest()
+            pinned = lock.get(path, {}).get('sha256')
+            if pinned and pinned != digest:
+                raise CommandError(f'{name}: {url} no longer matches the hash in vendor.lock.json.')
+            target.parent.mkdir(parents=True, exist_ok=True)
+            target.write_bytes(content)
+            lock[path] = {'url': url, 'sha256': digest}
+            self.stdout.write(f'{name}: {len(content)} bytes -> static/{path}')
+
+        lock_path.parent.mkdir(parents=True, exist_ok=True)
+        lock_path.write_text(json.dumps(lock, indent=2, sort_keys=True) + '\n')
+        self.stdout.write(self.style.SUCCESS('Vendored assets are up to date; run collectstatic to publish them.'))
@@ -0,0 +1,388 @@
+"""
+Prometheus metrics, served as text at ``/metrics``.
+
+Recording is cheap: every thread increments plain dicts of its own, so the
+request path takes no lock.  Per-thread stores are only merged when metrics
+are rendered (stores of finished threads are folded into one retired store
+then, so threaded servers do not accumulate them).
+
+With several worker processes each one writes its merged totals to
+``METRICS_DIR/<pid>.json`` at most every ``METRICS_FLUSH_INTERVAL`` seconds
+(and at exit); a scrape flushes the answering process and sums every file,
+so whichever worker gets the request reports for the whole deployment.
+Empty the directory when the service is (re)started.
+
+What is recorded:
+
+* ``MetricsMiddleware``: request latency and count per URL name, and the
+  database time and query count spent by each request;
+* ``LocMemCache``: cache gets by key family (the key up to its last ``:`` or
+  ``.`` segment), as hits and misses;
+* ``core.jobs``: background job run times and outcomes per task;
+* ``core.bedside``: streamed bedside readings by outcome, the lag from
+  receiving a reading to committing it, batch write times, and how long
+  connections were paused for backpressure;
+* at scrape time: job queue depth/lag, pending deletion audit entries and
+  the age of the newest database snapshot (``core.backups``).
+"""
+import atexit
+import ipaddress
+import json
+import os
+import tempfile
+import threading
+import time
+import weakref
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import ExitStack
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache.backends import locmem
+from django.db import connections
+from django.db.models import Count, Min
+from django.utils import timezone
+
+# Upper bounds (seconds) of the histogram buckets; +Inf is implied.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+METRICS = {
+    'http_requests_total': ('counter', 'Requests handled, by URL name, method and status code.'),
+    'http_request_duration_seconds': ('histogram', 'Time spent handling a request, by URL name.'),
+    'db_query_duration_seconds': ('histogram', 'Database time spent per request, by URL name.'),
+    'db_queries_total': ('counter', 'Database queries executed, by URL name.'),
+    'cache_requests_total': ('counter', 'Cache gets, by key family and result (hit or miss).'),
+    'cache_hit_ratio': ('gauge', 'Share of cache gets that were hits, by key family.'),
+    'job_duration_seconds': ('histogram', 'Background job run time, by task.'),
+    'jobs_finished_total': ('counter', 'Background job attempts, by task and outcome.'),
+    'vitals_readings_total': ('counter', 'Streamed bedside readings, by outcome.'),
+    'vitals_ingest_lag_seconds': ('histogram', 'Time from receiving a bedside reading to committing it.'),
+    'vitals_batch_duration_seconds': ('histogram', 'Time spent writing one batch of bedside readings.'),
+    'vitals_backpressure_seconds_total': ('counter', 'Time connections were paused because the ingest queue was full.'),
+    'jobs_queue_depth': ('gauge', 'Jobs waiting or running, by task and state.'),
+    'jobs_queue_lag_seconds': ('gauge', 'How long the oldest due job has been waiting.'),
+    'audit_pending_deletions': ('gauge', 'Deletion audit entries whose purge has not completed.'),
+    'db_backup_age_seconds': ('gauge', 'Time since the newest database snapshot was taken.'),
+}
+
+
+class _Store:
+    __slots__ = ('counters', 'histograms', '__weakref__')
+
+    def __init__(self):
+        self.counters = defaultdict(float)
+        self.histograms = {}
+
+    def merge(self, counters, histograms):
+        for key, value in counters.items():
+            self.counters[key] += value
+        for key, value in histograms.items():
+            merged = self.histograms.setdefault(key, [0] * len(value))
+            for index, amount in enumerate(value):
+                merged[index] += amount
+
+
+_local = threading.local()
+_stores = []  # (thread weakref, store)
+_stores_lock = threading.Lock()
+_retired = _Store()
+_last_flush = time.monotonic()
+
+
+def _store():
+    try:
+        return _local.store
+    except AttributeError:
+        store = _local.store = _Store()
+        with _stores_lock:
+            _stores.append((weakref.ref(threading.current_thread()), store))
+        return store
+
+
+def _key(name, labels):
+    return (name, tuple(sorted(labels.items())))
+
+
+def inc(name, amount=1, **labels):
+    """Add ``amount`` to a counter."""
+    _store().counters[_key(name, labels)] += amount
+
+
+def observe(name, value, **labels):
+    """Record ``value`` in a histogram (bucket counts followed by the sum)."""
+    histograms = _store().histograms
+    key = _key(name, labels)
+    buckets = histograms.get(key)
+    if buckets is None:
+        buckets = histograms[key] = [0] * (len(BUCKETS) + 2)
+    buckets[bisect_left(BUCKETS, value)] += 1
+    buckets[-1] += value
+
+
+def collect():
+    """Totals of this process: every thread's store merged."""
+    total = _Store()
+    with _stores_lock:
+        alive = []
+        for thread, store in _stores:
+            # Copies are taken in C, so a thread recording concurrently
+            # cannot break the iteration.
+            counters, histograms = store.counters.copy(), {k: v[:] for k, v in store.histograms.copy().items()}
+            if thread() is None or not thread().is_alive():
+                _retired.merge(counters, histograms)
+            else:
+                alive.append((thread, store))
+                total.merge(counters, histograms)
+        _stores[:] = alive
+        total.merge(_retired.counters, _retired.histograms)
+    return total
+
+
+def reset():
+    """Forget everything recorded in this process (for tests)."""
+    global _retired
+    with _stores_lock:
+        for _, store in _stores:
+            store.counters.clear()
+            store.histograms.clear()
+        _retired = _Store()
+
+
+def _serialize(store):
+    return {
+        'counters': [[name, labels, value] for (name, labels), value in store.counters.items()],
+        'histograms': [[name, labels, value] for (name, labels), value in store.histograms.items()],
+    }
+
+
+def _deserialize(data):
+    def keyed(rows):
+        return {(name, tuple(tuple(pair) for pair in labels)): value for name, labels, value in rows}
+
+    return keyed(data['counters']), keyed(data['histograms'])
+
+
+def flush():
+    """Write this process's totals to ``METRICS_DIR`` (if configured)."""
+    global _last_flush
+    directory = getattr(settings, 'METRICS_DIR', None)
+    _last_flush = time.monotonic()
+    if not directory:
+        return
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    # Written to a temporary file and renamed, so readers never see half a file.
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    with os.fdopen(fd, 'w') as fh:
+        json.dump(_serialize(collect()), fh)
+    os.replace(tmp, directory / f'{os.getpid()}.json')
+
+
+def maybe_flush():
+    if time.monotonic() - _last_flush >= getattr(settings, 'METRICS_FLUSH_INTERVAL', 5):
+        flush()
+
+
+atexit.register(lambda: getattr(settings, 'METRICS_DIR', None) and flush())
+
+
+def gather():
+    """Totals of the whole deployment: every process's file, or this process alone."""
+    directory = getattr(settings, 'METRICS_DIR', None)
+    if not directory:
+        return collect()
+    flush()
+    total = _Store()
+    for path in Path(directory).glob('*.json'):
+        try:
+            total.merge(*_deserialize(json.loads(path.read_text())))
+        except (OSError, ValueError):
+            continue  # replaced or removed while we read it
+    return total
+
+
+def _scrape_gauges():
+    """Gauges read from the database at scrape time: {(name, labels): value}."""
+    # Imported here: the cache backend below may be loaded before the models.
+    from .backups import latest_snapshot_time
+    from .models import AuditLog, Job
+
+    gauges = {}
+    open_jobs = Job.objects.filter(state__in=[Job.States.QUEUED, Job.States.RUNNING]).order_by()
+    for row in open_jobs.values('name', 'state').annotate(count=Count('pk')):
+        gauges[_key('jobs_queue_depth', {'task': row['name'], 'state': row['state']})] = row['count']
+    oldest = (
+        Job.objects.filter(state=Job.States.QUEUED, run_after__lte=timezone.now())
+        .aggregate(oldest=Min('run_after'))['oldest']
+    )
+    lag = (timezone.now() - oldest).total_seconds() if oldest else 0
+    gauges[_key('jobs_queue_lag_seconds', {})] = lag
+    gauges[_key('audit_pending_deletions', {})] = AuditLog.objects.filter(
+        action='delete_patient', details__state='pending',
+    ).count()
+    taken = latest_snapshot_time()
+    if taken is not None:
+        gauges[_key('db_backup_age_seconds', {})] = (timezone.now() - taken).total_seconds()
+    return gauges
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (
+        (name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in pairs
+    )
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+def render():
+    """The Prometheus text exposition of every metric."""
+    store = gather()
+    gauges = _scrape_gauges()
+
+    hits = defaultdict(lambda: [0, 0])
+    for (name, labels), value in store.counters.items():
+        if name == 'cache_requests_total':
+            label_map = dict(labels)
+            hits[label_map.get('cache', '')][label_map.get('result') == 'hit'] += value
+    for family, (misses, hit_count) in hits.items():
+        gauges[_key('cache_hit_ratio', {'cache': family})] = hit_count / ((misses + hit_count) or 1)
+
+    series = defaultdict(list)
+    for (name, labels), value in store.counters.items():
+        series[name].append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+    for (name, labels), value in gauges.items():
+        series[name].append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+    for (name, labels), buckets in store.histograms.items():
+        cumulative = 0
+        for bound, count in zip(BUCKETS + ('+Inf',), buckets[:-1]):
+            cumulative += count
+            series[name].append(f'{name}_bucket{_format_labels(labels, [("le", bound)])} {cumulative}')
+        series[name].append(f'{name}_sum{_format_labels(labels)} {_format_value(buckets[-1])}')
+        series[name].append(f'{name}_count{_format_labels(labels)} {cumulative}')
+
+    lines = []
+    for name, (kind, description) in METRICS.items():
+        if series.get(name):
+            lines.append(f'# HELP {name} {description}')
+            lines.append(f'# TYPE {name} {kind}')
+            lines.extend(sorted(series[name]))
+    return '\n'.join(lines) + '\n'
+
+
+def is_internal(request):
+    """
+    True for scrapers allowed to read ``/metrics``: a matching bearer token
+    (``METRICS_TOKEN``), or a direct connection from ``METRICS_ALLOWED_NETWORKS``.
+    Requests relayed by the load balancer (``X-Forwarded-For``) never count as
+    direct, so the balancer's own address cannot be used to reach the endpoint.
+    """
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if token and request.headers.get('Authorization') == f'Bearer {token}':
+        return True
+    if 'X-Forwarded-For' in request.headers:
+        return False
+    try:
+        address = ipaddress.ip_address(request.META.get('REMOTE_ADDR', ''))
+    except ValueError:
+        return False
+    return any(address in ipaddress.ip_network(network) for network in settings.METRICS_ALLOWED_NETWORKS)
+
+
+class _QueryTimer:
+    def __init__(self):
+        self.count = 0
+        self.elapsed = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.elapsed += time.perf_counter() - started
+            self.count += 1
+
+
+def wrap_connections(wrapper):
+    """Install ``wrapper`` on this thread's connections until the returned stack is closed."""
+    stack = ExitStack()
+    for alias in connections:
+        stack.enter_context(connections[alias].execute_wrapper(wrapper))
+    return stack
+
+
+class MetricsMiddleware:
+    """Records latency and database time per request, labelled by URL name."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timer = _QueryTimer()
+        started = time.perf_counter()
+        with wrap_connections(timer):
+            response = self.get_response(request)
+        self.record(request, response, time.perf_counter() - started, timer)
+        return response
+
+    async def __acall__(self, request):
+        timer = _QueryTimer()
+        started = time.perf_counter()
+        # Under ASGI the queries run in the request's worker thread, which
+        # has its own connections.
+        stack = await sync_to_async(wrap_connections)(timer)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+        self.record(request, response, time.perf_counter() - started, timer)
+        return response
+
+    def record(self, request, response, elapsed, timer):
+        match = request.resolver_match
+        # Unresolved paths share one label so that scanners cannot blow up
+        # the number of series.
+        view = match.view_name if match else 'unmatched'
+        observe('http_request_duration_seconds', elapsed, view=view)
+        inc('http_requests_total', view=view, method=request.method, status=str(response.status_code))
+        observe('db_query_duration_seconds', timer.elapsed, view=view)
+        inc('db_queries_total', timer.count, view=view)
+        maybe_flush()
+
+
+_MISSING = object()
+
+
+def _key_family(key):
+    head, sep, _ = str(key).rpartition(':')
+    if not sep:
+        head, sep, _ = str(key).rpartition('.')
+    return head if sep else str(key)
+
+
+class MetricsCacheMixin:
+    """Counts hits and misses of ``get`` (``get_many`` and ``get_or_set`` go through it)."""
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, _MISSING, version)
+        inc('cache_requests_total', cache=_key_family(key), result='miss' if value is _MISSING else 'hit')
+        return default if value is _MISSING else value
+
+
+class LocMemCache(MetricsCacheMixin, locmem.LocMemCache):
+    pass
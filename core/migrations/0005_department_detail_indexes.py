@@ -0,0 +1,21 @@
+# Generated by Django 5.1.2 on 2026-10-19 09:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_patient_city'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='patienthealthrecord',
+            index=models.Index(fields=['department', 'doctor', 'record_date'], name='core_patien_departm_76cf88_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patienthealthrecord',
+            index=models.Index(fields=['department', 'patient'], name='core_patien_departm_4acc39_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.2 on 2026-10-19 09:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_diagnosis_visit_type_dictionaries'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='City',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('normalized_name', models.CharField(max_length=255, unique=True)),
+                ('region', models.CharField(blank=True, help_text='Optional state/region for roll-ups', max_length=120)),
+            ],
+            options={
+                'verbose_name_plural': 'cities',
+                'ordering': ['name'],
+                'abstract': False,
+            },
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='city_ref',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='patients', to='core.city'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.1.2 on 2026-10-19 09:15
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_city_dimension'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VitalsFlag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('record_date', models.DateTimeField(help_text='Copied from the record so the work queue sorts on one table')),
+                ('kind', models.CharField(choices=[('hypertensive_crisis', 'Hypertensive crisis'), ('hypotension', 'Hypotension'), ('tachycardia', 'Tachycardia'), ('bradycardia', 'Bradycardia'), ('fever', 'Fever'), ('hypothermia', 'Hypothermia'), ('weight_change', 'Sudden weight change'), ('systolic_deviation', 'Unusual blood pressure for patient'), ('heart_rate_deviation', 'Unusual heart rate for patient')], max_length=32)),
+                ('severity', models.CharField(choices=[('warning', 'Warning'), ('critical', 'Critical')], max_length=10)),
+                ('value', models.FloatField()),
+                ('zscore', models.FloatField(blank=True, help_text="Deviation from the patient's recent readings", null=True)),
+                ('acknowledged_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('acknowledged_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='acknowledged_flags', to=settings.AUTH_USER_MODEL)),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='vitals_flags', to='core.patient')),
+                ('record', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='flags', to='core.patienthealthrecord')),
+            ],
+            options={
+                'ordering': ['-record_date'],
+                'indexes': [models.Index(fields=['acknowledged_at', '-record_date'], name='core_vitals_acknowl_e94ea6_idx'), models.Index(fields=['kind', '-record_date'], name='core_vitals_kind_15e073_idx'), models.Index(fields=['patient', '-record_date'], name='core_vitals_patient_8f3de6_idx')],
+                'constraints': [models.UniqueConstraint(fields=('record', 'kind'), name='unique_flag_per_record_kind')],
+            },
+        ),
+    ]
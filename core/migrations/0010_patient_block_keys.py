@@ -0,0 +1,25 @@
+# Generated by Django 5.1.2 on 2026-10-19 09:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_job_queue'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PatientBlockKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(db_index=True, max_length=64)),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='block_keys', to='core.patient')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('patient', 'key'), name='unique_block_key_per_patient')],
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.1.2 on 2026-10-19 09:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_patient_block_keys'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['registration_date'], name='core_patien_registr_4ee2d3_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patienthealthrecord',
+            index=models.Index(fields=['created_at'], name='core_patien_created_3cc85e_idx'),
+        ),
+    ]
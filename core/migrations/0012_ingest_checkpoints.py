@@ -0,0 +1,26 @@
+# Generated by Django 5.1.2 on 2026-10-19 09:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_export_since_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngestCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(help_text='Absolute path of the feed file', max_length=500, unique=True)),
+                ('fingerprint', models.CharField(help_text='SHA-256 of the first 64 KiB, to detect a replaced file', max_length=64)),
+                ('position', models.PositiveBigIntegerField(default=0, help_text='Messages/rows already consumed')),
+                ('created', models.PositiveIntegerField(default=0)),
+                ('skipped', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 5.1.2 on 2026-10-19 09:37
+
+import django.db.models.deletion
+import django.db.models.functions.comparison
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_ingest_checkpoints'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedHealthRecord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('original_id', models.BigIntegerField(unique=True)),
+                ('record_date', models.DateTimeField()),
+                ('systolic_bp', models.IntegerField(blank=True, null=True)),
+                ('diastolic_bp', models.IntegerField(blank=True, null=True)),
+                ('heart_rate', models.IntegerField(blank=True, null=True)),
+                ('temperature', models.DecimalField(blank=True, decimal_places=2, max_digits=4, null=True)),
+                ('weight', models.DecimalField(blank=True, decimal_places=2, max_digits=5, null=True)),
+                ('height', models.DecimalField(blank=True, decimal_places=2, max_digits=5, null=True)),
+                ('bmi', models.DecimalField(blank=True, decimal_places=2, max_digits=5, null=True)),
+                ('symptoms', models.TextField(blank=True)),
+                ('diagnosis', models.CharField(blank=True, max_length=255)),
+                ('medications', models.TextField(blank=True)),
+                ('notes', models.TextField(blank=True)),
+                ('visit_type', models.CharField(blank=True, max_length=50)),
+                ('created_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('department', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.PROTECT, related_name='archived_records', to='core.department')),
+                ('diagnosis_ref', models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='archived_records', to='core.diagnosis')),
+                ('doctor', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.PROTECT, related_name='archived_records', to='core.doctor')),
+                ('patient', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='archived_records', to='core.patient')),
+                ('visit_type_ref', models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='archived_records', to='core.visittype')),
+            ],
+            options={
+                'ordering': ['-record_date'],
+                'indexes': [models.Index(fields=['patient', '-record_date'], name='core_archiv_patient_3dabc2_idx'), models.Index(fields=['department', 'patient'], name='core_archiv_departm_c606e5_idx'), models.Index(fields=['doctor', 'patient'], name='core_archiv_doctor__cddbc6_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchiveRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.PositiveSmallIntegerField()),
+                ('bmi_band', models.CharField(blank=True, max_length=32)),
+                ('record_count', models.PositiveIntegerField(default=0)),
+                ('systolic_sum', models.BigIntegerField(default=0)),
+                ('systolic_count', models.PositiveIntegerField(default=0)),
+                ('diastolic_sum', models.BigIntegerField(default=0)),
+                ('diastolic_count', models.PositiveIntegerField(default=0)),
+                ('heart_rate_sum', models.BigIntegerField(default=0)),
+                ('heart_rate_count', models.PositiveIntegerField(default=0)),
+                ('department', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archive_rollups', to='core.department')),
+                ('diagnosis_ref', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='archive_rollups', to='core.diagnosis')),
+                ('visit_type_ref', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='archive_rollups', to='core.visittype')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(models.F('year'), models.F('department'), django.db.models.functions.comparison.Coalesce('diagnosis_ref', 0), django.db.models.functions.comparison.Coalesce('visit_type_ref', 0), models.F('bmi_band'), name='unique_archive_rollup_group')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.2 on 2026-10-19 09:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_health_record_archive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='patient',
+            name='deletion_requested_at',
+            field=models.DateTimeField(blank=True, editable=False, help_text='Set while a background deletion is pending', null=True),
+        ),
+    ]
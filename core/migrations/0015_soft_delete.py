@@ -0,0 +1,55 @@
+# Generated by Django 5.1.2 on 2026-10-19 09:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_patient_deletion_requested_at'),
+    ]
+
+    operations = [
+        # Patients pending background deletion become soft-deleted ones.
+        migrations.RenameField(
+            model_name='patient',
+            old_name='deletion_requested_at',
+            new_name='deleted_at',
+        ),
+        migrations.AddField(
+            model_name='department',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='doctor',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AlterField(
+            model_name='patient',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AlterField(
+            model_name='department',
+            name='name',
+            field=models.CharField(max_length=120),
+        ),
+        migrations.AddIndex(
+            model_name='department',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', False)), fields=['deleted_at'], name='core_department_deleted_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='doctor',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', False)), fields=['deleted_at'], name='core_doctor_deleted_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', False)), fields=['deleted_at'], name='core_patient_deleted_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='department',
+            constraint=models.UniqueConstraint(condition=models.Q(('deleted_at__isnull', True)), fields=('name',), name='unique_live_department_name', violation_error_message='A department with this name already exists.'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.1.2 on 2026-10-19 10:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_patient_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VitalsReading',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bed', models.CharField(blank=True, max_length=40)),
+                ('recorded_at', models.DateTimeField(help_text='When the monitor took the reading')),
+                ('received_at', models.DateTimeField(help_text='When the ingestion server accepted it')),
+                ('heart_rate', models.PositiveSmallIntegerField(blank=True, help_text='Heart rate (bpm)', null=True)),
+                ('systolic_bp', models.PositiveSmallIntegerField(blank=True, help_text='Systolic blood pressure (mmHg)', null=True)),
+                ('diastolic_bp', models.PositiveSmallIntegerField(blank=True, help_text='Diastolic blood pressure (mmHg)', null=True)),
+                ('patient', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='vitals_readings', to='core.patient')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['patient', '-recorded_at'], name='core_vitals_patient_39b1a2_idx'), models.Index(fields=['recorded_at'], name='core_vitals_recorde_032236_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 5.1.2 on 2026-10-19 10:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# The foreign key indexes replaced by the (column, -record_date) indexes
+# below.  Dropped directly: altering db_index makes SQLite rebuild the table.
+REPLACED_INDEXES = (
+    ('core_patienthealthrecord_doctor_id_1f5ba5fd', 'doctor_id'),
+    ('core_patienthealthrecord_diagnosis_ref_id_a07771e7', 'diagnosis_ref_id'),
+    ('core_patienthealthrecord_visit_type_ref_id_4d99f7a0', 'visit_type_ref_id'),
+)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_vitals_reading'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='auditlog',
+            index=models.Index(fields=['target', '-created_at'], name='core_auditl_target_a88241_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='auditlog',
+            index=models.Index(fields=['-created_at'], name='core_auditl_created_1a76fa_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patienthealthrecord',
+            index=models.Index(fields=['doctor', '-record_date'], name='core_patien_doctor__8b967f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patienthealthrecord',
+            index=models.Index(fields=['diagnosis_ref', '-record_date'], name='core_patien_diagnos_161b37_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patienthealthrecord',
+            index=models.Index(fields=['visit_type_ref', '-record_date'], name='core_patien_visit_t_b8be59_idx'),
+        ),
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(
+                    f'DROP INDEX "{name}"',
+                    reverse_sql=f'CREATE INDEX "{name}" ON "core_patienthealthrecord" ("{column}")',
+                )
+                for name, column in REPLACED_INDEXES
+            ],
+            state_operations=[
+                migrations.AlterField(
+                    model_name='patienthealthrecord',
+                    name='diagnosis_ref',
+                    field=models.ForeignKey(blank=True, db_index=False, editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='health_records', to='core.diagnosis'),
+                ),
+                migrations.AlterField(
+                    model_name='patienthealthrecord',
+                    name='doctor',
+                    field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.PROTECT, related_name='health_records', to='core.doctor'),
+                ),
+                migrations.AlterField(
+                    model_name='patienthealthrecord',
+                    name='visit_type_ref',
+                    field=models.ForeignKey(blank=True, db_index=False, editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='health_records', to='core.visittype'),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.1.2 on 2026-10-19 11:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_admin_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MaintenanceRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('seconds', models.FloatField(default=0, help_text='Duration of the run')),
+                ('page_size', models.PositiveIntegerField()),
+                ('page_count', models.PositiveIntegerField(help_text='Database pages before the vacuum')),
+                ('free_pages', models.PositiveIntegerField(help_text='Unused pages before the vacuum')),
+                ('freed_pages', models.PositiveIntegerField(default=0, help_text='Pages returned to the file system')),
+                ('integrity', models.TextField(blank=True, help_text="'ok', the problems found, or empty when not checked")),
+                ('analyzed', models.JSONField(blank=True, default=list, help_text='Tables whose statistics were refreshed')),
+                ('tables', models.JSONField(blank=True, default=dict, help_text='Rows, table and index bytes and the row estimate, by table')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.1.2 on 2026-10-19 11:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0019_maintenance_run'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['first_name'], name='core_patien_first_n_5013c7_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['email'], name='core_patien_email_e0bc4e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['phone'], name='core_patien_phone_dc5b9e_idx'),
+        ),
+    ]
@@ -2,6 +2,7 @@ from django.conf import settings
 from django.contrib.auth.models import AbstractUser, UserManager as DjangoUserManager
 from django.core.validators import MinValueValidator, MaxValueValidator, RegexValidator
 from django.db import models
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 
 
@@ -111,21 +112,96 @@ class AuditLog(models.Model):
 
     class Meta:
         ordering = ['-created_at']
-        indexes = [models.Index(fields=['action', '-created_at'])]
+        indexes = [
+            models.Index(fields=['action', '-created_at']),
+            models.Index(fields=['target', '-created_at']),
+            models.Index(fields=['-created_at']),
+        ]
 
     def __str__(self) -> str:
         return f"{self.created_at:%Y-%m-%d %H:%M:%S} - {self.action} ({self.target})"
 
 
-class Department(models.Model):
-    name = models.CharField(max_length=120, unique=True)
+class SoftDeleteQuerySet(models.QuerySet):
+    def soft_delete(self):
+        """Mark the rows deleted with a single UPDATE (no signals are sent)."""
+        return self.filter(deleted_at__isnull=True).update(deleted_at=timezone.now())
+
+    def restore(self):
+        return self.update(deleted_at=None)
+
+    def deleted(self):
+        return self.filter(deleted_at__isnull=False)
+
+
+class ActiveManager(models.Manager.from_queryset(SoftDeleteQuerySet)):
+    """Default manager: hides soft-deleted rows."""
+
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
+
+class SoftDeleteModel(models.Model):
+    """
+    Rows are marked with ``deleted_at`` instead of being removed; the
+    ``purge_deleted`` command removes them physically once their retention
+    window (``PURGE_AFTER_DAYS``) has passed.  ``objects`` only sees live
+    rows, ``all_objects`` sees everything.  Related-object access (e.g.
+    ``record.doctor``) still resolves soft-deleted rows.
+    """
+    deleted_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    objects = ActiveManager()
+    all_objects = models.Manager.from_queryset(SoftDeleteQuerySet)()
+
+    class Meta:
+        abstract = True
+
+    @property
+    def is_deleted(self):
+        return self.deleted_at is not None
+
+    def soft_delete(self):
+        """Mark this row deleted; saved with ``update_fields`` so post_save handlers run."""
+        self.deleted_at = timezone.now()
+        self.save(update_fields=['deleted_at'])
+
+    def restore(self):
+        self.deleted_at = None
+        self.save(update_fields=['deleted_at'])
+
+
+def _deleted_index(model_name):
+    # Partial index: only soft-deleted rows are in it, so it stays tiny and
+    # serves the purge's "deleted before <cutoff>" scan.
+    return models.Index(
+        fields=['deleted_at'],
+        condition=models.Q(deleted_at__isnull=False),
+        name=f'core_{model_name}_deleted_idx',
+    )
+
+
+class Department(SoftDeleteModel):
+    name = models.CharField(max_length=120)
     description = models.TextField(blank=True)
 
+    class Meta:
+        constraints = [
+            # Names only need to be unique among live departments.
+            models.UniqueConstraint(
+                fields=['name'],
+                condition=models.Q(deleted_at__isnull=True),
+                name='unique_live_department_name',
+                violation_error_message='A department with this name already exists.',
+            ),
+        ]
+        indexes = [_deleted_index('department')]
+
     def __str__(self) -> str:
         return self.name
 
 
-class Doctor(models.Model):
+class Doctor(SoftDeleteModel):
     user = models.OneToOneField(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
@@ -139,12 +215,46 @@ class Doctor(models.Model):
     email = models.EmailField(blank=True)
     phone = models.CharField(max_length=40, blank=True)
 
+    class Meta:
+        indexes = [_deleted_index('doctor')]
+
     def __str__(self) -> str:
         if self.user:
             return f"{self.full_name} ({self.department.name}) - @{self.user.username}"
         return f"{self.full_name} ({self.department.name})"
 
-class Patient(models.Model):
+
+class DictionaryEntry(models.Model):
+    """Interned lookup value; ``normalized_name`` is the case/whitespace-insensitive key."""
+
+    name = models.CharField(max_length=255)
+    normalized_name = models.CharField(max_length=255, unique=True)
+
+    class Meta:
+        abstract = True
+        ordering = ['name']
+
+    def __str__(self) -> str:
+        return self.name
+
+
+class Diagnosis(DictionaryEntry):
+    class Meta(DictionaryEntry.Meta):
+        verbose_name_plural = 'diagnoses'
+
+
+class VisitType(DictionaryEntry):
+    pass
+
+
+class City(DictionaryEntry):
+    region = models.CharField(max_length=120, blank=True, help_text="Optional state/region for roll-ups")
+
+    class Meta(DictionaryEntry.Meta):
+        verbose_name_plural = 'cities'
+
+
+class Patient(SoftDeleteModel):
     GENDER_CHOICES = [
         ('M', 'Male'),
         ('F', 'Female'),
@@ -197,6 +307,8 @@ class Patient(models.Model):
     )
     address = models.TextField(blank=True)
     city = models.CharField(max_length=120, blank=True)
+    city_ref = models.ForeignKey(City, on_delete=models.PROTECT, null=True, blank=True,
+                                 editable=False, related_name='patients')
     emergency_contact_name = models.CharField(max_length=160, blank=True)
     emergency_contact_phone = models.CharField(max_length=20, blank=True)
     blood_type = models.CharField(max_length=3, choices=BLOOD_TYPE_CHOICES, blank=True)
@@ -211,17 +323,32 @@ class Patient(models.Model):
         help_text="12-digit national identifier (Aadhar).",
     )
     registration_date = models.DateTimeField(auto_now_add=True)
+    # Row version: part of the key of cached template fragments showing the patient.
+    updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         ordering = ['-registration_date']
         indexes = [
             models.Index(fields=['patient_id']),
             models.Index(fields=['last_name', 'first_name']),
+            # The admin search (core.admin.PATIENT_SEARCH).
+            models.Index(fields=['first_name']),
+            models.Index(fields=['email']),
+            models.Index(fields=['phone']),
+            models.Index(fields=['registration_date']),
+            _deleted_index('patient'),
         ]
     
     def __str__(self) -> str:
         return f"{self.patient_id} - {self.first_name} {self.last_name}"
     
+    def save(self, *args, **kwargs):
+        from .dictionaries import cities, display_name
+
+        self.city = display_name(self.city)
+        self.city_ref_id = cities.resolve(self.city)
+        super().save(*args, **kwargs)
+
     @property
     def full_name(self):
         return f"{self.first_name} {self.last_name}"
@@ -236,7 +363,7 @@ class PatientHealthRecord(models.Model):
     """Time-series health records for patients - designed for data analysis"""
     patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='health_records')
     record_date = models.DateTimeField(default=timezone.now)
-    doctor = models.ForeignKey(Doctor, on_delete=models.PROTECT, related_name='health_records')
+    doctor = models.ForeignKey(Doctor, on_delete=models.PROTECT, related_name='health_records', db_index=False)
     department = models.ForeignKey(Department, on_delete=models.PROTECT, related_name='health_records')
     
     # Vital Signs - Numeric fields for analysis
@@ -269,6 +396,13 @@ class PatientHealthRecord(models.Model):
     # Metadata for analysis
     visit_type = models.CharField(max_length=50, blank=True, 
                                  help_text="e.g., Routine, Emergency, Follow-up")
+
+    # Interned keys used for grouping and filtering; resolved from the text on save.
+    # These and doctor are indexed with record_date (see Meta) for newest-first filtered lists.
+    diagnosis_ref = models.ForeignKey(Diagnosis, on_delete=models.PROTECT, null=True, blank=True,
+                                      editable=False, related_name='health_records', db_index=False)
+    visit_type_ref = models.ForeignKey(VisitType, on_delete=models.PROTECT, null=True, blank=True,
+                                       editable=False, related_name='health_records', db_index=False)
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
@@ -277,19 +411,269 @@ class PatientHealthRecord(models.Model):
             models.Index(fields=['patient', '-record_date']),
             models.Index(fields=['record_date']),
             models.Index(fields=['department', 'record_date']),
+            models.Index(fields=['department', 'doctor', 'record_date']),
+            models.Index(fields=['department', 'patient']),
             models.Index(fields=['diagnosis']),
+            models.Index(fields=['created_at']),
+            models.Index(fields=['doctor', '-record_date']),
+            models.Index(fields=['diagnosis_ref', '-record_date']),
+            models.Index(fields=['visit_type_ref', '-record_date']),
         ]
     
     def __str__(self) -> str:
         return f"Health Record for {self.patient.patient_id} - {self.record_date.strftime('%Y-%m-%d %H:%M')}"
     
     def save(self, *args, **kwargs):
+        self.calculate_derived_fields()
+        super().save(*args, **kwargs)
+
+    def calculate_derived_fields(self):
+        """Fill in BMI and the interned keys; also used by bulk writers that bypass save()."""
+        from .dictionaries import diagnoses, visit_types
+
         # Calculate BMI if weight and height are provided
         if self.weight and self.height:
             height_m = self.height / 100  # Convert cm to meters
             if height_m > 0:
                 self.bmi = self.weight / (height_m ** 2)
-        super().save(*args, **kwargs)
+        self.diagnosis = (self.diagnosis or '').strip()
+        self.visit_type = (self.visit_type or '').strip()
+        self.diagnosis_ref_id = diagnoses.resolve(self.diagnosis)
+        self.visit_type_ref_id = visit_types.resolve(self.visit_type)
+
+
+class ArchivedHealthRecord(models.Model):
+    """
+    Health record moved out of the hot table by ``archive_records`` (see
+    ``core.archive``).  Same columns as ``PatientHealthRecord`` but only the
+    indexes needed to page a patient's history and answer membership
+    questions; ``original_id`` keeps the record's id for restores and exports.
+    """
+    original_id = models.BigIntegerField(unique=True)
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='archived_records', db_index=False)
+    record_date = models.DateTimeField()
+    doctor = models.ForeignKey(Doctor, on_delete=models.PROTECT, related_name='archived_records', db_index=False)
+    department = models.ForeignKey(Department, on_delete=models.PROTECT, related_name='archived_records',
+                                   db_index=False)
+    systolic_bp = models.IntegerField(null=True, blank=True)
+    diastolic_bp = models.IntegerField(null=True, blank=True)
+    heart_rate = models.IntegerField(null=True, blank=True)
+    temperature = models.DecimalField(max_digits=4, decimal_places=2, null=True, blank=True)
+    weight = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True)
+    height = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True)
+    bmi = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True)
+    symptoms = models.TextField(blank=True)
+    diagnosis = models.CharField(max_length=255, blank=True)
+    medications = models.TextField(blank=True)
+    notes = models.TextField(blank=True)
+    visit_type = models.CharField(max_length=50, blank=True)
+    diagnosis_ref = models.ForeignKey(Diagnosis, on_delete=models.PROTECT, null=True, blank=True,
+                                      related_name='archived_records', db_index=False)
+    visit_type_ref = models.ForeignKey(VisitType, on_delete=models.PROTECT, null=True, blank=True,
+                                       related_name='archived_records', db_index=False)
+    created_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-record_date']
+        indexes = [
+            models.Index(fields=['patient', '-record_date']),
+            models.Index(fields=['department', 'patient']),
+            models.Index(fields=['doctor', 'patient']),
+        ]
+
+    def __str__(self) -> str:
+        return f"Archived record {self.original_id} for patient {self.patient_id}"
+
+
+class ArchiveRollup(models.Model):
+    """
+    Pre-aggregated totals of the archived records, so dashboard figures that
+    cover all history do not have to scan the archive.
+    """
+    year = models.PositiveSmallIntegerField()
+    department = models.ForeignKey(Department, on_delete=models.CASCADE, related_name='archive_rollups')
+    diagnosis_ref = models.ForeignKey(Diagnosis, on_delete=models.CASCADE, null=True, blank=True,
+                                      related_name='archive_rollups')
+    visit_type_ref = models.ForeignKey(VisitType, on_delete=models.CASCADE, null=True, blank=True,
+                                       related_name='archive_rollups')
+    bmi_band = models.CharField(max_length=32, blank=True)
+    record_count = models.PositiveIntegerField(default=0)
+    systolic_sum = models.BigIntegerField(default=0)
+    systolic_count = models.PositiveIntegerField(default=0)
+    diastolic_sum = models.BigIntegerField(default=0)
+    diastolic_count = models.PositiveIntegerField(default=0)
+    heart_rate_sum = models.BigIntegerField(default=0)
+    heart_rate_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            # NULL references are coalesced so that they still identify one group.
+            models.UniqueConstraint(
+                'year', 'department', Coalesce('diagnosis_ref', 0), Coalesce('visit_type_ref', 0), 'bmi_band',
+                name='unique_archive_rollup_group',
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.year} / department {self.department_id}: {self.record_count} records"
+
+
+class VitalsFlag(models.Model):
+    """Abnormal reading detected on a health record by ``core.anomalies``."""
+
+    class Kinds(models.TextChoices):
+        HYPERTENSIVE_CRISIS = 'hypertensive_crisis', 'Hypertensive crisis'
+        HYPOTENSION = 'hypotension', 'Hypotension'
+        TACHYCARDIA = 'tachycardia', 'Tachycardia'
+        BRADYCARDIA = 'bradycardia', 'Bradycardia'
+        FEVER = 'fever', 'Fever'
+        HYPOTHERMIA = 'hypothermia', 'Hypothermia'
+        WEIGHT_CHANGE = 'weight_change', 'Sudden weight change'
+        SYSTOLIC_DEVIATION = 'systolic_deviation', 'Unusual blood pressure for patient'
+        HEART_RATE_DEVIATION = 'heart_rate_deviation', 'Unusual heart rate for patient'
+
+    class Severity(models.TextChoices):
+        WARNING = 'warning', 'Warning'
+        CRITICAL = 'critical', 'Critical'
+
+    record = models.ForeignKey(PatientHealthRecord, on_delete=models.CASCADE, related_name='flags')
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='vitals_flags')
+    record_date = models.DateTimeField(help_text="Copied from the record so the work queue sorts on one table")
+    kind = models.CharField(max_length=32, choices=Kinds.choices)
+    severity = models.CharField(max_length=10, choices=Severity.choices)
+    value = models.FloatField()
+    zscore = models.FloatField(null=True, blank=True, help_text="Deviation from the patient's recent readings")
+    acknowledged_at = models.DateTimeField(null=True, blank=True)
+    acknowledged_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='acknowledged_flags',
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-record_date']
+        constraints = [models.UniqueConstraint(fields=['record', 'kind'], name='unique_flag_per_record_kind')]
+        indexes = [
+            models.Index(fields=['acknowledged_at', '-record_date']),
+            models.Index(fields=['kind', '-record_date']),
+            models.Index(fields=['patient', '-record_date']),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.get_kind_display()} ({self.severity}) on record {self.record_id}"
+
+
+class PatientBlockKey(models.Model):
+    """Blocking key for duplicate detection; patients sharing a key are compared (see ``core.dedup``)."""
+
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='block_keys')
+    key = models.CharField(max_length=64, db_index=True)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=['patient', 'key'], name='unique_block_key_per_patient')]
+
+    def __str__(self) -> str:
+        return f"{self.key} -> {self.patient_id}"
+
+
+class IngestCheckpoint(models.Model):
+    """Progress of a feed file through ``ingest_feed`` so an interrupted run can resume."""
+
+    source = models.CharField(max_length=500, unique=True, help_text="Absolute path of the feed file")
+    fingerprint = models.CharField(max_length=64, help_text="SHA-256 of the first 64 KiB, to detect a replaced file")
+    position = models.PositiveBigIntegerField(default=0, help_text="Messages/rows already consumed")
+    created = models.PositiveIntegerField(default=0)
+    skipped = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self) -> str:
+        return f"{self.source} @ {self.position}"
+
+
+class VitalsReading(models.Model):
+    """Bedside monitor reading streamed in by ``serve_vitals`` (see ``core.bedside``)."""
+
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='vitals_readings', db_index=False)
+    bed = models.CharField(max_length=40, blank=True)
+    recorded_at = models.DateTimeField(help_text="When the monitor took the reading")
+    received_at = models.DateTimeField(help_text="When the ingestion server accepted it")
+    heart_rate = models.PositiveSmallIntegerField(null=True, blank=True, help_text="Heart rate (bpm)")
+    systolic_bp = models.PositiveSmallIntegerField(null=True, blank=True, help_text="Systolic blood pressure (mmHg)")
+    diastolic_bp = models.PositiveSmallIntegerField(null=True, blank=True, help_text="Diastolic blood pressure (mmHg)")
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['patient', '-recorded_at']),
+            models.Index(fields=['recorded_at']),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.patient_id} @ {self.recorded_at:%Y-%m-%d %H:%M:%S}"
+
+
+class Job(models.Model):
+    """Unit of background work claimed and executed by ``run_workers`` (see ``core.jobs``)."""
+
+    class States(models.TextChoices):
+        QUEUED = 'queued', 'Queued'
+        RUNNING = 'running', 'Running'
+        SUCCEEDED = 'succeeded', 'Succeeded'
+        FAILED = 'failed', 'Failed'
+
+    name = models.CharField(max_length=64, help_text="Registered task name")
+    payload = models.JSONField(default=dict, blank=True)
+    state = models.CharField(max_length=10, choices=States.choices, default=States.QUEUED)
+    priority = models.SmallIntegerField(default=0, help_text="Higher runs first")
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=120, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    result = models.JSONField(default=dict, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['state', '-priority', 'run_after']),
+            models.Index(fields=['state', 'locked_at']),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.name} #{self.pk} ({self.state})"
+
+
+class MaintenanceRun(models.Model):
+    """What one ``db_maintenance`` run measured and did (see ``core.maintenance``), kept for trends."""
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    seconds = models.FloatField(default=0, help_text="Duration of the run")
+    page_size = models.PositiveIntegerField()
+    page_count = models.PositiveIntegerField(help_text="Database pages before the vacuum")
+    free_pages = models.PositiveIntegerField(help_text="Unused pages before the vacuum")
+    freed_pages = models.PositiveIntegerField(default=0, help_text="Pages returned to the file system")
+    integrity = models.TextField(blank=True, help_text="'ok', the problems found, or empty when not checked")
+    analyzed = models.JSONField(default=list, blank=True, help_text="Tables whose statistics were refreshed")
+    tables = models.JSONField(
+        default=dict, blank=True, help_text="Rows, table and index bytes and the row estimate, by table",
+    )
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self) -> str:
+        return f"Maintenance {self.created_at:%Y-%m-%d %H:%M}"
+
+    @property
+    def free_ratio(self) -> float:
+        return self.free_pages / self.page_count if self.page_count else 0.0
 
 
 # Create your models here.
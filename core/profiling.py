@@ -0,0 +1,238 @@
+"""
+On-demand request profiling.
+
+``ProfilingMiddleware`` profiles a request when a superadmin asks for it
+(``X-Profile: 1`` header or ``?_profile=1``) or, with
+``PROFILE_SAMPLE_RATE = N``, one request in N at random.  When neither
+applies it costs a header lookup and, if sampling is on, one random number.
+
+A profile combines
+* a stack sample of the request's thread every ``PROFILE_INTERVAL``
+  seconds, kept as collapsed stacks (``outer;inner;leaf count``, the input
+  format of flamegraph.pl and speedscope), and
+* the SQL timeline: offset, duration and statement of every query.  Only
+  the statement text is kept, never the parameters.
+
+Profiles are written to ``PROFILE_DIR`` as a ring buffer of at most
+``PROFILE_KEEP`` files and browsed at ``core/admin/profiles/``.  Each file
+holds a one-line JSON summary followed by the full profile, so listing
+them only reads the first line.
+
+Under ASGI both the event loop thread (async views, templates) and the
+request's worker thread (ORM, sync views) are sampled.
+"""
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.utils import timezone
+
+from .metrics import wrap_connections
+
+PROFILE_ID = re.compile(r'^\d+-[0-9a-f]{8}$')
+
+# Statements longer than this are cut in the timeline.
+MAX_SQL_LENGTH = 500
+MAX_QUERIES = 2000
+
+
+def _location(code):
+    filename = code.co_filename
+    base = str(settings.BASE_DIR) + os.sep
+    if filename.startswith(base):
+        filename = filename[len(base):]
+    else:
+        _, marker, rest = filename.rpartition(f'site-packages{os.sep}')
+        filename = rest if marker else os.path.basename(filename)
+    return f'{code.co_name} ({filename}:{code.co_firstlineno})'
+
+
+class StackSampler:
+    """Samples the stack of one thread (and ``extra_threads``) from a background thread."""
+
+    def __init__(self, thread_id, interval, extra_threads=()):
+        self.thread_ids = [thread_id, *extra_threads]
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            for thread_id in self.thread_ids:
+                frame = frames.get(thread_id)
+                stack = []
+                while frame is not None:
+                    stack.append(_location(frame.f_code))
+                    frame = frame.f_back
+                if stack:
+                    self.stacks[';'.join(reversed(stack))] += 1
+
+
+class SQLTimeline:
+    def __init__(self, started):
+        self.started = started
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        begin = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            if len(self.queries) < MAX_QUERIES:
+                self.queries.append({
+                    'offset_ms': round((begin - self.started) * 1000, 3),
+                    'duration_ms': round((time.perf_counter() - begin) * 1000, 3),
+                    'sql': sql[:MAX_SQL_LENGTH],
+                    'many': many,
+                })
+
+
+def profile_dir():
+    return Path(settings.PROFILE_DIR)
+
+
+def save(summary, data):
+    """Store a profile and drop the oldest beyond ``PROFILE_KEEP``; returns its id."""
+    directory = profile_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    profile_id = f'{time.time_ns()}-{uuid.uuid4().hex[:8]}'
+    summary = {'id': profile_id, **summary}
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    with os.fdopen(fd, 'w') as fh:
+        fh.write(json.dumps(summary) + '\n')
+        fh.write(json.dumps(data) + '\n')
+    os.replace(tmp, directory / f'{profile_id}.json')
+
+    # Ids start with a nanosecond timestamp, so name order is age order.
+    for stale in sorted(directory.glob('*.json'))[:-settings.PROFILE_KEEP or None]:
+        stale.unlink(missing_ok=True)
+    return profile_id
+
+
+def list_profiles():
+    """Summaries of the stored profiles, newest first."""
+    summaries = []
+    for path in sorted(profile_dir().glob('*.json'), reverse=True):
+        try:
+            with open(path) as fh:
+                summaries.append(json.loads(fh.readline()))
+        except (OSError, ValueError):
+            continue  # pruned while listing
+    return summaries
+
+
+def load(profile_id):
+    """``(summary, data)`` of a stored profile, or None."""
+    if not PROFILE_ID.match(profile_id):
+        return None
+    try:
+        with open(profile_dir() / f'{profile_id}.json') as fh:
+            return json.loads(fh.readline()), json.loads(fh.readline())
+    except (OSError, ValueError):
+        return None
+
+
+def folded(data):
+    """Collapsed-stack text (one ``stack count`` line per distinct stack)."""
+    return ''.join(f'{stack} {count}\n' for stack, count in sorted(data['stacks'].items()))
+
+
+class ProfilingMiddleware:
+    """Profiles requests on demand; must come after AuthenticationMiddleware."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def asked(self, request):
+        return bool(request.headers.get('X-Profile') or '_profile' in request.GET)
+
+    def trigger(self, user):
+        """``user`` is the requesting user when a profile was asked for, else None."""
+        if user is not None and user.is_authenticated and user.role == user.Roles.SUPERADMIN:
+            return 'requested'
+        rate = settings.PROFILE_SAMPLE_RATE
+        if rate and random.randrange(rate) == 0:
+            return 'sampled'
+        return None
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        trigger = self.trigger(request.user if self.asked(request) else None)
+        if trigger is None:
+            return self.get_response(request)
+
+        started = time.perf_counter()
+        timeline = SQLTimeline(started)
+        sampler = StackSampler(threading.get_ident(), settings.PROFILE_INTERVAL)
+        sampler.start()
+        try:
+            with wrap_connections(timeline):
+                response = self.get_response(request)
+        finally:
+            sampler.stop()
+        return self.finish(request, response, trigger, started, timeline, sampler)
+
+    async def __acall__(self, request):
+        trigger = self.trigger(await request.auser() if self.asked(request) else None)
+        if trigger is None:
+            return await self.get_response(request)
+
+        started = time.perf_counter()
+        timeline = SQLTimeline(started)
+        # The request's worker thread runs its queries on its own connections.
+        worker = await sync_to_async(threading.get_ident)()
+        stack = await sync_to_async(wrap_connections)(timeline)
+        sampler = StackSampler(threading.get_ident(), settings.PROFILE_INTERVAL, extra_threads=[worker])
+        sampler.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            sampler.stop()
+            await sync_to_async(stack.close)()
+        return self.finish(request, response, trigger, started, timeline, sampler)
+
+    def finish(self, request, response, trigger, started, timeline, sampler):
+        duration = time.perf_counter() - started
+
+        match = request.resolver_match
+        summary = {
+            'created_at': timezone.now().isoformat(),
+            'trigger': trigger,
+            'method': request.method,
+            'path': request.path,
+            'view': match.view_name if match else '',
+            'status': response.status_code,
+            'duration_ms': round(duration * 1000, 3),
+            'sql_ms': round(sum(query['duration_ms'] for query in timeline.queries), 3),
+            'queries': len(timeline.queries),
+            'samples': sum(sampler.stacks.values()),
+        }
+        profile_id = save(summary, {'stacks': dict(sampler.stacks), 'queries': timeline.queries})
+        if trigger == 'requested':
+            response['X-Profile-Id'] = profile_id
+        return response
@@ -0,0 +1,154 @@
+"""
+Query plans of the hot querysets.
+
+Several views only stay fast because SQLite (or PostgreSQL) answers their
+querysets from a particular index.  ``QUERYSETS`` names those querysets,
+built by the same helpers the views use, and ``explain`` returns their
+plan.  ``core.tests.test_query_plans`` asserts that none of them scans a
+large table unless the entry explicitly allows it, and compares every plan
+with the snapshot stored in ``core/tests/query_plans/<vendor>/`` so that a
+changed plan shows up as a diff in review.
+"""
+import re
+
+from django.db import connections
+from django.utils import timezone
+
+from . import jobs, views
+from .models import AuditLog, Department, Doctor, Patient, PatientHealthRecord, VitalsFlag
+
+# Tables that grow with the number of patients or visits.
+LARGE_TABLES = {
+    'core_patient',
+    'core_patienthealthrecord',
+    'core_archivedhealthrecord',
+    'core_vitalsflag',
+    'core_patientblockkey',
+    'core_auditlog',
+    'core_job',
+}
+
+# name -> (factory returning the queryset, tables it may scan)
+QUERYSETS = {}
+
+
+def register(name, allow_scan=()):
+    def decorator(factory):
+        QUERYSETS[name] = (factory, frozenset(allow_scan))
+        return factory
+
+    return decorator
+
+
+def explain(queryset):
+    """The plan of ``queryset`` as a list of lines, indented by depth."""
+    connection = connections[queryset.db]
+    sql, params = queryset.query.get_compiler(using=queryset.db).as_sql()
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            depth = {0: -1}
+            lines = []
+            for node, parent, _, detail in cursor.fetchall():
+                depth[node] = depth.get(parent, -1) + 1
+                lines.append('  ' * depth[node] + detail)
+            return lines
+        cursor.execute(f'EXPLAIN (COSTS OFF) {sql}', params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+_SCAN = re.compile(r'^\s*(?:->\s*)?(?:SCAN (\w+)|Seq Scan on (\w+))')
+
+
+def scanned_tables(queryset, plan):
+    """Tables ``plan`` reads in full; subquery aliases (U0, T3) are resolved."""
+    sql, _ = queryset.query.get_compiler(using=queryset.db).as_sql()
+    aliases = {alias: table for table, alias in re.findall(r'"(\w+)" (?:AS )?"?([UT]\d+)\b', sql)}
+    tables = set()
+    for line in plan:
+        match = _SCAN.match(line)
+        if match:
+            name = match.group(1) or match.group(2)
+            tables.add(aliases.get(name, name))
+    return tables
+
+
+# Unsaved instances are enough to build the querysets.
+PATIENT = Patient(pk=1)
+DEPARTMENT = Department(pk=1)
+DOCTOR = Doctor(pk=1, department_id=1)
+
+
+# A page of the list is read off the registration_date index.
+@register('patient_list', allow_scan={'core_patient'})
+def patient_list():
+    return views.patient_list_queryset()[:views.PATIENT_LIST_PAGE_SIZE]
+
+
+# Substring search cannot use a B-tree index.
+@register('patient_search', allow_scan={'core_patient'})
+def patient_search():
+    return views.patient_list_queryset('rao')[:views.PATIENT_LIST_PAGE_SIZE]
+
+
+@register('patient_records')
+def patient_records():
+    return views.patient_record_queryset(PATIENT)[:10]
+
+
+@register('patient_archived_records')
+def patient_archived_records():
+    return views.patient_archive_queryset(PATIENT)[:views.DEPARTMENT_PAGE_SIZE]
+
+
+@register('department_patients')
+def department_patients():
+    return views.department_patient_queryset(DEPARTMENT).only(*views.PATIENT_ROW_FIELDS)[:views.DEPARTMENT_PAGE_SIZE]
+
+
+@register('department_records')
+def department_records():
+    records = views.department_record_queryset(DEPARTMENT).select_related('patient', 'doctor', 'department')
+    return records[:views.DEPARTMENT_PAGE_SIZE]
+
+
+@register('department_doctor_records')
+def department_doctor_records():
+    return views.department_record_queryset(DEPARTMENT, doctor=DOCTOR)[:views.DEPARTMENT_PAGE_SIZE]
+
+
+@register('doctor_patients')
+def doctor_patients():
+    return views.doctor_patient_queryset(DOCTOR).order_by('last_name', 'first_name')
+
+
+@register('open_flags')
+def open_flags():
+    return views.flag_queryset()[:views.PATIENT_LIST_PAGE_SIZE]
+
+
+@register('flags_by_kind')
+def flags_by_kind():
+    return views.flag_queryset('all', VitalsFlag.Kinds.choices[0][0])[:views.PATIENT_LIST_PAGE_SIZE]
+
+
+# The admin's diagnosis list filter, in changelist order (Meta.ordering, then -pk).
+@register('records_by_diagnosis')
+def records_by_diagnosis():
+    records = PatientHealthRecord.objects.filter(diagnosis_ref=1).order_by('-record_date', '-created_at', '-pk')
+    return records[:100]
+
+
+@register('audit_by_action')
+def audit_by_action():
+    return AuditLog.objects.filter(action='delete_patient')[:50]
+
+
+@register('due_jobs')
+def due_jobs():
+    return jobs.due_jobs(timezone.now())[:1]
+
+
+@register('recent_visits')
+def recent_visits():
+    return PatientHealthRecord.objects.filter(record_date__gte=timezone.now()).order_by()
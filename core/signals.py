@@ -1,8 +1,15 @@
 from django.conf import settings
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
 from django.dispatch import receiver
 
-from .models import DoctorProfile, PatientProfile, _format_profile_id
+from .anomalies import flag_record
+from .archive import discard_archived
+from .cohorts import cohort_index
+from .dedup import index_patients
+from .live import patient_deltas, publish_change, record_deltas
+from .models import ArchivedHealthRecord, Doctor, DoctorProfile, Patient, PatientHealthRecord, PatientProfile, _format_profile_id
+from .stats import invalidate_department_stats
 
 
 @receiver(post_save, sender=settings.AUTH_USER_MODEL)
@@ -27,3 +34,83 @@ def provision_profiles(sender, instance, created, **kwargs):
             patient_id=_format_profile_id('PAT', instance.pk),
         )
 
+
+@receiver(pre_save, sender=PatientHealthRecord)
+@receiver(pre_save, sender=Doctor)
+def remember_previous_department(sender, instance, **kwargs):
+    """Keep the department a row is moving away from so its stats are refreshed too."""
+    instance._previous_department_id = None
+    if instance.pk:
+        instance._previous_department_id = (
+            sender._base_manager.filter(pk=instance.pk).values_list('department_id', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=PatientHealthRecord)
+@receiver(post_delete, sender=PatientHealthRecord)
+@receiver(post_save, sender=Doctor)
+@receiver(post_delete, sender=Doctor)
+def refresh_department_stats(sender, instance, **kwargs):
+    invalidate_department_stats(
+        instance.department_id,
+        getattr(instance, '_previous_department_id', None),
+    )
+
+
+@receiver(post_save, sender=Patient)
+def refresh_stats_of_visited_departments(sender, instance, update_fields=None, **kwargs):
+    # Department stats leave soft-deleted patients' records out.
+    if update_fields is not None and set(update_fields) == {'deleted_at'}:
+        invalidate_department_stats(
+            *instance.health_records.order_by().values_list('department_id', flat=True).distinct(),
+            *instance.archived_records.order_by().values_list('department_id', flat=True).distinct(),
+        )
+
+
+@receiver(post_save, sender=Patient)
+@receiver(post_save, sender=PatientHealthRecord)
+@receiver(post_delete, sender=PatientHealthRecord)
+def refresh_patient_cohorts(sender, instance, **kwargs):
+    patient_id = instance.pk if sender is Patient else instance.patient_id
+    transaction.on_commit(lambda: cohort_index.refresh_patient(patient_id))
+
+
+@receiver(pre_delete, sender=Patient)
+def discard_archived_history(sender, instance, **kwargs):
+    # The cascade would remove the rows but leave them counted in the rollups.
+    discard_archived(ArchivedHealthRecord.objects.filter(patient=instance))
+
+
+@receiver(post_delete, sender=Patient)
+def remove_patient_cohorts(sender, instance, **kwargs):
+    patient_id = instance.pk
+    transaction.on_commit(lambda: cohort_index.remove_patient(patient_id))
+
+
+@receiver(post_save, sender=PatientHealthRecord)
+def flag_abnormal_vitals(sender, instance, **kwargs):
+    record_id = instance.pk
+    transaction.on_commit(lambda: flag_record(record_id))
+
+
+@receiver(post_save, sender=Patient)
+def refresh_duplicate_blocks(sender, instance, **kwargs):
+    patient_id = instance.pk
+    transaction.on_commit(lambda: index_patients([patient_id]))
+
+
+@receiver(post_save, sender=Patient)
+def publish_patient_to_dashboards(sender, instance, created, update_fields=None, **kwargs):
+    if created:
+        sign = 1
+    elif update_fields is not None and set(update_fields) == {'deleted_at'}:
+        sign = -1 if instance.is_deleted else 1
+    else:
+        return
+    transaction.on_commit(lambda: publish_change(patient_deltas, instance, sign))
+
+
+@receiver(post_save, sender=PatientHealthRecord)
+def publish_record_to_dashboards(sender, instance, created, **kwargs):
+    if created:
+        transaction.on_commit(lambda: publish_change(record_deltas, instance))
@@ -0,0 +1,64 @@
+"""
+Cached summary statistics shared by the department pages.
+
+Values are computed from indexed aggregates and kept in the default cache;
+signal handlers drop the entry whenever a department's records or doctors
+change, so the cache never has to be expired by time alone.
+"""
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db.models import Count, Max, Sum
+from django.utils import timezone
+
+from .models import ArchivedHealthRecord, ArchiveRollup, Doctor, Patient, PatientHealthRecord
+
+DEPARTMENT_STATS_TIMEOUT = 60 * 15
+
+
+def _department_stats_key(department_id):
+    return f'core:department-stats:{department_id}'
+
+
+def department_stats(department_id):
+    """Return patient/record/doctor counts for a department, cached."""
+    key = _department_stats_key(department_id)
+    stats = cache.get(key)
+    if stats is not None:
+        return stats
+
+    # Records of soft-deleted patients are left out (see core.archive).
+    deleted_patients = Patient.all_objects.deleted().values('pk')
+    records = (
+        PatientHealthRecord.objects.filter(department_id=department_id)
+        .exclude(patient__in=deleted_patients).order_by()
+    )
+    totals = records.aggregate(
+        record_count=Count('id'),
+        last_record_date=Max('record_date'),
+    )
+    # Archived history counts too: record totals come from the archive
+    # rollups, patients from the archive's (department, patient) index.
+    archived = ArchivedHealthRecord.objects.filter(department_id=department_id).order_by()
+    archived_count = ArchiveRollup.objects.filter(department_id=department_id).aggregate(
+        total=Sum('record_count'),
+    )['total'] or 0
+    archived_count -= archived.filter(patient__in=deleted_patients).count()
+    archived = archived.exclude(patient__in=deleted_patients)
+    last_record_date = totals['last_record_date']
+    if last_record_date is None and archived_count:
+        last_record_date = archived.aggregate(last=Max('record_date'))['last']
+    thirty_days_ago = timezone.now() - timedelta(days=30)
+    stats = {
+        'patient_count': records.values('patient_id').union(archived.values('patient_id')).count(),
+        'record_count': totals['record_count'] + archived_count,
+        'records_last_30_days': records.filter(record_date__gte=thirty_days_ago).count(),
+        'last_record_date': last_record_date,
+        'doctor_count': Doctor.objects.filter(department_id=department_id).count(),
+    }
+    cache.set(key, stats, DEPARTMENT_STATS_TIMEOUT)
+    return stats
+
+
+def invalidate_department_stats(*department_ids):
+    cache.delete_many([_department_stats_key(pk) for pk in department_ids if pk])
@@ -0,0 +1,57 @@
+"""
+Background job handlers; see ``core.jobs`` for the queue itself.
+"""
+from django.conf import settings
+
+from .anomalies import flag_patients
+from .exports import run_export
+from .jobs import task
+from .mailer import OnboardingMailer
+from .models import Department, Job, Patient
+from .stats import department_stats, invalidate_department_stats
+
+
+@task('send_password_reset', max_attempts=8, batch_size=50)
+def send_password_reset(requests):
+    """Email onboarding/password-reset links for newly provisioned accounts, one connection per batch."""
+    return OnboardingMailer().send(requests)
+
+
+@task('refresh_vitals_flags')
+def refresh_vitals_flags(patient_ids=None, batch_size=500):
+    """Recompute anomaly flags for the given patients (or everyone)."""
+    if patient_ids is None:
+        patient_ids = list(Patient.objects.order_by('pk').values_list('pk', flat=True))
+    flags = 0
+    for offset in range(0, len(patient_ids), batch_size):
+        flags += flag_patients(patient_ids[offset:offset + batch_size])
+    return {'patients': len(patient_ids), 'flags': flags}
+
+
+@task('warm_department_stats')
+def warm_department_stats(department_ids=None):
+    """Rebuild cached department summaries (effective when CACHES is shared between processes)."""
+    if department_ids is None:
+        department_ids = list(Department.objects.values_list('pk', flat=True))
+    invalidate_department_stats(*department_ids)
+    for department_id in department_ids:
+        department_stats(department_id)
+    return {'departments': len(department_ids)}
+
+
+@task('fhir_export', max_attempts=1)
+def fhir_export(export_id, types, since=None, requested_by=None, request_url=''):
+    """Bulk export (``$export``); the returned manifest is served by the status endpoint."""
+
+    def progress(message):
+        Job.objects.filter(name='fhir_export', payload__export_id=export_id).update(result={'progress': message})
+
+    return run_export(
+        export_id,
+        types,
+        since=since,
+        request_url=request_url,
+        processes=settings.FHIR_EXPORT_PROCESSES,
+        progress=progress,
+    )
+
@@ -0,0 +1,17 @@
+from django import template
+from django.utils.html import format_html
+
+from core.assets import vendored_url
+
+register = template.Library()
+
+
+@register.simple_tag
+def vendored_script(name):
+    """``<script>`` for a vendored library; deferred, so it keeps document order."""
+    return format_html('<script src="{}" defer></script>', vendored_url(name))
+
+
+@register.simple_tag
+def vendored_stylesheet(name):
+    return format_html('<link rel="stylesheet" href="{}">', vendored_url(name))
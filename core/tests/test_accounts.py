@@ -3,6 +3,7 @@ from django.core import mail
 from django.test import TestCase, override_settings
 from django.urls import reverse
 
+from core.jobs import run_pending
 from core.models import AuditLog, DoctorProfile, PatientProfile
 
 
@@ -77,6 +78,9 @@ class AccountProvisioningTests(TestCase):
         profile = new_user.doctor_profile
         self.assertEqual(profile.doctor_id, f'DOC{new_user.pk:05d}')
 
+        # The reset email is queued and sent by a worker, not inline.
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(run_pending(), 1)
         self.assertEqual(len(mail.outbox), 1)
         self.assertIn('drnew@example.com', mail.outbox[0].to)
 
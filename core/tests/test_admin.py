@@ -0,0 +1,159 @@
+from datetime import date, datetime, timezone as dt_timezone
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from core.admin import EstimatedCountPaginator, _with_probed_dates, search_patients, top_values
+from core.management.commands.benchmark_admin import inflate
+from core.models import AuditLog, Department, Doctor, Patient, PatientHealthRecord
+
+User = get_user_model()
+
+
+class ScalableAdminTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.department = Department.objects.create(name='Cardiology')
+        cls.doctor = Doctor.objects.create(full_name='Dr. Heart', department=cls.department)
+        cls.patients = [
+            Patient.objects.create(
+                patient_id=f'PAT0000{number}', first_name='Asha', last_name=last_name,
+                date_of_birth=date(1970, 1, 1), gender='F', email=f'p{number}@example.com',
+                phone=f'98765432{number}0',
+            )
+            for number, last_name in enumerate(('Rao', 'Iyer', 'Raman'), start=1)
+        ]
+        cls.add_records(2022, 2024, 2025)
+        cls.superuser = User.objects.create_superuser('root', 'root@example.com', 'RootPass123')
+
+    @classmethod
+    def add_records(cls, *years, per_patient=1):
+        PatientHealthRecord.objects.bulk_create(
+            PatientHealthRecord(
+                patient=patient, doctor=cls.doctor, department=cls.department,
+                record_date=datetime(year, 3, 1 + copy, 9, tzinfo=dt_timezone.utc),
+                systolic_bp=120, diastolic_bp=80, heart_rate=70, weight=70, height=170,
+                diagnosis='Hypertension', visit_type='Follow-up',
+            )
+            for year in years for patient in cls.patients for copy in range(per_patient)
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.superuser)
+
+    def changelist(self, model, **params):
+        url = reverse(f'admin:core_{model._meta.model_name}_changelist')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response, [query['sql'] for query in queries.captured_queries]
+
+    def test_queries_do_not_grow_with_the_table(self):
+        self.changelist(PatientHealthRecord)  # fills the filter choice cache
+        _, before = self.changelist(PatientHealthRecord)
+        self.add_records(2023, per_patient=20)
+        _, after = self.changelist(PatientHealthRecord)
+        self.assertEqual(len(after), len(before))
+        for sql in after:
+            self.assertNotIn('DISTINCT', sql)
+            self.assertFalse('MIN(' in sql and 'MAX(' in sql)  # together they scan
+            if 'COUNT(' in sql:
+                self.assertIn('LIMIT', sql)  # capped, never the whole table
+
+    def test_counts_are_capped_then_estimated(self):
+        records = PatientHealthRecord.objects.order_by('pk')
+        records[4].delete()
+        with mock.patch('core.admin.COUNT_LIMIT', 5):
+            # No statistics yet: the primary key span.
+            self.assertEqual(EstimatedCountPaginator(records, 100).count, 9)
+            self.assertEqual(EstimatedCountPaginator(records.filter(doctor=self.doctor), 100).count, 5)
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+            with self.assertNumQueries(3):  # capped count, statistics table, estimate
+                self.assertEqual(EstimatedCountPaginator(records, 100).count, 8)
+        self.assertEqual(EstimatedCountPaginator(records.filter(doctor=self.doctor), 100).count, 8)
+
+    def test_date_hierarchy_probes_match_distinct_dates(self):
+        queryset = PatientHealthRecord.objects.all()
+        queryset.__class__ = _with_probed_dates(queryset.__class__)
+        for kind in ('year', 'month', 'day'):
+            with self.subTest(kind=kind):
+                self.assertEqual(
+                    list(queryset.filter(record_date__year=2024).datetimes('record_date', kind)),
+                    list(PatientHealthRecord.objects.filter(record_date__year=2024).datetimes('record_date', kind)),
+                )
+        self.assertEqual(
+            [value.year for value in queryset.datetimes('record_date', 'year', order='DESC')], [2025, 2024, 2022],
+        )
+        response, _ = self.changelist(PatientHealthRecord)
+        for year in (2022, 2024, 2025):
+            self.assertContains(response, f'?record_date__year={year}')
+        self.assertNotContains(response, '?record_date__year=2023')
+
+    def test_filter_choices_are_the_cached_top_values(self):
+        second = Doctor.objects.create(full_name='Dr. Bone', department=self.department)
+        self.assertEqual(top_values(PatientHealthRecord, 'doctor'), [(str(self.doctor.pk), 'Dr. Heart (Cardiology)')])
+        PatientHealthRecord.objects.filter(pk=PatientHealthRecord.objects.first().pk).update(doctor=second)
+        with self.assertNumQueries(0):
+            self.assertEqual(top_values(PatientHealthRecord, 'doctor'), [(str(self.doctor.pk), 'Dr. Heart (Cardiology)')])
+        cache.clear()
+        self.assertEqual(
+            top_values(PatientHealthRecord, 'doctor'),
+            [(str(second.pk), 'Dr. Bone (Cardiology)'), (str(self.doctor.pk), 'Dr. Heart (Cardiology)')],
+        )
+
+    def test_searches_use_exact_and_prefix_matches(self):
+        rao, iyer, raman = self.patients
+        response, _ = self.changelist(PatientHealthRecord, q='pat00002')
+        self.assertEqual({record.patient for record in response.context['cl'].result_list}, {iyer})
+        response, _ = self.changelist(PatientHealthRecord, q='ra')
+        self.assertEqual({record.patient for record in response.context['cl'].result_list}, {rao, raman})
+        response, _ = self.changelist(Patient, q='IYE')
+        self.assertEqual(list(response.context['cl'].result_list), [iyer])
+
+    def test_patient_search_finds_every_match_by_name_or_contact(self):
+        rao, iyer, raman = self.patients
+        response, _ = self.changelist(Patient, q='asha')
+        self.assertEqual(set(response.context['cl'].result_list), {rao, iyer, raman})
+        response, _ = self.changelist(Patient, q='p2@example.com')
+        self.assertEqual(list(response.context['cl'].result_list), [iyer])
+        response, _ = self.changelist(Patient, q=raman.phone)
+        self.assertEqual(list(response.context['cl'].result_list), [raman])
+        with mock.patch('core.admin.SEARCH_PATIENTS', 1):
+            response, _ = self.changelist(Patient, q='ra')
+        self.assertEqual(set(response.context['cl'].result_list), {rao, raman})  # not capped
+
+    def test_record_search_picks_the_same_patients_and_says_so(self):
+        rao, iyer, raman = self.patients
+        self.assertEqual(search_patients('ra', limit=1), ([rao.pk], True))
+        self.assertEqual(search_patients('ra'), ([rao.pk, raman.pk], False))
+        # An identifier is never crowded out by name matches.
+        Patient.objects.filter(pk=iyer.pk).update(email='Raj@example.com')
+        self.assertEqual(search_patients('raj@example.com', limit=1), ([iyer.pk], False))
+
+        with mock.patch('core.admin.SEARCH_PATIENTS', 1):
+            response, _ = self.changelist(PatientHealthRecord, q='ra')
+        self.assertEqual({record.patient for record in response.context['cl'].result_list}, {rao})
+        self.assertIn('matches more than 1 patients', [str(message) for message in response.context['messages']][0])
+
+    def test_audit_log_search_never_reads_details(self):
+        AuditLog.objects.create(actor=self.superuser, action='export', target='PAT00001', details={'note': 'urgent'})
+        response, queries = self.changelist(AuditLog, q='pat00001')
+        self.assertEqual([entry.target for entry in response.context['cl'].result_list], ['PAT00001'])
+        response, queries = self.changelist(AuditLog, q='urgent')
+        self.assertEqual(list(response.context['cl'].result_list), [])
+        self.assertFalse([sql for sql in queries if 'LIKE' in sql])
+
+    def test_benchmark_copies_rows_with_fresh_unique_values(self):
+        inflate(Patient, 12, 'registration_date')
+        inflate(PatientHealthRecord, 40, 'record_date')
+        self.assertEqual(Patient.all_objects.count(), 12)
+        self.assertEqual(Patient.all_objects.values('patient_id').distinct().count(), 12)
+        self.assertEqual(PatientHealthRecord.objects.count(), 40)
+        self.assertGreater(PatientHealthRecord.objects.values('patient').distinct().count(), 3)
@@ -0,0 +1,131 @@
+from datetime import date, timedelta
+from decimal import Decimal
+from io import StringIO
+
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from core.anomalies import rolling_zscores
+from core.models import Department, Doctor, Patient, PatientHealthRecord, VitalsFlag
+
+
+User = get_user_model()
+
+
+class RollingZScoreTests(TestCase):
+    def test_scores_against_previous_readings_of_same_group_only(self):
+        groups = np.array([1, 1, 1, 1, 2, 2, 2, 2])
+        values = np.array([70.0, 71.0, 69.0, 90.0, 50.0, np.nan, 51.0, 49.0])
+        z = rolling_zscores(groups, values, min_history=3)
+
+        self.assertTrue(np.isnan(z[:3]).all())
+        self.assertGreater(z[3], 3)
+        # Patient 2 only has two earlier valid readings when the last one arrives.
+        self.assertTrue(np.isnan(z[4:]).all())
+
+
+class VitalsFlagTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.department = Department.objects.create(name='Cardiology')
+        cls.doctor = Doctor.objects.create(full_name='Dr. Heart', department=cls.department)
+        cls.patient = Patient.objects.create(
+            patient_id='P1', first_name='Test', last_name='Patient', date_of_birth=date(1970, 1, 1),
+            gender='F', email='p1@example.com', phone='9876543210',
+        )
+
+    def record(self, days_ago, **vitals):
+        return PatientHealthRecord.objects.create(
+            patient=self.patient, doctor=self.doctor, department=self.department,
+            record_date=timezone.now() - timedelta(days=days_ago), **vitals,
+        )
+
+    def test_threshold_rules_flag_on_save(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            record = self.record(1, systolic_bp=190, diastolic_bp=100, heart_rate=115, temperature=Decimal('38.4'))
+
+        kinds = dict(record.flags.values_list('kind', 'severity'))
+        self.assertEqual(kinds, {
+            VitalsFlag.Kinds.HYPERTENSIVE_CRISIS: VitalsFlag.Severity.CRITICAL,
+            VitalsFlag.Kinds.TACHYCARDIA: VitalsFlag.Severity.WARNING,
+            VitalsFlag.Kinds.FEVER: VitalsFlag.Severity.WARNING,
+        })
+
+    def test_crisis_stores_the_pressure_that_triggered_it(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            high_diastolic = self.record(2, systolic_bp=150, diastolic_bp=125)
+            diastolic_only = self.record(1, diastolic_bp=125)
+            both = self.record(0, systolic_bp=200, diastolic_bp=130)
+
+        for record, value in ((high_diastolic, 125), (diastolic_only, 125), (both, 200)):
+            flag = record.flags.get(kind=VitalsFlag.Kinds.HYPERTENSIVE_CRISIS)
+            self.assertEqual((flag.severity, flag.value), (VitalsFlag.Severity.CRITICAL, value))
+
+    def test_sudden_weight_change_against_own_history(self):
+        for days_ago, weight in ((40, 70), (30, 71), (20, 70)):
+            self.record(days_ago, weight=Decimal(weight))
+        with self.captureOnCommitCallbacks(execute=True):
+            jump = self.record(1, weight=Decimal(82))
+
+        flag = jump.flags.get()
+        self.assertEqual(flag.kind, VitalsFlag.Kinds.WEIGHT_CHANGE)
+        self.assertGreater(flag.zscore, 3)
+
+    def test_backfill_command_and_work_queue(self):
+        record = self.record(2, heart_rate=40)
+        self.assertFalse(VitalsFlag.objects.exists())
+
+        call_command('flag_vitals', stdout=StringIO())
+        flag = VitalsFlag.objects.get()
+        self.assertEqual((flag.record_id, flag.kind), (record.pk, VitalsFlag.Kinds.BRADYCARDIA))
+
+        admin = User.objects.create_user(
+            username='adminuser', email='admin@example.com', password='AdminPass123', role=User.Roles.ADMIN,
+        )
+        self.client.force_login(admin)
+        response = self.client.get(reverse('flagged_readings'))
+        self.assertEqual(list(response.context['flags']), [flag])
+
+        self.client.post(reverse('flagged_readings'), {'flag': [flag.pk]})
+        flag.refresh_from_db()
+        self.assertEqual(flag.acknowledged_by, admin)
+
+        # Recomputing keeps the acknowledgement.
+        call_command('flag_vitals', stdout=StringIO())
+        self.assertIsNotNone(VitalsFlag.objects.get().acknowledged_at)
+
+    def test_doctors_work_only_their_own_flags(self):
+        other = Doctor.objects.create(full_name='Dr. Other', department=self.department)
+        mine = self.record(2, heart_rate=40)
+        theirs = PatientHealthRecord.objects.create(
+            patient=self.patient, doctor=other, department=self.department,
+            record_date=timezone.now() - timedelta(days=1), heart_rate=40,
+        )
+        call_command('flag_vitals', stdout=StringIO())
+        my_flag = mine.flags.get()
+        their_flag = theirs.flags.get()
+
+        doctor_user = User.objects.create_user(
+            username='drheart', email='heart@example.com', password='DoctorPass123', role=User.Roles.DOCTOR,
+        )
+        self.doctor.user = doctor_user
+        self.doctor.save()
+        self.client.force_login(doctor_user)
+        response = self.client.get(reverse('flagged_readings'))
+        self.assertEqual(list(response.context['flags']), [my_flag])
+
+        self.client.post(reverse('flagged_readings'), {'flag': [my_flag.pk, their_flag.pk]})
+        my_flag.refresh_from_db()
+        their_flag.refresh_from_db()
+        self.assertEqual(my_flag.acknowledged_by, doctor_user)
+        self.assertIsNone(their_flag.acknowledged_at)
+
+        patient_user = User.objects.create_user(
+            username='patient', email='patient@example.com', password='PatientPass123', role=User.Roles.PATIENT,
+        )
+        self.client.force_login(patient_user)
+        self.assertEqual(self.client.get(reverse('flagged_readings')).status_code, 403)
@@ -0,0 +1,153 @@
+from datetime import date, timedelta
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db.models.signals import post_delete
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from core.archive import archive_batch
+from core.cohorts import cohort_index
+from core.models import ArchivedHealthRecord, ArchiveRollup, Department, Doctor, Patient, PatientHealthRecord
+from core.stats import department_stats
+from core.views import department_patient_queryset
+
+
+User = get_user_model()
+
+
+class ArchiveTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.department = Department.objects.create(name='Cardiology')
+        cls.doctor = Doctor.objects.create(full_name='Dr. Heart', department=cls.department)
+        cls.patient = Patient.objects.create(
+            patient_id='PAT00001', first_name='Asha', last_name='Rao', date_of_birth=date(1970, 1, 1),
+            gender='F', email='asha@example.com', phone='9876543210',
+        )
+        cls.old_only = Patient.objects.create(
+            patient_id='PAT00002', first_name='Ravi', last_name='Iyer', date_of_birth=date(1965, 5, 5),
+            gender='M', email='ravi@example.com', phone='9876500000',
+        )
+        now = timezone.now()
+        for years, patient in ((5, cls.patient), (4, cls.patient), (3, cls.old_only), (0, cls.patient)):
+            PatientHealthRecord.objects.create(
+                patient=patient, doctor=cls.doctor, department=cls.department,
+                record_date=now - timedelta(days=365 * years + 1),
+                systolic_bp=120 + years * 10, diastolic_bp=80, heart_rate=70,
+                weight=70, height=170, diagnosis='Hypertension', visit_type='Follow-up',
+            )
+        cls.admin = User.objects.create_user(
+            username='adminuser', email='admin@example.com', password='AdminPass123', role=User.Roles.ADMIN,
+        )
+
+    def setUp(self):
+        cache.clear()
+        cohort_index.invalidate()
+
+    def archive(self, *args):
+        out = StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('archive_records', '--older-than-days', '730', '--batch-size', '2', *args, stdout=out)
+        return out.getvalue()
+
+    def dashboard_context(self):
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse('dashboard'))
+        self.assertEqual(response.status_code, 200)
+        return response.context
+
+    def test_archiving_moves_old_records_in_batches(self):
+        output = self.archive()
+        self.assertIn('Archived 3 health records', output)
+        self.assertEqual(PatientHealthRecord.objects.count(), 1)
+        self.assertEqual(ArchivedHealthRecord.objects.count(), 3)
+        self.assertEqual(ArchiveRollup.objects.get(year=timezone.now().year - 5).record_count, 1)
+        # Rerunning finds nothing left to move.
+        self.assertIn('Archived 0 health records', self.archive())
+
+    def test_batches_delete_without_per_row_signals(self):
+        deleted = []
+
+        def receiver(sender, instance, **kwargs):
+            deleted.append(instance.pk)
+
+        post_delete.connect(receiver, sender=PatientHealthRecord)
+        self.addCleanup(post_delete.disconnect, receiver, sender=PatientHealthRecord)
+        cutoff = timezone.now() - timedelta(days=730)
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.assertEqual(archive_batch(cutoff, batch_size=10), 3)
+        self.assertEqual(deleted, [])
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(PatientHealthRecord.objects.count(), 1)
+
+    def test_totals_are_unchanged_by_archiving(self):
+        before = self.dashboard_context()
+        stats_before = department_stats(self.department.pk)
+        patients_before = set(department_patient_queryset(self.department))
+        cohort_before = cohort_index.query({'diagnosis': ['Hypertension']})
+
+        self.archive()
+        cohort_index.invalidate()
+
+        after = self.dashboard_context()
+        self.assertEqual(after['total_health_records'], before['total_health_records'])
+        for key in ('dept_patient_data', 'diagnosis_counts', 'visit_type_counts', 'dept_vital_systolic', 'bmi_counts'):
+            self.assertEqual(after['chart_data'][key], before['chart_data'][key], key)
+        self.assertEqual(department_stats(self.department.pk), stats_before)
+        self.assertEqual(set(department_patient_queryset(self.department)), patients_before)
+        self.assertEqual(cohort_index.query({'diagnosis': ['Hypertension']}), cohort_before)
+
+    def test_soft_deleted_patients_leave_the_totals(self):
+        self.archive()
+        before = self.dashboard_context()
+        stats_before = department_stats(self.department.pk)
+        self.assertEqual((stats_before['record_count'], stats_before['patient_count']), (4, 2))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.old_only.soft_delete()
+        cache.clear()
+        after = self.dashboard_context()
+        self.assertEqual(after['total_health_records'], before['total_health_records'] - 1)
+        self.assertEqual(sum(after['chart_data']['diagnosis_counts']), sum(before['chart_data']['diagnosis_counts']) - 1)
+        self.assertEqual(sum(after['chart_data']['bmi_counts']), sum(before['chart_data']['bmi_counts']) - 1)
+        stats = department_stats(self.department.pk)
+        self.assertEqual((stats['record_count'], stats['patient_count']), (3, 1))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.old_only.restore()
+        self.assertEqual(department_stats(self.department.pk), stats_before)  # the signal dropped the cache
+        self.assertEqual(self.dashboard_context()['total_health_records'], before['total_health_records'])
+
+    def test_patient_detail_pages_into_archived_history(self):
+        self.archive()
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse('patient_detail', args=[self.patient.pk]))
+        self.assertEqual(len(response.context['health_records']), 1)
+        self.assertEqual(response.context['archived_records'].paginator.count, 2)
+        self.assertContains(response, 'Archived History (2)')
+
+    def test_restore_round_trip(self):
+        original_ids = set(PatientHealthRecord.objects.values_list('pk', flat=True))
+        self.archive()
+        out = StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('archive_records', '--restore', '--patient', 'PAT00002', stdout=out)
+        self.assertIn('Restored 1 health records', out.getvalue())
+        self.assertTrue(PatientHealthRecord.objects.filter(patient=self.old_only).exists())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('archive_records', '--restore', stdout=StringIO())
+        self.assertEqual(set(PatientHealthRecord.objects.values_list('pk', flat=True)), original_ids)
+        self.assertFalse(ArchivedHealthRecord.objects.exists())
+        self.assertFalse(ArchiveRollup.objects.exists())
+
+    def test_deleting_a_patient_removes_archived_rollups(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            archive_batch(timezone.now() - timedelta(days=730))
+        self.old_only.delete()
+        self.assertEqual(ArchivedHealthRecord.objects.count(), 2)
+        self.assertEqual(sum(ArchiveRollup.objects.values_list('record_count', flat=True)), 2)
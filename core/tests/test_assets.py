@@ -0,0 +1,112 @@
+import gzip
+import tempfile
+from io import StringIO
+from pathlib import Path
+
+import brotli
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from core.assets import _is_vendored, accepted_encodings
+
+User = get_user_model()
+
+CDN_CHART_JS = 'https://cdn.jsdelivr.net/npm/chart.js@4.4.0/dist/chart.umd.min.js'
+
+
+class DashboardAssetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(
+            username='adminuser', email='admin@example.com', password='AdminPass123', role=User.Roles.ADMIN,
+        )
+
+    def setUp(self):
+        _is_vendored.cache_clear()
+        self.addCleanup(_is_vendored.cache_clear)
+        self.client.force_login(self.admin)
+
+    def test_dashboard_script_is_static_and_data_is_json(self):
+        response = self.client.get(reverse('dashboard'))
+        self.assertContains(response, '<script id="dashboard-data" type="application/json">')
+        self.assertContains(response, 'js/dashboard.js')
+        self.assertNotContains(response, 'new Chart(')
+
+    def test_vendored_library_replaces_cdn(self):
+        # Not vendored in this checkout: the CDN is used.
+        self.assertContains(self.client.get(reverse('dashboard')), CDN_CHART_JS)
+
+        with tempfile.TemporaryDirectory() as vendor:
+            target = Path(vendor) / 'vendor/chart.js/4.4.0/chart.umd.min.js'
+            target.parent.mkdir(parents=True)
+            target.write_text('/* chart.js */')
+            with override_settings(STATICFILES_DIRS=[*settings.STATICFILES_DIRS, vendor]):
+                _is_vendored.cache_clear()
+                response = self.client.get(reverse('dashboard'))
+        self.assertNotContains(response, CDN_CHART_JS)
+        self.assertContains(response, '/static/vendor/chart.js/4.4.0/chart.umd.min.js')
+
+    def test_bootstrap_is_vendored_and_locked(self):
+        response = self.client.get(reverse('dashboard'))
+        self.assertContains(response, '/static/vendor/bootstrap/5.3.3/bootstrap.min.css')
+        self.assertContains(response, '/static/vendor/bootstrap/5.3.3/bootstrap.bundle.min.js')
+        out = StringIO()
+        call_command('vendor_assets', 'bootstrap.css', 'bootstrap.js', '--check', stdout=out)
+        self.assertIn('2 vendored assets verified', out.getvalue())
+
+
+class PrecompressedStaticTests(TestCase):
+    def setUp(self):
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        self.root = Path(root.name)
+        storages = {**settings.STORAGES, 'staticfiles': {'BACKEND': 'core.assets.CompressedManifestStaticFilesStorage'}}
+        middleware = [settings.MIDDLEWARE[0], 'core.assets.StaticFilesMiddleware', *settings.MIDDLEWARE[1:]]
+        overrides = override_settings(STATIC_ROOT=self.root, STORAGES=storages, MIDDLEWARE=middleware)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        call_command('collectstatic', interactive=False, verbosity=0, stdout=StringIO())
+
+    def hashed_name(self, name):
+        return staticfiles_storage.stored_name(name)
+
+    def test_collectstatic_writes_compressed_variants(self):
+        name = self.hashed_name('js/dashboard.js')
+        self.assertNotEqual(name, 'js/dashboard.js')
+        original = (self.root / name).read_bytes()
+        self.assertEqual(gzip.decompress((self.root / f'{name}.gz').read_bytes()), original)
+        # Vendored libraries too, although their source maps are not vendored with them.
+        name = self.hashed_name('vendor/bootstrap/5.3.3/bootstrap.min.css')
+        original = (self.root / name).read_bytes()
+        self.assertEqual(brotli.decompress((self.root / f'{name}.br').read_bytes()), original)
+
+    def test_fingerprinted_files_are_served_compressed_and_immutable(self):
+        name = self.hashed_name('js/dashboard.js')
+        response = self.client.get(f'/static/{name}', HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Content-Type'], 'text/javascript')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertIn('Accept-Encoding', response['Vary'])
+        body = b''.join(response.streaming_content)
+        self.assertEqual(gzip.decompress(body), (self.root / name).read_bytes())
+
+        plain = self.client.get(f'/static/{name}', HTTP_ACCEPT_ENCODING='gzip;q=0')
+        self.assertFalse(plain.has_header('Content-Encoding'))
+
+        revalidate = self.client.get(f'/static/{name}', HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(revalidate.status_code, 304)
+
+        unhashed = self.client.get('/static/js/dashboard.js')
+        self.assertNotIn('immutable', unhashed['Cache-Control'])
+        self.assertEqual(self.client.get('/static/../manage.py').status_code, 404)
+
+    def test_accepted_encodings(self):
+        self.assertEqual(accepted_encodings('gzip, deflate, br;q=0.5'), {'gzip', 'deflate', 'br'})
+        self.assertEqual(accepted_encodings('br;q=0, gzip'), {'gzip'})
+        self.assertEqual(accepted_encodings(''), set())
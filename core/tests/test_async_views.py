@@ -0,0 +1,105 @@
+from datetime import date
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+
+from core import metrics
+from core.models import Department, Doctor, Patient, PatientHealthRecord
+
+User = get_user_model()
+
+
+def make_patient(number, user=None):
+    return Patient.objects.create(
+        user=user,
+        patient_id=f'PAT{number:05d}',
+        first_name='Asha',
+        last_name=f'Rao{number}',
+        date_of_birth=date(1980, 1, 1),
+        gender='F',
+        email=f'patient{number}@example.com',
+        phone='9876543210',
+    )
+
+
+# AsyncClient goes through the ASGI handler, where a template touching the
+# database raises SynchronousOnlyOperation.
+class AsyncViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.department = Department.objects.create(name='Cardiology')
+        cls.doctor_user = User.objects.create_user(
+            username='drheart', email='heart@example.com', password='DoctorPass123', role=User.Roles.DOCTOR,
+        )
+        cls.doctor = Doctor.objects.create(full_name='Dr. Heart', department=cls.department, user=cls.doctor_user)
+        cls.patient_user = User.objects.create_user(
+            username='asha', email='asha@example.com', password='PatientPass123', role=User.Roles.PATIENT,
+        )
+        cls.patient = make_patient(1, user=cls.patient_user)
+        cls.other_patient = make_patient(2)
+        cls.record = PatientHealthRecord.objects.create(
+            patient=cls.patient, doctor=cls.doctor, department=cls.department, diagnosis='Hypertension',
+        )
+        other_doctor = Doctor.objects.create(full_name='Dr. Brain', department=cls.department)
+        cls.other_record = PatientHealthRecord.objects.create(
+            patient=cls.other_patient, doctor=other_doctor, department=cls.department,
+        )
+        cls.admin = User.objects.create_user(
+            username='adminuser', email='admin@example.com', password='AdminPass123', role=User.Roles.ADMIN,
+        )
+        cls.analyst = User.objects.create_user(
+            username='analyst', email='analyst@example.com', password='AnalystPass123', role=User.Roles.ANALYST,
+        )
+
+    async def get(self, user, name, *args):
+        await self.async_client.aforce_login(user)
+        return await self.async_client.get(reverse(name, args=args))
+
+    async def test_admin_sees_every_page(self):
+        response = await self.get(self.admin, 'patient_detail', self.patient.pk)
+        self.assertContains(response, 'Hypertension')
+        self.assertEqual(response.context['archived_records'].paginator.count, 0)
+        self.assertContains(await self.get(self.admin, 'health_record_detail', self.record.pk), 'Dr. Heart')
+        self.assertContains(await self.get(self.admin, 'departments'), 'Cardiology')
+        self.assertContains(await self.get(self.admin, 'doctors'), 'Dr. Heart')
+
+    async def test_doctor_sees_only_their_patients(self):
+        response = await self.get(self.doctor_user, 'doctor_patients')
+        self.assertEqual(response.context['patients'], [self.patient])
+        self.assertEqual((await self.get(self.doctor_user, 'patient_detail', self.patient.pk)).status_code, 200)
+        self.assertEqual((await self.get(self.doctor_user, 'health_record_detail', self.record.pk)).status_code, 200)
+        self.assertRedirects(
+            await self.get(self.doctor_user, 'patient_detail', self.other_patient.pk), reverse('home'),
+            fetch_redirect_response=False,
+        )
+        self.assertRedirects(
+            await self.get(self.doctor_user, 'health_record_detail', self.other_record.pk), reverse('home'),
+            fetch_redirect_response=False,
+        )
+
+    async def test_patient_sees_only_their_records(self):
+        response = await self.get(self.patient_user, 'patient_detail', self.patient.pk)
+        self.assertContains(response, 'Patient:</strong> Asha Rao1')
+        self.assertEqual((await self.get(self.patient_user, 'health_record_detail', self.record.pk)).status_code, 200)
+        self.assertRedirects(
+            await self.get(self.patient_user, 'health_record_detail', self.other_record.pk), reverse('home'),
+            fetch_redirect_response=False,
+        )
+        self.assertEqual((await self.get(self.patient_user, 'departments')).status_code, 200)
+
+    async def test_roles_and_login_are_enforced(self):
+        response = await self.async_client.get(reverse('departments'))
+        self.assertRedirects(response, f"{reverse('login')}?next={reverse('departments')}", fetch_redirect_response=False)
+        self.assertEqual((await self.get(self.analyst, 'doctor_patients')).status_code, 403)
+        # No patient profile: redirected, not a query from the template.
+        self.assertRedirects(
+            await self.get(self.analyst, 'patient_detail', self.patient.pk), reverse('home'),
+            fetch_redirect_response=False,
+        )
+
+    async def test_queries_are_counted_under_asgi(self):
+        metrics.reset()
+        await self.get(self.admin, 'doctors')
+        self.assertRegex(await sync_to_async(metrics.render)(), r'db_queries_total\{view="doctors"\} [1-9]')
@@ -0,0 +1,140 @@
+import json
+import sqlite3
+import tempfile
+from datetime import date
+from io import StringIO
+from pathlib import Path
+from unittest import mock
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+
+from core import backups, metrics
+from core.models import Patient
+
+
+class OnlineCopyTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        self.source = sqlite3.connect(self.directory / 'live.sqlite3', isolation_level=None)
+        self.addCleanup(self.source.close)
+        self.source.execute('CREATE TABLE readings (value TEXT)')
+        self.source.executemany('INSERT INTO readings VALUES (?)', [('x' * 500,)] * 500)
+        self.writer = sqlite3.connect(self.directory / 'live.sqlite3', isolation_level=None)
+        self.addCleanup(self.writer.close)
+
+    def copied_rows(self, path):
+        copy = sqlite3.connect(path)
+        try:
+            return copy.execute('SELECT COUNT(*) FROM readings').fetchone()[0]
+        finally:
+            copy.close()
+
+    def test_the_copy_pauses_between_steps(self):
+        with mock.patch('core.backups.time.sleep') as sleep:
+            restarts = backups.online_copy(self.source, self.directory / 'copy.sqlite3', pages=10, sleep=0.5)
+        self.assertEqual(restarts, 0)
+        self.assertGreater(sleep.call_count, 5)
+        sleep.assert_called_with(0.5)
+        self.assertEqual(self.copied_rows(self.directory / 'copy.sqlite3'), 500)
+
+    def test_steady_writes_end_in_a_single_step_copy(self):
+        commits = []
+
+        def commit_meanwhile(seconds):
+            self.writer.execute("INSERT INTO readings VALUES ('new')")
+            commits.append(seconds)
+
+        with mock.patch('core.backups.time.sleep', side_effect=commit_meanwhile):
+            restarts = backups.online_copy(self.source, self.directory / 'copy.sqlite3', pages=10, sleep=0.5)
+        self.assertEqual(restarts, backups.MAX_RESTARTS + 1)
+        self.assertEqual(self.copied_rows(self.directory / 'copy.sqlite3'), 500 + len(commits))
+        self.assertEqual(backups.integrity_check(self.directory / 'copy.sqlite3'), 'ok')
+
+
+# The backup API waits for open write transactions, so the data has to be committed.
+class SnapshotTests(TransactionTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        settings = override_settings(BACKUP_DIR=self.directory / 'backups', BACKUP_KEEP=2, ANALYTICS_REPLICA='')
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.patient = Patient.objects.create(
+            patient_id='PAT00001', first_name='Asha', last_name='Rao', date_of_birth=date(1970, 1, 1),
+            gender='F', email='asha@example.com', phone='9876543210',
+        )
+
+    def run_command(self, *args):
+        out = StringIO()
+        call_command(*args, stdout=out)
+        return out.getvalue()
+
+    def test_snapshots_rotate_and_restore(self):
+        replica = self.directory / 'analytics.sqlite3'
+        self.run_command('backup_db', '--replica', str(replica))
+        self.run_command('backup_db')
+        output = self.run_command('backup_db', '--step-pages', '5')
+        self.assertIn('Removed 1 old snapshot', output)
+        snapshots = backups.list_snapshots()
+        self.assertEqual(len(snapshots), 2)
+        self.assertEqual(len(list((self.directory / 'backups').iterdir())), 4)  # no leftovers
+        self.assertEqual(snapshots[-1]['restarts'], 0)
+        self.assertIn('db_backup_age_seconds', metrics.render())
+
+        analytics = sqlite3.connect(replica)
+        self.assertEqual(analytics.execute('SELECT patient_id FROM core_patient').fetchall(), [('PAT00001',)])
+        analytics.close()
+
+        self.patient.delete()
+        self.assertIn('intact', self.run_command('restore_db', '--check'))
+        staging = self.directory / 'staging.sqlite3'
+        self.run_command('restore_db', snapshots[0]['name'], '--target', str(staging))
+        self.assertEqual(backups.integrity_check(staging), 'ok')
+        self.assertFalse(Patient.all_objects.exists())
+
+        output = self.run_command('restore_db', '--noinput')
+        self.assertIn('pre-restore', output)
+        self.assertEqual(list(Patient.objects.values_list('patient_id', flat=True)), ['PAT00001'])
+        self.assertEqual(len(backups.list_snapshots()), 3)  # the safety snapshot is not rotated away
+
+    def test_the_safety_snapshot_is_kept_apart(self):
+        replica = self.directory / 'analytics.sqlite3'
+        with override_settings(ANALYTICS_REPLICA=replica):
+            self.run_command('backup_db')
+            self.patient.delete()
+            self.run_command('restore_db', '--noinput')
+            # The replica still holds the restored data, not the copy taken before restoring.
+            analytics = sqlite3.connect(replica)
+            self.assertEqual(analytics.execute('SELECT patient_id FROM core_patient').fetchall(), [('PAT00001',)])
+            analytics.close()
+            for _ in range(3):
+                self.run_command('backup_db')
+        labels = [manifest['label'] for manifest in backups.list_snapshots()]
+        self.assertEqual(sorted(labels), ['', '', 'pre-restore'])
+
+    def test_damaged_snapshots_are_refused(self):
+        self.run_command('backup_db')
+        manifest = backups.find_snapshot()
+        manifest_path = self.directory / 'backups' / f"{manifest['name']}.json"
+        archive = self.directory / 'backups' / manifest['file']
+
+        stored = json.loads(manifest_path.read_text())
+        manifest_path.write_text(json.dumps(dict(stored, sha256='0' * 64, compressed_sha256=backups._sha256(archive))))
+        with self.assertRaisesMessage(CommandError, 'does not match its checksum'):
+            self.run_command('restore_db', '--check')
+
+        manifest_path.write_text(json.dumps(stored))
+        data = bytearray(archive.read_bytes())
+        data[len(data) // 2] ^= 0xFF
+        archive.write_bytes(bytes(data))
+        with self.assertRaisesMessage(CommandError, 'damaged'):
+            self.run_command('restore_db', '--noinput')
+        self.assertTrue(Patient.objects.exists())
+
+        with self.assertRaisesMessage(CommandError, 'No snapshot nope'):
+            self.run_command('restore_db', 'nope', '--check')
@@ -0,0 +1,159 @@
+import asyncio
+import json
+import tempfile
+from datetime import date, datetime, timezone as dt_timezone
+from pathlib import Path
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.db import OperationalError
+from django.test import TestCase
+
+from core import bedside, metrics
+from core.bedside import VitalsServer, parse_reading
+from core.ingest import FeedError
+from core.models import Patient, VitalsReading
+
+
+def line(**reading):
+    return (json.dumps(reading) + '\n').encode()
+
+
+class ParseReadingTests(TestCase):
+    def test_readings_are_validated(self):
+        reading = parse_reading(line(patient_id='P1', bed='ICU-1', recorded_at=0, heart_rate=71.6, systolic_bp=120))
+        self.assertEqual(reading['vitals'], {'heart_rate': 72, 'systolic_bp': 120})
+        self.assertEqual(reading['recorded_at'], datetime(1970, 1, 1, tzinfo=dt_timezone.utc))
+        reading = parse_reading(line(patient_id='P1', diastolic_bp=80))
+        self.assertEqual(reading['recorded_at'], reading['received_at'])
+
+        for bad in (
+            b'not json\n',
+            b'[1, 2]\n',
+            line(heart_rate=70),
+            line(patient_id='P1'),
+            line(patient_id='P1', heart_rate=400),
+            line(patient_id='P1', heart_rate=True),
+            line(patient_id='P1', heart_rate=70, recorded_at='yesterday'),
+            line(patient_id='P1', heart_rate=70, recorded_at='2026-02-30T00:00:00'),
+            line(patient_id='P1', heart_rate=70, recorded_at=1e20),
+            line(patient_id='P1', heart_rate=70, recorded_at=float('nan')),
+        ):
+            with self.subTest(bad=bad), self.assertRaises(FeedError):
+                parse_reading(bad)
+
+
+class VitalsServerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.patient = Patient.objects.create(
+            patient_id='P1', first_name='Asha', last_name='Rao', date_of_birth=date(1970, 1, 1),
+            gender='F', email='p1@example.com', phone='9876543210',
+        )
+
+    def setUp(self):
+        metrics.reset()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = str(Path(directory.name) / 'vitals.sock')
+
+    # Run through async_to_sync so the writer's queries use this test's
+    # connection (and transaction).
+    @async_to_sync
+    async def stream(self, *lines, **options):
+        server = VitalsServer(**options)
+        await server.start(path=self.path)
+        _, writer = await asyncio.open_unix_connection(self.path)
+        for data in lines:
+            writer.write(data)
+        await writer.drain()
+        writer.close()
+        await writer.wait_closed()
+        expected = sum(1 for data in lines if data.strip())
+        while server.counts['accepted'] + server.counts['rejected'] < expected:
+            await asyncio.sleep(0.01)
+        await server.stop()
+        return server
+
+    def test_readings_are_written_in_batches(self):
+        readings = [line(patient_id='P1', bed='ICU-1', heart_rate=70 + number) for number in range(7)]
+        server = self.stream(
+            *readings, b'garbage\n', b'\n', line(patient_id='NOBODY', heart_rate=80),
+            batch_size=3, max_delay=0.05,
+        )
+
+        self.assertEqual(
+            sorted(VitalsReading.objects.values_list('heart_rate', flat=True)), list(range(70, 77)),
+        )
+        self.assertEqual(VitalsReading.objects.filter(patient=self.patient, bed='ICU-1').count(), 7)
+        self.assertEqual(server.counts['accepted'], 8)
+        self.assertEqual(server.counts['rejected'], 1)
+        self.assertEqual(server.counts['stored'], 7)
+        self.assertEqual(server.counts['unknown_patient'], 1)
+        self.assertGreaterEqual(server.counts['batches'], 3)
+        self.assertFalse(Path(self.path).exists())
+
+        rendered = metrics.render()
+        self.assertIn('vitals_readings_total{outcome="stored"} 7', rendered)
+        self.assertIn('vitals_ingest_lag_seconds_count 8', rendered)
+
+    def test_an_impossible_timestamp_only_rejects_its_line(self):
+        server = self.stream(
+            line(patient_id='P1', heart_rate=70, recorded_at='2026-02-30T00:00:00'),
+            line(patient_id='P1', heart_rate=71),
+        )
+        self.assertEqual(server.counts['rejected'], 1)
+        self.assertEqual(list(VitalsReading.objects.values_list('heart_rate', flat=True)), [71])
+
+    def test_overlong_lines_close_the_connection(self):
+        server = self.stream(b'{"patient_id": "' + b'x' * 5000 + b'"}\n')
+        self.assertEqual(server.counts['rejected'], 1)
+        self.assertFalse(VitalsReading.objects.exists())
+
+    def test_a_full_queue_stops_reading_the_connection(self):
+        async def scenario():
+            server = VitalsServer(batch_size=2, max_queue=2)
+            reader = asyncio.StreamReader()
+            for number in range(5):
+                reader.feed_data(line(patient_id='P1', heart_rate=60 + number))
+            reader.feed_eof()
+
+            class Writer:
+                def close(self):
+                    pass
+
+                async def wait_closed(self):
+                    pass
+
+            handler = asyncio.create_task(server.handle(reader, Writer()))
+            await asyncio.sleep(0.05)
+            blocked = (handler.done(), server.queue.qsize(), server.counts['accepted'])
+            while not handler.done():
+                server.queue.get_nowait()
+                await asyncio.sleep(0)
+            return blocked, server
+
+        (done, queued, accepted), server = asyncio.run(scenario())
+        self.assertFalse(done)
+        self.assertEqual(queued, 2)
+        self.assertEqual(accepted, 3)  # the third waits for room
+        self.assertEqual(server.counts['accepted'], 5)
+        self.assertGreater(server.paused, 0)
+
+    def test_a_batch_the_database_keeps_refusing_is_dropped(self):
+        class Writer:
+            calls = 0
+
+            def write(self, readings):
+                Writer.calls += 1
+                raise OperationalError('database is locked')
+
+        server = VitalsServer(writer=Writer())
+        batch = [parse_reading(line(patient_id='P1', heart_rate=70)) for _ in range(3)]
+        with mock.patch.object(bedside, 'MAX_RETRY_DELAY', 0), self.assertLogs('core.bedside') as logs:
+            async_to_sync(server.write)(batch)
+        self.assertEqual(Writer.calls, bedside.MAX_RETRIES + 1)
+        self.assertEqual(server.counts['failed'], 3)
+        self.assertEqual(server.counts['batches'], 0)
+        self.assertIn('after 5 retries', logs.output[-1])
+        self.assertIn('vitals_readings_total{outcome="failed"} 3', metrics.render())
@@ -0,0 +1,95 @@
+from datetime import date
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from core.cohorts import CohortIndex, cohort_index, iter_ids, to_bitmap
+from core.models import Department, Doctor, Patient, PatientHealthRecord
+
+
+User = get_user_model()
+
+
+def years_ago(years):
+    today = timezone.localdate()
+    return date(today.year - years, 1, 1)
+
+
+class CohortIndexTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.cardiology = Department.objects.create(name='Cardiology')
+        cls.neurology = Department.objects.create(name='Neurology')
+        cls.doctor = Doctor.objects.create(full_name='Dr. Heart', department=cls.cardiology)
+        cls.neuro_doctor = Doctor.objects.create(full_name='Dr. Brain', department=cls.neurology)
+
+        def patient(pid, gender, age, city=''):
+            return Patient.objects.create(
+                patient_id=pid, first_name='Test', last_name=pid, date_of_birth=years_ago(age),
+                gender=gender, email=f'{pid}@example.com', phone='9876543210', city=city,
+            )
+
+        cls.obese_senior = patient('P1', 'F', 65, city='Mumbai')
+        cls.lean_senior = patient('P2', 'M', 70, city=' mumbai ')
+        cls.obese_adult = patient('P3', 'F', 40)
+        for subject, weight in ((cls.obese_senior, 100), (cls.lean_senior, 60), (cls.obese_adult, 110)):
+            PatientHealthRecord.objects.create(
+                patient=subject, doctor=cls.doctor, department=cls.cardiology,
+                weight=Decimal(weight), height=Decimal(170), diagnosis='Hypertension', visit_type='Routine',
+            )
+        PatientHealthRecord.objects.create(
+            patient=cls.obese_adult, doctor=cls.neuro_doctor, department=cls.neurology, visit_type='emergency ',
+        )
+
+    def setUp(self):
+        self.index = CohortIndex()
+        self.index.build()
+
+    def ids(self, **kwargs):
+        return set(iter_ids(self.index.query(**kwargs)))
+
+    def test_and_or_not_combinations(self):
+        chained = {'department': ['Cardiology'], 'bmi': ['Obese (≥30)'], 'age_group': ['61-75']}
+        self.assertEqual(self.ids(include=chained), {self.obese_senior.pk})
+        self.assertEqual(
+            self.ids(include={'age_group': ['61-75', '31-45']}),
+            {self.obese_senior.pk, self.lean_senior.pk, self.obese_adult.pk},
+        )
+        self.assertEqual(
+            self.ids(include={'department': ['Cardiology']}, exclude={'department': ['Neurology']}),
+            {self.obese_senior.pk, self.lean_senior.pk},
+        )
+        self.assertEqual(self.ids(include={'city': ['MUMBAI']}), {self.obese_senior.pk, self.lean_senior.pk})
+        self.assertEqual(self.ids(include={'visit_type': ['Emergency']}), {self.obese_adult.pk})
+
+    def test_incremental_refresh_after_writes(self):
+        PatientHealthRecord.objects.create(patient=self.lean_senior, doctor=self.neuro_doctor, department=self.neurology)
+        self.index.refresh_patient(self.lean_senior.pk)
+        self.assertEqual(self.ids(include={'department': ['Neurology']}), {self.lean_senior.pk, self.obese_adult.pk})
+
+        self.index.remove_patient(self.obese_adult.pk)
+        self.assertEqual(self.ids(include={'department': ['Neurology']}), {self.lean_senior.pk})
+
+    def test_iter_ids_orders_both_ways(self):
+        bitmap = to_bitmap([3, 9, 64, 1000])
+        self.assertEqual(list(iter_ids(bitmap)), [3, 9, 64, 1000])
+        self.assertEqual(list(iter_ids(bitmap, reverse=True)), [1000, 64, 9, 3])
+
+    def test_patient_list_drill_down_is_paginated(self):
+        admin = User.objects.create_user(
+            username='adminuser', email='admin@example.com', password='AdminPass123', role=User.Roles.ADMIN,
+        )
+        self.client.force_login(admin)
+        cohort_index.invalidate()
+        response = self.client.get(reverse('patient_list'), {
+            'filter': ['department:Cardiology', 'gender:Female'],
+            'exclude': 'age_group:31-45',
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([p.pk for p in response.context['patients']], [self.obese_senior.pk])
+
+        response = self.client.get(reverse('patient_list'), {'filter_type': 'gender', 'filter_value': 'Male'})
+        self.assertEqual([p.pk for p in response.context['patients']], [self.lean_senior.pk])
@@ -0,0 +1,138 @@
+from datetime import date
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from core.dedup import block_keys, find_duplicates, jaro_winkler, possible_duplicates, prepare, score, soundex
+from core.models import Patient, PatientBlockKey
+
+User = get_user_model()
+
+
+def make_patient(patient_id, first, last, dob, phone, email=None, aadhar=None):
+    return Patient.objects.create(
+        patient_id=patient_id,
+        first_name=first,
+        last_name=last,
+        date_of_birth=dob,
+        gender='F',
+        email=email or f'{patient_id.lower()}@example.com',
+        phone=phone,
+        aadhar_number=aadhar,
+    )
+
+
+class SimilarityTests(TestCase):
+    def test_soundex(self):
+        self.assertEqual(soundex('Robert'), 'R163')
+        self.assertEqual(soundex('Rupert'), 'R163')
+        self.assertEqual(soundex('Ashcraft'), 'A261')
+        self.assertEqual(soundex('Tymczak'), 'T522')
+        self.assertEqual(soundex(''), '')
+
+    def test_jaro_winkler(self):
+        self.assertAlmostEqual(jaro_winkler('martha', 'marhta'), 0.961, places=3)
+        self.assertAlmostEqual(jaro_winkler('dixon', 'dicksonx'), 0.813, places=3)
+        self.assertEqual(jaro_winkler('abc', ''), 0.0)
+
+    def test_block_keys_never_store_raw_aadhar(self):
+        row = prepare({'last_name': 'Sharma', 'date_of_birth': '1985-04-02', 'phone': '98765 43210',
+                       'aadhar_number': '123456789012'})
+        keys = block_keys(row)
+        self.assertIn('name:S650:1985', keys)
+        self.assertIn('phone:6543210', keys)
+        self.assertFalse(any('123456789012' in key for key in keys))
+
+    def test_score_tolerates_typos_and_swapped_day_month(self):
+        a = prepare({'first_name': 'Priya', 'last_name': 'Sharma', 'date_of_birth': '1985-04-02', 'phone': '9876543210'})
+        b = prepare({'first_name': 'Priya', 'last_name': 'Sharmaa', 'date_of_birth': '1985-02-04', 'phone': '9876543210'})
+        c = prepare({'first_name': 'Rahul', 'last_name': 'Verma', 'date_of_birth': '1990-01-01', 'phone': '9000000000'})
+        self.assertGreater(score(a, b), 0.8)
+        self.assertLess(score(a, c), 0.3)
+
+
+class DuplicateDetectionTests(TestCase):
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.priya = make_patient('PAT1', 'Priya', 'Sharma', date(1985, 4, 2), '9876543210')
+            self.copy = make_patient('PAT2', 'Priya', 'Sharmaa', date(1985, 4, 2), '9876543210', email='p@x.com')
+            self.other = make_patient('PAT3', 'Rahul', 'Verma', date(1990, 1, 1), '9000000000')
+
+    def test_keys_are_maintained_on_save(self):
+        self.assertTrue(PatientBlockKey.objects.filter(patient=self.priya, key='phone:6543210').exists())
+        with self.captureOnCommitCallbacks(execute=True):
+            self.other.phone = '9111111111'
+            self.other.save()
+        self.assertEqual(
+            set(self.other.block_keys.values_list('key', flat=True)),
+            {'name:V650:1990', 'phone:1111111'},
+        )
+
+    def test_possible_duplicates_for_new_signup(self):
+        matches = possible_duplicates({
+            'first_name': 'Pria', 'last_name': 'Sharma', 'date_of_birth': '1985-04-02', 'phone': '1234567890',
+        })
+        self.assertEqual([row['patient_id'] for _, row in matches], ['PAT1', 'PAT2'])
+        self.assertEqual(possible_duplicates({'first_name': 'Priya', 'last_name': 'Sharma'}), [])
+
+    def test_oversized_blocks_are_skipped_not_sliced(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            make_patient('PAT4', 'Asha', 'Sharma', date(1985, 1, 1), '9222222222')
+        data = {'first_name': 'Asha', 'last_name': 'Sharma', 'date_of_birth': '1985-01-01', 'phone': '9222222222'}
+        with mock.patch('core.dedup.MAX_BLOCK', 2):
+            # The three Sharmas born in 1985 are left out; the phone still finds her.
+            self.assertEqual([row['patient_id'] for _, row in possible_duplicates(data)], ['PAT4'])
+            data['phone'] = '9333333333'
+            self.assertEqual(possible_duplicates(data), [])
+
+    def test_find_duplicates_only_compares_blocked_pairs(self):
+        found, compared = find_duplicates(threshold=0.8)
+        self.assertEqual(compared, 1)
+        self.assertEqual([(a, b) for _, a, b in found], [(self.priya.pk, self.copy.pk)])
+
+    def test_duplicate_check_endpoint_hides_matches_from_anonymous_users(self):
+        url = reverse('patient_duplicate_check')
+        params = {'first_name': 'Priya', 'last_name': 'Sharma', 'date_of_birth': '1985-04-02', 'phone': '9876543210'}
+        response = self.client.get(url, params)
+        self.assertEqual(response.json(), {'possible_duplicate': True})
+
+        # Anonymous callers cannot probe with an Aadhar number or a near-miss identity.
+        Patient.objects.filter(pk=self.other.pk).update(aadhar_number='123456789012')
+        probes = [
+            {**params, 'phone': '9000000001', 'aadhar_number': '1234 5678 9012'},
+            {**params, 'last_name': 'Sharm'},
+            {**params, 'date_of_birth': '1985-02-04'},
+        ]
+        for probe in probes:
+            with self.subTest(probe=probe):
+                self.assertEqual(self.client.get(url, probe).json(), {'possible_duplicate': False})
+
+        admin = User.objects.create_user('admin', 'admin@example.com', 'x', role=User.Roles.ADMIN)
+        self.client.force_login(admin)
+        response = self.client.get(url, {**params, 'exclude': self.priya.pk})
+        self.assertEqual([match['patient_id'] for match in response.json()['matches']], ['PAT2'])
+
+    @override_settings(DUPLICATE_CHECK_LIMIT=2)
+    def test_duplicate_check_endpoint_throttles_anonymous_users(self):
+        cache.clear()
+        url = reverse('patient_duplicate_check')
+        params = {'first_name': 'Priya', 'last_name': 'Sharma', 'date_of_birth': '1985-04-02', 'phone': '9876543210'}
+        for _ in range(2):
+            self.assertTrue(self.client.get(url, params, REMOTE_ADDR='203.0.113.7').json()['possible_duplicate'])
+        self.assertEqual(self.client.get(url, params, REMOTE_ADDR='203.0.113.7').status_code, 429)
+        self.assertEqual(self.client.get(url, params, REMOTE_ADDR='203.0.113.8').status_code, 200)
+        # A forwarded-for header only counts when a trusted proxy sent it.
+        self.assertEqual(
+            self.client.get(url, params, REMOTE_ADDR='203.0.113.7', HTTP_X_FORWARDED_FOR='198.51.100.1').status_code,
+            429,
+        )
+        with override_settings(TRUSTED_PROXIES=['10.0.0.0/8']):
+            for _ in range(2):
+                response = self.client.get(url, params, REMOTE_ADDR='10.0.0.2', HTTP_X_FORWARDED_FOR='1.2.3.4, 203.0.113.9')
+                self.assertEqual(response.status_code, 200)
+            response = self.client.get(url, params, REMOTE_ADDR='10.0.0.3', HTTP_X_FORWARDED_FOR='203.0.113.9')
+            self.assertEqual(response.status_code, 429)
+        cache.clear()
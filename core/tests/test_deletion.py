@@ -0,0 +1,166 @@
+from datetime import date, timedelta
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from core.archive import archive_batch
+from core.deletion import request_patient_deletion
+from core.views import PatientForm
+from core.models import (
+    ArchivedHealthRecord,
+    ArchiveRollup,
+    AuditLog,
+    Department,
+    Doctor,
+    Patient,
+    PatientHealthRecord,
+    VitalsFlag,
+)
+
+
+User = get_user_model()
+
+
+@override_settings(DELETE_CHUNK_SIZE=2)
+class PatientDeletionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.department = Department.objects.create(name='Cardiology')
+        cls.doctor = Doctor.objects.create(full_name='Dr. Heart', department=cls.department)
+        cls.admin = User.objects.create_user(
+            username='adminuser', email='admin@example.com', password='AdminPass123', role=User.Roles.ADMIN,
+        )
+
+    def make_patient(self, number, records=5, user=None):
+        now = timezone.now()
+        with self.captureOnCommitCallbacks(execute=True):
+            patient = Patient.objects.create(
+                patient_id=f'PAT{number:05d}', first_name='Test', last_name=f'Patient{number}',
+                date_of_birth=date(1980, 1, 1), gender='F', email=f'p{number}@example.com',
+                phone='9876543210', user=user,
+            )
+            for days in range(records):
+                PatientHealthRecord.objects.create(
+                    patient=patient, doctor=self.doctor, department=self.department,
+                    record_date=now - timedelta(days=400 * days), systolic_bp=190, diastolic_bp=125,
+                )
+        return patient
+
+    def purge(self, *args):
+        out = StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('purge_deleted', '--older-than-days', '0', *args, stdout=out)
+        return out.getvalue()
+
+    def test_delete_view_soft_deletes_and_purge_removes_everything(self):
+        patient = self.make_patient(1)
+        with self.captureOnCommitCallbacks(execute=True):
+            archive_batch(timezone.now() - timedelta(days=730))
+        self.assertEqual(ArchivedHealthRecord.objects.count(), 3)
+        flags = VitalsFlag.objects.filter(patient=patient).count()
+        self.assertGreater(flags, 0)
+
+        self.client.force_login(self.admin)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('patient_delete', args=[patient.pk]))
+        self.assertRedirects(response, reverse('patient_list'))
+        self.assertFalse(Patient.objects.filter(pk=patient.pk).exists())
+        self.assertTrue(Patient.all_objects.get(pk=patient.pk).is_deleted)
+        self.assertEqual(PatientHealthRecord.objects.filter(patient_id=patient.pk).count(), 2)
+        self.assertEqual(self.client.get(reverse('patient_detail', args=[patient.pk])).status_code, 404)
+
+        # Still within the retention window.
+        call_command('purge_deleted', stdout=StringIO())
+        self.assertTrue(Patient.all_objects.filter(pk=patient.pk).exists())
+
+        self.purge()
+        self.assertFalse(Patient.all_objects.filter(pk=patient.pk).exists())
+        self.assertFalse(ArchiveRollup.objects.exists())
+        audit = AuditLog.objects.get(action='delete_patient')
+        self.assertEqual(audit.actor, self.admin)
+        self.assertEqual(audit.details['state'], 'completed')
+        self.assertEqual(audit.details['deleted'], {
+            'core.VitalsFlag': flags,
+            'core.PatientHealthRecord': 2,
+            'core.ArchivedHealthRecord': 3,
+            'core.Patient': 1,
+        })
+
+    def test_identifiers_of_deleted_patients_are_not_reused(self):
+        patient = self.make_patient(1, records=0)
+        Patient.objects.filter(pk=patient.pk).update(aadhar_number='123456789012')
+        patient.soft_delete()
+        data = {
+            'patient_id': 'PAT00002', 'first_name': 'Test', 'last_name': 'Patient1', 'date_of_birth': '1980-01-01',
+            'gender': 'F', 'email': 'p1@example.com', 'phone_country_code': '+91', 'phone': '9876543210',
+            'aadhar_number': '123456789012',
+        }
+        form = PatientForm(data)
+        self.assertFalse(form.is_valid())
+        self.assertIn('belongs to a deleted patient', form.errors['aadhar_number'][0])
+        form = PatientForm({**data, 'patient_id': 'PAT00001', 'aadhar_number': ''})
+        self.assertFalse(form.is_valid())
+        self.assertIn('belongs to a deleted patient', form.errors['patient_id'][0])
+        # Editing the deleted patient itself is not a clash.
+        self.assertTrue(PatientForm({**data, 'patient_id': 'PAT00001'}, instance=patient).is_valid())
+
+    def test_self_delete_disables_login_and_purge_removes_account(self):
+        user = User.objects.create_user(
+            username='patientuser', email='p2@example.com', password='PatientPass123', role=User.Roles.PATIENT,
+        )
+        patient = self.make_patient(2, records=1, user=user)
+
+        self.client.force_login(user)
+        response = self.client.post(reverse('patient_self_delete'))
+        self.assertContains(response, 'retained by the hospital')
+        user.refresh_from_db()
+        self.assertFalse(user.is_active)
+        self.assertTrue(PatientHealthRecord.objects.filter(patient_id=patient.pk).exists())
+
+        self.purge()
+        self.assertFalse(User.objects.filter(pk=user.pk).exists())
+        self.assertFalse(PatientHealthRecord.objects.filter(patient_id=patient.pk).exists())
+
+    def test_doctor_and_department_are_purged_once_unreferenced(self):
+        patient = self.make_patient(3, records=1)
+        department = Department.objects.create(name='Neurology')
+        doctor = Doctor.objects.create(full_name='Dr. Brain', department=department)
+        PatientHealthRecord.objects.create(patient=patient, doctor=doctor, department=department)
+
+        self.client.force_login(self.admin)
+        self.client.post(reverse('department_delete', args=[department.pk]))
+        self.assertTrue(Department.objects.filter(pk=department.pk).exists())  # still has a doctor
+
+        self.client.post(reverse('doctor_delete', args=[doctor.pk]))
+        self.client.post(reverse('department_delete', args=[department.pk]))
+        self.assertFalse(Doctor.objects.filter(pk=doctor.pk).exists())
+        self.assertFalse(Department.objects.filter(pk=department.pk).exists())
+        # The name can be reused by a live department.
+        Department.objects.create(name='Neurology')
+
+        self.assertIn('kept because records still refer to them', self.purge())
+        self.assertTrue(Doctor.all_objects.filter(pk=doctor.pk).exists())
+        self.assertEqual(PatientHealthRecord.objects.get(doctor_id=doctor.pk).doctor.full_name, 'Dr. Brain')
+
+        request_patient_deletion([patient])
+        self.purge()
+        self.assertFalse(Doctor.all_objects.filter(pk=doctor.pk).exists())
+        self.assertFalse(Department.all_objects.filter(pk=department.pk).exists())
+
+    def test_admin_bulk_delete_and_restore(self):
+        patients = [self.make_patient(number, records=1) for number in (4, 5, 6)]
+        superuser = User.objects.create_superuser('root', 'root@example.com', 'RootPass123')
+        self.client.force_login(superuser)
+        changelist = reverse('admin:core_patient_changelist')
+        selected = [patient.pk for patient in patients]
+        response = self.client.post(changelist, {'action': 'soft_delete_selected', '_selected_action': selected})
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(Patient.objects.exists())
+        self.assertEqual(AuditLog.objects.filter(action='delete_patient', details__state='pending').count(), 3)
+
+        self.client.post(changelist, {'action': 'restore_selected', '_selected_action': selected[:1]})
+        self.assertEqual(list(Patient.objects.values_list('pk', flat=True)), selected[:1])
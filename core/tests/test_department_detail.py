@@ -0,0 +1,97 @@
+from datetime import date
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.urls import reverse
+
+from core.models import Department, Doctor, Patient, PatientHealthRecord
+from core.stats import department_stats
+from core.views import department_patient_queryset, department_record_queryset
+
+
+User = get_user_model()
+
+
+def explain(queryset):
+    """Return the SQLite query plan lines for a queryset."""
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+class DepartmentDetailTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.department = Department.objects.create(name='Cardiology')
+        cls.other_department = Department.objects.create(name='Neurology')
+        cls.doctor = Doctor.objects.create(full_name='Dr. Heart', department=cls.department)
+        cls.other_doctor = Doctor.objects.create(full_name='Dr. Brain', department=cls.other_department)
+        cls.patients = [
+            Patient.objects.create(
+                patient_id=f'PAT{i:05d}',
+                first_name='Test',
+                last_name=f'Patient{i}',
+                date_of_birth=date(1980, 1, 1),
+                gender='F',
+                email=f'patient{i}@example.com',
+                phone='9876543210',
+            )
+            for i in range(30)
+        ]
+        for patient in cls.patients:
+            PatientHealthRecord.objects.create(patient=patient, doctor=cls.doctor, department=cls.department)
+            PatientHealthRecord.objects.create(patient=patient, doctor=cls.doctor, department=cls.department)
+        PatientHealthRecord.objects.create(
+            patient=cls.patients[0], doctor=cls.other_doctor, department=cls.other_department,
+        )
+        cls.admin = User.objects.create_user(
+            username='adminuser', email='admin@example.com', password='AdminPass123', role=User.Roles.ADMIN,
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_patient_section_is_paginated_and_distinct(self):
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse('department_detail', args=[self.department.pk]))
+        self.assertEqual(response.status_code, 200)
+        page = response.context['patients']
+        self.assertEqual(page.paginator.count, 30)
+        self.assertEqual(len(page.object_list), 25)
+
+        response = self.client.get(reverse('department_detail', args=[self.department.pk]), {'patients_page': 2})
+        self.assertEqual(len(response.context['patients'].object_list), 5)
+
+    def test_stats_are_cached_and_invalidated_on_write(self):
+        stats = department_stats(self.department.pk)
+        self.assertEqual(stats['patient_count'], 30)
+        self.assertEqual(stats['record_count'], 60)
+
+        with self.assertNumQueries(0):
+            department_stats(self.department.pk)
+
+        PatientHealthRecord.objects.create(
+            patient=self.patients[1], doctor=self.doctor, department=self.department,
+        )
+        self.assertEqual(department_stats(self.department.pk)['record_count'], 61)
+
+    def test_each_branch_uses_an_index(self):
+        branches = {
+            'staff patients': department_patient_queryset(self.department),
+            'doctor patients': department_patient_queryset(self.department, doctor=self.doctor),
+            'staff records': department_record_queryset(self.department),
+            'doctor records': department_record_queryset(self.department, doctor=self.doctor),
+            'patient records': department_record_queryset(self.department, patient=self.patients[0]),
+        }
+        for name, queryset in branches.items():
+            with self.subTest(branch=name):
+                plan = explain(queryset[:25])
+                for line in plan:
+                    self.assertFalse(
+                        line.startswith('SCAN') and 'INDEX' not in line,
+                        f'{name} falls back to a table scan: {plan}',
+                    )
+                self.assertTrue(any('INDEX' in line for line in plan), plan)
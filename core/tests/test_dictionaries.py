@@ -0,0 +1,68 @@
+from datetime import date
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from core.dictionaries import diagnoses
+from core.models import City, Department, Diagnosis, Doctor, Patient, PatientHealthRecord, VisitType
+
+
+class DictionaryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.department = Department.objects.create(name='Cardiology')
+        cls.doctor = Doctor.objects.create(full_name='Dr. Heart', department=cls.department)
+        cls.patient = Patient.objects.create(
+            patient_id='P1', first_name='Test', last_name='Patient', date_of_birth=date(1980, 1, 1),
+            gender='F', email='p1@example.com', phone='9876543210',
+        )
+
+    def record(self, **kwargs):
+        return PatientHealthRecord.objects.create(
+            patient=self.patient, doctor=self.doctor, department=self.department, **kwargs,
+        )
+
+    def test_equivalent_values_share_one_key(self):
+        first = self.record(diagnosis='Type 2  Diabetes', visit_type='Follow-up')
+        second = self.record(diagnosis=' type 2 diabetes', visit_type='FOLLOW-UP ')
+        blank = self.record()
+
+        self.assertEqual(first.diagnosis_ref_id, second.diagnosis_ref_id)
+        self.assertEqual(first.visit_type_ref_id, second.visit_type_ref_id)
+        self.assertEqual(Diagnosis.objects.get().name, 'Type 2 Diabetes')
+        self.assertIsNone(blank.diagnosis_ref_id)
+        self.assertIsNone(blank.visit_type_ref_id)
+
+    def test_resolved_keys_are_cached_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            pk = diagnoses.resolve('Migraine')
+        with self.assertNumQueries(0):
+            self.assertEqual(diagnoses.resolve('  MIGRAINE'), pk)
+
+    def test_backfill_command_resolves_legacy_rows(self):
+        record = self.record(diagnosis='Asthma', visit_type='Routine')
+        PatientHealthRecord.objects.filter(pk=record.pk).update(diagnosis_ref=None, visit_type_ref=None)
+
+        call_command('backfill_dictionaries', batch_size=1, stdout=StringIO())
+
+        record.refresh_from_db()
+        self.assertEqual(record.diagnosis_ref.name, 'Asthma')
+        self.assertEqual(record.visit_type_ref, VisitType.objects.get(normalized_name='routine'))
+
+    def test_patient_city_is_resolved_to_a_shared_key(self):
+        other = Patient.objects.create(
+            patient_id='P2', first_name='Other', last_name='Patient', date_of_birth=date(1990, 1, 1),
+            gender='M', email='p2@example.com', phone='9876543210', city='  new   delhi ',
+        )
+        self.patient.city = 'New Delhi'
+        self.patient.save()
+
+        self.assertEqual(other.city, 'new delhi')
+        self.assertEqual(other.city_ref_id, self.patient.city_ref_id)
+        self.assertEqual(City.objects.count(), 1)
+
+        Patient.objects.filter(pk=other.pk).update(city_ref=None)
+        call_command('backfill_dictionaries', stdout=StringIO())
+        other.refresh_from_db()
+        self.assertEqual(other.city_ref_id, self.patient.city_ref_id)
@@ -0,0 +1,96 @@
+import gzip
+import hashlib
+import json
+import tempfile
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from core.exports import export_dir, run_export
+from core.fhir import OBSERVATION_FIELDS, observation_resources
+from core.jobs import run_pending
+from core.models import Department, Doctor, Patient, PatientHealthRecord
+
+
+User = get_user_model()
+
+
+class FhirExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.department = Department.objects.create(name='Cardiology')
+        cls.doctor = Doctor.objects.create(full_name='Dr. Heart', department=cls.department)
+        cls.patient = Patient.objects.create(
+            patient_id='P1', first_name='Asha', last_name='Rao', date_of_birth=date(1970, 1, 1),
+            gender='F', email='p1@example.com', phone='9876543210', city='Pune',
+        )
+        cls.record = PatientHealthRecord.objects.create(
+            patient=cls.patient, doctor=cls.doctor, department=cls.department,
+            systolic_bp=120, diastolic_bp=80, heart_rate=72, temperature=Decimal('36.80'),
+        )
+        cls.admin = User.objects.create_user('admin', 'admin@example.com', 'x', role=User.Roles.ADMIN)
+
+    def setUp(self):
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        self.settings_override = override_settings(EXPORT_ROOT=root.name, FHIR_EXPORT_PROCESSES=1)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+
+    def read(self, export_id, resource_type):
+        with gzip.open(export_dir(export_id) / f'{resource_type}.ndjson.gz', 'rt') as handle:
+            return [json.loads(line) for line in handle]
+
+    def test_observations_per_vital(self):
+        row = PatientHealthRecord.objects.values(*OBSERVATION_FIELDS).get()
+        resources = observation_resources(row)
+        codes = [resource['code']['coding'][0]['code'] for resource in resources]
+        self.assertEqual(codes, ['85354-9', '8867-4', '8310-5'])
+        self.assertEqual(resources[0]['component'][1]['valueQuantity']['value'], 80.0)
+        self.assertEqual(resources[0]['subject'], {'reference': 'Patient/P1'})
+
+    def test_export_writes_gzip_ndjson_with_checksummed_manifest(self):
+        manifest = run_export('abc', ['Patient', 'Observation'], chunk_size=1)
+        counts = {item['type']: item['count'] for item in manifest['output']}
+        self.assertEqual(counts, {'Patient': 1, 'Observation': 3})
+
+        patient = self.read('abc', 'Patient')[0]
+        self.assertEqual(patient['id'], 'P1')
+        self.assertEqual(patient['gender'], 'female')
+        self.assertEqual(patient['address'], [{'city': 'Pune'}])
+
+        for item in manifest['output']:
+            data = (export_dir('abc') / item['url']).read_bytes()
+            self.assertEqual(item['extension']['sha256'], hashlib.sha256(data).hexdigest())
+        self.assertEqual(json.loads((export_dir('abc') / 'manifest.json').read_text()), manifest)
+
+    def test_since_only_exports_newer_rows(self):
+        PatientHealthRecord.objects.filter(pk=self.record.pk).update(created_at=timezone.now() - timedelta(days=10))
+        manifest = run_export('inc', ['Observation'], since=(timezone.now() - timedelta(days=1)).isoformat())
+        self.assertEqual(manifest['output'], [])
+
+    def test_kickoff_status_and_download(self):
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse('fhir_export'), {'_type': 'Patient'})
+        self.assertEqual(response.status_code, 202)
+        status_url = response['Content-Location']
+
+        response = self.client.get(status_url)
+        self.assertEqual(response.status_code, 202)
+
+        run_pending()
+        manifest = self.client.get(status_url).json()
+        self.assertEqual([item['type'] for item in manifest['output']], ['Patient'])
+        download = self.client.get(manifest['output'][0]['url'])
+        self.assertEqual(download.status_code, 200)
+        self.assertEqual(gzip.decompress(b''.join(download.streaming_content)).count(b'\n'), 1)
+
+    def test_rejects_unsupported_types(self):
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse('fhir_export'), {'_type': 'Encounter'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['resourceType'], 'OperationOutcome')
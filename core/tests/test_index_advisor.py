@@ -0,0 +1,85 @@
+import json
+import tempfile
+from datetime import date
+from io import StringIO
+from pathlib import Path
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TransactionTestCase
+
+from core import indexadvisor
+from core.models import Patient
+
+User = get_user_model()
+
+CITY_QUERY = (
+    'SELECT "core_patient"."id" FROM "core_patient" WHERE ("core_patient"."deleted_at" IS NULL'
+    ' AND "core_patient"."city" = \'{city}\') ORDER BY "core_patient"."registration_date" DESC LIMIT 20'
+)
+
+
+# The scratch copy uses SQLite's backup API, which waits for open write
+# transactions to finish, so the data has to be committed.
+class IndexAdvisorTests(TransactionTestCase):
+    def setUp(self):
+        Patient.objects.bulk_create(
+            Patient(
+                patient_id=f'P{number:05d}', first_name='Asha', last_name=f'Rao{number}',
+                date_of_birth=date(1980, 1, 1), gender='F', email=f'p{number}@example.com',
+                phone=f'98{number:08d}',
+                city=f'City{number % 50}',
+            )
+            for number in range(2000)
+        )
+
+    def run_command(self, *args):
+        out = StringIO()
+        call_command('suggest_indexes', *args, stdout=out)
+        return out.getvalue()
+
+    def test_fingerprints_ignore_literals(self):
+        self.assertEqual(
+            indexadvisor.fingerprint(CITY_QUERY.format(city='Pune')),
+            indexadvisor.fingerprint(CITY_QUERY.format(city='Delhi')),
+        )
+        self.assertEqual(
+            indexadvisor.fingerprint('SELECT 1 FROM t WHERE id IN (1, 2,  3)'),
+            'SELECT ? FROM t WHERE id IN (...)',
+        )
+        statements = indexadvisor.group([{'sql': CITY_QUERY.format(city=c), 'time': 0.001} for c in 'ABAB'])
+        self.assertEqual(len(statements), 1)
+        self.assertEqual(statements[0].count, 4)
+        self.assertEqual(len(statements[0].samples), 2)
+
+    def test_filter_columns_resolve_aliases_and_skip_substring_search(self):
+        columns = indexadvisor.filter_columns(
+            'SELECT 1 FROM "core_patient" WHERE "core_patient"."first_name" LIKE \'%rao%\''
+            ' AND EXISTS(SELECT 1 FROM "core_patienthealthrecord" U0 WHERE U0."doctor_id" = 3'
+            ' AND U0."record_date" >= \'2024-01-01\')'
+        )
+        self.assertEqual(columns['core_patienthealthrecord'][:2], (['doctor_id'], ['record_date']))
+        self.assertEqual(columns['core_patient'], ([], [], []))
+
+    def test_suggests_an_index_with_a_migration(self):
+        with tempfile.TemporaryDirectory() as directory:
+            log = Path(directory, 'queries.ndjson')
+            log.write_text(''.join(
+                json.dumps({'sql': CITY_QUERY.format(city=f'City{n % 50}'), 'time': 0.002}) + '\n'
+                for n in range(30)
+            ) + json.dumps({'sql': 'INSERT INTO "core_patient" ("first_name") VALUES (\'x\')', 'time': 0.001}))
+            output = self.run_command('--log', str(log), '--min-speedup', '0', '--repeat', '1')
+
+        self.assertIn('31 statements, 2 fingerprints.', output)
+        self.assertIn('core_patient(city, deleted_at, registration_date DESC)', output)
+        self.assertIn('migrations.AddIndex(', output)
+        self.assertIn("fields=['city', 'deleted_at', '-registration_date']", output)
+        # Maintained by the logged insert but never read from.
+        self.assertRegex(output, r'core_patien_last_na_\w+ on core_patient\(last_name, first_name\): 1 logged writes')
+
+    def test_records_pages_without_keeping_changes(self):
+        User.objects.create_superuser('root', 'root@example.com', 'RootPass123')
+        patients = Patient.objects.count()
+        output = self.run_command('--record', '/patients/', '--repeat', '1')
+        self.assertRegex(output, r'Recorded \d+ queries from 1 pages')
+        self.assertEqual(Patient.objects.count(), patients)
@@ -0,0 +1,114 @@
+import tempfile
+from datetime import date
+from decimal import Decimal
+from io import StringIO
+from pathlib import Path
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from core.ingest import FeedWriter, iter_messages, iter_segments, parse_hl7_message
+from core.models import Department, Doctor, IngestCheckpoint, Patient, PatientHealthRecord
+
+
+HL7_FEED = (
+    'MSH|^~\\&|LAB|HOSP|EHR|HOSP|202401151030||ORU^R01|MSG0001|P|2.5\r'
+    'PID|1||P1^^^HOSP^MR||Rao^Asha\r'
+    'PV1|1|O|Cardiology||||^Heart\r'
+    'OBR|1|||85354-9^BP panel^LN|||202401151015\r'
+    'OBX|1|ST|85354-9^Blood pressure^LN||128/84|mm[Hg]|||||F\r'
+    'OBX|2|NM|8867-4^Heart rate^LN||72|/min|||||F\r'
+    'OBX|3|NM|8310-5^Body temperature^LN||100.4|[degF]|||||F\r'
+    'OBX|4|NM|29463-7^Body weight^LN||150|[lb_av]|||||D\r'
+    'MSH|^~\\&|LAB|HOSP|EHR|HOSP|202401161030||ORU^R01|MSG0002|P|2.5\n'
+    'PID|1||123456789012^^^UIDAI^NI\n'
+    'OBR|1|||||202401161000\n'
+    'OBX|1|NM|8867-4^Heart rate^LN||88|/min|||||F\n'
+    'MSH|^~\\&|LAB|HOSP|EHR|HOSP|202401171030||ORU^R01|MSG0003|P|2.5\n'
+    'PID|1||UNKNOWN^^^HOSP^MR\n'
+    'OBX|1|NM|8867-4^Heart rate^LN||90|/min|||||F\n'
+)
+
+
+class IngestFeedTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.department = Department.objects.create(name='Cardiology')
+        cls.doctor = Doctor.objects.create(full_name='Dr. Heart', department=cls.department)
+        cls.patient = Patient.objects.create(
+            patient_id='P1', first_name='Asha', last_name='Rao', date_of_birth=date(1970, 1, 1),
+            gender='F', email='p1@example.com', phone='9876543210', aadhar_number='123456789012',
+        )
+
+    def write(self, name, content):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = Path(directory.name) / name
+        path.write_text(content, newline='')
+        return path
+
+    def ingest(self, path, *args):
+        out, err = StringIO(), StringIO()
+        call_command('ingest_feed', str(path), *args, stdout=out, stderr=err)
+        return out.getvalue(), err.getvalue()
+
+    def test_segments_are_split_across_read_boundaries(self):
+        with mock.patch('core.ingest.READ_SIZE', 7):
+            messages = list(iter_messages(iter_segments(StringIO(HL7_FEED))))
+        self.assertEqual([len(message) for message in messages], [8, 4, 3])
+
+    def test_obx_vitals_are_mapped_and_converted(self):
+        message = next(iter_messages(iter_segments(StringIO(HL7_FEED))))
+        reading = parse_hl7_message(message)
+        self.assertEqual(reading['patient_id'], 'P1')
+        self.assertEqual(reading['doctor'], 'Heart')
+        self.assertEqual(reading['vitals']['systolic_bp'], 128)
+        self.assertEqual(round(reading['vitals']['temperature'], 1), Decimal('38.0'))
+        self.assertNotIn('weight', reading['vitals'])  # OBX-11 = D (deleted)
+        self.assertEqual(reading['record_date'].isoformat()[:16], '2024-01-15T10:15')
+
+    def test_hl7_feed_creates_records_and_reports_rejects(self):
+        out, err = self.ingest(self.write('feed.hl7', HL7_FEED), '--doctor', 'Dr. Heart')
+        records = PatientHealthRecord.objects.filter(patient=self.patient).order_by('record_date')
+        self.assertEqual([record.heart_rate for record in records], [72, 88])
+        self.assertEqual(records[0].visit_type, 'Outpatient')
+        self.assertIn('MSG0001', records[0].notes)
+        self.assertIn('unknown patient UNKNOWN', err)
+        self.assertIn('records/s', out)
+
+        checkpoint = IngestCheckpoint.objects.get()
+        self.assertEqual((checkpoint.position, checkpoint.created, checkpoint.skipped), (3, 2, 1))
+        self.assertIsNotNone(checkpoint.completed_at)
+
+    def test_csv_feed(self):
+        path = self.write('feed.csv', 'patient_id,record_date,systolic_bp,diastolic_bp,weight,height,doctor\n'
+                                      'P1,2024-02-01T09:00:00,118,76,70,175,Heart\n'
+                                      'P1,2024-02-02T09:00:00,400,76,,,Heart\n')
+        out, err = self.ingest(path)
+        record = PatientHealthRecord.objects.get()
+        self.assertEqual(record.bmi.quantize(Decimal('0.1')), Decimal('22.9'))
+        self.assertIn('line 3', err)
+
+    def test_resumes_after_last_committed_batch(self):
+        path = self.write('feed.hl7', HL7_FEED)
+        original = FeedWriter.write_batch
+        calls = []
+
+        def crash_on_second_batch(writer, batch):
+            calls.append(batch)
+            if len(calls) == 2:
+                raise RuntimeError('worker died')
+            return original(writer, batch)
+
+        with mock.patch.object(FeedWriter, 'write_batch', crash_on_second_batch):
+            with self.assertRaises(RuntimeError):
+                self.ingest(path, '--batch-size', '1', '--doctor', 'Dr. Heart')
+        self.assertEqual(IngestCheckpoint.objects.get().position, 1)
+
+        out, _ = self.ingest(path, '--batch-size', '1', '--doctor', 'Dr. Heart')
+        self.assertIn('Resuming feed.hl7 after 1', out)
+        self.assertEqual(PatientHealthRecord.objects.count(), 2)
+
+        out, _ = self.ingest(path)
+        self.assertIn('already imported', out)
@@ -0,0 +1,131 @@
+import time
+from datetime import timedelta
+
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+
+from core import jobs
+from core.models import Job
+
+calls = []
+
+
+@jobs.task('test_echo')
+def echo(value):
+    calls.append(value)
+    return {'value': value}
+
+
+@jobs.task('test_flaky', max_attempts=2)
+def flaky():
+    raise RuntimeError('boom')
+
+
+class JobQueueTests(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_enqueue_rejects_unknown_task(self):
+        with self.assertRaises(jobs.UnknownTask):
+            jobs.enqueue('does_not_exist')
+
+    def test_claim_orders_by_priority_and_skips_future_jobs(self):
+        low = jobs.enqueue('test_echo', value='low')
+        high = jobs.enqueue('test_echo', priority=5, value='high')
+        jobs.enqueue('test_echo', delay=timedelta(hours=1), value='later')
+
+        claimed = jobs.claim('w1', limit=5)
+        self.assertEqual([job.pk for job in claimed], [high.pk, low.pk])
+        self.assertTrue(all(job.state == Job.States.RUNNING and job.attempts == 1 for job in claimed))
+        # Already-claimed jobs cannot be claimed again.
+        self.assertEqual(jobs.claim('w2', limit=5), [])
+
+    def test_run_pending_records_result(self):
+        job = jobs.enqueue('test_echo', value=3)
+        self.assertEqual(jobs.run_pending(), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.state, Job.States.SUCCEEDED)
+        self.assertEqual(job.result, {'value': 3})
+        self.assertEqual(calls, [3])
+
+    def test_failures_back_off_then_fail(self):
+        job = jobs.enqueue('test_flaky')
+        self.assertEqual(job.max_attempts, 2)
+
+        jobs.run_pending()
+        job.refresh_from_db()
+        self.assertEqual(job.state, Job.States.QUEUED)
+        self.assertGreater(job.run_after, timezone.now())
+        self.assertIn('boom', job.last_error)
+
+        Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+        jobs.run_pending()
+        job.refresh_from_db()
+        self.assertEqual(job.state, Job.States.FAILED)
+        self.assertEqual(job.attempts, 2)
+        self.assertIsNotNone(job.finished_at)
+
+    def test_release_stale_requeues_abandoned_jobs(self):
+        job = jobs.enqueue('test_echo', value=1)
+        jobs.claim('dead-worker')
+        Job.objects.filter(pk=job.pk).update(locked_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(jobs.release_stale(), 1)
+        self.assertEqual(jobs.run_pending(), 1)
+
+    def test_release_stale_fails_jobs_on_their_last_attempt(self):
+        job = jobs.enqueue('test_flaky')
+        jobs.claim('dead-worker')
+        Job.objects.filter(pk=job.pk).update(attempts=2, locked_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(jobs.release_stale(), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.state, Job.States.FAILED)
+        self.assertIn('heartbeating', job.last_error)
+        self.assertEqual(jobs.run_pending(), 0)
+
+    def test_outcome_is_dropped_once_the_job_was_released(self):
+        job = jobs.enqueue('test_echo', value=1)
+        [slow] = jobs.claim('slow-worker')
+        Job.objects.filter(pk=job.pk).update(locked_at=timezone.now() - timedelta(hours=1))
+        jobs.release_stale()
+        [again] = jobs.claim('other-worker')
+        with self.assertLogs('core.jobs', 'WARNING'):
+            self.assertFalse(jobs.complete(slow, {'value': 'late'}))
+            self.assertFalse(jobs.fail(slow, 'late'))
+        job.refresh_from_db()
+        self.assertEqual((job.state, job.locked_by, job.result), (Job.States.RUNNING, 'other-worker', {}))
+        self.assertTrue(jobs.complete(again, {'value': 1}))
+
+
+# The heartbeat thread has its own connection, so the claim has to be committed.
+class HeartbeatTests(TransactionTestCase):
+    def test_running_jobs_are_not_released(self):
+        job = jobs.enqueue('test_echo', value=1)
+        [claimed] = jobs.claim('busy-worker')
+        Job.objects.filter(pk=job.pk).update(locked_at=timezone.now() - timedelta(hours=1))
+        with jobs.heartbeat([claimed], interval=timedelta(milliseconds=20)):
+            time.sleep(0.2)
+        self.assertEqual(jobs.release_stale(), 0)
+        job.refresh_from_db()
+        self.assertEqual((job.state, job.locked_by), (Job.States.RUNNING, 'busy-worker'))
+
+
+@jobs.task('test_batch', batch_size=3)
+def batch(payloads):
+    calls.append(len(payloads))
+    return [ValueError('odd') if payload['n'] % 2 else {'n': payload['n']} for payload in payloads]
+
+
+class BatchedJobTests(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_batched_task_receives_payload_lists_and_fails_items_individually(self):
+        for n in range(5):
+            jobs.enqueue('test_batch', n=n)
+        self.assertEqual(jobs.run_pending(), 5)
+        self.assertEqual(calls, [3, 2])
+        states = dict(Job.objects.values_list('payload__n', 'state'))
+        self.assertEqual(states, {
+            0: Job.States.SUCCEEDED, 1: Job.States.QUEUED, 2: Job.States.SUCCEEDED,
+            3: Job.States.QUEUED, 4: Job.States.SUCCEEDED,
+        })
@@ -0,0 +1,245 @@
+from datetime import date
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+
+from core import live, views
+from core.cohorts import age_band
+from core.dictionaries import cities, diagnoses, visit_types
+from core.models import Department, Doctor, Patient, PatientHealthRecord
+
+User = get_user_model()
+
+
+class PublisherTests(TestCase):
+    def setUp(self):
+        self.publisher = live.Publisher()
+
+    def test_deltas_are_coalesced_per_key(self):
+        subscription = self.publisher.subscribe()
+        self.publisher.publish({('gender', 'Female'): 1, ('totals', 'patients'): 1})
+        self.publisher.publish({('gender', 'Female'): 1, ('gender', 'Male'): -1})
+        self.publisher.publish({('gender', 'Male'): 1})
+
+        sequence, overflowed, deltas = subscription.take()
+        self.assertEqual(str(sequence), self.publisher.last_event_id())
+        self.assertFalse(overflowed)
+        # Increments that cancel out are not sent.
+        self.assertEqual(deltas, {('gender', 'Female'): 2, ('totals', 'patients'): 1})
+        self.assertEqual(subscription.take()[2], {})
+
+    def test_a_client_too_far_behind_is_told_to_resync(self):
+        subscription = self.publisher.subscribe()
+        with mock.patch.object(live, 'MAX_PENDING', 2):
+            for number in range(3):
+                self.publisher.publish({('city', f'City {number}'): 1})
+        _, overflowed, deltas = subscription.take()
+        self.assertTrue(overflowed)
+        self.assertEqual(deltas, {})
+
+    def test_reconnecting_replays_what_was_missed(self):
+        self.publisher.publish({('bmi', 'Normal'): 1})
+        since = self.publisher.last_event_id()
+        self.publisher.publish({('bmi', 'Normal'): 1})
+        self.publisher.publish({('bmi', 'Obese'): 1})
+
+        _, overflowed, deltas = self.publisher.subscribe(since).take()
+        self.assertFalse(overflowed)
+        self.assertEqual(deltas, {('bmi', 'Normal'): 1, ('bmi', 'Obese'): 1})
+        self.assertFalse(self.publisher.subscribe(self.publisher.last_event_id()).take()[1])
+        # Ids are times, so another server process (or a restarted one) resumes them too.
+        other = live.Publisher()
+        with mock.patch.object(live.time, 'time', return_value=int(since) / 1000 + 1):
+            other.publish({('bmi', 'Obese'): 1})
+        self.assertEqual(other.subscribe(since).take()[1:], (False, {('bmi', 'Obese'): 1}))
+        self.assertTrue(self.publisher.subscribe('stale-0').take()[1])
+
+    def test_an_id_from_another_process_replays_nothing_older(self):
+        other = live.Publisher()
+        other.publish({('bmi', 'Obese'): 1})
+        # Rendered by a process that published nothing, after the other one's delta.
+        since = self.publisher.last_event_id()
+        self.assertEqual(other.subscribe(since).take()[1:], (False, {}))
+        other.publish({('bmi', 'Normal'): 1})
+        self.assertEqual(other.subscribe(since).take()[2], {('bmi', 'Normal'): 1})
+
+    def test_resuming_from_before_the_history_resyncs(self):
+        since = self.publisher.last_event_id()
+        with mock.patch.object(live, 'HISTORY', 2):
+            self.publisher._history = live.deque(maxlen=2)
+            for number in range(3):
+                self.publisher.publish({('city', f'City {number}'): 1})
+        self.assertTrue(self.publisher.subscribe(since).take()[1])
+        _, overflowed, deltas = self.publisher.subscribe(str(self.publisher.complete_since)).take()
+        self.assertFalse(overflowed)
+        self.assertEqual(deltas, {('city', 'City 1'): 1, ('city', 'City 2'): 1})
+
+
+class SignalTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.department = Department.objects.create(name='Cardiology')
+        cls.doctor = Doctor.objects.create(full_name='Dr. Heart', department=cls.department)
+
+    def setUp(self):
+        patcher = mock.patch.object(live, 'publisher', live.Publisher())
+        self.publisher = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.subscription = self.publisher.subscribe()
+        # Keys cached on commit are rolled back with the test.
+        for dictionary in (cities, diagnoses, visit_types):
+            self.addCleanup(dictionary.clear)
+
+    def published(self):
+        return self.subscription.take()[2]
+
+    def make_patient(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Patient.objects.create(
+                patient_id='P1', first_name='Asha', last_name='Rao', date_of_birth=date(1980, 1, 1),
+                gender='F', email='p1@example.com', phone='9876543210', city='Pune', blood_type='O+',
+            )
+
+    def test_patients_added_and_removed(self):
+        patient = self.make_patient()
+        added = self.published()
+        self.assertEqual(added[('totals', 'patients')], 1)
+        self.assertEqual(added[('totals', 'new_patients')], 1)
+        self.assertEqual(added[('gender', 'Female')], 1)
+        self.assertEqual(added[('city', 'Pune')], 1)
+        self.assertEqual(added[('blood_type', 'O+')], 1)
+        self.assertEqual(added[('age_group', age_band(patient.age))], 1)
+        self.assertEqual(added[('registration', patient.registration_date.strftime('%Y-%m'))], 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            patient.soft_delete()
+        self.assertEqual(self.published(), {key: -amount for key, amount in added.items()})
+        with self.captureOnCommitCallbacks(execute=True):
+            patient.restore()
+        self.assertEqual(self.published(), added)
+
+        # Other edits are not streamed.
+        with self.captureOnCommitCallbacks(execute=True):
+            patient.save()
+        self.assertEqual(self.published(), {})
+
+    def test_records_count_a_department_once_per_patient(self):
+        patient = self.make_patient()
+        self.published()
+
+        def add_record():
+            with self.captureOnCommitCallbacks(execute=True):
+                PatientHealthRecord.objects.create(
+                    patient=patient, doctor=self.doctor, department=self.department,
+                    diagnosis='Hypertension', visit_type='Follow-up', bmi=23,
+                )
+            return self.published()
+
+        first = add_record()
+        self.assertEqual(first, {
+            ('totals', 'health_records'): 1,
+            ('totals', 'visits'): 1,
+            ('visit_type', 'Follow-up'): 1,
+            ('diagnosis', 'Hypertension'): 1,
+            ('bmi', 'Normal (18.5-24.9)'): 1,
+            ('department', 'Cardiology'): 1,
+        })
+        self.assertNotIn(('department', 'Cardiology'), add_record())
+
+    def test_nothing_is_computed_without_subscribers(self):
+        self.publisher.unsubscribe(self.subscription)
+        with mock.patch.object(live, 'patient_deltas') as patient_deltas:
+            self.make_patient()
+        patient_deltas.assert_not_called()
+        # Nor is the history dropped: a dashboard reconnecting afterwards resumes without a resync.
+        self.assertFalse(self.publisher.subscribe(self.publisher.last_event_id()).take()[1])
+
+
+@mock.patch.multiple(live, MIN_INTERVAL=0, KEEPALIVE=0.01, MAX_STREAM_SECONDS=0.1)
+class StreamTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(
+            username='adminuser', email='admin@example.com', password='AdminPass123', role=User.Roles.ADMIN,
+        )
+        cls.doctor = User.objects.create_user(
+            username='drheart', email='heart@example.com', password='DoctorPass123', role=User.Roles.DOCTOR,
+        )
+
+    def setUp(self):
+        patcher = mock.patch.object(live, 'publisher', live.Publisher())
+        self.publisher = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_dashboard_starts_the_stream_where_its_numbers_end(self):
+        self.publisher.publish({('totals', 'patients'): 1})
+        published = self.publisher.sequence
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse('dashboard'))
+        rendered = int(response.context['chart_data']['live_event_id'])
+        self.assertGreaterEqual(rendered, published)
+        self.assertLessEqual(rendered, int(self.publisher.last_event_id()))
+        self.assertContains(response, 'data-live-total="patients"')
+
+    async def test_only_dashboards_served_by_asgi_stream(self):
+        await self.async_client.aforce_login(self.admin)
+        response = await self.async_client.get(reverse('dashboard'))
+        self.assertEqual(response.context['chart_data']['events_url'], reverse('dashboard_events'))
+
+        await sync_to_async(self.client.force_login)(self.admin)
+        response = await sync_to_async(self.client.get)(reverse('dashboard'))
+        chart_data = response.context['chart_data']
+        self.assertEqual(chart_data['events_url'], '')
+        self.assertEqual(chart_data['poll_ms'], live.POLL_SECONDS * 1000)
+        self.assertEqual(chart_data['snapshot_url'], reverse('dashboard_snapshot'))
+
+    def test_snapshot_has_the_live_numbers(self):
+        Patient.objects.create(
+            patient_id='P1', first_name='Asha', last_name='Rao', date_of_birth=date(1980, 1, 1),
+            gender='F', email='p1@example.com', phone='9876543210', city='Pune',
+        )
+        self.publisher.publish({('totals', 'patients'): 1})
+        published = self.publisher.sequence
+        self.client.force_login(self.admin)
+        snapshot = self.client.get(reverse('dashboard_snapshot')).json()
+        self.assertGreaterEqual(int(snapshot['live_event_id']), published)
+        self.assertEqual(snapshot['totals'], {'patients': 1, 'health_records': 0, 'new_patients': 1, 'visits': 0})
+        self.assertEqual(snapshot['charts']['gender'], {'labels': ['Female'], 'counts': [1]})
+        self.assertEqual(snapshot['charts']['city'], {'labels': ['Pune'], 'counts': [1]})
+        self.assertEqual(set(snapshot['charts']), set(views.LIVE_CHARTS))
+
+        self.client.force_login(self.doctor)
+        self.assertEqual(self.client.get(reverse('dashboard_snapshot')).status_code, 403)
+
+    def test_stream_sends_missed_deltas(self):
+        since = self.publisher.last_event_id()
+        self.publisher.publish({('totals', 'patients'): 1, ('gender', 'Male'): 1})
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse('dashboard_events'), {'since': since})
+
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertEqual(response['Cache-Control'], 'no-cache')
+        body = b''.join(response.streaming_content).decode()
+        self.assertIn(
+            f'id: {self.publisher.sequence}\nevent: delta\n'
+            'data: {"gender": {"Male": 1}, "totals": {"patients": 1}}\n\n',
+            body,
+        )
+        self.assertIn(': keepalive', body)
+        self.assertFalse(self.publisher.has_subscribers())
+
+    async def test_stream_under_asgi_asks_stale_clients_to_resync(self):
+        self.publisher.publish({('totals', 'patients'): 1})
+        await self.async_client.aforce_login(self.admin)
+        response = await self.async_client.get(reverse('dashboard_events'), headers={'Last-Event-ID': 'stale-0'})
+        body = b''.join([chunk async for chunk in response.streaming_content]).decode()
+        self.assertTrue(body.endswith('event: resync\ndata: {}\n\n'))
+        self.assertFalse(self.publisher.has_subscribers())
+
+    def test_only_staff_may_subscribe(self):
+        self.client.force_login(self.doctor)
+        self.assertEqual(self.client.get(reverse('dashboard_events')).status_code, 403)
+        self.assertFalse(self.publisher.has_subscribers())
@@ -0,0 +1,86 @@
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.mail.backends.locmem import EmailBackend
+from django.test import TestCase, override_settings
+
+from core.jobs import enqueue, run_pending
+from core.mailer import OnboardingMailer
+from core.models import Job
+
+User = get_user_model()
+
+
+class CountingBackend(EmailBackend):
+    """locmem backend that counts connections like SMTP would and rejects one address."""
+
+    opened = 0
+    connected = False
+
+    def open(self):
+        if self.connected:
+            return False
+        self.connected = True
+        CountingBackend.opened += 1
+        return True
+
+    def close(self):
+        self.connected = False
+
+    def send_messages(self, messages):
+        if any('bounce@example.com' in message.to for message in messages):
+            raise ConnectionError('mailbox unavailable')
+        return super().send_messages(messages)
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend', ONBOARDING_MAIL_RATE=0)
+class OnboardingMailerTests(TestCase):
+    def setUp(self):
+        CountingBackend.opened = 0
+        self.users = []
+        for name in ('ana', 'bounce', 'cleo'):
+            user = User(username=name, email=f'{name}@example.com')
+            user.set_unusable_password()
+            user.save()
+            self.users.append(user)
+
+    def requests(self):
+        return [{'user_id': user.pk, 'domain': 'hospital.test', 'use_https': True} for user in self.users]
+
+    def test_one_message_per_user_with_reset_link(self):
+        outcomes = OnboardingMailer(connection=EmailBackend()).send(self.requests())
+        self.assertEqual([outcome['sent'] for outcome in outcomes], [True, True, True])
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertIn('https://hospital.test/reset/', mail.outbox[0].body)
+        self.assertEqual(mail.outbox[2].to, ['cleo@example.com'])
+
+    def test_failures_are_tracked_per_message(self):
+        outcomes = OnboardingMailer(connection=CountingBackend()).send(self.requests())
+        self.assertEqual(outcomes[0]['email'], 'ana@example.com')
+        self.assertIsInstance(outcomes[1], ConnectionError)
+        self.assertEqual(outcomes[2]['email'], 'cleo@example.com')
+        self.assertEqual(len(mail.outbox), 2)
+
+    def test_inactive_or_missing_users_are_skipped(self):
+        self.users[0].is_active = False
+        self.users[0].save()
+        requests = self.requests() + [{'user_id': 0, 'domain': 'hospital.test'}]
+        outcomes = OnboardingMailer(connection=EmailBackend()).send(requests)
+        self.assertEqual([outcome['sent'] for outcome in outcomes], [False, True, True, False])
+
+    def test_rate_limit_spaces_out_messages(self):
+        waits = []
+        OnboardingMailer(connection=EmailBackend(), rate=2, sleep=waits.append).send(self.requests())
+        self.assertEqual(len(waits), 2)
+        self.assertTrue(all(0 < wait <= 0.5 for wait in waits))
+
+    @override_settings(EMAIL_BACKEND='core.tests.test_mailer.CountingBackend')
+    def test_queued_resets_share_one_connection(self):
+        for user in self.users:
+            enqueue('send_password_reset', user_id=user.pk, domain='hospital.test')
+        self.assertEqual(run_pending(), 3)
+        self.assertEqual(len(mail.outbox), 2)
+        # One connection for the batch, plus a reconnect after the rejected message.
+        self.assertEqual(CountingBackend.opened, 2)
+        bounced = Job.objects.get(payload__user_id=self.users[1].pk)
+        self.assertEqual(bounced.state, Job.States.QUEUED)
+        self.assertIn('mailbox unavailable', bounced.last_error)
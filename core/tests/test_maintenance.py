@@ -0,0 +1,84 @@
+import tempfile
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+
+from core.admin import estimated_row_count
+from core.maintenance import STALE_RATIO, incremental_vacuum, stale_tables
+from core.models import AuditLog, Department, MaintenanceRun
+
+
+class StaleTablesTests(SimpleTestCase):
+    def test_tables_are_stale_when_their_size_moved(self):
+        def table(rows, estimate):
+            return {'model': '', 'rows': rows, 'table_bytes': 0, 'index_bytes': 0, 'estimate': estimate}
+
+        tables = {
+            'never_analyzed': table(5, None),
+            'empty': table(0, None),
+            'grown': table(1000, int(1000 * (1 - STALE_RATIO)) - 1),
+            'emptied': table(0, 40),
+            'steady': table(1000, 950),
+            'sqlite_sequence': table(12, None),
+        }
+        self.assertEqual(stale_tables(tables), ['never_analyzed', 'grown', 'emptied'])
+
+
+# The online copy waits for open write transactions, so the data has to be committed.
+class MaintenanceTests(TransactionTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = override_settings(BACKUP_DIR=directory.name, BACKUP_STEP_SLEEP=0, MAINTENANCE_STEP_SLEEP=0)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def tearDown(self):
+        # Statistics outlive the flush and would change other tests' query plans.
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TABLE IF EXISTS sqlite_stat1')
+
+    def pragma(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def run_command(self, *args):
+        out = StringIO()
+        call_command('db_maintenance', *args, stdout=out)
+        return out.getvalue()
+
+    def test_runs_analyze_vacuum_and_compare_with_the_last(self):
+        Department.objects.create(name='Cardiology')
+        AuditLog.objects.bulk_create(AuditLog(action='seed', details={'blob': 'x' * 2000}) for _ in range(300))
+        AuditLog.objects.all().delete()
+        self.assertEqual(self.pragma('auto_vacuum'), 2)  # from the connection's init_command
+        free = self.pragma('freelist_count')
+        self.assertGreater(free, 100)
+
+        self.assertEqual(incremental_vacuum(connection, max_pages=3, step=2), 3)
+        output = self.run_command()
+        run = MaintenanceRun.objects.get()
+        self.assertEqual(run.integrity, 'ok')
+        self.assertEqual(run.free_pages, free - 3)
+        self.assertGreater(run.freed_pages, 100)  # ANALYZE may reuse a few of the free pages first
+        self.assertEqual(self.pragma('freelist_count'), 0)
+        self.assertIn('core_department', run.analyzed)
+        self.assertNotIn('core_auditlog', run.analyzed)  # empty and never analyzed
+        self.assertEqual(run.tables['core_department']['model'], 'core.Department')
+        self.assertEqual(run.tables['core_department']['rows'], 1)
+        self.assertEqual(estimated_row_count(Department, 'default'), 1)
+        self.assertIn('Integrity check: ok', output)
+        self.assertIn('Returned', output)
+
+        Department.objects.create(name='Neurology')
+        Department.objects.create(name='Oncology')
+        output = self.run_command('--report-only', '--no-integrity-check')
+        latest = MaintenanceRun.objects.first()
+        self.assertEqual((latest.analyzed, latest.freed_pages, latest.integrity), ([], 0, ''))
+        self.assertRegex(output, r'core\.Department +3 \(\+2\)')
+        self.assertEqual(estimated_row_count(Department, 'default'), 1)  # left alone
+
+        self.assertEqual(len(self.run_command('--history', '5').splitlines()), 2)
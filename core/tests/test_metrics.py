@@ -0,0 +1,93 @@
+import json
+import tempfile
+import threading
+from pathlib import Path
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from core import jobs, metrics
+from core.models import Department
+from core.stats import department_stats
+
+User = get_user_model()
+
+
+@jobs.task('test_metrics_noop')
+def noop():
+    return {}
+
+
+class MetricsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(
+            username='adminuser', email='admin@example.com', password='AdminPass123', role=User.Roles.ADMIN,
+        )
+
+    def setUp(self):
+        metrics.reset()
+        cache.clear()
+
+    def scrape(self, **headers):
+        response = self.client.get('/metrics', **headers)
+        self.assertEqual(response.status_code, 200)
+        return response.content.decode()
+
+    def test_requests_are_timed_by_url_name(self):
+        self.client.force_login(self.admin)
+        self.client.get(reverse('dashboard'))
+        self.client.get(reverse('dashboard'))
+        self.client.get('/no-such-page/')
+        body = self.scrape()
+        self.assertIn('# TYPE http_request_duration_seconds histogram', body)
+        self.assertIn('http_request_duration_seconds_count{view="dashboard"} 2', body)
+        self.assertIn('http_request_duration_seconds_bucket{view="dashboard",le="+Inf"} 2', body)
+        self.assertIn('http_requests_total{method="GET",status="200",view="dashboard"} 2', body)
+        self.assertIn('http_requests_total{method="GET",status="404",view="unmatched"} 1', body)
+        self.assertIn('db_query_duration_seconds_count{view="dashboard"} 2', body)
+        self.assertRegex(body, r'db_queries_total\{view="dashboard"\} [1-9]')
+
+    def test_cache_hits_and_queue_depth(self):
+        department = Department.objects.create(name='Cardiology')
+        department_stats(department.pk)
+        department_stats(department.pk)
+        jobs.enqueue('test_metrics_noop')
+        body = self.scrape()
+        self.assertIn('cache_requests_total{cache="core:department-stats",result="hit"} 1', body)
+        self.assertIn('cache_requests_total{cache="core:department-stats",result="miss"} 1', body)
+        self.assertIn('cache_hit_ratio{cache="core:department-stats"} 0.5', body)
+        self.assertIn('jobs_queue_depth{state="queued",task="test_metrics_noop"} 1', body)
+
+        jobs.run_pending(names=['test_metrics_noop'])
+        body = self.scrape()
+        self.assertNotIn('jobs_queue_depth{state="queued",task="test_metrics_noop"}', body)
+        self.assertIn('jobs_finished_total{outcome="succeeded",task="test_metrics_noop"} 1', body)
+
+    def test_counters_from_finished_threads_are_kept(self):
+        thread = threading.Thread(target=metrics.inc, args=('db_queries_total', 3), kwargs={'view': 'worker'})
+        thread.start()
+        thread.join()
+        metrics.inc('db_queries_total', 2, view='worker')
+        self.assertIn('db_queries_total{view="worker"} 5', metrics.render())
+        self.assertIn('db_queries_total{view="worker"} 5', metrics.render())
+
+    def test_processes_are_aggregated_through_the_shared_directory(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(METRICS_DIR=directory):
+            other = {'counters': [['db_queries_total', [['view', 'worker']], 4]], 'histograms': []}
+            Path(directory, '99999.json').write_text(json.dumps(other))
+            metrics.inc('db_queries_total', 1, view='worker')
+            body = metrics.render()
+        self.assertIn('db_queries_total{view="worker"} 5', body)
+
+    def test_only_internal_callers(self):
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='203.0.113.7').status_code, 403)
+        # Relayed by the load balancer.
+        self.assertEqual(self.client.get('/metrics', HTTP_X_FORWARDED_FOR='203.0.113.7').status_code, 403)
+        with override_settings(METRICS_TOKEN='s3cret', METRICS_ALLOWED_NETWORKS=['10.0.0.0/8']):
+            self.scrape(REMOTE_ADDR='10.1.2.3')
+            self.scrape(REMOTE_ADDR='203.0.113.7', HTTP_AUTHORIZATION='Bearer s3cret')
+            response = self.client.get('/metrics', REMOTE_ADDR='203.0.113.7', HTTP_AUTHORIZATION='Bearer nope')
+            self.assertEqual(response.status_code, 403)
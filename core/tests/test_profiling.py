@@ -0,0 +1,86 @@
+import tempfile
+import threading
+import time
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from core import profiling
+
+User = get_user_model()
+
+
+def busy_loop(seconds):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+class ProfilingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.superadmin = User.objects.create_user(
+            username='root', email='root@example.com', password='RootPass123', role=User.Roles.SUPERADMIN,
+        )
+        cls.admin = User.objects.create_user(
+            username='adminuser', email='admin@example.com', password='AdminPass123', role=User.Roles.ADMIN,
+        )
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        overrides = override_settings(PROFILE_DIR=directory.name, PROFILE_INTERVAL=0.001)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def test_superadmin_profiles_a_request(self):
+        self.client.force_login(self.superadmin)
+        response = self.client.get(reverse('dashboard'), HTTP_X_PROFILE='1')
+        profile_id = response['X-Profile-Id']
+
+        summary, data = profiling.load(profile_id)
+        self.assertEqual(summary['view'], 'dashboard')
+        self.assertEqual(summary['trigger'], 'requested')
+        self.assertEqual(summary['queries'], len(data['queries']))
+        self.assertTrue(any('core_patient' in query['sql'] for query in data['queries']))
+
+        listing = self.client.get(reverse('profile_list'))
+        self.assertContains(listing, reverse('profile_detail', args=[profile_id]))
+        self.assertContains(self.client.get(reverse('profile_detail', args=[profile_id])), 'SQL timeline')
+        folded = self.client.get(reverse('profile_detail', args=[profile_id]), {'format': 'folded'})
+        self.assertEqual(folded['Content-Type'], 'text/plain; charset=utf-8')
+        self.assertEqual(self.client.get(reverse('profile_detail', args=['..secrets'])).status_code, 404)
+
+    async def test_async_views_are_profiled_with_their_queries(self):
+        await self.async_client.aforce_login(self.superadmin)
+        response = await self.async_client.get(reverse('doctors'), headers={'X-Profile': '1'})
+        summary, data = profiling.load(response['X-Profile-Id'])
+        self.assertEqual(summary['view'], 'doctors')
+        self.assertTrue(any('core_doctor' in query['sql'] for query in data['queries']))
+
+    def test_only_superadmins_can_ask_for_profiles(self):
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse('dashboard') + '?_profile=1')
+        self.assertFalse(response.has_header('X-Profile-Id'))
+        self.assertEqual(profiling.list_profiles(), [])
+        self.assertEqual(self.client.get(reverse('profile_list')).status_code, 403)
+
+    @override_settings(PROFILE_SAMPLE_RATE=1, PROFILE_KEEP=3)
+    def test_sampled_profiles_form_a_ring_buffer(self):
+        for _ in range(5):
+            self.client.get(reverse('login'))
+        profiles = profiling.list_profiles()
+        self.assertEqual(len(profiles), 3)
+        self.assertEqual({profile['trigger'] for profile in profiles}, {'sampled'})
+        self.assertEqual(len(list(profiling.profile_dir().glob('*.json'))), 3)
+
+    def test_sampler_collects_collapsed_stacks(self):
+        sampler = profiling.StackSampler(threading.get_ident(), 0.001)
+        sampler.start()
+        busy_loop(0.1)
+        sampler.stop()
+        folded = profiling.folded({'stacks': dict(sampler.stacks)})
+        self.assertIn('busy_loop (core/tests/test_profiling.py:', folded)
+        line = folded.splitlines()[0]
+        self.assertRegex(line, r' \d+$')
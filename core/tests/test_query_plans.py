@@ -0,0 +1,45 @@
+import difflib
+import os
+from pathlib import Path
+
+from django.db import connection
+from django.test import TestCase
+
+from core.queryplans import LARGE_TABLES, QUERYSETS, explain, scanned_tables
+
+SNAPSHOTS = Path(__file__).parent / 'query_plans'
+
+# UPDATE_QUERY_PLANS=1 rewrites the snapshots instead of comparing them.
+UPDATE = os.environ.get('UPDATE_QUERY_PLANS') == '1'
+
+
+class QueryPlanTests(TestCase):
+    def test_no_unexpected_table_scans(self):
+        for name, (factory, allow_scan) in QUERYSETS.items():
+            with self.subTest(name):
+                queryset = factory()
+                scanned = scanned_tables(queryset, explain(queryset)) & LARGE_TABLES
+                self.assertFalse(scanned - allow_scan, f'{name} scans {sorted(scanned - allow_scan)}')
+
+    def test_plans_match_snapshots(self):
+        directory = SNAPSHOTS / connection.vendor
+        for name, (factory, _) in QUERYSETS.items():
+            with self.subTest(name):
+                plan = '\n'.join(explain(factory())) + '\n'
+                path = directory / f'{name}.txt'
+                if UPDATE:
+                    directory.mkdir(parents=True, exist_ok=True)
+                    path.write_text(plan)
+                    continue
+                self.assertTrue(path.exists(), f'No snapshot for {name}; run with UPDATE_QUERY_PLANS=1.')
+                expected = path.read_text()
+                diff = ''.join(difflib.unified_diff(
+                    expected.splitlines(keepends=True), plan.splitlines(keepends=True), 'snapshot', 'current',
+                ))
+                self.assertEqual(plan, expected, f'Plan of {name} changed (UPDATE_QUERY_PLANS=1 to accept):\n{diff}')
+
+    def test_scan_detection(self):
+        queryset = QUERYSETS['patient_search'][0]()
+        self.assertEqual(scanned_tables(queryset, ['SCAN core_patient']), {'core_patient'})
+        self.assertEqual(scanned_tables(queryset, ['SEARCH core_patient USING INDEX x (patient_id=?)']), set())
+        self.assertEqual(scanned_tables(queryset, ['  ->  Seq Scan on core_patient']), {'core_patient'})
@@ -0,0 +1,68 @@
+from datetime import date
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from core.models import Department, Doctor, Patient, PatientHealthRecord
+
+
+User = get_user_model()
+
+
+class RowRenderingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.department = Department.objects.create(name='Cardiology')
+        cls.doctors = [
+            Doctor.objects.create(full_name=f'Dr. {name}', department=cls.department) for name in ('Heart', 'Pulse')
+        ]
+        cls.patient = Patient.objects.create(
+            patient_id='PAT00001', first_name='Asha', last_name='Rao', date_of_birth=date(1970, 1, 1),
+            gender='F', email='asha@example.com', phone='9876543210',
+        )
+        cls.admin = User.objects.create_user(
+            username='adminuser', email='admin@example.com', password='AdminPass123', role=User.Roles.ADMIN,
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.admin)
+
+    def add_records(self, count):
+        for i in range(count):
+            PatientHealthRecord.objects.create(
+                patient=self.patient, doctor=self.doctors[i % 2], department=self.department, heart_rate=70,
+            )
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        return len(queries)
+
+    def test_record_rows_do_not_query_per_row(self):
+        url = reverse('patient_detail', args=[self.patient.pk])
+        self.add_records(1)
+        one = self.count_queries(url)
+        self.add_records(9)
+        self.assertEqual(self.count_queries(url), one)
+
+        url = reverse('department_detail', args=[self.department.pk])
+        few = self.count_queries(url)
+        self.add_records(10)
+        cache.clear()
+        self.assertEqual(self.count_queries(url), few)
+
+    def test_patient_row_fragment_follows_row_version(self):
+        url = reverse('patient_list')
+        self.assertContains(self.client.get(url), 'Asha Rao')
+        # A queryset update does not bump the row version, so the cached row is served...
+        Patient.objects.filter(pk=self.patient.pk).update(first_name='Anita')
+        self.assertContains(self.client.get(url), 'Asha Rao')
+        # ...while a save does.
+        patient = Patient.objects.get(pk=self.patient.pk)
+        patient.save()
+        self.assertContains(self.client.get(url), 'Anita Rao')
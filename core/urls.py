@@ -1,4 +1,5 @@
-from django.urls import path
+from django.contrib.auth import views as auth_views
+from django.urls import path, reverse_lazy
 from . import views
 
 urlpatterns = [
@@ -6,7 +7,17 @@ urlpatterns = [
     path('login/', views.login_view, name='login'),
     path('logout/', views.logout_view, name='logout'),
     path('signup/', views.patient_signup, name='patient_signup'),
+    # Targets of the onboarding / password reset email
+    path('reset/<uidb64>/<token>/', auth_views.PasswordResetConfirmView.as_view(
+        template_name='password_reset_confirm.html',
+        success_url=reverse_lazy('password_reset_complete'),
+    ), name='password_reset_confirm'),
+    path('reset/done/', auth_views.PasswordResetCompleteView.as_view(
+        template_name='password_reset_complete.html',
+    ), name='password_reset_complete'),
     path('dashboard/', views.dashboard, name='dashboard'),
+    path('dashboard/events/', views.dashboard_events, name='dashboard_events'),
+    path('dashboard/snapshot/', views.dashboard_snapshot, name='dashboard_snapshot'),
     path('departments/', views.departments, name='departments'),
     path('departments/create/', views.department_create, name='department_create'),
     path('departments/<int:pk>/delete/', views.department_delete, name='department_delete'),
@@ -15,10 +26,13 @@ urlpatterns = [
     path('doctors/create/', views.doctor_create, name='doctor_create'),
     path('doctors/<int:pk>/delete/', views.doctor_delete, name='doctor_delete'),
     path('core/admin/create-user/', views.create_user_view, name='core_create_user'),
+    path('core/admin/profiles/', views.profile_list, name='profile_list'),
+    path('core/admin/profiles/<str:profile_id>/', views.profile_detail, name='profile_detail'),
     path('doctor/patients/', views.doctor_patients, name='doctor_patients'),
     # Patient Management URLs
     path('patients/', views.patient_list, name='patient_list'),
     path('patients/create/', views.patient_create, name='patient_create'),
+    path('patients/duplicate-check/', views.patient_duplicate_check, name='patient_duplicate_check'),
     path('patients/delete-account/', views.patient_self_delete, name='patient_self_delete'),
     path('patients/<int:pk>/delete/', views.patient_delete, name='patient_delete'),
     path('patients/<int:pk>/edit/', views.patient_update, name='patient_update'),
@@ -27,6 +41,13 @@ urlpatterns = [
     path('health-records/create/', views.health_record_create, name='health_record_create'),
     path('health-records/create/<int:patient_pk>/', views.health_record_create, name='health_record_create_for_patient'),
     path('health-records/<int:pk>/', views.health_record_detail, name='health_record_detail'),
+    path('health-records/flagged/', views.flagged_readings, name='flagged_readings'),
+    # FHIR bulk data export
+    path('fhir/$export', views.fhir_export, name='fhir_export'),
+    path('fhir/export/<slug:export_id>/', views.fhir_export_status, name='fhir_export_status'),
+    path('fhir/export/<slug:export_id>/<str:filename>', views.fhir_export_file, name='fhir_export_file'),
+    # Prometheus scrape target
+    path('metrics', views.metrics_view, name='metrics'),
 ]
 
 
@@ -1,24 +1,54 @@
+import ipaddress
 from collections import defaultdict
 from datetime import timedelta
-import json
 
 from django import forms
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth import authenticate, get_user_model, login, logout
 from django.contrib.auth.decorators import login_required, user_passes_test
-from django.contrib.auth.forms import PasswordResetForm
+from django.core.cache import cache
+from django.core.exceptions import PermissionDenied
+from django.core.paginator import Paginator
 from django.db import transaction
-from django.db.models import Avg, Count, Max, Min, Q
-from django.shortcuts import get_object_or_404, redirect, render
+from django.db.models import Count, Max, Min, Q
+from django.core.handlers.asgi import ASGIRequest
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.shortcuts import aget_object_or_404, get_object_or_404, redirect, render
+from django.urls import reverse
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from django.utils.crypto import get_random_string
 
+from . import archive, live, metrics, profiling
+from .cohorts import AGE_BANDS, ATTRIBUTES, BMI_BANDS, CohortResult, age_band, bmi_band, cohort_index, to_bitmap
 from .decorators import role_required
+from .dedup import possible_duplicates
+from .deletion import request_patient_deletion
+from .dictionaries import cities, diagnoses, display_name, visit_types
+from .exports import RESOURCE_TYPES, delete_export, export_dir, find_job, start_export
 from .forms import CreateUserForm
-from .models import AuditLog, Department, Doctor, Patient, PatientHealthRecord
+from .jobs import enqueue
+from .models import AuditLog, Department, Doctor, Job, Patient, PatientHealthRecord, VitalsFlag
+from .stats import department_stats
 
 User = get_user_model()
 
+DEPARTMENT_PAGE_SIZE = 25
+PATIENT_LIST_PAGE_SIZE = 50
+
+# Columns the list templates read per row.  Loading only these (with the
+# related rows joined in) keeps rendering free of lazy queries, and skips the
+# long free-text columns nobody displays in a table.
+PATIENT_ROW_FIELDS = (
+    'patient_id', 'first_name', 'last_name', 'gender', 'date_of_birth', 'email', 'phone',
+    'city', 'blood_type', 'updated_at',
+)
+RECORD_ROW_FIELDS = (
+    'patient_id', 'record_date', 'diagnosis', 'visit_type', 'systolic_bp', 'diastolic_bp', 'heart_rate', 'bmi',
+    'doctor__full_name', 'department__name',
+)
+
 def generate_patient_id():
     """Generate a unique patient identifier for self-service signups."""
     base = timezone.now().strftime('PAT%Y%m%d')
@@ -133,6 +163,23 @@ class PatientForm(forms.ModelForm):
             'aadhar_number': forms.TextInput(attrs={'class': 'form-control', 'placeholder': '12-digit number'}),
         }
 
+    def clean_city(self):
+        # Canonical spelling is resolved to the City dimension when the patient is saved
+        return display_name(self.cleaned_data.get('city'))
+
+    def validate_unique(self):
+        super().validate_unique()
+        # Soft-deleted patients keep their identifiers until they are purged,
+        # but the default check only looks at live rows.
+        deleted = Patient.all_objects.deleted().exclude(pk=self.instance.pk)
+        for name, label in (('patient_id', 'patient ID'), ('aadhar_number', 'Aadhar number')):
+            value = self.cleaned_data.get(name)
+            if value and deleted.filter(**{name: value}).exists():
+                self.add_error(name, (
+                    f'This {label} belongs to a deleted patient. Restore that patient '
+                    '(or ask reception to) instead of registering them again.'
+                ))
+
 
 class AdminPatientAccountForm(PatientForm):
     username = forms.CharField(
@@ -338,19 +385,70 @@ def get_logged_in_doctor(user):
     if not user.is_authenticated or not getattr(user, 'is_doctor', False):
         return None
     try:
-        return user.doctor_record
+        doctor = user.doctor_record
     except Doctor.DoesNotExist:
         return None
+    return None if doctor.is_deleted else doctor
+
+
+async def aget_logged_in_doctor(user):
+    if not user.is_authenticated or not getattr(user, 'is_doctor', False):
+        return None
+    return await Doctor.all_objects.filter(user=user, deleted_at__isnull=True).afirst()
 
 
 def doctor_patient_queryset(doctor):
-    return Patient.objects.filter(health_records__doctor=doctor).distinct()
+    return Patient.objects.filter(archive.visited(doctor=doctor))
+
+
+def department_patient_queryset(department, doctor=None):
+    """Patients with at least one visit in the department, optionally for one doctor.
+
+    Resolved as a semi-join on the ``(department, patient)`` and
+    ``(department, doctor, record_date)`` indexes instead of a JOIN + DISTINCT,
+    over both current and archived records.
+    """
+    filters = {'department': department}
+    if doctor is not None:
+        filters['doctor'] = doctor
+    return Patient.objects.filter(archive.visited(**filters)).order_by('-pk')
+
+
+def department_record_queryset(department, doctor=None, patient=None):
+    """Department visits newest first, ordered so the composite indexes satisfy the sort."""
+    records = PatientHealthRecord.objects.filter(department=department)
+    if doctor is not None:
+        records = records.filter(doctor=doctor)
+    if patient is not None:
+        records = records.filter(patient=patient)
+    return records.order_by('-record_date', '-pk')
 
 
 def doctor_can_view_patient(doctor, patient):
     if not doctor:
         return False
-    return patient.health_records.filter(doctor=doctor).exists()
+    return (
+        patient.health_records.filter(doctor=doctor).exists()
+        or patient.archived_records.filter(doctor=doctor).exists()
+    )
+
+
+async def adoctor_can_view_patient(doctor, patient):
+    if not doctor:
+        return False
+    return (
+        await patient.health_records.filter(doctor=doctor).aexists()
+        or await patient.archived_records.filter(doctor=doctor).aexists()
+    )
+
+
+async def aget_page(queryset, per_page, number):
+    """``Paginator(queryset, per_page).get_page(number)`` for async views, with the page loaded."""
+    paginator = Paginator(queryset, per_page)
+    paginator.count = await queryset.acount()
+    page = paginator.get_page(number)
+    page.object_list = [obj async for obj in page.object_list]
+    return page
 
 
 @role_required(User.Roles.ADMIN, User.Roles.SUPERADMIN)
@@ -369,12 +467,14 @@ def create_user_view(request):
 
         password_was_provided = form.password_provided
         if not password_was_provided:
-            reset_form = PasswordResetForm({'email': new_user.email})
-            if reset_form.is_valid():
-                reset_form.save(
-                    request=request,
-                    use_https=request.is_secure(),
-                )
+            # Sent by a background worker so SMTP latency stays out of the request
+            enqueue(
+                'send_password_reset',
+                priority=10,
+                user_id=new_user.pk,
+                domain=request.get_host(),
+                use_https=request.is_secure(),
+            )
 
         AuditLog.objects.create(
             actor=request.user,
@@ -392,9 +492,45 @@ def create_user_view(request):
     return render(request, 'admin/create_user.html', {'form': form})
 
 
-@login_required
-@user_passes_test(is_admin, login_url='home')
-def dashboard(request):
+@role_required(User.Roles.SUPERADMIN)
+def profile_list(request):
+    """Request profiles captured by ``core.profiling``, newest first."""
+    return render(request, 'admin/profiles.html', {'profiles': profiling.list_profiles()})
+
+
+@role_required(User.Roles.SUPERADMIN)
+def profile_detail(request, profile_id):
+    profile = profiling.load(profile_id)
+    if profile is None:
+        raise Http404
+    summary, data = profile
+    if request.GET.get('format') == 'folded':
+        response = HttpResponse(profiling.folded(data), content_type='text/plain; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="{profile_id}.folded"'
+        return response
+
+    # Self time per function: the leaf frame of every sample.
+    total = sum(data['stacks'].values()) or 1
+    leaves = defaultdict(int)
+    for stack, count in data['stacks'].items():
+        leaves[stack.rsplit(';', 1)[-1]] += count
+    hot_functions = [
+        {'function': function, 'samples': count, 'percent': round(100 * count / total, 1)}
+        for function, count in sorted(leaves.items(), key=lambda item: -item[1])[:30]
+    ]
+    return render(request, 'admin/profile_detail.html', {
+        'summary': summary,
+        'hot_functions': hot_functions,
+        'queries': data['queries'],
+    })
+
+
+def dashboard_context(streaming=False):
+    """
+    Everything the dashboard shows, with the live event id its numbers go up
+    to; the page streams deltas from there when ``streaming``, and polls the
+    snapshot otherwise (see ``core.live``).
+    """
     def change_metrics(current, previous):
         if previous:
             delta = current - previous
@@ -420,15 +556,14 @@ def dashboard(request):
     total_patients = Patient.objects.count()
     total_doctors = Doctor.objects.count()
     total_departments = Department.objects.count()
-    total_health_records = PatientHealthRecord.objects.count()
+    total_health_records = archive.record_count()
     
     # Gender distribution
     gender_data = Patient.objects.values('gender').annotate(count=Count('id'))
     gender_labels = []
     gender_counts = []
-    gender_map = {'M': 'Male', 'F': 'Female', 'O': 'Other', 'P': 'Prefer not to say'}
     for item in gender_data:
-        gender_labels.append(gender_map.get(item['gender'], item['gender']))
+        gender_labels.append(live.GENDER_LABELS.get(item['gender'], item['gender']))
         gender_counts.append(item['count'])
     
     # Blood type distribution
@@ -437,29 +572,9 @@ def dashboard(request):
     blood_type_counts = [item['count'] for item in blood_type_data]
     
     # Age groups distribution
-    patients = Patient.objects.all()
-    age_groups = {
-        '0-17': 0,
-        '18-30': 0,
-        '31-45': 0,
-        '46-60': 0,
-        '61-75': 0,
-        '75+': 0
-    }
-    for patient in patients:
-        age = patient.age
-        if age <= 17:
-            age_groups['0-17'] += 1
-        elif age <= 30:
-            age_groups['18-30'] += 1
-        elif age <= 45:
-            age_groups['31-45'] += 1
-        elif age <= 60:
-            age_groups['46-60'] += 1
-        elif age <= 75:
-            age_groups['61-75'] += 1
-        else:
-            age_groups['75+'] += 1
+    age_groups = {label: 0 for label, _, _ in AGE_BANDS}
+    for patient in Patient.objects.only('date_of_birth'):
+        age_groups[age_band(patient.age)] += 1
     
     age_group_labels = list(age_groups.keys())
     age_group_counts = list(age_groups.values())
@@ -484,13 +599,14 @@ def dashboard(request):
         registration_date__gte=sixty_days_ago,
     ).count()
 
-    visits_current = PatientHealthRecord.objects.filter(record_date__gte=thirty_days_ago).count()
-    visits_previous = PatientHealthRecord.objects.filter(
+    # Records of soft-deleted patients are left out, as the patients are.
+    visits_current = archive.live_records(record_date__gte=thirty_days_ago).count()
+    visits_previous = archive.live_records(
         record_date__lt=thirty_days_ago,
         record_date__gte=sixty_days_ago,
     ).count()
 
-    patients_seen_current = PatientHealthRecord.objects.filter(
+    patients_seen_current = archive.live_records(
         record_date__gte=thirty_days_ago
     ).values('patient').distinct().count()
     avg_visits_per_patient = round(
@@ -498,17 +614,24 @@ def dashboard(request):
     ) if patients_seen_current else 0
 
     active_departments_current = Department.objects.filter(
-        health_records__record_date__gte=thirty_days_ago
-    ).distinct().count()
+        pk__in=archive.live_records(record_date__gte=thirty_days_ago).values('department_id')
+    ).count()
 
     top_recent_diagnosis = (
-        PatientHealthRecord.objects.filter(record_date__gte=thirty_days_ago)
-        .exclude(diagnosis='')
-        .values('diagnosis')
+        archive.live_records(record_date__gte=thirty_days_ago, diagnosis_ref__isnull=False)
+        .values('diagnosis_ref')
         .annotate(count=Count('id'))
         .order_by('-count')
         .first()
     )
+    if top_recent_diagnosis:
+        top_recent_diagnosis['diagnosis'] = diagnoses.names([top_recent_diagnosis['diagnosis_ref']]).get(
+            top_recent_diagnosis['diagnosis_ref'], ''
+        )
+
+    open_flags = VitalsFlag.objects.filter(
+        acknowledged_at__isnull=True, record_date__gte=thirty_days_ago,
+    ).exclude(patient__in=archive.deleted_patients()).count()
 
     snapshot_cards = [
         {
@@ -517,6 +640,7 @@ def dashboard(request):
             'change': change_metrics(new_patients_current, new_patients_previous),
             'subtext': 'vs previous 30 days',
             'icon': 'bi-people',
+            'live': 'new_patients',
         },
         {
             'title': 'Visits Logged (30d)',
@@ -524,6 +648,7 @@ def dashboard(request):
             'change': change_metrics(visits_current, visits_previous),
             'subtext': 'Health records added',
             'icon': 'bi-clipboard2-pulse',
+            'live': 'visits',
         },
         {
             'title': 'Avg Visits / Patient',
@@ -539,6 +664,14 @@ def dashboard(request):
             'subtext': 'Departments with recent visits',
             'icon': 'bi-hospital',
         },
+        {
+            'title': 'Flagged Readings (30d)',
+            'value': open_flags,
+            'change': None,
+            'subtext': 'Abnormal vitals awaiting review',
+            'icon': 'bi-exclamation-triangle',
+            'url': 'flagged_readings',
+        },
     ]
 
     snapshot_highlight = {
@@ -550,31 +683,27 @@ def dashboard(request):
     # Department-wise patient distribution (based on health records)
     dept_patient_counts = defaultdict(int)
     for dept in Department.objects.all():
-        patient_count = Patient.objects.filter(
-            health_records__department=dept
-        ).distinct().count()
+        patient_count = Patient.objects.filter(archive.visited(department=dept)).count()
         dept_patient_counts[dept.name] = patient_count
     
     dept_labels = list(dept_patient_counts.keys())
     dept_patient_data = list(dept_patient_counts.values())
     
-    # Top diagnoses
-    diagnoses = PatientHealthRecord.objects.exclude(diagnosis='').values('diagnosis').annotate(
-        count=Count('id')
-    ).order_by('-count')[:10]
-    diagnosis_labels = [item['diagnosis'] for item in diagnoses]
-    diagnosis_counts = [item['count'] for item in diagnoses]
+    # Top diagnoses (grouped on the interned integer key, archived rollups included)
+    diagnosis_totals = archive.record_counts_by('diagnosis_ref')
+    diagnosis_totals.pop(None, None)
+    diagnosis_rows = diagnosis_totals.most_common(10)
+    diagnosis_names = diagnoses.names([pk for pk, _ in diagnosis_rows])
+    diagnosis_labels = [diagnosis_names[pk] for pk, _ in diagnosis_rows]
+    diagnosis_counts = [count for _, count in diagnosis_rows]
 
     # Visit type breakdown
-    visit_type_qs = (
-        PatientHealthRecord.objects.values('visit_type')
-        .annotate(count=Count('id'))
-        .order_by('-count')
-    )
-    visit_type_pairs = []
-    for item in visit_type_qs:
-        label = item['visit_type'].strip() if item['visit_type'] else 'Not specified'
-        visit_type_pairs.append((label, item['count']))
+    visit_type_rows = archive.record_counts_by('visit_type_ref').most_common()
+    visit_type_names = visit_types.names([pk for pk, _ in visit_type_rows])
+    visit_type_pairs = [
+        (visit_type_names.get(pk, 'Not specified'), count)
+        for pk, count in visit_type_rows
+    ]
     visit_type_labels = []
     visit_type_counts = []
     if len(visit_type_pairs) > 6:
@@ -586,56 +715,38 @@ def dashboard(request):
         visit_type_labels = [label for label, _ in visit_type_pairs]
         visit_type_counts = [count for _, count in visit_type_pairs]
 
-    # City distribution (top 8)
-    city_counts_map = defaultdict(int)
-    for item in Patient.objects.values('city').annotate(count=Count('id')):
-        city_value = (item['city'] or '').strip()
-        label = city_value if city_value else 'Not specified'
-        city_counts_map[label] += item['count']
-    sorted_cities = sorted(city_counts_map.items(), key=lambda pair: pair[1], reverse=True)
-    top_cities = sorted_cities[:8]
-    city_labels = [label for label, _ in top_cities]
-    city_counts = [count for _, count in top_cities]
+    # City distribution (top 8), grouped on the indexed city key
+    city_rows = list(
+        Patient.objects.values('city_ref')
+        .annotate(count=Count('id'))
+        .order_by('-count')[:8]
+    )
+    city_names = cities.names([item['city_ref'] for item in city_rows])
+    city_labels = [city_names.get(item['city_ref'], 'Not specified') for item in city_rows]
+    city_counts = [item['count'] for item in city_rows]
 
     # Average vital signs by department
     dept_vital_labels = []
     dept_vital_systolic = []
     dept_vital_diastolic = []
     dept_vital_heart_rate = []
-    dept_vitals_qs = (
-        PatientHealthRecord.objects.values('department__name')
-        .annotate(
-            avg_systolic=Avg('systolic_bp'),
-            avg_diastolic=Avg('diastolic_bp'),
-            avg_heart_rate=Avg('heart_rate'),
-        )
-        .order_by('department__name')
-    )
-    for item in dept_vitals_qs:
-        if not any([item['avg_systolic'], item['avg_diastolic'], item['avg_heart_rate']]):
+    dept_vitals = archive.vitals_averages_by_department()
+    for dept_id, dept_name in Department.objects.order_by('name').values_list('pk', 'name'):
+        item = dept_vitals.get(dept_id)
+        if not item or not any(item.values()):
             continue
-        dept_vital_labels.append(item['department__name'])
-        dept_vital_systolic.append(round(item['avg_systolic'], 1) if item['avg_systolic'] is not None else None)
-        dept_vital_diastolic.append(round(item['avg_diastolic'], 1) if item['avg_diastolic'] is not None else None)
-        dept_vital_heart_rate.append(round(item['avg_heart_rate'], 1) if item['avg_heart_rate'] is not None else None)
+        dept_vital_labels.append(dept_name)
+        dept_vital_systolic.append(round(item['systolic'], 1) if item['systolic'] is not None else None)
+        dept_vital_diastolic.append(round(item['diastolic'], 1) if item['diastolic'] is not None else None)
+        dept_vital_heart_rate.append(round(item['heart_rate'], 1) if item['heart_rate'] is not None else None)
     
     # BMI distribution
-    bmi_records = PatientHealthRecord.objects.exclude(bmi__isnull=True).values_list('bmi', flat=True)
-    bmi_categories = {
-        'Underweight (<18.5)': 0,
-        'Normal (18.5-24.9)': 0,
-        'Overweight (25-29.9)': 0,
-        'Obese (≥30)': 0
-    }
+    bmi_records = archive.live_records().exclude(bmi__isnull=True).values_list('bmi', flat=True)
+    bmi_categories = {label: 0 for label, _, _ in BMI_BANDS}
     for bmi in bmi_records:
-        if bmi < 18.5:
-            bmi_categories['Underweight (<18.5)'] += 1
-        elif bmi < 25:
-            bmi_categories['Normal (18.5-24.9)'] += 1
-        elif bmi < 30:
-            bmi_categories['Overweight (25-29.9)'] += 1
-        else:
-            bmi_categories['Obese (≥30)'] += 1
+        bmi_categories[bmi_band(bmi)] += 1
+    for band, count in archive.archived_bmi_bands().items():
+        bmi_categories[band] += count
     
     bmi_labels = list(bmi_categories.keys())
     bmi_counts = list(bmi_categories.values())
@@ -645,28 +756,36 @@ def dashboard(request):
         'total_doctors': total_doctors,
         'total_departments': total_departments,
         'total_health_records': total_health_records,
-        'gender_labels': json.dumps(gender_labels),
-        'gender_counts': json.dumps(gender_counts),
-        'blood_type_labels': json.dumps(blood_type_labels),
-        'blood_type_counts': json.dumps(blood_type_counts),
-        'age_group_labels': json.dumps(age_group_labels),
-        'age_group_counts': json.dumps(age_group_counts),
-        'registration_months': json.dumps(registration_months),
-        'registration_counts': json.dumps(registration_counts),
-        'dept_labels': json.dumps(dept_labels),
-        'dept_patient_data': json.dumps(dept_patient_data),
-        'diagnosis_labels': json.dumps(diagnosis_labels),
-        'diagnosis_counts': json.dumps(diagnosis_counts),
-        'bmi_labels': json.dumps(bmi_labels),
-        'bmi_counts': json.dumps(bmi_counts),
-        'visit_type_labels': json.dumps(visit_type_labels),
-        'visit_type_counts': json.dumps(visit_type_counts),
-        'city_labels': json.dumps(city_labels),
-        'city_counts': json.dumps(city_counts),
-        'dept_vital_labels': json.dumps(dept_vital_labels),
-        'dept_vital_systolic': json.dumps(dept_vital_systolic),
-        'dept_vital_diastolic': json.dumps(dept_vital_diastolic),
-        'dept_vital_heart_rate': json.dumps(dept_vital_heart_rate),
+        'chart_data': {
+            'gender_labels': gender_labels,
+            'gender_counts': gender_counts,
+            'blood_type_labels': blood_type_labels,
+            'blood_type_counts': blood_type_counts,
+            'age_group_labels': age_group_labels,
+            'age_group_counts': age_group_counts,
+            'registration_months': registration_months,
+            'registration_counts': registration_counts,
+            'dept_labels': dept_labels,
+            'dept_patient_data': dept_patient_data,
+            'diagnosis_labels': diagnosis_labels,
+            'diagnosis_counts': diagnosis_counts,
+            'bmi_labels': bmi_labels,
+            'bmi_counts': bmi_counts,
+            'visit_type_labels': visit_type_labels,
+            'visit_type_counts': visit_type_counts,
+            'city_labels': city_labels,
+            'city_counts': city_counts,
+            'dept_vital_labels': dept_vital_labels,
+            'dept_vital_systolic': dept_vital_systolic,
+            'dept_vital_diastolic': dept_vital_diastolic,
+            'dept_vital_heart_rate': dept_vital_heart_rate,
+            'patient_list_url': reverse('patient_list'),
+            'events_url': reverse('dashboard_events') if streaming else '',
+            'snapshot_url': reverse('dashboard_snapshot'),
+            'poll_ms': live.POLL_SECONDS * 1000,
+            # Taken after the queries: writes from here on arrive as deltas.
+            'live_event_id': live.publisher.last_event_id(),
+        },
         'has_gender_data': any(gender_counts),
         'has_blood_type_data': any(blood_type_counts),
         'has_age_group_data': sum(age_group_counts) > 0,
@@ -680,13 +799,74 @@ def dashboard(request):
         'snapshot_cards': snapshot_cards,
         'snapshot_highlight': snapshot_highlight,
     }
-    
-    return render(request, 'dashboard.html', context)
+    return context
 
 
 @login_required
-def departments(request):
-    department_list = Department.objects.all()
+@user_passes_test(is_admin, login_url='home')
+def dashboard(request):
+    # A stream would hold a WSGI worker thread for as long as the page is open.
+    return render(request, 'dashboard.html', dashboard_context(streaming=isinstance(request, ASGIRequest)))
+
+
+# Chart name in the live deltas: (labels, counts) keys in chart_data.
+LIVE_CHARTS = {
+    'gender': ('gender_labels', 'gender_counts'),
+    'blood_type': ('blood_type_labels', 'blood_type_counts'),
+    'age_group': ('age_group_labels', 'age_group_counts'),
+    'registration': ('registration_months', 'registration_counts'),
+    'department': ('dept_labels', 'dept_patient_data'),
+    'bmi': ('bmi_labels', 'bmi_counts'),
+    'visit_type': ('visit_type_labels', 'visit_type_counts'),
+    'city': ('city_labels', 'city_counts'),
+    'diagnosis': ('diagnosis_labels', 'diagnosis_counts'),
+}
+
+
+def dashboard_snapshot(request):
+    """
+    The live numbers of the dashboard as JSON, for a stream that has to
+    resync: the page replaces its charts and totals with these and
+    subscribes again from ``live_event_id``.
+    """
+    if not is_admin(request.user):
+        raise PermissionDenied
+    context = dashboard_context()
+    chart_data = context['chart_data']
+    cards = {card['live']: card['value'] for card in context['snapshot_cards'] if card.get('live')}
+    return JsonResponse({
+        'live_event_id': chart_data['live_event_id'],
+        'totals': {
+            'patients': context['total_patients'],
+            'health_records': context['total_health_records'],
+            **cards,
+        },
+        'charts': {
+            name: {'labels': chart_data[labels], 'counts': chart_data[counts]}
+            for name, (labels, counts) in LIVE_CHARTS.items()
+        },
+    })
+
+
+@role_required()
+async def dashboard_events(request):
+    """Server-Sent Events stream of dashboard deltas (see ``core.live``)."""
+    if not is_admin(request.user):
+        raise PermissionDenied
+    subscription = live.publisher.subscribe(
+        request.headers.get('Last-Event-ID') or request.GET.get('since', '')
+    )
+    events = live.astream(subscription) if isinstance(request, ASGIRequest) else live.stream(subscription)
+    response = StreamingHttpResponse(events, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stops nginx from buffering the stream.
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@role_required()
+async def departments(request):
+    department_list = [department async for department in Department.objects.all()]
     return render(request, 'departments.html', {'departments': department_list})
 
 
@@ -704,45 +884,50 @@ def department_create(request):
 @login_required
 def department_detail(request, pk):
     department = get_object_or_404(Department, pk=pk)
-    doctors = department.doctors.all()
-    
+    doctors = list(department.doctors.all())
+    stats = None
+
     # Filter data based on user type
     if request.user.is_staff:
-        patients = Patient.objects.filter(
-            health_records__department=department
-        ).distinct()
-        recent_records = department.health_records.select_related('patient', 'doctor').all()[:10]
+        patients = department_patient_queryset(department)
+        recent_records = department_record_queryset(department)
+        stats = department_stats(department.pk)
     elif getattr(request.user, 'is_doctor', False):
         doctor = get_logged_in_doctor(request.user)
         if not doctor:
             messages.error(request, 'No doctor profile associated with your account.')
             return redirect('home')
-        patients = Patient.objects.filter(
-            health_records__doctor=doctor,
-            health_records__department=department,
-        ).distinct()
-        recent_records = department.health_records.filter(doctor=doctor).select_related('patient').all()[:10]
+        patients = department_patient_queryset(department, doctor=doctor)
+        recent_records = department_record_queryset(department, doctor=doctor)
     else:
         # Patient can only see their own data
         try:
             patient = request.user.patient_profile
             patients = Patient.objects.filter(pk=patient.pk)
-            recent_records = department.health_records.filter(patient=patient).select_related('doctor').all()[:10]
+            recent_records = department_record_queryset(department, patient=patient)
         except Patient.DoesNotExist:
             patients = Patient.objects.none()
             recent_records = PatientHealthRecord.objects.none()
-    
+
+    patients = patients.only(*PATIENT_ROW_FIELDS)
+    recent_records = recent_records.select_related('patient', 'doctor', 'department').only(
+        *RECORD_ROW_FIELDS, 'patient__first_name', 'patient__last_name',
+    )
+    patient_page = Paginator(patients, DEPARTMENT_PAGE_SIZE).get_page(request.GET.get('patients_page'))
+    record_page = Paginator(recent_records, DEPARTMENT_PAGE_SIZE).get_page(request.GET.get('records_page'))
+
     return render(request, 'department_detail.html', {
         'department': department,
         'doctors': doctors,
-        'patients': patients,
-        'recent_records': recent_records,
+        'stats': stats,
+        'patients': patient_page,
+        'recent_records': record_page,
     })
 
 
-@login_required
-def doctors(request):
-    doctor_list = Doctor.objects.select_related('department').all()
+@role_required()
+async def doctors(request):
+    doctor_list = [doctor async for doctor in Doctor.objects.select_related('department')]
     return render(request, 'doctors.html', {'doctors': doctor_list})
 
 
@@ -775,101 +960,77 @@ def patient_list(request):
             return redirect('home')
     
     # Admin can see all patients
-    patients = Patient.objects.all()
-    
     search_query = request.GET.get('search', '')
-    filter_type = request.GET.get('filter_type', '')
-    filter_value = request.GET.get('filter_value', '')
-    
-    if search_query:
-        patients = patients.filter(
-            patient_id__icontains=search_query
-        ) | patients.filter(
-            first_name__icontains=search_query
-        ) | patients.filter(
-            last_name__icontains=search_query
-        ) | patients.filter(
-            email__icontains=search_query
-        )
+    include, exclude = parse_cohort_filters(request.GET)
+    patients = patient_list_queryset(search_query)
     
-    # Apply filters from chart clicks
-    if filter_type == 'gender':
-        gender_map = {'Male': 'M', 'Female': 'F', 'Other': 'O', 'Prefer not to say': 'P'}
-        patients = patients.filter(gender=gender_map.get(filter_value, filter_value))
-    elif filter_type == 'blood_type':
-        patients = patients.filter(blood_type=filter_value)
-    elif filter_type == 'age_group':
-        today = timezone.now().date()
-        from datetime import date
-        
-        if filter_value == '0-17':
-            max_date = today.replace(year=today.year - 17)
-            patients = patients.filter(date_of_birth__gte=max_date)
-        elif filter_value == '18-30':
-            min_date = today.replace(year=today.year - 30)
-            max_date = today.replace(year=today.year - 18)
-            patients = patients.filter(date_of_birth__gte=min_date, date_of_birth__lt=max_date)
-        elif filter_value == '31-45':
-            min_date = today.replace(year=today.year - 45)
-            max_date = today.replace(year=today.year - 31)
-            patients = patients.filter(date_of_birth__gte=min_date, date_of_birth__lt=max_date)
-        elif filter_value == '46-60':
-            min_date = today.replace(year=today.year - 60)
-            max_date = today.replace(year=today.year - 46)
-            patients = patients.filter(date_of_birth__gte=min_date, date_of_birth__lt=max_date)
-        elif filter_value == '61-75':
-            min_date = today.replace(year=today.year - 75)
-            max_date = today.replace(year=today.year - 61)
-            patients = patients.filter(date_of_birth__gte=min_date, date_of_birth__lt=max_date)
-        elif filter_value == '75+':
-            min_date = today.replace(year=today.year - 75)
-            patients = patients.filter(date_of_birth__lt=min_date)
-    elif filter_type == 'department':
-        patients = patients.filter(
-            health_records__department__name=filter_value
-        ).distinct()
-    elif filter_type == 'diagnosis':
-        patients = patients.filter(health_records__diagnosis=filter_value).distinct()
-    elif filter_type == 'bmi':
-        if filter_value == 'Underweight (<18.5)':
-            patients = patients.filter(health_records__bmi__lt=18.5).distinct()
-        elif filter_value == 'Normal (18.5-24.9)':
-            patients = patients.filter(health_records__bmi__gte=18.5, health_records__bmi__lt=25).distinct()
-        elif filter_value == 'Overweight (25-29.9)':
-            patients = patients.filter(health_records__bmi__gte=25, health_records__bmi__lt=30).distinct()
-        elif filter_value == 'Obese (≥30)':
-            patients = patients.filter(health_records__bmi__gte=30).distinct()
-    elif filter_type == 'visit_type':
-        if filter_value.lower() == 'not specified':
-            patients = patients.filter(
-                Q(health_records__visit_type__isnull=True) | Q(health_records__visit_type__exact='')
-            ).distinct()
-        else:
-            patients = patients.filter(
-                health_records__visit_type__iexact=filter_value
-            ).distinct()
-    elif filter_type == 'city':
-        if filter_value.lower() == 'not specified':
-            patients = patients.filter(Q(city__isnull=True) | Q(city__exact='')).distinct()
-        else:
-            patients = patients.filter(city__iexact=filter_value).distinct()
+    # Chart drill-downs are answered from the cohort bitmaps rather than JOINs
+    if include or exclude:
+        cohort = cohort_index.query(include, exclude)
+        if search_query:
+            cohort &= to_bitmap(patients.values_list('pk', flat=True))
+        patients = CohortResult(cohort, fields=PATIENT_ROW_FIELDS)
     
-    filter_label = ''
-    if filter_type and filter_value:
-        filter_label = f"{filter_type.replace('_', ' ').title()}: {filter_value}"
+    active_filters = [
+        {'mode': mode, 'type': attribute, 'value': value, 'param': f'{attribute}:{value}',
+         'label': f"{attribute.replace('_', ' ').title()}: {value}"}
+        for mode, filters in (('filter', include), ('exclude', exclude))
+        for attribute, values in filters.items()
+        for value in values
+    ]
+    filter_label = ' AND '.join(
+        ('NOT ' if item['mode'] == 'exclude' else '') + item['label'] for item in active_filters
+    )
+    page = Paginator(patients, PATIENT_LIST_PAGE_SIZE).get_page(request.GET.get('page'))
     
     return render(request, 'patient_list.html', {
-        'patients': patients,
+        'patients': page,
         'search_query': search_query,
-        'filter_type': filter_type,
-        'filter_value': filter_value,
+        'active_filters': active_filters,
+        'filter_attributes': [(attribute, attribute.replace('_', ' ').title()) for attribute in ATTRIBUTES],
         'filter_label': filter_label,
     })
 
 
+def patient_list_queryset(search_query=''):
+    patients = Patient.objects.only(*PATIENT_ROW_FIELDS)
+    if search_query:
+        patients = patients.filter(
+            Q(patient_id__icontains=search_query)
+            | Q(first_name__icontains=search_query)
+            | Q(last_name__icontains=search_query)
+            | Q(email__icontains=search_query)
+        )
+    return patients
+
+
+def parse_cohort_filters(params):
+    """
+    Collect drill-down filters from the query string.
+
+    ``filter``/``exclude`` take repeated ``attribute:value`` pairs; the legacy
+    single ``filter_type``/``filter_value`` pair from chart clicks is still
+    honoured.  Returns ``(include, exclude)`` dicts of attribute -> values.
+    """
+    include, exclude = {}, {}
+    pairs = [('filter', raw) for raw in params.getlist('filter')]
+    pairs += [('exclude', raw) for raw in params.getlist('exclude')]
+    if params.get('filter_type') and params.get('filter_value'):
+        pairs.append(('filter', f"{params['filter_type']}:{params['filter_value']}"))
+    for mode, raw in pairs:
+        attribute, _, value = raw.partition(':')
+        if attribute not in ATTRIBUTES or not value:
+            continue
+        target = include if mode == 'filter' else exclude
+        values = target.setdefault(attribute, [])
+        if value not in values:
+            values.append(value)
+    return include, exclude
+
+
 @role_required(User.Roles.DOCTOR)
-def doctor_patients(request):
-    doctor = get_logged_in_doctor(request.user)
+async def doctor_patients(request):
+    doctor = await aget_logged_in_doctor(request.user)
     if not doctor:
         messages.error(request, 'No doctor profile found for your account.')
         return redirect('home')
@@ -882,7 +1043,7 @@ def doctor_patients(request):
             | Q(last_name__icontains=search_query)
         )
     return render(request, 'doctor_patients.html', {
-        'patients': patients,
+        'patients': [patient async for patient in patients],
         'search_query': search_query,
         'doctor': doctor,
     })
@@ -896,6 +1057,10 @@ def patient_create(request):
         if form.is_valid():
             patient = form.save()
             messages.success(request, f'Patient account for "{patient.full_name}" created successfully!')
+            matches = possible_duplicates(form.cleaned_data, exclude=patient.pk)
+            if matches:
+                similar = ', '.join(row['patient_id'] for _, row in matches)
+                messages.warning(request, f'{patient.full_name} closely matches existing patients: {similar}. Please review.')
             return redirect('patient_list')
     else:
         form = AdminPatientAccountForm(initial={'patient_id': generate_patient_id()})
@@ -906,16 +1071,99 @@ def patient_create(request):
     })
 
 
-@login_required
-def patient_detail(request, pk):
-    patient = get_object_or_404(Patient, pk=pk)
+DUPLICATE_CHECK_FIELDS = ('first_name', 'last_name', 'date_of_birth', 'phone', 'email', 'aadhar_number')
+
+
+def _client_address(request):
+    """
+    The caller's IP address: ``REMOTE_ADDR``, or the last ``X-Forwarded-For``
+    entry when ``REMOTE_ADDR`` is one of the ``TRUSTED_PROXIES`` (the entry
+    that proxy added; the ones before it are whatever the client sent).
+    Anyone else could send a fresh header with every request.
+    """
+    remote = request.META.get('REMOTE_ADDR', '')
+    forwarded = request.headers.get('X-Forwarded-For', '').rsplit(',', 1)[-1].strip()
+    if forwarded and settings.TRUSTED_PROXIES:
+        try:
+            address = ipaddress.ip_address(remote)
+        except ValueError:
+            return remote
+        if any(address in ipaddress.ip_network(network) for network in settings.TRUSTED_PROXIES):
+            return forwarded
+    return remote
+
+
+def _duplicate_check_allowed(request):
+    """Count an anonymous lookup against the caller's DUPLICATE_CHECK_LIMIT per hour."""
+    if not settings.DUPLICATE_CHECK_LIMIT:
+        return True
+    key = f'duplicate-check:{_client_address(request)}'
+    cache.add(key, 0, timeout=3600)
+    try:
+        return cache.incr(key) <= settings.DUPLICATE_CHECK_LIMIT
+    except ValueError:  # expired between add() and incr()
+        return True
+
+
+def patient_duplicate_check(request):
+    """Live "possible duplicates" lookup for the signup and registration forms.
+
+    Anonymous visitors only learn whether a patient with the same surname,
+    date of birth and phone exists (the Aadhar number is not consulted), and
+    only DUPLICATE_CHECK_LIMIT times an hour; staff also receive the
+    matching patients.
+    """
+    data = {name: request.GET.get(name, '').strip() for name in DUPLICATE_CHECK_FIELDS}
+    is_staff = request.user.is_authenticated and request.user.is_staff
+    if not is_staff:
+        if not (data['last_name'] and data['date_of_birth'] and data['phone']):
+            return JsonResponse({'possible_duplicate': False})
+        if not _duplicate_check_allowed(request):
+            return JsonResponse({'possible_duplicate': False, 'error': 'Too many lookups.'}, status=429)
+
+    exclude = request.GET.get('exclude') if is_staff else None
+    matches = possible_duplicates(
+        data, exclude=int(exclude) if exclude and exclude.isdigit() else None, anonymous=not is_staff,
+    )
+    payload = {'possible_duplicate': bool(matches)}
+    if is_staff:
+        payload['matches'] = [
+            {
+                'score': similarity,
+                'patient_id': row['patient_id'],
+                'name': f"{row['first_name']} {row['last_name']}",
+                'date_of_birth': row['date_of_birth'].isoformat(),
+                'url': reverse('patient_detail', args=[row['pk']]),
+            }
+            for similarity, row in matches
+        ]
+    return JsonResponse(payload)
+
+
+def patient_record_queryset(patient):
+    return patient.health_records.select_related('doctor', 'department').only(*RECORD_ROW_FIELDS)
+
+
+def patient_archive_queryset(patient):
+    # Older visits live in the archive table; page through them on the
+    # (patient, record_date) index.
+    return (
+        patient.archived_records.select_related('doctor', 'department')
+        .only(*RECORD_ROW_FIELDS)
+        .order_by('-record_date', '-pk')
+    )
+
+
+@role_required()
+async def patient_detail(request, pk):
+    patient = await aget_object_or_404(Patient, pk=pk)
     
     # Check if user has permission to view this patient
     if request.user.is_staff:
         pass
     elif getattr(request.user, 'is_doctor', False):
-        doctor = get_logged_in_doctor(request.user)
-        if not doctor or not doctor_can_view_patient(doctor, patient):
+        doctor = await aget_logged_in_doctor(request.user)
+        if not doctor or not await adoctor_can_view_patient(doctor, patient):
             messages.error(request, 'You do not have permission to view this patient record.')
             return redirect('home')
     else:
@@ -928,10 +1176,14 @@ def patient_detail(request, pk):
             messages.error(request, 'No patient profile found.')
             return redirect('home')
     
-    health_records = patient.health_records.all()[:10]  # Latest 10 records
+    health_records = patient_record_queryset(patient).prefetch_related('flags')[:10]  # Latest 10 records
+    health_records = [record async for record in health_records]
+    archived_records = patient_archive_queryset(patient)
+    archived_page = await aget_page(archived_records, DEPARTMENT_PAGE_SIZE, request.GET.get('archived_page'))
     return render(request, 'patient_detail.html', {
         'patient': patient,
         'health_records': health_records,
+        'archived_records': archived_page,
     })
 
 
@@ -971,6 +1223,57 @@ def patient_update(request, pk):
     })
 
 
+def flag_queryset(status='open', kind='', severity='', doctor=None):
+    flags = VitalsFlag.objects.select_related('patient', 'record__doctor', 'record__department')
+    if doctor is not None:
+        flags = flags.filter(record__doctor=doctor)
+    if status == 'open':
+        flags = flags.filter(acknowledged_at__isnull=True)
+    if kind:
+        flags = flags.filter(kind=kind)
+    if severity:
+        flags = flags.filter(severity=severity)
+    return flags
+
+
+@role_required()
+def flagged_readings(request):
+    """
+    Work queue of abnormal vitals detected by the anomaly engine.
+
+    Admins see every flag; doctors only the flags raised on readings they
+    recorded, and can only acknowledge those.
+    """
+    doctor = None
+    if not request.user.is_staff:
+        doctor = get_logged_in_doctor(request.user)
+        if not doctor:
+            raise PermissionDenied
+
+    if request.method == 'POST':
+        acknowledged = flag_queryset(doctor=doctor).filter(
+            pk__in=request.POST.getlist('flag'),
+        ).update(acknowledged_at=timezone.now(), acknowledged_by=request.user)
+        messages.success(request, f'Acknowledged {acknowledged} flagged reading(s).')
+        return redirect(request.get_full_path())
+
+    status = request.GET.get('status', 'open')
+    kind = request.GET.get('kind', '')
+    severity = request.GET.get('severity', '')
+
+    flags = flag_queryset(status, kind, severity, doctor=doctor)
+    page = Paginator(flags, PATIENT_LIST_PAGE_SIZE).get_page(request.GET.get('page'))
+
+    return render(request, 'flagged_readings.html', {
+        'flags': page,
+        'status': status,
+        'kind': kind,
+        'severity': severity,
+        'kind_choices': VitalsFlag.Kinds.choices,
+        'severity_choices': VitalsFlag.Severity.choices,
+    })
+
+
 @login_required
 @user_passes_test(is_admin, login_url='home')
 def health_record_create(request, patient_pk=None):
@@ -995,16 +1298,17 @@ def health_record_create(request, patient_pk=None):
     })
 
 
-@login_required
-def health_record_detail(request, pk):
-    record = get_object_or_404(PatientHealthRecord, pk=pk)
+@role_required()
+async def health_record_detail(request, pk):
+    records = PatientHealthRecord.objects.select_related('patient', 'doctor', 'department')
+    record = await aget_object_or_404(records, pk=pk)
     
     # Check if user has permission to view this record
     if request.user.is_staff:
         pass
     elif getattr(request.user, 'is_doctor', False):
-        doctor = get_logged_in_doctor(request.user)
-        if not doctor or record.doctor != doctor:
+        doctor = await aget_logged_in_doctor(request.user)
+        if not doctor or record.doctor_id != doctor.pk:
             messages.error(request, 'You do not have permission to view this health record.')
             return redirect('home')
     else:
@@ -1027,24 +1331,21 @@ def department_delete(request, pk):
     department = get_object_or_404(Department, pk=pk)
     
     if request.method == 'POST':
-        # Check for related records
-        doctors_count = department.doctors.count()
-        health_records_count = department.health_records.count()
-        
-        if doctors_count > 0 or health_records_count > 0:
-            messages.error(request, 
-                f'Cannot delete department "{department.name}" because it has '
-                f'{doctors_count} doctor(s) and {health_records_count} health record(s) associated with it.')
+        # Soft delete: historic records keep pointing at the department until
+        # purge_deleted removes it, but its doctors must be moved or deleted first.
+        if department.doctors.exists():
+            messages.error(request,
+                f'Cannot delete department "{department.name}" because it still has '
+                f'{department.doctors.count()} doctor(s).')
             return redirect('departments')
         
-        department_name = department.name
-        department.delete()
-        messages.success(request, f'Department "{department_name}" deleted successfully!')
+        department.soft_delete()
+        messages.success(request, f'Department "{department.name}" deleted successfully!')
         return redirect('departments')
     
     # GET request - show confirmation
     doctors_count = department.doctors.count()
-    health_records_count = department.health_records.count()
+    health_records_count = archive.record_count(department=department)
     
     return render(request, 'delete_confirm.html', {
         'object': department,
@@ -1064,22 +1365,14 @@ def doctor_delete(request, pk):
     doctor = get_object_or_404(Doctor, pk=pk)
     
     if request.method == 'POST':
-        # Check for related records
-        health_records_count = doctor.health_records.count()
-        
-        if health_records_count > 0:
-            messages.error(request, 
-                f'Cannot delete doctor "{doctor.full_name}" because they have '
-                f'{health_records_count} health record(s) associated.')
-            return redirect('doctors')
-        
-        doctor_name = doctor.full_name
-        doctor.delete()
-        messages.success(request, f'Doctor "{doctor_name}" deleted successfully!')
+        # Soft delete: the doctor's records keep their author; purge_deleted
+        # removes the row once no record refers to it.
+        doctor.soft_delete()
+        messages.success(request, f'Doctor "{doctor.full_name}" deleted successfully!')
         return redirect('doctors')
     
     # GET request - show confirmation
-    health_records_count = doctor.health_records.count()
+    health_records_count = doctor.health_records.count() + doctor.archived_records.count()
     
     return render(request, 'delete_confirm.html', {
         'object': doctor,
@@ -1098,20 +1391,14 @@ def patient_delete(request, pk):
     patient = get_object_or_404(Patient, pk=pk)
     
     if request.method == 'POST':
-        # Count related records for warning
-        health_records_count = patient.health_records.count()
-        
-        patient_name = patient.full_name
-        patient_id = patient.patient_id
-        patient.delete()
-        
-        messages.success(request, 
-            f'Patient "{patient_name}" (ID: {patient_id}) deleted successfully! '
-            f'This also deleted {health_records_count} health record(s).')
+        # A single UPDATE; purge_deleted removes the records after the
+        # retention period and logs the exact counts.
+        request_patient_deletion([patient], actor=request.user)
+        messages.success(request, f'Patient "{patient.full_name}" (ID: {patient.patient_id}) deleted successfully!')
         return redirect('patient_list')
     
     # GET request - show confirmation
-    health_records_count = patient.health_records.count()
+    health_records_count = patient.health_records.count() + patient.archived_records.count()
     
     return render(request, 'delete_confirm.html', {
         'object': patient,
@@ -1135,19 +1422,19 @@ def patient_self_delete(request):
         return redirect('home')
     
     if request.method == 'POST':
-        patient_name = patient.full_name
-        patient_id = patient.patient_id
-        health_records_count = patient.health_records.count()
+        # Log in is disabled right away; the records are retained for the
+        # retention period, then purged together with the account.
         user = request.user
+        request_patient_deletion([patient], actor=user, delete_user=True)
+        user.is_active = False
+        user.save(update_fields=['is_active'])
         logout(request)
-        user.delete()
         return render(request, 'account_deleted.html', {
-            'patient_name': patient_name,
-            'patient_id': patient_id,
-            'health_records_count': health_records_count,
+            'patient_name': patient.full_name,
+            'patient_id': patient.patient_id,
         })
     
-    health_records_count = patient.health_records.count()
+    health_records_count = patient.health_records.count() + patient.archived_records.count()
     return render(request, 'delete_confirm.html', {
         'object': patient,
         'object_type': 'Account',
@@ -1162,3 +1449,87 @@ def patient_self_delete(request):
 
 
 # Create your views here.
+
+
+FHIR_JSON = 'application/fhir+json'
+
+
+def operation_outcome(message, status=400):
+    return JsonResponse({
+        'resourceType': 'OperationOutcome',
+        'issue': [{'severity': 'error', 'code': 'processing', 'diagnostics': message}],
+    }, status=status, content_type=FHIR_JSON)
+
+
+@role_required(User.Roles.ADMIN, User.Roles.SUPERADMIN)
+def fhir_export(request):
+    """Kick off a bulk export; the status URL is returned in Content-Location."""
+    types = [name for name in request.GET.get('_type', '').split(',') if name] or list(RESOURCE_TYPES)
+    unsupported = [name for name in types if name not in RESOURCE_TYPES]
+    if unsupported:
+        return operation_outcome(f'Unsupported resource type(s): {", ".join(unsupported)}')
+
+    since = None
+    if request.GET.get('_since'):
+        since = parse_datetime(request.GET['_since'].replace(' ', '+'))
+        if since is None:
+            return operation_outcome('_since must be a FHIR instant, e.g. 2024-01-01T00:00:00Z')
+        if timezone.is_naive(since):
+            since = timezone.make_aware(since)
+
+    export_id = start_export(types, since, requested_by=request.user.pk, request_url=request.build_absolute_uri())
+    AuditLog.objects.create(
+        actor=request.user,
+        action='fhir_export',
+        target=export_id,
+        details={'types': types, 'since': since.isoformat() if since else None},
+    )
+    response = HttpResponse(status=202)
+    response['Content-Location'] = request.build_absolute_uri(reverse('fhir_export_status', args=[export_id]))
+    return response
+
+
+@role_required(User.Roles.ADMIN, User.Roles.SUPERADMIN)
+def fhir_export_status(request, export_id):
+    """202 while the export runs, the manifest once it is complete; DELETE discards it."""
+    job = find_job(export_id)
+    if job is None:
+        raise Http404
+    if request.method == 'DELETE':
+        delete_export(export_id)
+        return HttpResponse(status=202)
+
+    if job.state in (Job.States.QUEUED, Job.States.RUNNING):
+        response = HttpResponse(status=202)
+        response['X-Progress'] = job.result.get('progress', job.get_state_display())
+        response['Retry-After'] = '5'
+        return response
+    if job.state == Job.States.FAILED:
+        return operation_outcome('Export failed; see the job log for details.', status=500)
+
+    manifest = dict(job.result)
+    manifest['output'] = [
+        {**item, 'url': request.build_absolute_uri(reverse('fhir_export_file', args=[export_id, item['url']]))}
+        for item in manifest['output']
+    ]
+    return JsonResponse(manifest)
+
+
+@role_required(User.Roles.ADMIN, User.Roles.SUPERADMIN)
+def fhir_export_file(request, export_id, filename):
+    job = find_job(export_id)
+    if job is None or job.state != Job.States.SUCCEEDED:
+        raise Http404
+    if filename not in {item['url'] for item in job.result.get('output', [])}:
+        raise Http404
+    path = export_dir(export_id) / filename
+    if not path.exists():
+        raise Http404
+    return FileResponse(open(path, 'rb'), as_attachment=True, filename=filename, content_type='application/gzip')
+
+
+def metrics_view(request):
+    """Prometheus scrape target; only internal callers (see ``core.metrics.is_internal``)."""
+    if not metrics.is_internal(request):
+        raise PermissionDenied
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
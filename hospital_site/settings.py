@@ -43,10 +43,12 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'core.metrics.MetricsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.profiling.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -79,6 +81,25 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # Job workers write concurrently with web requests; wait for the lock instead of failing.
+            'timeout': 20,
+            # New database files return freed pages to db_maintenance's incremental vacuum
+            # (no effect on existing files; see db_maintenance --enable-incremental-vacuum).
+            'init_command': 'PRAGMA auto_vacuum = INCREMENTAL',
+        },
+    }
+}
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+
+CACHES = {
+    'default': {
+        # LocMemCache that also counts hits and misses for /metrics.
+        'BACKEND': 'core.metrics.LocMemCache',
+        'LOCATION': 'hospital-default',
     }
 }
 
@@ -119,6 +140,8 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 STATICFILES_DIRS = [BASE_DIR / 'static']
+# Where collectstatic gathers the fingerprinted, precompressed files.
+STATIC_ROOT = Path(os.environ.get('DJANGO_STATIC_ROOT', BASE_DIR / 'staticfiles'))
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
@@ -139,3 +162,67 @@ EMAIL_BACKEND = os.environ.get(
     'EMAIL_BACKEND',
     'django.core.mail.backends.console.EmailBackend',
 )
+
+# Upper bound on onboarding emails sent per second by the batched dispatcher
+# (core.mailer); 0 disables throttling.
+ONBOARDING_MAIL_RATE = float(os.environ.get('ONBOARDING_MAIL_RATE', 5))
+
+# Duplicate-patient lookups an anonymous visitor (by IP address) may make per
+# hour from the signup form (core.views.patient_duplicate_check); 0 disables the limit.
+DUPLICATE_CHECK_LIMIT = int(os.environ.get('DUPLICATE_CHECK_LIMIT', 30))
+# Load balancers whose X-Forwarded-For is believed when counting those
+# lookups; a request from anywhere else is counted by its own address.
+TRUSTED_PROXIES = [network for network in os.environ.get('TRUSTED_PROXIES', '').split(',') if network]
+
+# FHIR bulk export files (core.exports) and the worker processes used to serialize them.
+EXPORT_ROOT = Path(os.environ.get('EXPORT_ROOT', BASE_DIR / 'exports'))
+FHIR_EXPORT_PROCESSES = int(os.environ.get('FHIR_EXPORT_PROCESSES', min(4, os.cpu_count() or 1)))
+
+# Health records dated more than this many days ago are moved to the archive
+# table by the archive_records command (core.archive).
+RECORD_ARCHIVE_AFTER_DAYS = int(os.environ.get('RECORD_ARCHIVE_AFTER_DAYS', 730))
+
+# Rows removed per transaction when purge_deleted removes a patient (core.deletion).
+DELETE_CHUNK_SIZE = int(os.environ.get('DELETE_CHUNK_SIZE', 500))
+
+# Days a soft-deleted row is retained before purge_deleted removes it.
+PURGE_AFTER_DAYS = {
+    'patient': int(os.environ.get('PURGE_PATIENTS_AFTER_DAYS', 30)),
+    'doctor': int(os.environ.get('PURGE_DOCTORS_AFTER_DAYS', 30)),
+    'department': int(os.environ.get('PURGE_DEPARTMENTS_AFTER_DAYS', 30)),
+}
+
+# Prometheus metrics (core.metrics).  With several worker processes, point
+# METRICS_DIR at a directory shared by all of them (emptied on restart).
+METRICS_DIR = os.environ.get('METRICS_DIR', '')
+METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', 5))
+# /metrics answers direct connections from these networks, or any caller
+# presenting "Authorization: Bearer <METRICS_TOKEN>".
+METRICS_ALLOWED_NETWORKS = os.environ.get('METRICS_ALLOWED_NETWORKS', '127.0.0.1/32,::1/128').split(',')
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+# Request profiling (core.profiling): superadmins can ask for a profile with
+# an "X-Profile: 1" header or ?_profile=1; PROFILE_SAMPLE_RATE = N also
+# profiles one request in N (0 disables sampling).
+PROFILE_DIR = Path(os.environ.get('PROFILE_DIR', BASE_DIR / 'profiles'))
+PROFILE_KEEP = int(os.environ.get('PROFILE_KEEP', 200))
+PROFILE_SAMPLE_RATE = int(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+PROFILE_INTERVAL = float(os.environ.get('PROFILE_INTERVAL', 0.005))
+
+# Database snapshots (core.backups): backup_db writes compressed, checksummed
+# copies to BACKUP_DIR and keeps the newest BACKUP_KEEP (0 keeps all).
+BACKUP_DIR = Path(os.environ.get('BACKUP_DIR', BASE_DIR / 'backups'))
+BACKUP_KEEP = int(os.environ.get('BACKUP_KEEP', 14))
+# Pages copied per step of the online backup, and the pause after each step
+# during which writers can commit.
+BACKUP_STEP_PAGES = int(os.environ.get('BACKUP_STEP_PAGES', 1024))
+BACKUP_STEP_SLEEP = float(os.environ.get('BACKUP_STEP_SLEEP', 0.05))
+# When set, every snapshot also replaces this file: a consistent read-only
+# copy for reporting tools that never locks the live database.
+ANALYTICS_REPLICA = os.environ.get('ANALYTICS_REPLICA', '')
+
+# db_maintenance (core.maintenance): pages the incremental vacuum frees per step
+# and at most per run, and the pause after each step and each ANALYZE'd index.
+MAINTENANCE_VACUUM_STEP_PAGES = int(os.environ.get('MAINTENANCE_VACUUM_STEP_PAGES', 512))
+MAINTENANCE_VACUUM_MAX_PAGES = int(os.environ.get('MAINTENANCE_VACUUM_MAX_PAGES', 25600))
+MAINTENANCE_STEP_SLEEP = float(os.environ.get('MAINTENANCE_STEP_SLEEP', 0.1))
@@ -0,0 +1,21 @@
+"""
+ASGI deployment: ``DJANGO_SETTINGS_MODULE=hospital_site.settings_asgi``,
+served from ``hospital_site.asgi:application`` by an ASGI server, e.g.
+
+    uvicorn hospital_site.asgi:application --workers 4 --no-access-log
+    gunicorn hospital_site.asgi:application -k uvicorn.workers.UvicornWorker -w 4
+
+The async views (patient and record detail, departments, doctors, a
+doctor's patients) then wait for the database without holding a thread;
+the remaining views run in a worker thread per request.  Everything else
+is as in ``hospital_site.settings_production``.  ``manage.py loadtest``
+compares the two handlers.
+"""
+from .settings_production import *  # noqa: F401,F403
+from .settings_production import DATABASES
+
+ASGI_APPLICATION = 'hospital_site.asgi.application'
+
+# Each ASGI request runs its queries in a fresh worker thread, so a
+# connection kept open past the request would never be reused.
+DATABASES['default']['CONN_MAX_AGE'] = 0
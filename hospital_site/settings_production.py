@@ -0,0 +1,46 @@
+"""
+Production settings: ``DJANGO_SETTINGS_MODULE=hospital_site.settings_production``.
+
+Everything not overridden here comes from ``hospital_site.settings``.
+"""
+import os
+
+from .settings import *  # noqa: F401,F403
+from .settings import MIDDLEWARE, TEMPLATES
+
+DEBUG = False
+
+SECRET_KEY = os.environ.get('DJANGO_SECRET_KEY', SECRET_KEY)  # noqa: F405
+
+ALLOWED_HOSTS = [host for host in os.environ.get('DJANGO_ALLOWED_HOSTS', '').split(',') if host]
+
+# Compile each template once per process and never check the files again;
+# template edits need a restart.
+TEMPLATES = [
+    {
+        **TEMPLATES[0],
+        'APP_DIRS': False,
+        'OPTIONS': {
+            **TEMPLATES[0]['OPTIONS'],
+            'debug': False,
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
+        },
+    },
+]
+
+# Keep database connections open between requests.
+DATABASES['default']['CONN_MAX_AGE'] = int(os.environ.get('DB_CONN_MAX_AGE', 60))  # noqa: F405
+
+# Static files are collected with content hashes in their names and gzip /
+# brotli copies (``manage.py collectstatic``) and served by core.assets with
+# far-future cache headers.
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'core.assets.CompressedManifestStaticFilesStorage'},
+}
+MIDDLEWARE = [MIDDLEWARE[0], 'core.assets.StaticFilesMiddleware', *MIDDLEWARE[1:]]
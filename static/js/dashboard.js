@@ -0,0 +1,335 @@
+// Dashboard charts. The data comes from the "dashboard-data" JSON block
+// rendered by the dashboard view; a chart is only drawn when its canvas is
+// on the page (the template leaves it out when there is nothing to show).
+(function () {
+    'use strict';
+
+    const data = JSON.parse(document.getElementById('dashboard-data').textContent);
+
+    // Navigate to the filtered patient list. Shift-click collects several
+    // segments into one drill-down; a plain click opens the cohort.
+    const drillDownKey = 'dashboardDrillDown';
+    function navigateToFilteredPatients(filterType, filterValue, event) {
+        const filters = JSON.parse(sessionStorage.getItem(drillDownKey) || '[]');
+        const filter = `${filterType}:${filterValue}`;
+        if (!filters.includes(filter)) {
+            filters.push(filter);
+        }
+        if (event && event.native && event.native.shiftKey) {
+            sessionStorage.setItem(drillDownKey, JSON.stringify(filters));
+            return;
+        }
+        sessionStorage.removeItem(drillDownKey);
+        const query = filters.map(item => `filter=${encodeURIComponent(item)}`).join('&');
+        window.location.href = `${data.patient_list_url}?${query}`;
+    }
+
+    // Charts by the name the live deltas use for them (see core/live.py).
+    const charts = {};
+
+    const countAxis = () => ({beginAtZero: true, ticks: {stepSize: 1}});
+
+    // Draws the chart on the canvas with the given id, if present. With a
+    // filterType, clicking a segment drills down into the patient list.
+    function drawChart(canvasId, config, filterType) {
+        const canvas = document.getElementById(canvasId);
+        if (!canvas) {
+            return null;
+        }
+        config.options = Object.assign({responsive: true, maintainAspectRatio: true}, config.options);
+        if (filterType) {
+            const labels = config.data.labels;
+            config.options.onClick = (event, elements) => {
+                if (elements.length > 0) {
+                    navigateToFilteredPatients(filterType, labels[elements[0].index], event);
+                }
+            };
+            config.options.plugins = {
+                tooltip: {callbacks: {afterLabel: () => 'Click to view patients'}},
+            };
+        }
+        return new Chart(canvas.getContext('2d'), config);
+    }
+
+    // Gender Distribution (Pie Chart)
+    charts.gender = drawChart('genderChart', {
+        type: 'pie',
+        data: {
+            labels: data.gender_labels,
+            datasets: [{
+                data: data.gender_counts,
+                backgroundColor: [
+                    'rgba(54, 162, 235, 0.8)',
+                    'rgba(255, 99, 132, 0.8)',
+                    'rgba(75, 192, 192, 0.8)',
+                    'rgba(153, 102, 255, 0.8)'
+                ]
+            }]
+        }
+    }, 'gender');
+
+    // Blood Type Distribution (Doughnut Chart)
+    charts.blood_type = drawChart('bloodTypeChart', {
+        type: 'doughnut',
+        data: {
+            labels: data.blood_type_labels,
+            datasets: [{
+                data: data.blood_type_counts,
+                backgroundColor: [
+                    'rgba(255, 99, 132, 0.8)',
+                    'rgba(54, 162, 235, 0.8)',
+                    'rgba(255, 206, 86, 0.8)',
+                    'rgba(75, 192, 192, 0.8)',
+                    'rgba(153, 102, 255, 0.8)',
+                    'rgba(255, 159, 64, 0.8)',
+                    'rgba(199, 199, 199, 0.8)',
+                    'rgba(83, 102, 255, 0.8)'
+                ]
+            }]
+        }
+    }, 'blood_type');
+
+    // Age Group Distribution (Bar Chart)
+    charts.age_group = drawChart('ageGroupChart', {
+        type: 'bar',
+        data: {
+            labels: data.age_group_labels,
+            datasets: [{
+                label: 'Number of Patients',
+                data: data.age_group_counts,
+                backgroundColor: 'rgba(54, 162, 235, 0.8)',
+                borderColor: 'rgba(54, 162, 235, 1)',
+                borderWidth: 1
+            }]
+        },
+        options: {scales: {y: countAxis()}}
+    }, 'age_group');
+
+    // Patient Registrations Over Time (Line Chart)
+    charts.registration = drawChart('registrationChart', {
+        type: 'line',
+        data: {
+            labels: data.registration_months,
+            datasets: [{
+                label: 'New Registrations',
+                data: data.registration_counts,
+                borderColor: 'rgba(255, 206, 86, 1)',
+                backgroundColor: 'rgba(255, 206, 86, 0.2)',
+                tension: 0.4,
+                fill: true
+            }]
+        },
+        options: {scales: {y: countAxis()}}
+    });
+
+    // Patients by Department (Bar Chart)
+    charts.department = drawChart('departmentChart', {
+        type: 'bar',
+        data: {
+            labels: data.dept_labels,
+            datasets: [{
+                label: 'Number of Patients',
+                data: data.dept_patient_data,
+                backgroundColor: 'rgba(220, 53, 69, 0.8)',
+                borderColor: 'rgba(220, 53, 69, 1)',
+                borderWidth: 1
+            }]
+        },
+        options: {scales: {y: countAxis()}}
+    }, 'department');
+
+    // BMI Distribution (Pie Chart)
+    charts.bmi = drawChart('bmiChart', {
+        type: 'pie',
+        data: {
+            labels: data.bmi_labels,
+            datasets: [{
+                data: data.bmi_counts,
+                backgroundColor: [
+                    'rgba(75, 192, 192, 0.8)',
+                    'rgba(54, 162, 235, 0.8)',
+                    'rgba(255, 206, 86, 0.8)',
+                    'rgba(255, 99, 132, 0.8)'
+                ]
+            }]
+        }
+    }, 'bmi');
+
+    // Visit Type Distribution (Doughnut Chart)
+    charts.visit_type = drawChart('visitTypeChart', {
+        type: 'doughnut',
+        data: {
+            labels: data.visit_type_labels,
+            datasets: [{
+                data: data.visit_type_counts,
+                backgroundColor: [
+                    'rgba(13, 110, 253, 0.85)',
+                    'rgba(25, 135, 84, 0.85)',
+                    'rgba(255, 193, 7, 0.85)',
+                    'rgba(220, 53, 69, 0.85)',
+                    'rgba(111, 66, 193, 0.85)',
+                    'rgba(32, 201, 151, 0.85)'
+                ],
+                borderWidth: 1
+            }]
+        }
+    }, 'visit_type');
+
+    // City Distribution (Bar Chart)
+    charts.city = drawChart('cityChart', {
+        type: 'bar',
+        data: {
+            labels: data.city_labels,
+            datasets: [{
+                label: 'Patients',
+                data: data.city_counts,
+                backgroundColor: 'rgba(102, 16, 242, 0.8)',
+                borderColor: 'rgba(102, 16, 242, 1)',
+                borderWidth: 1
+            }]
+        },
+        options: {indexAxis: 'y', scales: {x: countAxis()}}
+    }, 'city');
+
+    // Top Diagnoses (Bar Chart - Horizontal)
+    charts.diagnosis = drawChart('diagnosisChart', {
+        type: 'bar',
+        data: {
+            labels: data.diagnosis_labels,
+            datasets: [{
+                label: 'Number of Cases',
+                data: data.diagnosis_counts,
+                backgroundColor: 'rgba(108, 117, 125, 0.8)',
+                borderColor: 'rgba(108, 117, 125, 1)',
+                borderWidth: 1
+            }]
+        },
+        options: {indexAxis: 'y', scales: {x: countAxis()}}
+    }, 'diagnosis');
+
+    // Average Vitals by Department (Grouped Bar Chart)
+    drawChart('deptVitalsChart', {
+        type: 'bar',
+        data: {
+            labels: data.dept_vital_labels,
+            datasets: [
+                {
+                    label: 'Avg Systolic BP (mmHg)',
+                    data: data.dept_vital_systolic,
+                    backgroundColor: 'rgba(13, 110, 253, 0.8)'
+                },
+                {
+                    label: 'Avg Diastolic BP (mmHg)',
+                    data: data.dept_vital_diastolic,
+                    backgroundColor: 'rgba(25, 135, 84, 0.8)'
+                },
+                {
+                    label: 'Avg Heart Rate (bpm)',
+                    data: data.dept_vital_heart_rate,
+                    backgroundColor: 'rgba(255, 193, 7, 0.8)'
+                }
+            ]
+        },
+        options: {scales: {y: {beginAtZero: true}}}
+    });
+
+    // Live updates: the server streams increments per chart and label as
+    // records are written; they are added to the charts in place.
+    function bump(chart, label, amount) {
+        const labels = chart.data.labels;
+        let index = labels.indexOf(label);
+        if (index === -1 && chart === charts.visit_type) {
+            // The visit type chart folds its tail into "Other".
+            index = labels.indexOf('Other');
+        }
+        if (index === -1) {
+            labels.push(label);
+            chart.data.datasets[0].data.push(0);
+            index = labels.length - 1;
+        }
+        const values = chart.data.datasets[0].data;
+        values[index] = Math.max(0, (values[index] || 0) + amount);
+    }
+
+    // Sets a total or chart to the numbers of a fresh snapshot. The arrays
+    // are refilled in place: the drill-down handlers hold on to the labels.
+    function replace(array, values) {
+        array.splice(0, array.length, ...values);
+    }
+
+    function applySnapshot(snapshot) {
+        Object.entries(snapshot.totals).forEach(([total, value]) => {
+            document.querySelectorAll(`[data-live-total="${total}"]`).forEach(element => {
+                element.textContent = value;
+            });
+        });
+        Object.entries(snapshot.charts).forEach(([name, {labels, counts}]) => {
+            const chart = charts[name];
+            if (!chart) {
+                return;
+            }
+            replace(chart.data.labels, labels);
+            replace(chart.data.datasets[0].data, counts);
+            chart.update();
+        });
+    }
+
+    function applyDeltas(deltas) {
+        Object.entries(deltas).forEach(([name, amounts]) => {
+            if (name === 'totals') {
+                Object.entries(amounts).forEach(([total, amount]) => {
+                    document.querySelectorAll(`[data-live-total="${total}"]`).forEach(element => {
+                        element.textContent = Math.max(0, parseInt(element.textContent, 10) + amount);
+                    });
+                });
+                return;
+            }
+            const chart = charts[name];
+            if (!chart) {
+                return;
+            }
+            Object.entries(amounts).forEach(([label, amount]) => bump(chart, label, amount));
+            chart.update();
+        });
+    }
+
+    const retryDelay = 3000;
+
+    function subscribe(since) {
+        const source = new EventSource(`${data.events_url}?since=${encodeURIComponent(since)}`);
+        source.addEventListener('delta', event => applyDeltas(JSON.parse(event.data)));
+        // Too far behind to catch up from deltas: start over from fresh numbers.
+        source.addEventListener('resync', () => {
+            source.close();
+            resync();
+        });
+    }
+
+    function fetchSnapshot() {
+        return fetch(data.snapshot_url, {credentials: 'same-origin', headers: {Accept: 'application/json'}})
+            .then(response => {
+                if (!response.ok) {
+                    throw new Error(`Snapshot failed: ${response.status}`);
+                }
+                return response.json();
+            })
+            .then(snapshot => {
+                applySnapshot(snapshot);
+                return snapshot;
+            });
+    }
+
+    function resync() {
+        fetchSnapshot()
+            .then(snapshot => subscribe(snapshot.live_event_id))
+            .catch(() => window.setTimeout(resync, retryDelay));
+    }
+
+    // The server only streams when served by ASGI; otherwise the numbers
+    // are refreshed from the snapshot now and then.
+    if (window.EventSource && data.events_url) {
+        subscribe(data.live_event_id);
+    } else if (data.snapshot_url) {
+        window.setInterval(() => fetchSnapshot().catch(() => {}), data.poll_ms);
+    }
+})();